@@ -0,0 +1,39 @@
+"""
+Filtros del listado de citas, sobre columnas con índice:
+
+- `start`/`end` (YYYY-MM-DD): rango sobre fecha, que con el grupo es el comienzo del
+  índice (grupo, fecha, hora_inicio, id) y del orden de la paginación
+- `medico`: sus bloques horarios, índice (bloque_horario, fecha)
+- `paciente`: índice de la clave foránea
+"""
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+
+def _fecha(params, clave):
+    try:
+        fecha = parse_date(params[clave])
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ValidationError({clave: ['Debe ser una fecha YYYY-MM-DD.']})
+    return fecha
+
+
+def _id(params, clave):
+    try:
+        return int(params[clave])
+    except ValueError:
+        raise ValidationError({clave: ['Debe ser un id numérico.']})
+
+
+def filtrar_citas(queryset, params):
+    if params.get('start'):
+        queryset = queryset.filter(fecha__gte=_fecha(params, 'start'))
+    if params.get('end'):
+        queryset = queryset.filter(fecha__lte=_fecha(params, 'end'))
+    if params.get('medico'):
+        queryset = queryset.filter(bloque_horario__medico_id=_id(params, 'medico'))
+    if params.get('paciente'):
+        queryset = queryset.filter(paciente_id=_id(params, 'paciente'))
+    return queryset
@@ -0,0 +1,103 @@
+import datetime
+
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Usuario
+from apps.doctores.disponibilidad import DIAS_SEMANA, fechas
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+INICIO = datetime.date(2030, 1, 7)  # lunes
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Listado de citas: la agenda de un día y de un médico, y una página profunda, con el '
+        'listado paginado por (fecha, hora_inicio, id), frente a bajar el listado completo de la clínica.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=30)
+        parser.add_argument('--semanas', type=int, default=26, help='Semanas con citas de la clínica medida')
+        parser.add_argument('--citas-por-dia', type=int, default=8, help='Citas por médico y día hábil')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def clinica(self, nombre, roles, medicos, semanas, por_dia):
+        grupo, token = crear_clinica(nombre, roles)
+        prefijo = nombre.split()[-1].lower()
+        medicos = [
+            Medico.objects.create(
+                grupo=grupo, rol=roles['medico'], nombre=f'Medico {i:04d}', correo=f'm{i}@{prefijo}.bench',
+                sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'{prefijo}-{i}',
+            )
+            for i in range(medicos)
+        ]
+        bloques = {
+            (b.medico_id, b.dia_semana): b for b in Bloque_Horario.objects.bulk_create([
+                Bloque_Horario(grupo=grupo, medico=medico, dia_semana=dia, hora_inicio=datetime.time(8),
+                               hora_fin=datetime.time(16), duracion_cita_minutos=30, max_citas_por_bloque=16)
+                for medico in medicos for dia in DIAS_SEMANA[:5]
+            ])
+        }
+        usuario = Usuario.objects.create(grupo=grupo, rol=roles['paciente'], nombre='Paciente',
+                                         correo=f'p@{prefijo}.bench', sexo='M', fecha_nacimiento='1990-01-01')
+        paciente = Paciente.objects.create(usuario=usuario, numero_historia_clinica=f'HC-{prefijo}-1')
+        Cita_Medica.objects.bulk_create((
+            Cita_Medica(grupo=grupo, paciente=paciente, bloque_horario=bloque, fecha=fecha,
+                        hora_inicio=datetime.time(8 + k), hora_fin=datetime.time(8 + k, 30))
+            for medico in medicos
+            for fecha in fechas(INICIO, INICIO + datetime.timedelta(weeks=semanas, days=-1))
+            for bloque in [bloques.get((medico.pk, DIAS_SEMANA[fecha.weekday()]))] if bloque
+            for k in range(por_dia)
+        ), batch_size=2000)
+        return grupo, token, medicos
+
+    def medir(self, **options):
+        roles = crear_roles()
+        grupo, token, medicos = self.clinica('Clinica Agenda', roles, options['medicos'], options['semanas'],
+                                             options['citas_por_dia'])
+        # Otra clínica con el mismo volumen: el listado no puede recorrer sus citas
+        self.clinica('Clinica Vecina', roles, options['medicos'], options['semanas'], options['citas_por_dia'])
+        total = Cita_Medica.objects.filter(grupo=grupo).count()
+        self.stdout.write(f'{total} citas en la clínica medida, {Cita_Medica.objects.count()} en total')
+
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        dia = INICIO + datetime.timedelta(weeks=options['semanas'] // 2, days=2)
+        url = '/api/citas/citas-medicas/'
+
+        def completo():
+            # Sin paginación ni filtros en el servidor: todas las citas y el filtro en el cliente
+            filas, siguiente = [], f'{url}?page_size=500'
+            while siguiente:
+                pagina = cliente.get(siguiente).json()
+                filas += pagina['results']
+                siguiente = pagina['next']
+            return [f for f in filas if f['fecha'] == dia.isoformat()]
+
+        def ultima_pagina():
+            respuesta = cliente.get(url, {'start': INICIO + datetime.timedelta(weeks=options['semanas'] - 1, days=4)})
+            return respuesta.json()['results']
+
+        self.fila(('consulta', 34), ('consultas', 10), ('ms', 9), ('filas', 7))
+        for nombre, funcion in (
+            ('todas las citas, filtro en cliente', completo),
+            ('agenda del día (?start=&end=)', lambda: cliente.get(url, {'start': dia, 'end': dia}).json()['results']),
+            ('agenda del día de un médico', lambda: cliente.get(url, {'start': dia, 'end': dia, 'medico': medicos[-1].pk}).json()['results']),
+            ('último día (página profunda)', ultima_pagina),
+        ):
+            with contar_consultas() as consultas, cronometro() as t:
+                filas = funcion()
+            self.fila((nombre, 34), (consultas['total'], 10), (f'{t["segundos"] * 1000:.0f}', 9), (len(filas), 7))
+        self.stdout.write('  incluye las consultas de autenticación; páginas de 100 citas; el listado completo se recorre en páginas de 500')
+        consulta = Cita_Medica.objects.filter(grupo=grupo, estado=True, fecha__gte=dia, fecha__lte=dia).order_by('fecha', 'hora_inicio', 'id')[:101]
+        self.stdout.write('plan de la agenda del día:')
+        for linea in consulta.explain().splitlines():
+            self.stdout.write(f'  {linea}')
@@ -0,0 +1,119 @@
+import datetime
+
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.citas_pagos.recordatorios import RECORDATORIOS, correo_recordatorio, encolar_recordatorios, zona_clinica
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.correo import encolar_correo
+from apps.cuentas.models import CorreoSaliente, Usuario
+from apps.doctores.disponibilidad import DIAS_SEMANA
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+AHORA = datetime.datetime(2031, 3, 3, 7, 0)  # lunes, antes de la primera cita del día
+
+
+def por_cita(ahora):
+    """
+    Como se haría revisando cita por cita: todas las citas activas futuras, y por
+    cada una que ya toca, su paciente, la marca con save() y un correo con su INSERT.
+    """
+    zona = zona_clinica()
+    hoy = timezone.localtime(ahora, zona).date()
+    correos = 0
+    for cita in Cita_Medica.objects.filter(estado=True, fecha__gte=hoy):
+        inicio = timezone.make_aware(datetime.datetime.combine(cita.fecha, cita.hora_inicio), zona)
+        for campo, anticipacion in RECORDATORIOS:
+            if ahora < inicio <= ahora + anticipacion:
+                # Solo el recordatorio más cercano que corresponde, como encolar_recordatorios
+                if getattr(cita, campo) is None:
+                    correo = correo_recordatorio(cita, hoy)
+                    encolar_correo(correo.asunto, correo.cuerpo, correo.destinatarios, grupo_id=cita.grupo_id)
+                    setattr(cita, campo, ahora)
+                    cita.save()
+                    correos += 1
+                break
+    return correos
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Una vuelta del programador de recordatorios con semanas de citas por delante: revisando '
+        'cita por cita frente a encolar_recordatorios (una consulta por rango y un UPDATE por tipo).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=50)
+        parser.add_argument('--semanas', type=int, default=8, help='Semanas de citas futuras')
+        parser.add_argument('--citas-por-dia', type=int, default=16, help='Citas por médico y día hábil')
+        parser.add_argument('--lote', type=int, default=500, help='Citas por transacción de encolar_recordatorios')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Recordatorios', roles)
+        medicos = [
+            Medico.objects.create(
+                grupo=grupo, rol=roles['medico'], nombre=f'Medico {i:04d}', correo=f'm{i}@rec.bench',
+                sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'rec-{i}',
+            )
+            for i in range(options['medicos'])
+        ]
+        bloques = Bloque_Horario.objects.bulk_create([
+            Bloque_Horario(grupo=grupo, medico=medico, dia_semana=dia, hora_inicio=datetime.time(8),
+                           hora_fin=datetime.time(16), duracion_cita_minutos=30, max_citas_por_bloque=16)
+            for medico in medicos for dia in DIAS_SEMANA[:5]
+        ])
+        pacientes = []
+        for i in range(200):
+            usuario = Usuario.objects.create(grupo=grupo, rol=roles['paciente'], nombre=f'Paciente {i}',
+                                             correo=f'p{i}@rec.bench', sexo='M', fecha_nacimiento='1990-01-01')
+            pacientes.append(Paciente.objects.create(usuario=usuario, numero_historia_clinica=f'HC-rec-{i}'))
+        citas = []
+        for semana in range(options['semanas']):
+            for n, bloque in enumerate(bloques):
+                fecha = AHORA.date() + datetime.timedelta(weeks=semana, days=DIAS_SEMANA.index(bloque.dia_semana))
+                for k in range(options['citas_por_dia']):
+                    inicio = datetime.time(8 + k // 2, k % 2 * 30)
+                    citas.append(Cita_Medica(
+                        grupo=grupo, paciente=pacientes[(n + k) % len(pacientes)], bloque_horario=bloque, fecha=fecha,
+                        hora_inicio=inicio, hora_fin=datetime.time(inicio.hour, inicio.minute + 29),
+                    ))
+        Cita_Medica.objects.bulk_create(citas, batch_size=2000)
+        ahora = timezone.make_aware(AHORA, zona_clinica())
+        self.stdout.write(f'{len(citas)} citas futuras de {len(medicos)} médicos')
+
+        self.fila(('vuelta', 40), ('consultas', 10), ('ms', 9), ('correos', 8))
+        for nombre, funcion in (
+            ('cita por cita', lambda: por_cita(ahora)),
+            ('cita por cita, sin nada nuevo', lambda: por_cita(ahora)),
+        ):
+            with contar_consultas() as consultas, cronometro() as t:
+                correos = funcion()
+            self.fila((nombre, 40), (consultas['total'], 10), (f'{t["segundos"] * 1000:.0f}', 9), (correos, 8))
+
+        # Las mismas citas sin marcar, para medir encolar_recordatorios desde cero
+        Cita_Medica.objects.update(recordatorio_24h=None, recordatorio_2h=None)
+        CorreoSaliente.objects.all().delete()
+
+        def vuelta():
+            # Como el comando: lotes hasta que ningún tipo llene el suyo
+            correos = 0
+            while True:
+                resultado = encolar_recordatorios(ahora=ahora, lote=options['lote'])
+                correos += sum(datos['correos'] for datos in resultado.values())
+                if all(datos['citas'] < options['lote'] for datos in resultado.values()):
+                    return correos
+
+        for nombre in (f'encolar_recordatorios (lotes de {options["lote"]})', 'encolar_recordatorios, sin nada nuevo'):
+            with contar_consultas() as consultas, cronometro() as t:
+                correos = vuelta()
+            self.fila((nombre, 40), (consultas['total'], 10), (f'{t["segundos"] * 1000:.0f}', 9), (correos, 8))
+        assert CorreoSaliente.objects.count() == Cita_Medica.objects.exclude(
+            recordatorio_24h=None, recordatorio_2h=None).count()
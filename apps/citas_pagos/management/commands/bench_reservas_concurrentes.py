@@ -0,0 +1,164 @@
+import datetime
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.test.utils import override_settings
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.citas_pagos.reservas import TurnoNoDisponible, reserva_turno
+from apps.cuentas.benchmark import BenchmarkCommand, crear_clinica, crear_roles, percentil
+from apps.cuentas.models import Usuario
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+
+LUNES = datetime.date(2031, 3, 3)
+TURNOS = [datetime.time(8 + i // 2, i % 2 * 30) for i in range(8)]  # 08:00 a 11:30, de 30 minutos
+
+
+def fin_de(hora):
+    return (datetime.datetime.combine(LUNES, hora) + datetime.timedelta(minutes=30)).time()
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Reservas simultáneas de los mismos turnos: comprobación y alta por separado (como '
+        'antes) frente a reserva_turno. Cuenta reservas por segundo, turnos reservados dos '
+        'veces y bloques por encima de su cupo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Clientes simultáneos')
+        parser.add_argument('--intentos', type=int, default=400, help='Intentos de reserva por forma')
+        parser.add_argument('--bloques', type=int, default=4, help='Bloques que se disputan los clientes')
+        parser.add_argument('--cupo', type=int, default=6, help='max_citas_por_bloque (8 turnos por bloque)')
+
+    def run_benchmark(self, *args, **options):
+        # Los bloqueos de SQLite son parte de la medición: no se registran como errores
+        registro = logging.getLogger('django.request')
+        nivel = registro.level
+        registro.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(BITACORA={'MODO': 'sincrono'}):
+                self.medir(**options)
+        finally:
+            registro.setLevel(nivel)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        self.grupo, _ = crear_clinica('Clinica Reservas', roles)
+        usuario = Usuario.objects.create(grupo=self.grupo, rol=roles['paciente'], nombre='Paciente',
+                                         correo='p@reservas.bench', sexo='M', fecha_nacimiento='1990-01-01')
+        self.paciente = Paciente.objects.create(usuario=usuario, numero_historia_clinica='HC-reservas-1')
+        self.roles = roles
+
+        self.fila(('forma', 24), ('intentos', 9), ('intentos/s', 11), ('reservas', 9), ('reservas/s', 11), ('p95', 9),
+                  ('rechazos', 9), ('dobles', 7), ('sobrecupo', 10), ('bloqueos', 9))
+        for n, (nombre, reservar) in enumerate((
+            ('comprobar y dar de alta', self.reservar_antes),
+            ('reserva_turno', self.reservar_ahora),
+        )):
+            bloques = self.bloques(n, options['bloques'], options['cupo'])
+            resultado = self.concurrente(bloques, options['intentos'], options['hilos'], reservar)
+            dobles, sobrecupo = self.verificar(bloques)
+            self.fila(
+                (nombre, 24), (options['intentos'], 9), (f'{options["intentos"] / resultado["segundos"]:.1f}', 11),
+                (resultado['reservas'], 9),
+                (f'{resultado["reservas"] / resultado["segundos"]:.1f}', 11), (f'{resultado["p95"]:.0f} ms', 9),
+                (resultado['rechazos'], 9), (dobles, 7), (sobrecupo, 10), (resultado['bloqueos'], 9),
+            )
+            if reservar == self.reservar_ahora:
+                assert not dobles and not sobrecupo, (dobles, sobrecupo)
+        self.stdout.write(
+            '  dobles: pares de citas activas superpuestas en un mismo bloque y día; sobrecupo: bloques '
+            'con más citas que max_citas_por_bloque; bloqueos: SQLite rechazó el acceso concurrente y se reintentó'
+        )
+
+    def bloques(self, n, cantidad, cupo):
+        """Un bloque de lunes de 08:00 a 12:00 por médico (turnos de 30 minutos)"""
+        bloques = []
+        for i in range(cantidad):
+            medico = Medico.objects.create(
+                grupo=self.grupo, rol=self.roles['medico'], nombre=f'Medico {n}-{i}', correo=f'm{n}-{i}@reservas.bench',
+                sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'reservas-{n}-{i}',
+            )
+            bloques.append(Bloque_Horario.objects.create(
+                grupo=self.grupo, medico=medico, dia_semana='LUNES', hora_inicio=datetime.time(8),
+                hora_fin=datetime.time(12), duracion_cita_minutos=30, max_citas_por_bloque=cupo,
+            ))
+        return bloques
+
+    def nueva_cita(self, bloque, hora):
+        return Cita_Medica(grupo=self.grupo, paciente=self.paciente, bloque_horario=bloque, fecha=LUNES,
+                           hora_inicio=hora, hora_fin=fin_de(hora))
+
+    def reservar_antes(self, bloque, hora, contadores):
+        """Como la vista anterior: exists() y después el INSERT, sin bloqueo ni cupo"""
+        cita = self.nueva_cita(bloque, hora)
+        ocupado = self.reintentar(lambda: Cita_Medica.objects.filter(
+            bloque_horario=bloque, fecha=LUNES, estado=True, hora_inicio__lt=cita.hora_fin, hora_fin__gt=hora,
+        ).exists(), contadores)
+        if ocupado:
+            return False
+        # Ida y vuelta a la base entre la comprobación y el alta
+        time.sleep(0.001)
+        try:
+            self.reintentar(cita.save, contadores)
+        except IntegrityError:
+            # En PostgreSQL la restricción de exclusión (migración 0002) frena la doble reserva
+            return False
+        return True
+
+    def reservar_ahora(self, bloque, hora, contadores):
+        def reservar():
+            with reserva_turno(bloque, LUNES, hora, fin_de(hora)):
+                time.sleep(0.001)
+                self.nueva_cita(bloque, hora).save()
+        try:
+            self.reintentar(reservar, contadores)
+            return True
+        except TurnoNoDisponible:
+            return False
+
+    def reintentar(self, funcion, contadores):
+        """Reintenta mientras SQLite rechace el acceso concurrente ("table is locked")"""
+        while True:
+            try:
+                with transaction.atomic():
+                    return funcion()
+            except OperationalError:
+                contadores['bloqueos'] += 1
+                # Espera al azar: dos transacciones que se bloquean no reintentan a la vez
+                time.sleep(random.uniform(0.001, 0.02))
+
+    def concurrente(self, bloques, intentos, hilos, reservar):
+        contadores = {'reservas': 0, 'rechazos': 0, 'bloqueos': 0}
+        latencias = []
+        azar = random.Random(20)
+        pedidos = [(azar.choice(bloques), azar.choice(TURNOS)) for _ in range(intentos)]
+
+        def ejecutar(pedido):
+            inicio = time.perf_counter()
+            try:
+                contadores['reservas' if reservar(*pedido, contadores) else 'rechazos'] += 1
+            finally:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                connections.close_all()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            list(executor.map(ejecutar, pedidos))
+        contadores.update(segundos=time.perf_counter() - inicio, p95=percentil(latencias, 0.95))
+        return contadores
+
+    def verificar(self, bloques):
+        dobles = sobrecupo = 0
+        for bloque in bloques:
+            citas = sorted(Cita_Medica.objects.filter(bloque_horario=bloque, fecha=LUNES, estado=True)
+                           .values_list('hora_inicio', 'hora_fin'))
+            dobles += sum(1 for a, b in zip(citas, citas[1:]) if b[0] < a[1])
+            sobrecupo += len(citas) > bloque.max_citas_por_bloque
+        return dobles, sobrecupo
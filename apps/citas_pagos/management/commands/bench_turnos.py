@@ -0,0 +1,104 @@
+import datetime
+import random
+
+from django.test.utils import override_settings
+
+from apps.citas_pagos.models import Cita_Medica, Turno
+from apps.citas_pagos.reservas import TurnoNoDisponible, reserva_turno
+from apps.citas_pagos.turnos import HORIZONTE_DIAS, generar_turnos
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Usuario
+from apps.doctores.disponibilidad import DIAS_SEMANA
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+DESDE = datetime.date(2031, 3, 3)  # lunes
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Tabla de turnos: generación inicial del horizonte, regeneración sin cambios, regeneración '
+        'incremental al editar un bloque y reservas sobre turnos generados frente a horarios fuera de la grilla.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=100)
+        parser.add_argument('--dias', type=int, default=HORIZONTE_DIAS)
+        parser.add_argument('--reservas', type=int, default=500, help='Reservas por forma')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Turnos', roles)
+        hasta = DESDE + datetime.timedelta(days=options['dias'] - 1)
+        medicos = [
+            Medico.objects.create(
+                grupo=grupo, rol=roles['medico'], nombre=f'Medico {i}', correo=f'm{i}@turnos.bench',
+                sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'turnos-{i}',
+            )
+            for i in range(options['medicos'])
+        ]
+        # Mañana (turnos de 20 minutos, sin tope) y tarde (30 minutos) de lunes a viernes
+        bloques = Bloque_Horario.objects.bulk_create([
+            Bloque_Horario(grupo=grupo, medico=medico, dia_semana=dia, hora_inicio=inicio, hora_fin=fin,
+                           duracion_cita_minutos=duracion, max_citas_por_bloque=100)
+            for medico in medicos for dia in DIAS_SEMANA[:5]
+            for inicio, fin, duracion in ((datetime.time(8), datetime.time(12), 20), (datetime.time(14), datetime.time(18), 30))
+        ])
+        usuario = Usuario.objects.create(grupo=grupo, rol=roles['paciente'], nombre='Paciente', correo='p@turnos.bench',
+                                         sexo='M', fecha_nacimiento='1990-01-01')
+        paciente = Paciente.objects.create(usuario=usuario, numero_historia_clinica='HC-turnos-1')
+
+        self.stdout.write(f'{len(medicos)} médicos, {len(bloques)} bloques, {options["dias"]} días')
+        self.fila(('paso', 36), ('consultas', 12), ('ms', 8), ('creados', 8), ('borrados', 8))
+        bloque = bloques[0]
+
+        def editar():
+            Bloque_Horario.objects.filter(pk=bloque.pk).update(duracion_cita_minutos=30)
+            return generar_turnos(Bloque_Horario.objects.filter(pk=bloque.pk), desde=DESDE, hasta=hasta)
+
+        for paso, funcion in (
+            ('generación inicial', lambda: generar_turnos(desde=DESDE, hasta=hasta)),
+            ('regeneración sin cambios', lambda: generar_turnos(desde=DESDE, hasta=hasta)),
+            ('editar un bloque (20 -> 30 min)', editar),
+        ):
+            with contar_consultas() as consultas, cronometro() as t:
+                resultado = funcion()
+            self.fila((paso, 36), (consultas['total'], 12), (f'{t["segundos"] * 1000:.0f}', 8),
+                      (resultado['creados'], 8), (resultado['borrados'], 8))
+        self.stdout.write(f'  {Turno.objects.count()} turnos en la tabla')
+
+        # Reservas de a una: un turno generado de la mañana, o en la tarde corrido 10 minutos de la grilla
+        azar = random.Random(21)
+        mananas = list(Turno.objects.filter(hora_inicio__lt=datetime.time(12)).exclude(bloque_horario=bloque)
+                       .select_related('bloque_horario').order_by('?')[:options['reservas']])
+        tardes = [b for b in bloques if b.hora_inicio == datetime.time(14)]
+        libres = []
+        for _ in range(options['reservas']):
+            tarde = azar.choice(tardes)
+            dias = (DIAS_SEMANA.index(tarde.dia_semana) + 7 * azar.randrange(options['dias'] // 7))
+            inicio = datetime.time(14 + azar.randrange(3), 10)
+            libres.append((tarde, DESDE + datetime.timedelta(days=dias), inicio,
+                           datetime.time(inicio.hour, 40)))
+        self.fila(('reserva', 36), ('consultas', 12), ('ms', 8), ('reservas', 8), ('rechazos', 8))
+        for nombre, pedidos in (
+            ('turno generado (UPDATE de una fila)', [(t.bloque_horario, t.fecha, t.hora_inicio, t.hora_fin) for t in mananas]),
+            ('fuera de la grilla (busca citas)', libres),
+        ):
+            reservas = rechazos = 0
+            with contar_consultas() as consultas, cronometro() as t:
+                for bloque_cita, fecha, inicio, fin in pedidos:
+                    try:
+                        with reserva_turno(bloque_cita, fecha, inicio, fin):
+                            Cita_Medica.objects.create(grupo=grupo, paciente=paciente, bloque_horario=bloque_cita,
+                                                       fecha=fecha, hora_inicio=inicio, hora_fin=fin)
+                        reservas += 1
+                    except TurnoNoDisponible:
+                        rechazos += 1
+            self.fila((nombre, 36), (f'{consultas["total"] / len(pedidos):.1f}/reserva', 12),
+                      (f'{t["segundos"] * 1000 / len(pedidos):.2f}', 8), (reservas, 8), (rechazos, 8))
+        self.stdout.write('  reserva: consultas y ms por reserva, con el contador de cupo del bloque incluido')
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.citas_pagos.recordatorios import config_recordatorios, encolar_recordatorios, zona_clinica
+
+
+class Command(BaseCommand):
+    help = (
+        'Encola en la bandeja de salida los recordatorios de las citas que empiezan en las próximas '
+        '24 y 2 horas. Queda corriendo como worker (se pueden correr varios); con --una-vez encola '
+        'lo pendiente y termina. Los correos los envía despachar_correos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Citas por transacción (por defecto, RECORDATORIOS["LOTE"])')
+        parser.add_argument('--intervalo', type=float, help='Segundos de espera sin citas pendientes (por defecto, RECORDATORIOS["INTERVALO"])')
+        parser.add_argument('--una-vez', action='store_true', help='Encola lo pendiente y termina')
+        parser.add_argument('--ahora', help='Fecha y hora de referencia (ISO 8601, sin zona: la de la clínica), con --una-vez; por defecto, ahora')
+
+    def handle(self, *args, **options):
+        config = config_recordatorios()
+        lote = options['lote'] or config['LOTE']
+        intervalo = options['intervalo'] if options['intervalo'] is not None else config['INTERVALO']
+        if lote < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+        ahora = None
+        if options['ahora']:
+            if not options['una_vez']:
+                raise CommandError('--ahora solo se puede usar con --una-vez')
+            ahora = parse_datetime(options['ahora'])
+            if ahora is None:
+                raise CommandError('--ahora debe ser una fecha y hora ISO 8601')
+            if timezone.is_naive(ahora):
+                ahora = timezone.make_aware(ahora, zona_clinica())
+
+        try:
+            while True:
+                close_old_connections()
+                resultado = encolar_recordatorios(ahora=ahora, lote=lote)
+                for campo, datos in resultado.items():
+                    if datos['citas']:
+                        self.stdout.write(f"{campo}: {datos['citas']} citas, {datos['correos']} correos encolados")
+                if all(datos['citas'] < lote for datos in resultado.values()):
+                    # Nada más pendiente por ahora
+                    if options['una_vez']:
+                        return
+                    time.sleep(intervalo)
+        except KeyboardInterrupt:
+            pass
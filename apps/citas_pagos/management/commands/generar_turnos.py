@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.citas_pagos.turnos import HORIZONTE_DIAS, generar_turnos
+from apps.cuentas.benchmark import cronometro
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los turnos de los próximos días a partir de los bloques horarios y borra los libres '
+        'que ya no corresponden o ya pasaron. Incremental: pensado para correr una vez por día (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=HORIZONTE_DIAS, help='Días desde --desde')
+        parser.add_argument('--desde', help='Primer día (YYYY-MM-DD); por defecto, hoy')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = parse_date(options['desde'])
+            if desde is None:
+                raise CommandError('--desde debe ser una fecha YYYY-MM-DD')
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor que cero')
+
+        inicio = desde or timezone.localdate()
+        with cronometro() as t:
+            resultado = generar_turnos(desde=inicio, hasta=inicio + timedelta(days=options['dias'] - 1))
+        self.stdout.write(
+            f"{resultado['creados']} turnos creados, {resultado['borrados']} borrados ({t['segundos'] * 1000:.0f} ms)"
+        )
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.citas_pagos.models import Cita_Medica, OcupacionBloque, Turno
+from apps.citas_pagos.reservas import _liberar, superpuestas
+from apps.citas_pagos.turnos import recalcular
+from apps.cuentas.correo import encolar_correos
+from apps.cuentas.models import CorreoSaliente
+
+CAMPOS = (
+    'pk', 'grupo_id', 'bloque_horario_id', 'fecha', 'hora_inicio', 'hora_fin',
+    'bloque_horario__medico__nombre', 'paciente__usuario__nombre', 'paciente__usuario__correo',
+)
+
+
+def aviso(cita):
+    return CorreoSaliente(
+        grupo_id=cita['grupo_id'],
+        asunto=f"Tu cita médica del {cita['fecha']:%d/%m/%Y} fue cancelada",
+        cuerpo=(
+            f"Hola {cita['paciente__usuario__nombre']},\n\n"
+            f"Tu cita con {cita['bloque_horario__medico__nombre']} del {cita['fecha']:%d/%m/%Y} "
+            f"a las {cita['hora_inicio']:%H:%M} se superponía con otra cita del mismo horario y tuvimos "
+            'que cancelarla. Comunícate con la clínica para reprogramarla.'
+        ),
+        destinatarios=[cita['paciente__usuario__correo']],
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Lista las citas activas que se superponen con otra del mismo bloque y día, las que impiden '
+        'aplicar la migración citas_pagos 0002. Con --cancelar, de cada choque conserva la cita más '
+        'antigua, cancela las demás con el motivo anotado y avisa por correo a sus pacientes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cancelar', action='store_true', help='Cancela las superpuestas (por defecto solo las lista)')
+
+    def handle(self, *args, **options):
+        pares = superpuestas()
+        if not pares:
+            self.stdout.write('No hay citas superpuestas')
+            return
+        # Solo columnas de la migración 0001: el comando corre antes de migrar
+        citas = {
+            c['pk']: c for c in Cita_Medica.objects.filter(pk__in=[pk for pk, _ in pares]).values(*CAMPOS)
+        }
+        for pk, choque in pares:
+            cita = citas[pk]
+            self.stdout.write(
+                f"cita {pk} ({cita['fecha']} {cita['hora_inicio']:%H:%M}-{cita['hora_fin']:%H:%M}, "
+                f"bloque {cita['bloque_horario_id']}) se superpone con la cita {choque}"
+            )
+        if not options['cancelar']:
+            self.stdout.write(f'{len(pares)} citas superpuestas; para cancelarlas y avisar a los pacientes: --cancelar')
+            return
+
+        tablas = set(connection.introspection.table_names())
+        if CorreoSaliente._meta.db_table not in tablas:
+            raise CommandError('Falta la bandeja de salida de correos: primero `migrate cuentas`')
+        with transaction.atomic():
+            for pk, choque in pares:
+                cita = citas[pk]
+                Cita_Medica.objects.filter(pk=pk, estado=True).update(
+                    estado=False, motivo_cancelacion=f'Cancelada: se superponía con la cita {choque}.',
+                )
+                # Ya migrada la base, el cupo y los turnos siguen a la cita
+                if OcupacionBloque._meta.db_table in tablas:
+                    _liberar(cita['bloque_horario_id'], cita['fecha'])
+                if Turno._meta.db_table in tablas:
+                    recalcular(cita['bloque_horario_id'], cita['fecha'], cita['hora_inicio'], cita['hora_fin'])
+            correos = encolar_correos([aviso(c) for c in citas.values() if c['paciente__usuario__correo']])
+        self.stdout.write(f'{len(pares)} citas canceladas, {len(correos)} avisos encolados')
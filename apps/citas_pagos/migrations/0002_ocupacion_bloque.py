@@ -0,0 +1,107 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Exists, F, OuterRef
+
+# Sin solapamiento entre citas activas de un mismo bloque y día, aunque se escriban
+# por fuera de la reserva (admin, cargas masivas). Solo PostgreSQL: en otros motores
+# alcanza con el bloqueo del contador.
+SQL_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    "ALTER TABLE citas_pagos_cita_medica ADD CONSTRAINT cita_sin_solapamiento EXCLUDE USING gist "
+    "(bloque_horario_id WITH =, fecha WITH =, "
+    # greatest: una cita con el fin antes del inicio no hace fallar el INSERT con un error de rango
+    "tsrange(fecha + hora_inicio, fecha + greatest(hora_inicio, hora_fin)) WITH &&) "
+    "WHERE (estado)",
+]
+
+REVERSA_POSTGRES = [
+    "ALTER TABLE citas_pagos_cita_medica DROP CONSTRAINT IF EXISTS cita_sin_solapamiento",
+]
+
+
+def verificar_superpuestas(apps, schema_editor):
+    """
+    La restricción de exclusión no se puede crear si ya hay citas activas que se
+    superponen. No se cancelan acá (serían citas reales canceladas sin avisar a
+    nadie): la migración se detiene con la lista, y `resolver_citas_superpuestas`
+    las muestra o las cancela avisando a los pacientes.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Cita_Medica = apps.get_model('citas_pagos', 'Cita_Medica')
+    # Una cita con el fin antes del inicio no choca con nada (ver greatest arriba)
+    activas = Cita_Medica.objects.filter(estado=True, hora_fin__gt=F('hora_inicio'))
+    superpuestas = list(activas.filter(Exists(
+        activas.filter(
+            bloque_horario=OuterRef('bloque_horario'), fecha=OuterRef('fecha'),
+            hora_inicio__lt=OuterRef('hora_fin'), hora_fin__gt=OuterRef('hora_inicio'),
+        ).exclude(pk=OuterRef('pk'))
+    )).order_by('pk').values_list('pk', flat=True))
+    if superpuestas:
+        raise RuntimeError(
+            f'Hay {len(superpuestas)} citas activas superpuestas en el mismo bloque y día: {superpuestas}. '
+            'Revísalas con `python manage.py resolver_citas_superpuestas` (con --cancelar, se cancelan '
+            'las más nuevas de cada choque y se avisa a los pacientes) y vuelve a migrar.'
+        )
+
+
+def contar_existentes(apps, schema_editor):
+    """Un contador por bloque y fecha con las citas activas ya guardadas"""
+    Cita_Medica = apps.get_model('citas_pagos', 'Cita_Medica')
+    OcupacionBloque = apps.get_model('citas_pagos', 'OcupacionBloque')
+    filas = (
+        Cita_Medica.objects.filter(estado=True).order_by()
+        .values('bloque_horario_id', 'bloque_horario__grupo_id', 'fecha')
+        .annotate(citas=Count('id'))
+    )
+    OcupacionBloque.objects.bulk_create([
+        OcupacionBloque(
+            grupo_id=fila['bloque_horario__grupo_id'], bloque_horario_id=fila['bloque_horario_id'],
+            fecha=fila['fecha'], citas=fila['citas'],
+        )
+        for fila in filas.iterator()
+    ], batch_size=1000)
+
+
+def crear_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in SQL_POSTGRES:
+            schema_editor.execute(sql)
+
+
+def quitar_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in REVERSA_POSTGRES:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas_pagos', '0001_initial'),
+        ('cuentas', '0001_initial'),
+        ('doctores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionBloque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('citas', models.PositiveIntegerField(default=0, help_text='Citas activas del bloque en la fecha')),
+                ('bloque_horario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones', to='doctores.bloque_horario')),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones_bloque', to='cuentas.grupo')),
+            ],
+            options={
+                'verbose_name': 'Ocupación de bloque horario',
+                'verbose_name_plural': 'Ocupaciones de bloques horarios',
+                'constraints': [models.UniqueConstraint(fields=('bloque_horario', 'fecha'), name='ocupacion_bloque_unica')],
+            },
+        ),
+        migrations.RunPython(verificar_superpuestas, migrations.RunPython.noop),
+        migrations.RunPython(contar_existentes, migrations.RunPython.noop),
+        migrations.RunPython(crear_exclusion, quitar_exclusion),
+    ]
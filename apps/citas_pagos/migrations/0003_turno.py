@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas_pagos', '0002_ocupacion_bloque'),
+        ('cuentas', '0013_correo_saliente'),
+        ('doctores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Turno',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('reservado', models.BooleanField(default=False)),
+                ('bloque_horario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnos', to='doctores.bloque_horario')),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnos', to='cuentas.grupo')),
+            ],
+            options={
+                'verbose_name': 'Turno',
+                'verbose_name_plural': 'Turnos',
+                'ordering': ['fecha', 'hora_inicio'],
+                'indexes': [models.Index(fields=['grupo', 'fecha', 'hora_inicio'], name='turno_grupo_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bloque_horario', 'fecha', 'hora_inicio'), name='turno_unico')],
+            },
+        ),
+    ]
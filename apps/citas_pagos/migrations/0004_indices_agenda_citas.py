@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas_pagos', '0003_turno'),
+        ('cuentas', '0013_correo_saliente'),
+        ('doctores', '0001_initial'),
+        ('historiasDiagnosticos', '0003_contador_historia_clinica'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita_medica',
+            index=models.Index(fields=['grupo', 'fecha', 'hora_inicio', 'id'], name='cita_grupo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita_medica',
+            index=models.Index(fields=['bloque_horario', 'fecha'], name='cita_bloque_fecha_idx'),
+        ),
+    ]
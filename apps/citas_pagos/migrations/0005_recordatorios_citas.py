@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas_pagos', '0004_indices_agenda_citas'),
+        ('cuentas', '0013_correo_saliente'),
+        ('doctores', '0001_initial'),
+        ('historiasDiagnosticos', '0003_contador_historia_clinica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita_medica',
+            name='recordatorio_24h',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cita_medica',
+            name='recordatorio_2h',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cita_medica',
+            index=models.Index(fields=['fecha', 'hora_inicio'], name='cita_fecha_hora_idx'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from apps.historiasDiagnosticos.models import Paciente
 from apps.doctores.models import Bloque_Horario
 from apps.cuentas.models import Grupo
+from apps.cuentas.tenant import TenantManager
 class Cita_Medica(models.Model):
 
     fecha = models.DateField(help_text="Fecha de la cita médica")
@@ -12,6 +13,9 @@ class Cita_Medica(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
     motivo_cancelacion = models.TextField(blank=True, help_text="Motivo de la cancelación, si aplica ")
+    # Cuándo se encoló cada recordatorio (ver recordatorios.py); se vacían si la cita cambia de horario
+    recordatorio_24h = models.DateTimeField(null=True, blank=True)
+    recordatorio_2h = models.DateTimeField(null=True, blank=True)
   
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='citas')
     bloque_horario = models.ForeignKey(Bloque_Horario, on_delete=models.CASCADE, related_name='citas')
@@ -22,6 +26,8 @@ class Cita_Medica(models.Model):
         verbose_name="Grupo al que pertenece",
     )
     
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Cita Médica"
         verbose_name_plural = "Citas Médicas"
@@ -29,4 +35,63 @@ class Cita_Medica(models.Model):
         indexes = [
             models.Index(fields=['fecha_creacion']),
             models.Index(fields=['estado']),
-        ]    
\ No newline at end of file
+            # Agenda de la clínica por día (listado paginado por fecha, hora_inicio, id)
+            models.Index(fields=['grupo', 'fecha', 'hora_inicio', 'id'], name='cita_grupo_fecha_idx'),
+            # Citas de un bloque (o de los bloques de un médico) en una fecha
+            models.Index(fields=['bloque_horario', 'fecha'], name='cita_bloque_fecha_idx'),
+            # Citas que empiezan en las próximas horas, de todas las clínicas (recordatorios)
+            models.Index(fields=['fecha', 'hora_inicio'], name='cita_fecha_hora_idx'),
+        ]
+
+class OcupacionBloque(models.Model):
+    """
+    Citas activas de un bloque horario en una fecha. Cada reserva suma una con un
+    UPDATE condicionado al cupo, que además deja la fila bloqueada hasta el fin de
+    la transacción: las reservas de un mismo bloque y día se hacen de a una.
+    """
+    grupo = models.ForeignKey(Grupo, on_delete=models.CASCADE, related_name='ocupaciones_bloque')
+    bloque_horario = models.ForeignKey(Bloque_Horario, on_delete=models.CASCADE, related_name='ocupaciones')
+    fecha = models.DateField()
+    citas = models.PositiveIntegerField(default=0, help_text="Citas activas del bloque en la fecha")
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = "Ocupación de bloque horario"
+        verbose_name_plural = "Ocupaciones de bloques horarios"
+        constraints = [
+            models.UniqueConstraint(fields=['bloque_horario', 'fecha'], name='ocupacion_bloque_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.bloque_horario_id} {self.fecha}: {self.citas}"
+
+
+class Turno(models.Model):
+    """
+    Turno concreto de un bloque horario en una fecha, generado por turnos.generar_turnos
+    para los próximos días. `reservado` marca que alguna cita activa lo ocupa: reservar
+    un turno libre es un UPDATE condicionado sobre esta fila.
+    """
+    grupo = models.ForeignKey(Grupo, on_delete=models.CASCADE, related_name='turnos')
+    bloque_horario = models.ForeignKey(Bloque_Horario, on_delete=models.CASCADE, related_name='turnos')
+    fecha = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    reservado = models.BooleanField(default=False)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = "Turno"
+        verbose_name_plural = "Turnos"
+        ordering = ['fecha', 'hora_inicio']
+        constraints = [
+            models.UniqueConstraint(fields=['bloque_horario', 'fecha', 'hora_inicio'], name='turno_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['grupo', 'fecha', 'hora_inicio'], name='turno_grupo_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bloque_horario_id} {self.fecha} {self.hora_inicio}-{self.hora_fin}"
@@ -0,0 +1,7 @@
+from apps.cuentas.pagination import KeysetPagination
+
+
+class CitaMedicaPagination(KeysetPagination):
+    """Agenda en orden de fecha y hora de inicio; índice (grupo, fecha, hora_inicio, id)"""
+    ordering = ('fecha', 'hora_inicio', 'id')
+    page_size = 100
@@ -0,0 +1,139 @@
+"""
+Recordatorios de citas por correo, 24 horas y 2 horas antes del comienzo.
+
+En vez de revisar cada cita, cada vuelta del comando `enviar_recordatorios` toma,
+por tipo de recordatorio, las citas activas sin ese recordatorio que empiezan
+entre ahora y ahora + anticipación: una consulta por rango sobre el índice
+(fecha, hora_inicio), con el paciente y su usuario por select_related. En la
+misma transacción:
+
+    - las citas del lote se marcan con un UPDATE ... WHERE id IN (...) sobre la
+      columna del recordatorio (recordatorio_24h o recordatorio_2h)
+    - los correos se encolan en la bandeja de salida con un bulk_create
+      (cuentas.correo); los envía `despachar_correos`
+
+La marca y los correos se confirman juntos: si el proceso muere antes, la cita
+sigue sin marca y la toma la vuelta siguiente; después, ya no se vuelve a tomar.
+En PostgreSQL el lote se lee con FOR UPDATE SKIP LOCKED, así varios procesos no
+toman las mismas citas.
+
+Una cita que empieza antes de que venza el de 2 horas no recibe el de 24 (sería
+el mismo aviso dos veces). Cambiar el horario de una cita vacía sus marcas.
+
+Configuración (settings.RECORDATORIOS):
+    LOTE        citas por transacción
+    INTERVALO   segundos entre vueltas del comando cuando no hay nada pendiente
+    ZONA_HORARIA  zona en que se cargan fecha y hora_inicio de las citas (la de
+                la clínica); por defecto, TIME_ZONE
+"""
+import datetime
+import zoneinfo
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.cuentas.correo import encolar_correos
+from apps.cuentas.models import CorreoSaliente
+
+from .models import Cita_Medica
+
+# (columna de la marca, anticipación), del más cercano al más lejano
+RECORDATORIOS = (
+    ('recordatorio_2h', datetime.timedelta(hours=2)),
+    ('recordatorio_24h', datetime.timedelta(hours=24)),
+)
+
+
+def config_recordatorios():
+    config = {
+        'LOTE': 500,
+        'INTERVALO': 60.0,
+        'ZONA_HORARIA': None,
+    }
+    config.update(getattr(settings, 'RECORDATORIOS', {}))
+    return config
+
+
+def zona_clinica():
+    """Zona horaria de fecha y hora_inicio de las citas"""
+    return zoneinfo.ZoneInfo(config_recordatorios()['ZONA_HORARIA'] or settings.TIME_ZONE)
+
+
+def empieza_entre(desde, hasta):
+    """
+    Citas que empiezan en (desde, hasta], instantes con zona horaria. fecha y
+    hora_inicio son la hora local de la clínica: la condición es un rango sobre
+    fecha (lo que recorre el índice) más los cortes de hora en los días de los extremos.
+    """
+    zona = zona_clinica()
+    desde, hasta = timezone.localtime(desde, zona), timezone.localtime(hasta, zona)
+    return (
+        Q(fecha__gte=desde.date(), fecha__lte=hasta.date())
+        & (Q(fecha__gt=desde.date()) | Q(hora_inicio__gt=desde.time()))
+        & (Q(fecha__lt=hasta.date()) | Q(hora_inicio__lte=hasta.time()))
+    )
+
+
+def pendientes(campo, anticipacion, ahora, siguiente=None):
+    """Citas activas sin el recordatorio `campo` que empiezan antes de ahora + anticipacion"""
+    citas = Cita_Medica.objects.filter(
+        empieza_entre(ahora, ahora + anticipacion), estado=True, **{f'{campo}__isnull': True},
+    )
+    if siguiente is not None:
+        # Ya tocaría el recordatorio más cercano: este queda de lado
+        citas = citas.exclude(empieza_entre(ahora, ahora + siguiente))
+    return citas
+
+
+def correo_recordatorio(cita, hoy):
+    usuario = cita.paciente.usuario
+    medico = cita.bloque_horario.medico
+    dia = {hoy: 'hoy', hoy + datetime.timedelta(days=1): 'mañana'}.get(cita.fecha, f'el {cita.fecha:%d/%m/%Y}')
+    return CorreoSaliente(
+        grupo_id=cita.grupo_id,
+        asunto=f'Recordatorio: tu cita médica es {dia} a las {cita.hora_inicio:%H:%M}',
+        cuerpo=(
+            f'Hola {usuario.nombre},\n\n'
+            f'Te recordamos tu cita con {medico.nombre} {dia} ({cita.fecha:%d/%m/%Y}) '
+            f'de {cita.hora_inicio:%H:%M} a {cita.hora_fin:%H:%M}.\n\n'
+            'Si no puedes asistir, avísanos para liberar el turno.'
+        ),
+        destinatarios=[usuario.correo],
+    )
+
+
+def notificar(citas, ahora):
+    """Encola un correo por cita (las de pacientes sin correo se saltan) con un solo bulk_create"""
+    hoy = timezone.localtime(ahora, zona_clinica()).date()
+    return len(encolar_correos([
+        correo_recordatorio(cita, hoy) for cita in citas if cita.paciente.usuario.correo
+    ]))
+
+
+def encolar_recordatorios(ahora=None, lote=None):
+    """
+    Una vuelta del programador: hasta `lote` citas por tipo de recordatorio.
+    Devuelve {campo: {'citas', 'correos'}}; si algún tipo llegó a `lote`, quedan más.
+    """
+    ahora = ahora or timezone.now()
+    lote = lote or config_recordatorios()['LOTE']
+    resultado = {}
+    siguiente = None
+    for campo, anticipacion in RECORDATORIOS:
+        citas = (
+            pendientes(campo, anticipacion, ahora, siguiente)
+            .select_related('paciente__usuario', 'bloque_horario__medico')
+            .order_by('fecha', 'hora_inicio', 'id')
+        )
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                citas = citas.select_for_update(skip_locked=True, of=('self',))
+            citas = list(citas[:lote])
+            # Sin pasar por save: fecha_modificacion (y el ETag del calendario) no cambian
+            Cita_Medica.objects.filter(pk__in=[c.pk for c in citas]).update(**{campo: ahora})
+            correos = notificar(citas, ahora)
+        resultado[campo] = {'citas': len(citas), 'correos': correos}
+        siguiente = anticipacion
+    return resultado
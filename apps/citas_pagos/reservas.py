@@ -0,0 +1,186 @@
+"""
+Reserva de turnos sin doble reserva ni sobrecupo, también con requests simultáneos.
+
+Antes la vista comprobaba el solapamiento con un exists() y después insertaba: dos
+reservas del mismo turno a la vez pasaban las dos la comprobación. Ahora cada
+reserva, dentro de una transacción:
+
+    1. suma uno al contador OcupacionBloque del bloque y la fecha con un UPDATE
+       condicionado al cupo (citas < max_citas_por_bloque); si no actualiza ninguna
+       fila, el bloque está lleno. El UPDATE deja la fila bloqueada hasta el commit,
+       así que las reservas de un mismo bloque y día pasan de a una por los pasos 2 y 3
+    2. si el turno coincide con uno de la tabla Turno, lo toma con un UPDATE
+       condicionado a que esté libre (una fila); si no, busca citas activas del
+       bloque que se superpongan y marca como reservados los turnos que pisa
+    3. guarda la cita
+
+Si algo falla la transacción se revierte con el contador. En PostgreSQL además una
+restricción de exclusión (migración 0002) rechaza el solapamiento aunque la cita se
+escriba por otro camino; en SQLite la base entera se escribe de a una transacción.
+
+Las fechas y horas se comparan como date y time, no como texto.
+"""
+import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils.dateparse import parse_date, parse_time
+
+from apps.doctores.disponibilidad import DIAS_SEMANA
+
+from .models import Cita_Medica, OcupacionBloque, Turno
+from .turnos import recalcular
+
+
+class TurnoNoDisponible(Exception):
+    """La cita no se puede reservar; el mensaje es para el usuario"""
+
+
+def leer_fecha(valor):
+    if isinstance(valor, datetime.date):
+        return valor
+    try:
+        fecha = parse_date(valor or '')
+    except (TypeError, ValueError):
+        fecha = None
+    if fecha is None:
+        raise TurnoNoDisponible('La fecha debe tener el formato YYYY-MM-DD.')
+    return fecha
+
+
+def leer_hora(valor):
+    if isinstance(valor, datetime.time):
+        return valor
+    try:
+        hora = parse_time(valor or '')
+    except (TypeError, ValueError):
+        hora = None
+    if hora is None:
+        raise TurnoNoDisponible('Las horas deben tener el formato HH:MM.')
+    return hora
+
+
+def validar_turno(bloque, fecha, hora_inicio, hora_fin):
+    """El turno cae en el día del bloque y dentro de su horario"""
+    dia = DIAS_SEMANA[fecha.weekday()]
+    if bloque.dia_semana != dia:
+        raise TurnoNoDisponible(f'La fecha corresponde a {dia}, pero el bloque es para {bloque.dia_semana}.')
+    if not (bloque.hora_inicio <= hora_inicio < hora_fin <= bloque.hora_fin):
+        raise TurnoNoDisponible('La hora de la cita está fuera del rango del bloque horario.')
+
+
+def _ocupar(bloque, fecha, sumar=1):
+    """
+    Suma `sumar` citas al contador del bloque en la fecha si entran en el cupo y
+    bloquea la fila. Con sumar=0 solo bloquea. False si el bloque está lleno.
+    """
+    filas = OcupacionBloque.objects.filter(bloque_horario=bloque, fecha=fecha)
+    if sumar:
+        filas = filas.filter(citas__lte=bloque.max_citas_por_bloque - sumar)
+    if filas.update(citas=F('citas') + sumar):
+        return True
+    if sumar > bloque.max_citas_por_bloque:
+        return False
+    try:
+        with transaction.atomic():
+            OcupacionBloque.objects.create(grupo_id=bloque.grupo_id, bloque_horario=bloque, fecha=fecha, citas=sumar)
+        return True
+    except IntegrityError:
+        # El contador ya existía (y no había cupo) o lo creó otra reserva a la vez
+        return bool(filas.update(citas=F('citas') + sumar))
+
+
+def _liberar(bloque_id, fecha):
+    OcupacionBloque.objects.filter(bloque_horario_id=bloque_id, fecha=fecha, citas__gt=0).update(citas=F('citas') - 1)
+
+
+@contextmanager
+def reserva_turno(bloque, fecha, hora_inicio, hora_fin, cita=None):
+    """
+    Transacción en la que se guarda una cita del turno. `cita` es la cita existente
+    que se modifica o se restaura (tal como está guardada), para no contarla dos
+    veces ni tomarla como solapamiento consigo misma. Una cita cancelada se cuenta
+    como reserva nueva: solo se pasa para restaurarla, no para editarla cancelada.
+    TurnoNoDisponible si el turno no es válido, el bloque está lleno o el turno se
+    superpone con otra cita.
+
+        with reserva_turno(bloque, fecha, inicio, fin):
+            Cita_Medica.objects.create(...)
+    """
+    fecha, hora_inicio, hora_fin = leer_fecha(fecha), leer_hora(hora_inicio), leer_hora(hora_fin)
+    validar_turno(bloque, fecha, hora_inicio, hora_fin)
+    activa = cita is not None and cita.estado
+    mismo_dia = activa and (cita.bloque_horario_id, cita.fecha) == (bloque.pk, fecha)
+    # El intervalo que la cita deja libre (la instancia cambia al guardarse)
+    anterior = (cita.bloque_horario_id, cita.fecha, cita.hora_inicio, cita.hora_fin) if activa else None
+    try:
+        with transaction.atomic():
+            if not _ocupar(bloque, fecha, sumar=0 if mismo_dia else 1):
+                raise TurnoNoDisponible('El bloque horario no tiene más cupos para esa fecha.')
+            if activa and not mismo_dia:
+                _liberar(cita.bloque_horario_id, cita.fecha)
+            tomado = Turno.objects.filter(
+                bloque_horario=bloque, fecha=fecha, hora_inicio=hora_inicio, hora_fin=hora_fin, reservado=False,
+            ).update(reservado=True)
+            if not tomado:
+                # Sin turno generado (fuera del horizonte u horario libre) o ya reservado
+                superpuestas = Cita_Medica.objects.filter(
+                    bloque_horario=bloque, fecha=fecha, estado=True,
+                    hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio,
+                )
+                if cita is not None:
+                    superpuestas = superpuestas.exclude(pk=cita.pk)
+                if superpuestas.exists():
+                    raise TurnoNoDisponible('El médico ya tiene una cita en ese horario.')
+                Turno.objects.filter(
+                    bloque_horario=bloque, fecha=fecha, hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio,
+                ).update(reservado=True)
+            yield
+            if anterior is not None and anterior != (bloque.pk, fecha, hora_inicio, hora_fin):
+                recalcular(*anterior)
+    except IntegrityError as e:
+        if 'cita_sin_solapamiento' in str(e):
+            raise TurnoNoDisponible('El médico ya tiene una cita en ese horario.')
+        raise
+
+
+def cancelar(cita, motivo=''):
+    """Baja lógica de la cita; devuelve su lugar en el cupo del bloque"""
+    with transaction.atomic():
+        # Condicionado al estado guardado: dos bajas simultáneas liberan un solo lugar
+        if Cita_Medica.objects.filter(pk=cita.pk, estado=True).update(estado=False):
+            _liberar(cita.bloque_horario_id, cita.fecha)
+            recalcular(cita.bloque_horario_id, cita.fecha, cita.hora_inicio, cita.hora_fin)
+        cita.estado = False
+        if motivo:
+            cita.motivo_cancelacion = motivo
+        cita.save()
+
+
+def superpuestas():
+    """
+    Citas activas que se superponen con otra del mismo bloque y día, como pares
+    (id de la cita, id de la más antigua con la que choca), en orden de id. Sin las
+    primeras, las citas entran en la restricción de la migración 0002. Solo lee
+    columnas de la migración 0001, así que sirve también antes de migrar.
+    """
+    # Una cita con el fin antes del inicio no choca con nada (ver la migración 0002)
+    activas = Cita_Medica.objects.filter(estado=True, hora_fin__gt=F('hora_inicio'))
+    candidatas = activas.filter(Exists(
+        activas.filter(
+            bloque_horario=OuterRef('bloque_horario'), fecha=OuterRef('fecha'),
+            hora_inicio__lt=OuterRef('hora_fin'), hora_fin__gt=OuterRef('hora_inicio'),
+        ).exclude(pk=OuterRef('pk'))
+    )).order_by('pk').values_list('pk', 'bloque_horario_id', 'fecha', 'hora_inicio', 'hora_fin')
+    conservadas = defaultdict(list)
+    pares = []
+    for pk, bloque_id, fecha, inicio, fin in candidatas.iterator():
+        turnos = conservadas[(bloque_id, fecha)]
+        choque = next((otra for otra, i, f in turnos if i < fin and inicio < f), None)
+        if choque is None:
+            turnos.append((pk, inicio, fin))
+        else:
+            pares.append((pk, choque))
+    return pares
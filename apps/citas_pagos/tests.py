@@ -1,3 +1,273 @@
-from django.test import TestCase
+import datetime
+from io import StringIO
+from unittest import skipIf
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import crear_clinica, crear_roles
+from apps.cuentas.models import CorreoSaliente, Usuario
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+from .models import Cita_Medica, OcupacionBloque, Turno
+from .recordatorios import encolar_recordatorios
+from .reservas import TurnoNoDisponible, cancelar, reserva_turno, superpuestas
+from .turnos import generar_turnos
+
+PRUEBAS = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    HASHING_PASSWORDS={'MODO': 'local'},
+    BITACORA={'MODO': 'sincrono'},
+)
+
+
+def hora(texto):
+    return datetime.time.fromisoformat(texto)
+
+
+class ClinicaMixin:
+    """Una clínica con un médico, su bloque de los lunes (8 a 10, turnos de 30 minutos) y un paciente"""
+
+    def setUp(self):
+        self.roles = crear_roles()
+        self.grupo, token = crear_clinica('Clinica Uno', self.roles)
+        self.admin = APIClient()
+        self.admin.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        medico = Medico.objects.create(
+            grupo=self.grupo, rol=self.roles['medico'], nombre='Medico', correo='medico@uno.test',
+            sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado='uno-1',
+        )
+        self.bloque = Bloque_Horario.objects.create(
+            grupo=self.grupo, medico=medico, dia_semana='LUNES', hora_inicio=hora('08:00'),
+            hora_fin=hora('10:00'), duracion_cita_minutos=30, max_citas_por_bloque=3,
+        )
+        usuario = Usuario.objects.create(
+            grupo=self.grupo, rol=self.roles['paciente'], nombre='Paciente', correo='paciente@uno.test',
+            sexo='M', fecha_nacimiento='1990-01-01',
+        )
+        self.paciente = Paciente.objects.create(usuario=usuario, numero_historia_clinica='HC-1')
+        hoy = timezone.localdate()
+        self.lunes = hoy + datetime.timedelta(days=7 - hoy.weekday())
+        generar_turnos()
+
+    def reservar(self, inicio, fin, fecha=None):
+        fecha = fecha or self.lunes
+        with reserva_turno(self.bloque, fecha, inicio, fin):
+            return Cita_Medica.objects.create(
+                grupo=self.grupo, paciente=self.paciente, bloque_horario=self.bloque,
+                fecha=fecha, hora_inicio=hora(inicio), hora_fin=hora(fin),
+            )
+
+    def ocupacion(self, fecha=None):
+        fila = OcupacionBloque.objects.filter(bloque_horario=self.bloque, fecha=fecha or self.lunes).first()
+        return fila.citas if fila else 0
+
+    def reservados(self):
+        return list(
+            Turno.objects.filter(bloque_horario=self.bloque, fecha=self.lunes, reservado=True)
+            .values_list('hora_inicio', flat=True)
+        )
+
+
+@PRUEBAS
+class ReservaTurnoTests(ClinicaMixin, TestCase):
+
+    def test_reserva_cuenta_y_toma_el_turno(self):
+        self.reservar('08:00', '08:30')
+        self.assertEqual(self.ocupacion(), 1)
+        self.assertEqual(self.reservados(), [hora('08:00')])
+
+    def test_turno_superpuesto(self):
+        self.reservar('08:00', '08:30')
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar('08:00', '08:30')
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar('08:15', '08:45')
+        self.assertEqual(self.ocupacion(), 1)
+        self.assertEqual(Cita_Medica.objects.count(), 1)
+
+    def test_cupo_del_bloque(self):
+        for inicio, fin in (('08:00', '08:30'), ('08:30', '09:00'), ('09:00', '09:30')):
+            self.reservar(inicio, fin)
+        with self.assertRaisesMessage(TurnoNoDisponible, 'cupos'):
+            self.reservar('09:30', '10:00')
+        self.assertEqual(self.ocupacion(), 3)
+
+    def test_fuera_del_bloque(self):
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar('08:00', '08:30', fecha=self.lunes + datetime.timedelta(days=1))
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar('09:45', '10:15')
+        self.assertEqual(OcupacionBloque.objects.count(), 0)
+
+    def test_horario_sin_turno_generado(self):
+        # Fuera de la grilla de turnos: se compara contra las citas del bloque
+        self.reservar('08:10', '08:40')
+        self.assertEqual(self.reservados(), [hora('08:00'), hora('08:30')])
+        with self.assertRaises(TurnoNoDisponible):
+            self.reservar('08:30', '09:00')
+
+    def test_cambio_de_horario(self):
+        cita = self.reservar('08:00', '08:30')
+        with reserva_turno(self.bloque, self.lunes, '09:00', '09:30', cita=cita):
+            cita.hora_inicio, cita.hora_fin = hora('09:00'), hora('09:30')
+            cita.save()
+        self.assertEqual(self.ocupacion(), 1)
+        self.assertEqual(self.reservados(), [hora('09:00')])
+
+    def test_cancelar_libera_cupo_y_turno(self):
+        cita = self.reservar('08:00', '08:30')
+        cancelar(cita, 'No puede asistir')
+        cancelar(cita)
+        cita.refresh_from_db()
+        self.assertEqual((cita.estado, cita.motivo_cancelacion), (False, 'No puede asistir'))
+        self.assertEqual(self.ocupacion(), 0)
+        self.assertEqual(self.reservados(), [])
+        self.reservar('08:00', '08:30')
+
+
+@PRUEBAS
+class GenerarTurnosTests(ClinicaMixin, TestCase):
+
+    def turnos(self):
+        return list(
+            Turno.objects.filter(bloque_horario=self.bloque, fecha=self.lunes).order_by('hora_inicio')
+            .values_list('hora_inicio', 'hora_fin', 'reservado')
+        )
+
+    def generar(self):
+        return generar_turnos(Bloque_Horario.objects.filter(pk=self.bloque.pk))
+
+    def test_sin_cambios(self):
+        self.assertEqual(len(self.turnos()), 4)
+        self.assertEqual(self.generar(), {'creados': 0, 'borrados': 0})
+
+    def test_editar_bloque_borra_solo_los_libres(self):
+        self.reservar('08:00', '08:30')
+        Bloque_Horario.objects.filter(pk=self.bloque.pk).update(duracion_cita_minutos=60)
+        self.generar()
+        # El reservado sigue y ocupa el inicio del turno de 60 minutos de las 8:00
+        self.assertEqual(self.turnos(), [
+            (hora('08:00'), hora('08:30'), True),
+            (hora('09:00'), hora('10:00'), False),
+        ])
+
+    def test_bloque_desactivado(self):
+        self.reservar('09:00', '09:30')
+        Bloque_Horario.objects.filter(pk=self.bloque.pk).update(estado=False)
+        self.generar()
+        self.assertEqual(self.turnos(), [(hora('09:00'), hora('09:30'), True)])
+
+    def test_turnos_nuevos_sobre_citas_nacen_reservados(self):
+        Turno.objects.all().delete()
+        # Guardada sin reserva y fuera de la grilla: pisa dos turnos
+        Cita_Medica.objects.create(
+            grupo=self.grupo, paciente=self.paciente, bloque_horario=self.bloque,
+            fecha=self.lunes, hora_inicio=hora('08:15'), hora_fin=hora('08:45'),
+        )
+        self.generar()
+        self.assertEqual([reservado for _, _, reservado in self.turnos()], [True, True, False, False])
+
+
+@PRUEBAS
+@skipIf(connection.vendor == 'postgresql', 'la restricción de exclusión no deja guardar citas superpuestas')
+class CitasSuperpuestasTests(ClinicaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Guardadas por fuera de la reserva, como antes de la migración 0002
+        self.citas = [
+            Cita_Medica.objects.create(
+                grupo=self.grupo, paciente=self.paciente, bloque_horario=self.bloque,
+                fecha=self.lunes, hora_inicio=hora(inicio), hora_fin=hora(fin),
+            ).pk
+            for inicio, fin in (('08:00', '08:30'), ('08:15', '08:45'), ('08:30', '09:00'))
+        ]
+        OcupacionBloque.objects.create(grupo=self.grupo, bloque_horario=self.bloque, fecha=self.lunes, citas=3)
+
+    def test_lista_sin_cancelar(self):
+        uno, dos, tres = self.citas
+        self.assertEqual(superpuestas(), [(dos, uno)])
+        call_command('resolver_citas_superpuestas', stdout=StringIO())
+        self.assertEqual(Cita_Medica.objects.filter(estado=True).count(), 3)
+
+    def test_cancelar_avisa_al_paciente(self):
+        call_command('resolver_citas_superpuestas', cancelar=True, stdout=StringIO())
+        self.assertFalse(Cita_Medica.objects.get(pk=self.citas[1]).estado)
+        self.assertEqual(superpuestas(), [])
+        self.assertEqual(self.ocupacion(), 2)
+        self.assertEqual(CorreoSaliente.objects.get().destinatarios, ['paciente@uno.test'])
+
+
+@PRUEBAS
+class CitaMedicaViewSetTests(ClinicaMixin, TestCase):
+    url = '/api/citas/citas-medicas/'
+
+    def crear(self, inicio, fin):
+        return self.admin.post(self.url, {
+            'paciente': self.paciente.pk, 'bloque_horario': self.bloque.pk,
+            'fecha': self.lunes.isoformat(), 'hora_inicio': inicio, 'hora_fin': fin,
+        }, format='json')
+
+    def test_crear_y_rechazar_superpuesta(self):
+        self.assertEqual(self.crear('08:00', '08:30').status_code, 201)
+        respuesta = self.crear('08:00', '08:30')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('error', respuesta.data)
+
+    def test_solo_la_propia_clinica(self):
+        self.assertEqual(self.crear('08:00', '08:30').status_code, 201)
+        self.assertEqual(len(self.admin.get(self.url).data['results']), 1)
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+        _, token = crear_clinica('Clinica Dos', self.roles)
+        otra = APIClient()
+        otra.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(otra.get(self.url).data['results'], [])
+
+    def test_editar_cita_cancelada_no_reserva(self):
+        pk = self.crear('08:00', '08:30').data['id']
+        self.assertEqual(self.admin.delete(f'{self.url}{pk}/').status_code, 204)
+        for _ in range(2):
+            respuesta = self.admin.patch(f'{self.url}{pk}/', {'notas': 'Reprogramar', 'hora_inicio': '09:00',
+                                                              'hora_fin': '09:30'}, format='json')
+            self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.ocupacion(), 0)
+        self.assertEqual(self.reservados(), [])
+        # Al restaurarla sí toma el turno (el nuevo horario)
+        self.assertEqual(self.admin.post(f'{self.url}{pk}/restaurar/').status_code, 200)
+        self.assertEqual(self.ocupacion(), 1)
+        self.assertEqual(self.reservados(), [hora('09:00')])
+
+    def test_restaurar_turno_ya_tomado(self):
+        pk = self.crear('08:00', '08:30').data['id']
+        self.admin.delete(f'{self.url}{pk}/')
+        self.assertEqual(self.crear('08:00', '08:30').status_code, 201)
+        self.assertEqual(self.admin.post(f'{self.url}{pk}/restaurar/').status_code, 400)
+        self.assertEqual(self.ocupacion(), 1)
+
+
+@PRUEBAS
+@override_settings(RECORDATORIOS={'ZONA_HORARIA': 'America/La_Paz'})
+class RecordatoriosTests(ClinicaMixin, TestCase):
+    """La clínica está en UTC-4: las 8:00 de la cita son las 12:00 UTC"""
+
+    def ahora(self, texto):
+        local = datetime.datetime.combine(self.lunes, hora(texto))
+        return timezone.make_aware(local, datetime.timezone(datetime.timedelta(hours=-4)))
+
+    def test_recordatorios_en_hora_de_la_clinica(self):
+        cita = self.reservar('08:00', '08:30')
+        # 3 horas antes en la clínica (en UTC, la cita ya habría pasado)
+        resultado = encolar_recordatorios(ahora=self.ahora('05:00'))
+        self.assertEqual(resultado['recordatorio_24h']['citas'], 1)
+        self.assertEqual(resultado['recordatorio_2h']['citas'], 0)
+        self.assertEqual(CorreoSaliente.objects.get().asunto, 'Recordatorio: tu cita médica es hoy a las 08:00')
+
+        self.assertEqual(encolar_recordatorios(ahora=self.ahora('05:59'))['recordatorio_2h']['citas'], 0)
+        self.assertEqual(encolar_recordatorios(ahora=self.ahora('06:00'))['recordatorio_2h']['citas'], 1)
+        cita.refresh_from_db()
+        self.assertEqual(cita.recordatorio_2h, self.ahora('06:00'))
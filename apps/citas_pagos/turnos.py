@@ -0,0 +1,118 @@
+"""
+Turnos concretos (tabla Turno) generados a partir de los bloques horarios semanales.
+
+Un Bloque_Horario es una plantilla que se repite cada semana; para reservar había
+que volver a calcular el calendario en cada request. generar_turnos guarda los
+turnos de los próximos HORIZONTE_DIAS días (los que caben enteros en el bloque,
+como en doctores.disponibilidad) y reservar uno pasa a ser un UPDATE condicionado
+sobre su fila (ver reservas.reserva_turno).
+
+La generación es incremental: compara los turnos esperados con los guardados y
+solo crea los que faltan y borra los libres que ya no corresponden (bloque editado,
+desactivado o médico inactivo). Los turnos reservados no se tocan aunque el bloque
+haya cambiado: la cita sigue en pie.
+
+Se mantiene que todo turno superpuesto con una cita activa de su bloque esté
+reservado: las reservas lo marcan al guardar la cita, las cancelaciones lo
+recalculan y los turnos recién generados se marcan contra las citas existentes.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apps.doctores.disponibilidad import DIAS_SEMANA, fechas, minutos
+from apps.doctores.models import Bloque_Horario
+
+from .models import Cita_Medica, Turno
+
+HORIZONTE_DIAS = 90
+LOTE = 1000
+
+
+def _hora(minuto):
+    return datetime.time(minuto // 60, minuto % 60)
+
+
+def con_cita():
+    """Para filtrar o actualizar turnos: hay una cita activa del bloque que se superpone"""
+    return Exists(Cita_Medica.objects.filter(
+        bloque_horario=OuterRef('bloque_horario'), fecha=OuterRef('fecha'), estado=True,
+        hora_inicio__lt=OuterRef('hora_fin'), hora_fin__gt=OuterRef('hora_inicio'),
+    ))
+
+
+def recalcular(bloque_id, fecha, hora_inicio, hora_fin):
+    """Marca como reservados o libres los turnos del intervalo según las citas activas"""
+    Turno.objects.filter(
+        bloque_horario_id=bloque_id, fecha=fecha, hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio,
+    ).update(reservado=con_cita())
+
+
+def turnos_esperados(bloques, desde, hasta):
+    """
+    {(bloque_id, fecha, inicio): (grupo_id, fin)} a partir de filas
+    (id, grupo_id, dia_semana, hora_inicio, hora_fin, duracion_cita_minutos)
+    """
+    por_dia = defaultdict(list)
+    for bloque in bloques:
+        por_dia[bloque[2]].append(bloque)
+    esperados = {}
+    for fecha in fechas(desde, hasta):
+        for bloque_id, grupo_id, _, inicio, fin, duracion in por_dia[DIAS_SEMANA[fecha.weekday()]]:
+            if not duracion:
+                continue
+            for t in range(minutos(inicio), minutos(fin) - duracion + 1, duracion):
+                esperados[(bloque_id, fecha, _hora(t))] = (grupo_id, _hora(t + duracion))
+    return esperados
+
+
+def generar_turnos(bloques=None, desde=None, hasta=None, lote=LOTE):
+    """
+    Pone al día los turnos de `bloques` (queryset; todos si es None) entre `desde`
+    (hoy) y `hasta` (hoy + HORIZONTE_DIAS - 1). Con todos los bloques también borra
+    los turnos libres anteriores a `desde`. Devuelve {'creados', 'borrados'}.
+    """
+    desde = desde or timezone.localdate()
+    hasta = hasta or desde + datetime.timedelta(days=HORIZONTE_DIAS - 1)
+    existentes = Turno.objects.filter(fecha__range=(desde, hasta))
+    todos = bloques is None
+    if todos:
+        bloques = Bloque_Horario.objects.all()
+    else:
+        existentes = existentes.filter(bloque_horario__in=bloques.values('pk'))
+    activos = (
+        bloques.filter(estado=True, medico__estado=True).order_by()
+        .values_list('id', 'grupo_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'duracion_cita_minutos')
+    )
+    esperados = turnos_esperados(activos, desde, hasta)
+
+    sobrantes = []
+    for pk, bloque_id, fecha, inicio, fin, reservado in existentes.order_by().values_list(
+        'id', 'bloque_horario_id', 'fecha', 'hora_inicio', 'hora_fin', 'reservado',
+    ):
+        clave = (bloque_id, fecha, inicio)
+        if clave in esperados and esperados[clave][1] == fin:
+            del esperados[clave]
+        elif reservado:
+            # Ya no corresponde al bloque pero tiene una cita: se conserva (y ocupa su inicio)
+            esperados.pop(clave, None)
+        else:
+            sobrantes.append(pk)
+
+    with transaction.atomic():
+        for i in range(0, len(sobrantes), lote):
+            Turno.objects.filter(pk__in=sobrantes[i:i + lote]).delete()
+        Turno.objects.bulk_create([
+            Turno(grupo_id=grupo_id, bloque_horario_id=bloque_id, fecha=fecha, hora_inicio=inicio, hora_fin=fin)
+            for (bloque_id, fecha, inicio), (grupo_id, fin) in esperados.items()
+        ], batch_size=lote)
+        if esperados:
+            # Los turnos nuevos que se superponen con citas ya guardadas nacen reservados
+            existentes.filter(reservado=False).filter(con_cita()).update(reservado=True)
+        borrados = len(sobrantes)
+        if todos:
+            borrados += Turno.objects.filter(fecha__lt=desde, reservado=False).delete()[0]
+    return {'creados': len(esperados), 'borrados': borrados}
@@ -1,99 +1,97 @@
-def get_dia_semana_es(fecha):
-    dias_map = {
-        'MONDAY': 'LUNES',
-        'TUESDAY': 'MARTES',
-        'WEDNESDAY': 'MIERCOLES',
-        'THURSDAY': 'JUEVES',
-        'FRIDAY': 'VIERNES',
-        'SATURDAY': 'SABADO',
-        'SUNDAY': 'DOMINGO',
-    }
-    import datetime
-    dia_en = datetime.datetime.strptime(fecha, '%Y-%m-%d').strftime('%A').upper()
-    return dias_map.get(dia_en)
-from datetime import datetime
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework import permissions
+from apps.cuentas.proyecciones import ProyeccionMixin
+from apps.cuentas.tenant import MultiTenantMixin
+from .filtros import filtrar_citas
 from .models import *
+from .pagination import CitaMedicaPagination
+from .reservas import TurnoNoDisponible, cancelar, reserva_turno
 from .serializers import *
-class CitaMedicaViewSet(viewsets.ModelViewSet):
-
-    def get_dia_semana_es(fecha):
-        dias_map = {
-        'MONDAY': 'LUNES',
-        'TUESDAY': 'MARTES',
-        'WEDNESDAY': 'MIERCOLES',
-        'THURSDAY': 'JUEVES',
-        'FRIDAY': 'VIERNES',
-        'SATURDAY': 'SABADO',
-        'SUNDAY': 'DOMINGO',
-        }
-        dia_en = datetime.strptime(fecha, '%Y-%m-%d').strftime('%A').upper()
-        return dias_map.get(dia_en)
+class CitaMedicaViewSet(ProyeccionMixin, MultiTenantMixin, viewsets.ModelViewSet):
 
     queryset = Cita_Medica.objects.all()
     serializer_class = CitaMedicaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    # Cursor sobre (fecha, hora_inicio, id): la agenda de cualquier día cuesta lo mismo
+    pagination_class = CitaMedicaPagination
 
     def create(self, request, *args, **kwargs):
-        data = request.data
-        bloque_id = data.get('bloque_horario')
-        fecha = data.get('fecha')
-        hora_inicio = data.get('hora_inicio')
-        hora_fin = data.get('hora_fin')
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_create(serializer)
+        except TurnoNoDisponible as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
-        # Validar bloque horario
+    def update(self, request, *args, **kwargs):
         try:
-            bloque = Bloque_Horario.objects.get(id=bloque_id)
-        except Bloque_Horario.DoesNotExist:
-            return Response({'error': 'Bloque horario no existe.'}, status=status.HTTP_400_BAD_REQUEST)
+            return super().update(request, *args, **kwargs)
+        except TurnoNoDisponible as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validar día de la semana (simplificado)
-        dia_es = get_dia_semana_es(fecha)
-        if bloque.dia_semana != dia_es:
-            return Response({'error': f'La fecha corresponde a {dia_es}, pero el bloque es para {bloque.dia_semana}.'}, status=status.HTTP_400_BAD_REQUEST)
+    def bloque_de(self, datos, cita=None):
+        """Bloque horario de la cita, que tiene que ser de la clínica del usuario"""
+        bloque = datos.get('bloque_horario') or cita.bloque_horario
+        tenant = self.get_tenant()
+        if not tenant.is_super_admin and bloque.grupo_id != tenant.grupo_id:
+            raise TurnoNoDisponible('Bloque horario no existe.')
+        return bloque
 
-        # Validar rango de hora
-        if not (str(bloque.hora_inicio) <= hora_inicio < str(bloque.hora_fin) and str(bloque.hora_inicio) < hora_fin <= str(bloque.hora_fin)):
-            return Response({'error': 'La hora de la cita está fuera del rango del bloque horario.'}, status=status.HTTP_400_BAD_REQUEST)
+    def perform_create(self, serializer):
+        datos = serializer.validated_data
+        bloque = self.bloque_de(datos)
+        with reserva_turno(bloque, datos['fecha'], datos['hora_inicio'], datos['hora_fin']):
+            serializer.save(grupo_id=bloque.grupo_id)
 
-        # Validar disponibilidad (no solapamiento)
-        citas_existentes = Cita_Medica.objects.filter(
-            bloque_horario=bloque,
-            fecha=fecha,
-            hora_inicio__lt=hora_fin,
-            hora_fin__gt=hora_inicio
-        )
-        if citas_existentes.exists():
-            return Response({'error': 'El médico ya tiene una cita en ese horario.'}, status=status.HTTP_400_BAD_REQUEST)
+    def perform_update(self, serializer):
+        cita, datos = serializer.instance, serializer.validated_data
+        bloque = self.bloque_de(datos, cita)
+        if not cita.estado:
+            # Una cita cancelada no ocupa cupo ni turno: el turno se reserva recién al restaurarla
+            serializer.save(grupo_id=bloque.grupo_id)
+            return
+        turno = [datos.get(campo, getattr(cita, campo)) for campo in ('fecha', 'hora_inicio', 'hora_fin')]
+        extra = {}
+        if (turno[0], turno[1]) != (cita.fecha, cita.hora_inicio):
+            # Cambió el comienzo: los recordatorios se envían de nuevo para el horario nuevo
+            extra = {'recordatorio_24h': None, 'recordatorio_2h': None}
+        with reserva_turno(bloque, *turno, cita=cita):
+            serializer.save(grupo_id=bloque.grupo_id, **extra)
 
-        return super().create(request, *args, **kwargs)
-        
     def get_queryset(self):
-        # Por defecto, solo pacientes cuyo usuario está activo
+        # El listado muestra solo las citas activas de la clínica, con los filtros de filtros.py
+        queryset = self.filter_by_grupo(Cita_Medica.objects.all())
         if self.action == 'list':
-            return Cita_Medica.objects.filter(estado=True)
-        return Cita_Medica.objects.all()
+            return filtrar_citas(queryset.filter(estado=True), self.request.query_params)
+        return queryset
 
     def perform_destroy(self, instance):
-        # Soft delete: cambia estado del usuario a False
-        instance.cita.estado = False
-        instance.cita.save()
+        # Soft delete: la cita queda cancelada y libera su cupo en el bloque
+        cancelar(instance)
 
     @action(detail=False, methods=['get'])
     def eliminadas(self, request):
         # Pacientes cuyo usuario está inactivo
-        eliminadas = Cita_Medica.objects.filter(estado=False)
+        eliminadas = self.filter_by_grupo(Cita_Medica.objects.all()).filter(estado=False)
         serializer = self.get_serializer(eliminadas, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def restaurar(self, request, pk=None):
         cita = self.get_object()
-        cita.estado = True
-        cita.save()
+        if not cita.estado:
+            # El turno pudo haberse reservado mientras la cita estaba cancelada
+            try:
+                with reserva_turno(cita.bloque_horario, cita.fecha, cita.hora_inicio, cita.hora_fin, cita=cita):
+                    cita.estado = True
+                    cita.save()
+            except TurnoNoDisponible as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(cita)
         return Response(serializer.data, status=status.HTTP_200_OK)
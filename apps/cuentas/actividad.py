@@ -0,0 +1,184 @@
+"""
+Resúmenes de actividad de la bitácora para los gráficos de los administradores.
+
+ActividadDiaria cuenta registros por (grupo, actor, día, tipo) y ActividadHoraria
+por (grupo, hora, tipo). Los gráficos leen estas tablas, que crecen con los días
+y no con la cantidad de registros: un GROUP BY sobre la bitácora cruda cuesta
+más cada mes.
+
+Se mantienen de forma incremental: el escritor de la bitácora (auditoria.py)
+llama a sumar_registros con cada lote que guarda, y eso es un upsert por
+combinación distinta del lote (INSERT ... ON CONFLICT DO UPDATE SET
+cantidad = cantidad + excluded.cantidad, en PostgreSQL y SQLite).
+Los registros que se insertan por otro camino (cargas masivas, datos
+anteriores) se recuperan con `reconstruir_actividad`, que recalcula un rango
+de días por tramos.
+
+Los días y las horas son los de la zona horaria vigente (settings.TIME_ZONE).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import archivo
+from .filtros import inicio_del_dia
+from .models import ActividadDiaria, ActividadHoraria, Bitacora, Usuario
+
+
+DIAS_POR_DEFECTO = 30
+MAX_DIAS = 366
+
+
+def rango_dias(params):
+    """
+    Días [desde, hasta] pedidos con ?start=&end= (YYYY-MM-DD); por defecto los
+    últimos 30. ValueError si las fechas no son válidas o el rango es muy largo.
+    """
+    hoy = timezone.localdate()
+    try:
+        hasta = parse_date(params['end']) if params.get('end') else hoy
+        desde = parse_date(params['start']) if params.get('start') else hasta - timedelta(days=DIAS_POR_DEFECTO - 1)
+    except ValueError:
+        desde = hasta = None
+    if desde is None or hasta is None:
+        raise ValueError('start y end deben ser fechas YYYY-MM-DD')
+    if desde > hasta:
+        raise ValueError('start no puede ser posterior a end')
+    if (hasta - desde).days >= MAX_DIAS:
+        raise ValueError(f'El rango no puede superar {MAX_DIAS} días')
+    return desde, hasta
+
+
+def _hora(momento):
+    return timezone.localtime(momento).replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(modelo, columnas, conflicto, filas):
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    nombres = ', '.join(connection.ops.quote_name(c) for c in columnas)
+    sql = (
+        f"INSERT INTO {tabla} ({nombres}) VALUES ({', '.join(['%s'] * len(columnas))}) "
+        f"ON CONFLICT ({', '.join(connection.ops.quote_name(c) for c in conflicto)}) "
+        f"DO UPDATE SET cantidad = {tabla}.cantidad + excluded.cantidad"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, filas)
+
+
+def sumar_registros(registros):
+    """
+    Suma al resumen los registros recién guardados (dicts como los de
+    auditoria.armar_registro). Los que no tienen grupo no entran en el resumen.
+    """
+    por_dia, por_hora = Counter(), Counter()
+    for registro in registros:
+        grupo_id = registro.get('grupo_id')
+        if grupo_id is None:
+            continue
+        momento = registro['timestamp']
+        tipo = registro.get('tipo') or 'OTRO'
+        por_dia[grupo_id, registro.get('usuario_id') or 0, timezone.localdate(momento), tipo] += 1
+        por_hora[grupo_id, _hora(momento), tipo] += 1
+    if not por_dia:
+        return
+
+    ops = connection.ops
+    with transaction.atomic():
+        _upsert(
+            ActividadDiaria, ['grupo_id', 'actor', 'dia', 'tipo', 'cantidad'], ['grupo_id', 'actor', 'dia', 'tipo'],
+            [(g, a, ops.adapt_datefield_value(d), t, n) for (g, a, d, t), n in por_dia.items()],
+        )
+        _upsert(
+            ActividadHoraria, ['grupo_id', 'hora', 'tipo', 'cantidad'], ['grupo_id', 'tipo', 'hora'],
+            [(g, ops.adapt_datetimefield_value(h), t, n) for (g, h, t), n in por_hora.items()],
+        )
+
+
+def reconstruir(desde, hasta, dias_por_tramo=7):
+    """
+    Recalcula el resumen de los días [desde, hasta] a partir de la bitácora, de a
+    `dias_por_tramo` días por transacción. Los días ya archivados no se tocan (sus
+    registros ya no están en la base). Devuelve (desde, hasta, registros) por tramo.
+    """
+    limite = archivo.horizonte()
+    if limite is not None:
+        desde = max(desde, timezone.localdate(limite))
+    resultado = []
+    dia = desde
+    while dia <= hasta:
+        fin = min(dia + timedelta(days=dias_por_tramo - 1), hasta)
+        inicio_t, fin_t = inicio_del_dia(dia), inicio_del_dia(fin + timedelta(days=1))
+        registros = Bitacora.objects.filter(
+            timestamp__gte=inicio_t, timestamp__lt=fin_t, grupo__isnull=False,
+        ).order_by()
+        with transaction.atomic():
+            ActividadDiaria.objects.filter(dia__gte=dia, dia__lte=fin).delete()
+            ActividadHoraria.objects.filter(hora__gte=inicio_t, hora__lt=fin_t).delete()
+            diarios = (
+                registros.annotate(d=TruncDate('timestamp'))
+                .values('grupo_id', 'usuario_id', 'd', 'tipo').annotate(n=Count('id'))
+            )
+            ActividadDiaria.objects.bulk_create(
+                (ActividadDiaria(grupo_id=f['grupo_id'], actor=f['usuario_id'] or 0, dia=f['d'],
+                                 tipo=f['tipo'], cantidad=f['n']) for f in diarios.iterator()),
+                batch_size=1000,
+            )
+            horarios = (
+                registros.annotate(h=TruncHour('timestamp'))
+                .values('grupo_id', 'h', 'tipo').annotate(n=Count('id'))
+            )
+            ActividadHoraria.objects.bulk_create(
+                (ActividadHoraria(grupo_id=f['grupo_id'], hora=f['h'], tipo=f['tipo'], cantidad=f['n'])
+                 for f in horarios.iterator()),
+                batch_size=1000,
+            )
+        resultado.append((dia, fin, registros.count()))
+        dia = fin + timedelta(days=1)
+    return resultado
+
+
+def acciones_por_dia(queryset, desde, hasta, tipo=None):
+    """
+    Acciones por día y por actor en [desde, hasta], con el desglose por tipo.
+    `queryset` es ActividadDiaria ya filtrado por el alcance del request.
+    """
+    filas = queryset.filter(dia__gte=desde, dia__lte=hasta)
+    if tipo:
+        filas = filas.filter(tipo=tipo)
+    filas = (
+        filas.values('grupo_id', 'dia', 'actor', 'tipo')
+        .annotate(cantidad=Sum('cantidad'))
+        .order_by('dia', 'grupo_id', 'actor', 'tipo')
+    )
+    series = {}
+    for fila in filas:
+        clave = (fila['dia'], fila['grupo_id'], fila['actor'])
+        serie = series.setdefault(clave, {
+            'dia': fila['dia'], 'grupo_id': fila['grupo_id'], 'usuario_id': fila['actor'] or None,
+            'total': 0, 'por_tipo': {},
+        })
+        serie['total'] += fila['cantidad']
+        serie['por_tipo'][fila['tipo']] = fila['cantidad']
+    nombres = dict(
+        Usuario.objects.filter(pk__in={s['usuario_id'] for s in series.values() if s['usuario_id']})
+        .values_list('pk', 'nombre')
+    )
+    for serie in series.values():
+        serie['usuario'] = nombres.get(serie['usuario_id'])
+    return list(series.values())
+
+
+def acciones_por_hora(queryset, desde, hasta, tipo='LOGIN'):
+    """Cantidad de acciones de `tipo` por hora en los días [desde, hasta]"""
+    filas = (
+        queryset.filter(
+            tipo=tipo, hora__gte=inicio_del_dia(desde), hora__lt=inicio_del_dia(hasta + timedelta(days=1)),
+        )
+        .values('hora').annotate(cantidad=Sum('cantidad')).order_by('hora')
+    )
+    return [{'hora': timezone.localtime(f['hora']), 'cantidad': f['cantidad']} for f in filas]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AcountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.cuentas'
+
+    def ready(self):
+        from .tenant import registrar_rutas_tenant
+        registrar_rutas_tenant()
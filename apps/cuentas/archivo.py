@@ -0,0 +1,245 @@
+"""
+Archivo de la bitácora.
+
+Los meses completos que pasan la retención (BITACORA['RETENCION_MESES']) salen
+de la base a segmentos NDJSON comprimidos en BITACORA['DIRECTORIO_ARCHIVO'].
+Cada segmento son dos archivos:
+
+    2025-01.1.ndjson.gz     registros del mes ordenados por (grupo, timestamp, id);
+                            cada grupo es un miembro gzip independiente
+    2025-01.1.indice.json   rango del segmento y, por grupo, offset y bytes de su
+                            miembro, cantidad de filas y primer/último timestamp
+
+Leer la bitácora de una clínica en un mes archivado descomprime solo su miembro.
+El índice se escribe al final: un segmento sin índice no existe para los
+lectores, y las filas se borran de la base recién cuando el índice quedó en disco.
+Si un mes se archiva en varias pasadas (filas que llegaron tarde) tiene varios
+segmentos: 2025-01.1, 2025-01.2, ...
+"""
+import gzip
+import io
+import json
+import os
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .auditoria import config_bitacora
+from .models import Bitacora, Grupo, Usuario
+from .particiones import eliminar_particion, inicio_de_mes, particion_del_mes, sumar_meses
+
+CAMPOS = [
+    'id', 'grupo_id', 'grupo__nombre', 'usuario_id', 'usuario__nombre', 'tipo',
+    'accion', 'ip', 'objeto', 'entidad', 'extra', 'timestamp',
+]
+
+_cache_segmentos = {}
+
+
+def directorio():
+    return Path(config_bitacora()['DIRECTORIO_ARCHIVO'])
+
+
+def segmentos():
+    """Índices de los segmentos archivados, del mes más antiguo al más reciente"""
+    carpeta = directorio()
+    try:
+        version = carpeta.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+    cache = _cache_segmentos.get(carpeta)
+    if cache is None or cache[0] != version:
+        indices = []
+        for ruta in carpeta.glob('*.indice.json'):
+            with open(ruta) as f:
+                indice = json.load(f)
+            indice['desde'] = parse_datetime(indice['desde'])
+            indice['hasta'] = parse_datetime(indice['hasta'])
+            indices.append(indice)
+        indices.sort(key=lambda i: (i['desde'], i['parte']))
+        cache = _cache_segmentos[carpeta] = (version, indices)
+    return cache[1]
+
+
+def horizonte():
+    """Fin del mes archivado más reciente (lo anterior ya no está en la base), o None"""
+    indices = segmentos()
+    return max(i['hasta'] for i in indices) if indices else None
+
+
+def _escribir_atomico(ruta, escribir):
+    temporal = ruta.with_name(ruta.name + '.tmp')
+    with open(temporal, 'wb') as f:
+        escribir(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+
+def escribir_segmento(desde, hasta, tamano_lote=2000):
+    """
+    Escribe los registros de [desde, hasta) en un segmento nuevo y devuelve su índice
+    (None si no hay registros). Lee con iterator(): en PostgreSQL es un cursor del
+    servidor y la memoria no depende del tamaño del mes.
+    """
+    carpeta = directorio()
+    carpeta.mkdir(parents=True, exist_ok=True)
+    mes = f'{desde.year:04d}-{desde.month:02d}'
+    parte = 1 + sum(1 for i in segmentos() if i['mes'] == mes)
+    nombre = f'{mes}.{parte}'
+    indice = {
+        'mes': mes, 'parte': parte, 'archivo': f'{nombre}.ndjson.gz',
+        'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'filas': 0, 'ultimo_id': 0, 'grupos': {},
+    }
+    registros = (
+        Bitacora.objects
+        .filter(timestamp__gte=desde, timestamp__lt=hasta)
+        .order_by('grupo_id', 'timestamp', 'id')
+        .values(*CAMPOS)
+    )
+
+    def escribir(f):
+        miembro, grupo_actual, datos = None, object(), None
+        for registro in registros.iterator(chunk_size=tamano_lote):
+            if registro['grupo_id'] != grupo_actual:
+                if miembro is not None:
+                    miembro.close()
+                    datos['bytes'] = f.tell() - datos['offset']
+                grupo_actual = registro['grupo_id']
+                datos = indice['grupos'][str(grupo_actual)] = {
+                    'offset': f.tell(), 'filas': 0, 'desde': registro['timestamp'].isoformat(),
+                }
+                miembro = gzip.GzipFile(fileobj=f, mode='wb', mtime=0)
+            # isoformat completo: DjangoJSONEncoder recorta a milisegundos y el cursor necesita el valor exacto
+            registro['timestamp'] = registro['timestamp'].isoformat()
+            linea = json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+            miembro.write(linea.encode() + b'\n')
+            datos['filas'] += 1
+            datos['hasta'] = registro['timestamp']
+            indice['filas'] += 1
+            indice['ultimo_id'] = max(indice['ultimo_id'], registro['id'])
+        if miembro is not None:
+            miembro.close()
+            datos['bytes'] = f.tell() - datos['offset']
+
+    ruta = carpeta / indice['archivo']
+    _escribir_atomico(ruta, escribir)
+    if not indice['filas']:
+        ruta.unlink()
+        return None
+    _escribir_atomico(
+        carpeta / f'{nombre}.indice.json',
+        lambda f: f.write(json.dumps(indice, indent=1).encode()),
+    )
+    return indice
+
+
+def eliminar_registros(desde, hasta, ultimo_id, lote=5000):
+    """
+    Quita de la base los registros de [desde, hasta) con id <= ultimo_id (los que se
+    archivaron; los ids crecen, así que lo que llegó después queda). Si el mes tiene
+    partición propia y no recibió nada nuevo se descarta entera; si no, se borra por
+    lotes. Devuelve las filas borradas.
+    """
+    if desde == inicio_de_mes(desde) and hasta == sumar_meses(desde, 1):
+        particion = particion_del_mes(desde)
+        if particion:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {particion} IN SHARE MODE')
+                cursor.execute(f'SELECT count(*), max(id) FROM {particion}')
+                filas, maximo = cursor.fetchone()
+                if maximo is None or maximo <= ultimo_id:
+                    eliminar_particion(particion)
+                    return filas
+    rango = Bitacora.objects.filter(timestamp__gte=desde, timestamp__lt=hasta, pk__lte=ultimo_id)
+    total = 0
+    while True:
+        ids = list(rango.order_by('timestamp', 'id').values_list('pk', flat=True)[:lote])
+        if not ids:
+            return total
+        borradas, _ = Bitacora.objects.filter(pk__in=ids).delete()
+        total += borradas
+
+
+def meses_por_archivar(retencion=None, ahora=None):
+    """Inicio de cada mes con registros en la base anterior a la ventana de retención"""
+    if retencion is None:
+        retencion = config_bitacora()['RETENCION_MESES']
+    corte = sumar_meses(inicio_de_mes(ahora or timezone.now()), -retencion)
+    primero = (
+        Bitacora.objects.filter(timestamp__lt=corte)
+        .order_by('timestamp').values_list('timestamp', flat=True).first()
+    )
+    if primero is None:
+        return []
+    meses, mes = [], inicio_de_mes(primero)
+    while mes < corte:
+        meses.append(mes)
+        mes = sumar_meses(mes, 1)
+    return meses
+
+
+def archivar(retencion=None, ahora=None, lote=5000):
+    """
+    Archiva y borra de la base cada mes fuera de la retención; devuelve
+    (mes, archivadas, borradas) por cada mes que tenía registros.
+    """
+    resultado = []
+    for desde in meses_por_archivar(retencion, ahora):
+        hasta = sumar_meses(desde, 1)
+        indice = escribir_segmento(desde, hasta)
+        if indice is None:
+            continue
+        borradas = eliminar_registros(desde, hasta, indice['ultimo_id'], lote)
+        resultado.append((desde, indice['filas'], borradas))
+    return resultado
+
+
+# --- Lectura -------------------------------------------------------------------
+
+def _leer_miembro(ruta, datos):
+    with open(ruta, 'rb') as f:
+        f.seek(datos['offset'])
+        comprimido = f.read(datos['bytes'])
+    with gzip.GzipFile(fileobj=io.BytesIO(comprimido)) as miembro:
+        for linea in miembro:
+            registro = json.loads(linea)
+            registro['timestamp'] = parse_datetime(registro['timestamp'])
+            yield registro
+
+
+def leer(grupo_id=None, desde=None, hasta=None, descendente=True):
+    """
+    Registros archivados de un grupo (todos si grupo_id es None) que pueden caer en
+    [desde, hasta), mes por mes en orden de (timestamp, id). Solo se leen los
+    miembros del grupo en los segmentos que tocan el rango.
+    """
+    por_mes = {}
+    for indice in segmentos():
+        if (desde and indice['hasta'] <= desde) or (hasta and indice['desde'] >= hasta):
+            continue
+        por_mes.setdefault(indice['mes'], []).append(indice)
+    for mes in sorted(por_mes, reverse=descendente):
+        registros = []
+        for indice in por_mes[mes]:
+            ruta = directorio() / indice['archivo']
+            grupos = indice['grupos'].values() if grupo_id is None else [indice['grupos'].get(str(grupo_id))]
+            for datos in grupos:
+                if datos:
+                    registros.extend(_leer_miembro(ruta, datos))
+        registros.sort(key=lambda r: (r['timestamp'], r['id']), reverse=descendente)
+        yield from registros
+
+
+def como_bitacora(registro):
+    """Instancia de Bitacora (sin guardar) para un registro archivado, con actor y grupo tal como estaban"""
+    campos = {k: v for k, v in registro.items() if '__' not in k}
+    bitacora = Bitacora(**campos)
+    if registro['usuario_id'] is not None:
+        bitacora.usuario = Usuario(pk=registro['usuario_id'], nombre=registro['usuario__nombre'])
+    if registro['grupo_id'] is not None:
+        bitacora.grupo = Grupo(pk=registro['grupo_id'], nombre=registro['grupo__nombre'])
+    return bitacora
@@ -0,0 +1,301 @@
+"""
+Escritura de la bitácora en segundo plano.
+
+log_action ya no hace un INSERT dentro del request: arma el registro (con la
+hora del momento), lo deja en una cola en memoria y un hilo de fondo lo guarda
+con bulk_create cuando se junta un lote o pasa el intervalo. Al apagar el
+proceso se vacía lo que quede.
+
+Configuración (settings.BITACORA):
+    MODO            'buffer' (cola + hilo) o 'sincrono' (un INSERT por registro, como antes)
+    TAMANO_LOTE     registros por bulk_create; llegar a este tamaño dispara la escritura
+    INTERVALO       segundos máximos que un registro espera en la cola
+    MAX_COLA        registros en memoria como máximo
+    DESBORDE        qué hacer con la cola llena:
+                      'descartar' -> se pierde el registro nuevo y se cuenta en `descartados`
+                      'escribir'  -> el request que lo generó lo escribe él mismo (más lento, sin
+                                     pérdida) y se cuenta en `desbordados`, no en `encolados`
+    RETENCION_MESES     meses completos que se conservan en la base (ver archivo.py)
+    DIRECTORIO_ARCHIVO  dónde quedan los segmentos archivados
+
+Cada lote guardado se suma además a los resúmenes de actividad (actividad.py).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+
+def config_bitacora():
+    config = {
+        'MODO': 'buffer',
+        'TAMANO_LOTE': 200,
+        'INTERVALO': 1.0,
+        'MAX_COLA': 10000,
+        'DESBORDE': 'descartar',
+        'RETENCION_MESES': 12,
+        'DIRECTORIO_ARCHIVO': os.path.join(settings.BASE_DIR, 'archivo_bitacora'),
+    }
+    config.update(getattr(settings, 'BITACORA', {}))
+    return config
+
+
+class EscritorBitacora:
+    """Cola acotada de registros de bitácora con un hilo que los guarda por lotes"""
+
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._config = None
+        self._pid = None
+        self._hilo = None
+        self._cola = deque()
+        self._cerrando = False
+        self.reiniciar_metricas()
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = config_bitacora()
+        return self._config
+
+    def reiniciar_metricas(self):
+        self._metricas = {
+            'encolados': 0,
+            'escritos': 0,
+            'descartados': 0,
+            'desbordados': 0,
+            'fallidos': 0,
+            'lotes': 0,
+            'latencia_total': 0.0,
+            'latencia_max': 0.0,
+            'escritura_total': 0.0,
+        }
+
+    def metricas(self):
+        """Contadores del proceso: encolados, escritos, descartados, desbordados, fallidos y latencias en ms"""
+        with self._condicion:
+            m = dict(self._metricas, en_cola=len(self._cola))
+        escritos, lotes = m['escritos'], m['lotes']
+        return {
+            'encolados': m['encolados'],
+            'escritos': escritos,
+            'descartados': m['descartados'],
+            'desbordados': m['desbordados'],
+            'fallidos': m['fallidos'],
+            'en_cola': m['en_cola'],
+            'lotes': lotes,
+            # Desde que se generó el registro hasta que quedó guardado
+            'latencia_media_ms': m['latencia_total'] / escritos * 1000 if escritos else 0.0,
+            'latencia_max_ms': m['latencia_max'] * 1000,
+            'escritura_media_ms': m['escritura_total'] / lotes * 1000 if lotes else 0.0,
+        }
+
+    def _asegurar_hilo(self):
+        # Tras un fork (p. ej. gunicorn con --preload) el hilo del padre no existe en el hijo
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._cola = deque()
+            self._hilo = None
+            self._cerrando = False
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, name='bitacora', daemon=True)
+            self._hilo.start()
+
+    def registrar(self, registro):
+        """Encola un registro (dict con los campos de Bitacora). No toca la base salvo en modo síncrono o desborde."""
+        config = self.config
+        if config['MODO'] != 'buffer':
+            self._escribir([(registro, time.monotonic())])
+            return
+        with self._condicion:
+            self._asegurar_hilo()
+            if len(self._cola) < config['MAX_COLA']:
+                self._metricas['encolados'] += 1
+                self._cola.append((registro, time.monotonic()))
+                if len(self._cola) >= config['TAMANO_LOTE']:
+                    self._condicion.notify()
+                return
+            if config['DESBORDE'] != 'escribir':
+                self._metricas['descartados'] += 1
+                return
+            self._metricas['desbordados'] += 1
+        # Cola llena con DESBORDE='escribir': lo guarda el propio request
+        self._escribir([(registro, time.monotonic())])
+
+    async def aregistrar(self, registro):
+        """registrar() para vistas async: encolar no toca la base, escribir sí y va fuera del event loop"""
+        config = self.config
+        if config['MODO'] != 'buffer' or config['DESBORDE'] == 'escribir':
+            await sync_to_async(self.registrar)(registro)
+        else:
+            self.registrar(registro)
+
+    def _tomar_lote(self):
+        tamano = self.config['TAMANO_LOTE']
+        lote = []
+        while self._cola and len(lote) < tamano:
+            lote.append(self._cola.popleft())
+        return lote
+
+    def _bucle(self):
+        while True:
+            try:
+                with self._condicion:
+                    config = self.config
+                    if not self._cerrando and len(self._cola) < config['TAMANO_LOTE']:
+                        self._condicion.wait(timeout=config['INTERVALO'])
+                    lote = self._tomar_lote()
+                    cerrando = self._cerrando
+                if lote:
+                    self._escribir(lote, hilo_de_fondo=True)
+                if cerrando and not lote:
+                    connection.close()
+                    return
+            except Exception:
+                # El hilo sigue vivo: lo que quede en la cola lo toma la vuelta siguiente
+                logger.exception('Error en el hilo de la bitácora')
+                time.sleep(1)
+
+    def _escribir(self, lote, hilo_de_fondo=False):
+        from .models import Bitacora
+
+        inicio = time.perf_counter()
+        try:
+            if hilo_de_fondo:
+                close_old_connections()
+            if len(lote) == 1:
+                Bitacora.objects.create(**lote[0][0])
+            else:
+                Bitacora.objects.bulk_create([Bitacora(**registro) for registro, _ in lote])
+        except Exception:
+            # La bitácora nunca hace fallar la operación que se está registrando
+            logger.exception('No se pudieron guardar %s registros de bitácora', len(lote))
+            with self._condicion:
+                self._metricas['fallidos'] += len(lote)
+            return
+        try:
+            from .actividad import sumar_registros
+            sumar_registros([registro for registro, _ in lote])
+        except Exception:
+            # Los registros ya están guardados; reconstruir_actividad recupera el resumen
+            logger.exception('No se pudo actualizar el resumen de actividad de %s registros', len(lote))
+        fin = time.monotonic()
+        latencias = [fin - encolado for _, encolado in lote]
+        with self._condicion:
+            m = self._metricas
+            m['escritos'] += len(lote)
+            m['lotes'] += 1
+            m['latencia_total'] += sum(latencias)
+            m['latencia_max'] = max(m['latencia_max'], *latencias)
+            m['escritura_total'] += time.perf_counter() - inicio
+
+    def vaciar(self):
+        """Guarda ya, en el hilo actual, todo lo que haya en la cola"""
+        while True:
+            with self._condicion:
+                lote = self._tomar_lote()
+            if not lote:
+                return
+            self._escribir(lote)
+
+    def cerrar(self, espera=5.0):
+        """Detiene el hilo de fondo después de vaciar la cola (se llama al apagar el proceso)"""
+        with self._condicion:
+            hilo = self._hilo if self._pid == os.getpid() else None
+            self._cerrando = True
+            self._condicion.notify()
+        if hilo is not None and hilo.is_alive():
+            hilo.join(espera)
+        # Lo que el hilo no alcanzó a guardar
+        self.vaciar()
+        with self._condicion:
+            self._hilo = None
+            self._cerrando = False
+
+
+escritor_bitacora = EscritorBitacora()
+atexit.register(escritor_bitacora.cerrar)
+
+
+@receiver(setting_changed)
+def reiniciar_escritor(*, setting, **kwargs):
+    if setting == 'BITACORA':
+        escritor_bitacora.cerrar()
+        escritor_bitacora._config = None
+
+
+# Prefijo del texto de la acción -> Bitacora.tipo (para registros que no indican su tipo)
+PREFIJOS_TIPO = [
+    ('Creó', 'CREAR'),
+    ('Actualizó', 'ACTUALIZAR'),
+    ('Eliminó', 'ELIMINAR'),
+    ('Restauró', 'RESTAURAR'),
+    ('Marcó como pagado', 'PAGO'),
+    ('Inicio de sesión', 'LOGIN'),
+    ('Cierre de sesión', 'LOGOUT'),
+    ('Se registró', 'REGISTRO'),
+]
+
+
+def clasificar_accion(accion):
+    for prefijo, tipo in PREFIJOS_TIPO:
+        if accion.startswith(prefijo):
+            return tipo
+    return 'OTRO'
+
+
+def entidad_de(objeto):
+    """'Paciente: Juanito (id:4)' -> 'paciente'; 'Patología: ...' -> 'patologia'"""
+    if not objeto or ':' not in objeto:
+        return ''
+    return slugify(objeto.split(':', 1)[0])[:40]
+
+
+def armar_registro(tenant, accion, objeto=None, usuario=None, ip=None, grupo=None, extra=None, tipo=None):
+    """
+    Campos de un registro de bitácora. Si el actor es el del contexto del request,
+    sus ids salen del contexto: no hace falta cargar el perfil para registrarlo.
+    Sin `tipo`, se deduce del texto de la acción.
+    """
+    if usuario is None:
+        usuario_id, grupo_id = None, tenant.grupo_id
+    elif usuario is tenant.usuario:
+        usuario_id, grupo_id = tenant.usuario_id, tenant.grupo_id
+    else:
+        usuario_id, grupo_id = usuario.pk, usuario.grupo_id
+    if grupo is not None:
+        grupo_id = grupo.pk
+    return {
+        'usuario_id': usuario_id,
+        'grupo_id': grupo_id,
+        'accion': accion,
+        'ip': ip,
+        'objeto': objeto,
+        'extra': extra,
+        'tipo': tipo or clasificar_accion(accion),
+        'entidad': entidad_de(objeto),
+        'timestamp': timezone.now(),
+    }
+
+
+def encolar_al_confirmar(registro):
+    """
+    Encola el registro cuando confirme la transacción en curso (en autocommit, ya):
+    si la operación registrada se deshace, su registro tampoco se guarda.
+    """
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: escritor_bitacora.registrar(registro))
+    else:
+        escritor_bitacora.registrar(registro)
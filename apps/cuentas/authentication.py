@@ -0,0 +1,209 @@
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .tenant import TenantContext
+
+SALT_ACCESS = 'apps.cuentas.token.access'
+SALT_REFRESH = 'apps.cuentas.token.refresh'
+
+
+def config_tokens():
+    config = {
+        'ACCESS_TTL': 15 * 60,          # segundos
+        'REFRESH_TTL': 7 * 24 * 3600,   # segundos
+        'SYNC_REVOCACIONES': 5,         # cada cuántos segundos se releen las revocaciones
+        'VENTANA_REVOCACIONES': 60,     # segundos hacia atrás que se releen en cada sincronización
+    }
+    config.update(getattr(settings, 'TOKENS_FIRMADOS', {}))
+    return config
+
+
+class ListaRevocacion:
+    """
+    Revocaciones de tokens firmados, consultadas en memoria.
+    Cada revocación se persiste con un INSERT en RevocacionToken; el resto de
+    procesos la incorporan releyendo cada pocos segundos las filas recientes,
+    así que validar un token no consulta la base de datos en cada request.
+
+    Se relee por fecha y con VENTANA_REVOCACIONES segundos de solapamiento, no
+    por id: una transacción que toma un id más bajo y confirma después que otra
+    no tiene que quedar fuera. Releer una revocación ya incorporada no cambia nada.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._sesiones = {}   # sid -> expira
+        self._usuarios = {}   # usuario id -> (revocado desde, expira)
+        self._grupos = {}     # grupo id -> (revocado desde, expira)
+        self._ultima_fecha = None   # fecha más reciente leída de la base
+        self._ultima_sync = None
+
+    def _incorporar(self, tipo, clave, fecha, expira):
+        if tipo == 'SESION':
+            self._sesiones[clave] = expira
+        else:
+            destino = self._usuarios if tipo == 'USUARIO' else self._grupos
+            desde = fecha.timestamp()
+            anterior = destino.get(clave)
+            if anterior is None or anterior[0] < desde:
+                destino[clave] = (desde, expira)
+
+    def _purgar(self, ahora):
+        self._sesiones = {k: v for k, v in self._sesiones.items() if v > ahora}
+        self._usuarios = {k: v for k, v in self._usuarios.items() if v[1] > ahora}
+        self._grupos = {k: v for k, v in self._grupos.items() if v[1] > ahora}
+
+    def sincronizar(self, forzar=False):
+        """Incorpora las revocaciones persistidas por otros procesos desde la última lectura"""
+        from .models import RevocacionToken
+
+        config = config_tokens()
+        intervalo = config['SYNC_REVOCACIONES']
+        ahora = time.monotonic()
+        if not forzar and self._ultima_sync is not None and ahora - self._ultima_sync < intervalo:
+            return
+        with self._lock:
+            if not forzar and self._ultima_sync is not None and ahora - self._ultima_sync < intervalo:
+                return
+            filas = RevocacionToken.objects.filter(expira__gt=timezone.now())
+            if self._ultima_fecha is not None:
+                filas = filas.filter(fecha__gte=self._ultima_fecha - timedelta(seconds=config['VENTANA_REVOCACIONES']))
+            ahora_ts = time.time()
+            for tipo, clave, fecha, expira in filas.values_list('tipo', 'clave', 'fecha', 'expira'):
+                self._incorporar(tipo, clave, fecha, expira.timestamp())
+                if self._ultima_fecha is None or fecha > self._ultima_fecha:
+                    self._ultima_fecha = fecha
+            self._purgar(ahora_ts)
+            self._ultima_sync = ahora
+
+    def esta_revocado(self, claims):
+        self.sincronizar()
+        if claims['sid'] in self._sesiones:
+            return True
+        emitido = claims['iat']
+        for destino, clave in ((self._usuarios, claims.get('pid')), (self._grupos, claims.get('gid'))):
+            revocado = destino.get(str(clave)) if clave is not None else None
+            if revocado and emitido <= revocado[0]:
+                return True
+        return False
+
+    def revocar(self, tipo, clave):
+        """Revoca y persiste: sesión (sid), usuario (id) o grupo (id)"""
+        from .models import RevocacionToken
+
+        expira = timezone.now() + timedelta(seconds=config_tokens()['REFRESH_TTL'])
+        revocacion = RevocacionToken.objects.create(tipo=tipo, clave=str(clave), expira=expira)
+        with self._lock:
+            self._incorporar(revocacion.tipo, revocacion.clave, revocacion.fecha, expira.timestamp())
+
+    def revocar_sesion(self, sid):
+        self.revocar('SESION', sid)
+
+    def revocar_usuario(self, usuario_id):
+        self.revocar('USUARIO', usuario_id)
+
+    def revocar_grupo(self, grupo_id):
+        self.revocar('GRUPO', grupo_id)
+
+
+revocaciones = ListaRevocacion()
+
+
+def cerrar_sesiones(usuario):
+    """Al desactivar o borrar un usuario: revoca sus tokens firmados y borra su token DRF"""
+    revocaciones.revocar_usuario(usuario.pk)
+    if usuario.user_id:
+        Token.objects.filter(user_id=usuario.user_id).delete()
+
+
+def emitir_tokens(user, usuario, sid=None):
+    """Emite el par access/refresh firmado con los datos del actor embebidos"""
+    config = config_tokens()
+    claims = {
+        'uid': user.pk,
+        'usr': user.get_username(),
+        'eml': user.email,
+        'pid': usuario.pk if usuario else None,
+        'gid': usuario.grupo_id if usuario else None,
+        'rol': usuario.rol.nombre if usuario and usuario.rol_id else None,
+        'sid': sid or secrets.token_urlsafe(12),
+        'iat': time.time(),
+    }
+    return {
+        'access': signing.dumps(claims, salt=SALT_ACCESS, compress=True),
+        'refresh': signing.dumps({'uid': user.pk, 'sid': claims['sid'], 'iat': claims['iat'],
+                                  'pid': claims['pid'], 'gid': claims['gid']},
+                                 salt=SALT_REFRESH, compress=True),
+        'expira_en': config['ACCESS_TTL'],
+    }
+
+
+def leer_refresh(token):
+    """Valida un refresh token y devuelve sus claims (lanza signing.BadSignature si no es válido)"""
+    claims = signing.loads(token, salt=SALT_REFRESH, max_age=config_tokens()['REFRESH_TTL'])
+    if revocaciones.esta_revocado(claims):
+        raise signing.BadSignature('Token revocado')
+    return claims
+
+
+def tenant_desde_claims(claims):
+    """Contexto de tenant a partir de los claims; el perfil completo solo se carga si alguien lo usa"""
+    pid = claims.get('pid')
+    usuario = None
+    if pid is not None:
+        def cargar_usuario():
+            from .models import Usuario
+            return Usuario.objects.select_related('rol', 'grupo').filter(pk=pid).first()
+        usuario = SimpleLazyObject(cargar_usuario)
+    return TenantContext(claims['uid'], pid, claims.get('gid'), claims.get('rol'), usuario)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Autenticación con tokens de acceso firmados (HMAC) de vida corta:
+        Authorization: Bearer <access>
+    El token ya trae usuario, perfil, grupo y rol, así que se valida sin tocar la
+    base de datos y deja resuelto el contexto de tenant del request.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Cabecera de token inválida.')
+
+        try:
+            claims = signing.loads(
+                auth[1].decode(), salt=SALT_ACCESS, max_age=config_tokens()['ACCESS_TTL']
+            )
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token expirado.')
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed('Token inválido.')
+
+        if revocaciones.esta_revocado(claims):
+            raise exceptions.AuthenticationFailed('Token revocado.')
+
+        user = User(pk=claims['uid'], username=claims['usr'], email=claims['eml'])
+        request._request._tenant = tenant_desde_claims(claims)
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
+
@@ -0,0 +1,97 @@
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from .auditoria import escritor_bitacora
+from .models import Grupo, Rol, Usuario, crear_credencial
+
+
+class BenchmarkCommand(BaseCommand):
+    """
+    Base para los comandos de benchmark.
+    Corre siempre sobre una base de datos de prueba desechable (nunca sobre la real).
+    """
+
+    # Los benchmarks que no miden el hashing usan un hasher barato para no distorsionar
+    hasher_rapido = True
+
+    def handle(self, *args, **options):
+        nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            if self.hasher_rapido:
+                with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+                    self.run_benchmark(*args, **options)
+            else:
+                self.run_benchmark(*args, **options)
+        finally:
+            # La bitácora pendiente se escribe antes de borrar la base de prueba
+            escritor_bitacora.cerrar()
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+    def run_benchmark(self, *args, **options):
+        raise NotImplementedError
+
+    def fila(self, *columnas):
+        self.stdout.write('  '.join(str(c).ljust(ancho) for c, ancho in columnas))
+
+
+@contextmanager
+def cronometro():
+    """Mide el tiempo del bloque; el resultado queda en resultado['segundos']."""
+    resultado = {}
+    inicio = time.perf_counter()
+    try:
+        yield resultado
+    finally:
+        resultado['segundos'] = time.perf_counter() - inicio
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+@contextmanager
+def contar_consultas():
+    """Cuenta las sentencias ejecutadas (sin el tope del log de consultas de Django)"""
+    contador = {'total': 0}
+
+    def contar(execute, sql, params, many, context):
+        contador['total'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(contar):
+        yield contador
+
+
+def crear_roles():
+    return {
+        nombre: Rol.objects.get_or_create(nombre=nombre)[0]
+        for nombre, _ in Rol.tipo_rol_opciones
+    }
+
+
+def crear_usuario(correo, rol, grupo=None, password='clave-bench-123', **extra):
+    """Crea el User de Django y su perfil Usuario, como lo hace el registro."""
+    user = crear_credencial(correo, password)
+    datos = {
+        'nombre': correo.split('@')[0],
+        'sexo': 'M',
+        'fecha_nacimiento': '1990-01-01',
+    }
+    datos.update(extra)
+    usuario = Usuario.objects.create(user=user, grupo=grupo, correo=correo, rol=rol, **datos)
+    return user, usuario
+
+
+def crear_clinica(nombre, roles):
+    """Crea un grupo con su administrador y devuelve (grupo, token del administrador)."""
+    grupo = Grupo.objects.create(nombre=nombre)
+    slug = nombre.lower().replace(' ', '-')
+    user, _ = crear_usuario(f'admin@{slug}.bench', roles['administrador'], grupo)
+    token = Token.objects.create(user=user)
+    return grupo, token.key
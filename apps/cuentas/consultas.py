@@ -0,0 +1,160 @@
+"""
+select_related / prefetch_related deducidos del serializer de la vista.
+
+Los listados serializan cada fila con campos como `source='rol.nombre'`, relaciones
+many=True o métodos que recorren relaciones del modelo; sin precargarlas, cada fila
+hace sus propias consultas (N+1). RelacionesMixin recorre los campos del serializer
+una vez por clase y arma el queryset:
+
+    - source con puntos ('usuario.nombre', 'grupo.nombre'): los tramos que son
+      ForeignKey / OneToOne van a select_related; desde el primer tramo que es
+      muchos-a-muchos o inverso, a prefetch_related
+    - relaciones many=True (p. ej. PrimaryKeyRelatedField(many=True)): prefetch_related
+    - serializers anidados: su relación y, recursivamente, las de sus campos
+    - SerializerMethodField: las relaciones que el método declara con @relaciones(...)
+
+Un PrimaryKeyRelatedField simple no necesita nada: DRF usa la columna `<campo>_id`.
+
+Con CONSULTAS['VERIFICAR'] (en los tests o en un settings de desarrollo, nunca en
+producción) los listados que superan el presupuesto de consultas
+(CONSULTAS['PRESUPUESTO'] o `presupuesto_consultas` de la vista) fallan con un
+AssertionError que muestra las consultas, para detectar un N+1 nuevo antes de
+que llegue a producción.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from rest_framework import serializers
+
+PRESUPUESTO = 10
+
+_RELACIONES = {}
+
+
+def config_consultas():
+    config = {'PRESUPUESTO': PRESUPUESTO, 'VERIFICAR': False}
+    config.update(getattr(settings, 'CONSULTAS', {}))
+    return config
+
+
+def relaciones(*rutas):
+    """
+    Declara las relaciones del modelo que lee un get_<campo> de SerializerMethodField,
+    con la misma sintaxis que source ('rol', 'usuario.grupo', 'especialidades').
+    """
+    def decorar(metodo):
+        metodo.relaciones = rutas
+        return metodo
+    return decorar
+
+
+def _campo(modelo, atributo):
+    """Campo de relación del modelo por nombre de atributo (también relaciones inversas por su accessor)"""
+    try:
+        campo = modelo._meta.get_field(atributo)
+    except FieldDoesNotExist:
+        campo = next((r for r in modelo._meta.related_objects if r.get_accessor_name() == atributo), None)
+    if campo is None or not campo.is_relation or campo.related_model is None:
+        return None
+    return campo
+
+
+def _clasificar(modelo, ruta, select, prefetch):
+    """
+    Reparte los tramos de relación de `ruta` (lista de atributos) entre select y prefetch;
+    devuelve el modelo al que se llega.
+    """
+    recorridos, muchos = [], False
+    for atributo in ruta:
+        campo = _campo(modelo, atributo)
+        if campo is None:
+            break
+        recorridos.append(campo.get_accessor_name() if campo.auto_created and not campo.concrete else campo.name)
+        muchos = muchos or campo.many_to_many or campo.one_to_many
+        modelo = campo.related_model
+    if recorridos:
+        (prefetch if muchos else select).add('__'.join(recorridos))
+    return modelo
+
+
+def _recorrer(serializer, modelo, prefijo, select, prefetch):
+    for campo in serializer.fields.values():
+        if campo.write_only:
+            continue
+        if isinstance(campo, serializers.SerializerMethodField):
+            metodo = getattr(serializer, campo.method_name, None)
+            for ruta in getattr(metodo, 'relaciones', ()):
+                _clasificar(modelo, prefijo + ruta.split('.'), select, prefetch)
+            continue
+        if campo.source == '*':
+            continue
+        ruta = prefijo + campo.source.split('.')
+        if isinstance(campo, serializers.ListSerializer) and isinstance(campo.child, serializers.Serializer):
+            destino = _clasificar(modelo, ruta, select, prefetch)
+            # Debajo de una relación muchos todo va a prefetch_related
+            _recorrer(campo.child, destino, ruta, prefetch, prefetch)
+        elif isinstance(campo, serializers.Serializer):
+            destino = _clasificar(modelo, ruta, select, prefetch)
+            _recorrer(campo, destino, ruta, select, prefetch)
+        elif isinstance(campo, serializers.ManyRelatedField):
+            _clasificar(modelo, ruta, select, prefetch)
+        elif isinstance(campo, serializers.PrimaryKeyRelatedField):
+            # La pk sale de la columna <campo>_id de la fila (o de la relación anterior)
+            _clasificar(modelo, ruta[:-1], select, prefetch)
+        elif len(ruta) > 1 or isinstance(campo, serializers.RelatedField):
+            _clasificar(modelo, ruta, select, prefetch)
+
+
+def relaciones_de(serializer_class):
+    """(select_related, prefetch_related) que usa `serializer_class`, calculados una vez por clase"""
+    if serializer_class not in _RELACIONES:
+        select, prefetch = set(), set()
+        _recorrer(serializer_class(), serializer_class.Meta.model, [], select, prefetch)
+        # select_related('a__b') ya incluye 'a'
+        select = {ruta for ruta in select if not any(otra.startswith(ruta + '__') for otra in select)}
+        _RELACIONES[serializer_class] = (sorted(select), sorted(prefetch))
+    return _RELACIONES[serializer_class]
+
+
+class PresupuestoExcedido(AssertionError):
+    pass
+
+
+class RelacionesMixin:
+    """
+    Para ModelViewSet: aplica al queryset las relaciones que lee su serializer
+    (ver relaciones_de) y, en desarrollo, verifica el presupuesto de consultas de los
+    listados. Las acciones propias que arman su queryset pueden usar self.optimizar(qs).
+    """
+    presupuesto_consultas = None
+
+    def optimizar(self, queryset):
+        select, prefetch = relaciones_de(self.get_serializer_class())
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        return self.optimizar(super().filter_queryset(queryset))
+
+    def list(self, request, *args, **kwargs):
+        config = config_consultas()
+        if not config['VERIFICAR']:
+            return super().list(request, *args, **kwargs)
+        presupuesto = self.presupuesto_consultas or config['PRESUPUESTO']
+        consultas = []
+
+        def anotar(execute, sql, params, many, context):
+            consultas.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(anotar):
+            respuesta = super().list(request, *args, **kwargs)
+        if len(consultas) > presupuesto:
+            raise PresupuestoExcedido(
+                f'{type(self).__name__}.list hizo {len(consultas)} consultas (presupuesto {presupuesto}):\n'
+                + '\n'.join(consultas[:presupuesto + 5])
+            )
+        return respuesta
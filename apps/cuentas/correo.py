@@ -0,0 +1,181 @@
+"""
+Bandeja de salida de correos.
+
+Los requests no hablan con el servidor SMTP: encolar_correo inserta una fila en
+CorreoSaliente y listo. El comando `despachar_correos` toma los pendientes por
+lotes y los envía por una sola conexión (un handshake TLS por lote y no por
+correo), con reintentos y espera exponencial para los errores transitorios.
+
+Un lote se reserva moviendo sus filas a ENVIANDO con proximo_intento = ahora +
+RESERVA; en PostgreSQL con FOR UPDATE SKIP LOCKED, así varios despachadores no
+toman las mismas filas. Si un despachador muere a mitad de un lote, sus filas
+vuelven a tomarse al vencer la reserva (un correo puede salir dos veces, nunca
+cero).
+
+El envío usa settings.EMAIL_BACKEND: con el backend locmem o filebased se puede
+probar sin servidor SMTP.
+
+Configuración (settings.CORREO):
+    LOTE            correos por reserva (y por conexión SMTP)
+    INTERVALO       segundos entre vueltas del despachador cuando no hay nada que enviar
+    MAX_INTENTOS    intentos antes de marcar el correo como FALLIDO
+    ESPERA_BASE     segundos de espera tras el primer error; se duplica en cada intento
+    ESPERA_MAXIMA   tope de la espera entre intentos
+    RESERVA         segundos que un lote queda reservado por un despachador
+    REMITENTE       remitente por defecto
+    CONSERVAR_DIAS  días que se conservan los correos enviados
+"""
+import logging
+import random
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CorreoSaliente
+
+logger = logging.getLogger(__name__)
+
+
+def config_correo():
+    config = {
+        'LOTE': 100,
+        'INTERVALO': 2.0,
+        'MAX_INTENTOS': 6,
+        'ESPERA_BASE': 30,
+        'ESPERA_MAXIMA': 3600,
+        'RESERVA': 300,
+        'REMITENTE': 'noreply@clinicavisionx.com',
+        'CONSERVAR_DIAS': 30,
+    }
+    config.update(getattr(settings, 'CORREO', {}))
+    return config
+
+
+def encolar_correo(asunto, cuerpo, destinatarios, remitente=None, grupo_id=None):
+    """Deja un correo en la bandeja de salida (un INSERT) y lo devuelve"""
+    return CorreoSaliente.objects.create(
+        asunto=asunto, cuerpo=cuerpo, destinatarios=list(destinatarios),
+        remitente=remitente or config_correo()['REMITENTE'], grupo_id=grupo_id,
+    )
+
+
+def encolar_correos(correos, tamano_lote=1000):
+    """Encola muchos correos (instancias de CorreoSaliente sin guardar) con bulk_create"""
+    remitente = config_correo()['REMITENTE']
+    for correo in correos:
+        correo.remitente = correo.remitente or remitente
+    return CorreoSaliente.objects.bulk_create(correos, batch_size=tamano_lote)
+
+
+def reservar(lote, ahora=None):
+    """Toma hasta `lote` correos listos para enviar y los marca ENVIANDO"""
+    ahora = ahora or timezone.now()
+    listos = (
+        CorreoSaliente.objects
+        .filter(estado__in=['PENDIENTE', 'ENVIANDO'], proximo_intento__lte=ahora)
+        .order_by('proximo_intento', 'id')
+    )
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            listos = listos.select_for_update(skip_locked=True)
+        correos = list(listos[:lote])
+        CorreoSaliente.objects.filter(pk__in=[c.pk for c in correos]).update(
+            estado='ENVIANDO', proximo_intento=ahora + timedelta(seconds=config_correo()['RESERVA']),
+        )
+    return correos
+
+
+def _mensaje(correo, conexion):
+    return EmailMessage(
+        subject=correo.asunto, body=correo.cuerpo, from_email=correo.remitente,
+        to=correo.destinatarios, connection=conexion,
+    )
+
+
+def _permanente(error):
+    """Errores que no se arreglan reintentando (el servidor rechazó el correo con un 5xx)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _espera(intentos, config):
+    segundos = min(config['ESPERA_BASE'] * 2 ** (intentos - 1), config['ESPERA_MAXIMA'])
+    # Con jitter: los correos que fallaron juntos no se reintentan todos en el mismo segundo
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def _registrar_error(correo, error, ahora, config):
+    correo.intentos += 1
+    correo.ultimo_error = f'{type(error).__name__}: {error}'[:2000]
+    if _permanente(error) or correo.intentos >= config['MAX_INTENTOS']:
+        correo.estado = 'FALLIDO'
+        logger.warning('Correo %s descartado tras %s intentos: %s', correo.pk, correo.intentos, correo.ultimo_error)
+    else:
+        correo.estado = 'PENDIENTE'
+        correo.proximo_intento = ahora + _espera(correo.intentos, config)
+    correo.save(update_fields=['intentos', 'ultimo_error', 'estado', 'proximo_intento'])
+
+
+def despachar(lote=None):
+    """
+    Envía un lote de correos pendientes por una sola conexión. Devuelve cuántos
+    se enviaron, cuántos quedan para reintentar y cuántos fallaron del todo.
+    """
+    config = config_correo()
+    correos = reservar(lote or config['LOTE'])
+    resultado = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+    if not correos:
+        return resultado
+
+    enviados, errores = [], []
+    conexion = get_connection(fail_silently=False)
+    try:
+        conexion.open()
+    except Exception as e:
+        logger.warning('No se pudo abrir la conexión de correo: %s', e)
+        errores = [(correo, e) for correo in correos]
+    else:
+        try:
+            for correo in correos:
+                try:
+                    _mensaje(correo, conexion).send()
+                    enviados.append(correo.pk)
+                except smtplib.SMTPServerDisconnected as e:
+                    # El servidor cortó (timeout, límite de mensajes por conexión): se reabre para el resto
+                    errores.append((correo, e))
+                    conexion.close()
+                    conexion.open()
+                except Exception as e:
+                    errores.append((correo, e))
+        except Exception as e:
+            # No se pudo reabrir: lo que no se intentó espera al próximo lote sin contar un intento
+            intentados = set(enviados) | {c.pk for c, _ in errores}
+            logger.warning('Se perdió la conexión de correo: %s', e)
+            CorreoSaliente.objects.filter(pk__in=[c.pk for c in correos if c.pk not in intentados]).update(
+                estado='PENDIENTE', proximo_intento=timezone.now() + _espera(1, config),
+            )
+        finally:
+            conexion.close()
+
+    ahora = timezone.now()
+    CorreoSaliente.objects.filter(pk__in=enviados).update(estado='ENVIADO', enviado=ahora, ultimo_error='')
+    resultado['enviados'] = len(enviados)
+    for correo, error in errores:
+        _registrar_error(correo, error, ahora, config)
+        resultado['fallidos' if correo.estado == 'FALLIDO' else 'reintentos'] += 1
+    return resultado
+
+
+def purgar_enviados(dias=None):
+    """Borra los correos enviados hace más de `dias` días (por defecto CONSERVAR_DIAS)"""
+    if dias is None:
+        dias = config_correo()['CONSERVAR_DIAS']
+    borrados, _ = CorreoSaliente.objects.filter(
+        estado='ENVIADO', enviado__lt=timezone.now() - timedelta(days=dias),
+    ).delete()
+    return borrados
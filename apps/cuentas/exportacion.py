@@ -0,0 +1,127 @@
+"""
+Exportación completa de la bitácora en streaming (CSV o NDJSON).
+
+Las filas salen de un values() sobre el queryset filtrado, leído con
+iterator(): en PostgreSQL es un cursor del servidor y en memoria solo hay un
+lote a la vez, sea cual sea el tamaño de la exportación. Actor y grupo vienen
+en la misma consulta (sin una consulta por fila). Si el rango de fechas llega
+al archivo (ver archivo.py), los registros archivados van primero.
+
+El cursor se recorre dentro de una transacción: la base de producción está
+detrás del pooler de Neon (PgBouncer en modo transacción), donde un cursor
+WITH HOLD fuera de una transacción no sobrevive.
+"""
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.text import compress_sequence
+
+from . import archivo
+from .filtros import alcanza_archivo, filtrar_bitacora, filtro_archivados
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Nombre de cada columna exportada y su clave en archivo.CAMPOS
+COLUMNAS = [
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('grupo_id', 'grupo_id'),
+    ('grupo', 'grupo__nombre'),
+    ('usuario_id', 'usuario_id'),
+    ('usuario', 'usuario__nombre'),
+    ('tipo', 'tipo'),
+    ('accion', 'accion'),
+    ('objeto', 'objeto'),
+    ('entidad', 'entidad'),
+    ('ip', 'ip'),
+    ('extra', 'extra'),
+]
+
+TAMANO_LOTE = 2000
+TAMANO_BLOQUE = 64 * 1024
+
+
+def registros(queryset, params, grupo_id=None, usuarios=None, tamano_lote=TAMANO_LOTE, archivados=True):
+    """
+    Registros (dicts con las claves de archivo.CAMPOS) en orden cronológico:
+    primero los archivados que correspondan (si `archivados`), después los de la base.
+    """
+    if archivados and alcanza_archivo(params):
+        coincide, desde, hasta = filtro_archivados(params, usuarios)
+        for registro in archivo.leer(grupo_id, desde, hasta, descendente=False):
+            if coincide(registro):
+                yield registro
+
+    filas = (
+        filtrar_bitacora(queryset, params, usuarios=usuarios)
+        .order_by('timestamp', 'id')
+        .values(*archivo.CAMPOS)
+    )
+    with transaction.atomic():
+        yield from filas.iterator(chunk_size=tamano_lote)
+
+
+def _fila(registro):
+    fila = {nombre: registro[clave] for nombre, clave in COLUMNAS}
+    if hasattr(fila['timestamp'], 'isoformat'):
+        fila['timestamp'] = fila['timestamp'].isoformat()
+    return fila
+
+
+def _en_bloques(partes):
+    """Junta las partes en bloques de ~64 KB: menos escrituras al socket y al compresor"""
+    bloque, tamano = [], 0
+    for parte in partes:
+        bloque.append(parte)
+        tamano += len(parte)
+        if tamano >= TAMANO_BLOQUE:
+            yield b''.join(bloque)
+            bloque, tamano = [], 0
+    if bloque:
+        yield b''.join(bloque)
+
+
+def como_csv(registros):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    def volcar():
+        # Se vacía el buffer en cada fila: nunca guarda más de una
+        linea = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return linea
+
+    def lineas():
+        escritor.writerow([nombre for nombre, _ in COLUMNAS])
+        # El encabezado sale aunque no haya registros
+        yield volcar()
+        for registro in registros:
+            fila = _fila(registro)
+            if fila['extra'] is not None:
+                fila['extra'] = json.dumps(fila['extra'], cls=DjangoJSONEncoder, ensure_ascii=False)
+            escritor.writerow(fila.values())
+            yield volcar()
+
+    # BOM para que Excel abra el CSV como UTF-8
+    yield '\ufeff'.encode()
+    yield from _en_bloques(lineas())
+
+
+def como_ndjson(registros):
+    yield from _en_bloques(
+        json.dumps(_fila(registro), cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+        for registro in registros
+    )
+
+
+def contenido(registros, formato, comprimir=False):
+    """Bytes de la exportación en el formato pedido, comprimidos con gzip al vuelo si se pide"""
+    partes = como_csv(registros) if formato == 'csv' else como_ndjson(registros)
+    return compress_sequence(partes) if comprimir else partes
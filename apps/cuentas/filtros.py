@@ -0,0 +1,271 @@
+"""
+Filtros de la bitácora pensados para usar índices.
+
+- Fechas: `start`/`end` son días completos en la zona horaria vigente y se
+  traducen a un rango semiabierto sobre la columna (timestamp >= inicio del
+  día start AND timestamp < inicio del día siguiente a end). Un filtro sobre
+  timestamp__date envuelve la columna en una conversión y no usa el índice.
+- `tipo` y `objeto` comparan columnas normalizadas (Bitacora.tipo, Bitacora.entidad)
+  que tienen índice junto con el orden del listado.
+- `usuario` es un id o parte del nombre del actor; el nombre se resuelve primero
+  contra los usuarios de la clínica (pocas filas) y la bitácora se filtra por id.
+- `q` busca palabras (o comienzos de palabra) en accion/objeto y en el nombre del actor:
+    PostgreSQL  tsvector + trigramas (índices GIN de la migración 0010)
+    SQLite      tabla FTS5 cuentas_bitacora_fts (migración 0010)
+    otras       icontains, sin índice
+
+Si el rango de fechas llega a meses ya archivados, los mismos filtros se aplican
+en memoria a los segmentos del archivo (buscar_archivados).
+"""
+import re
+import unicodedata
+from datetime import datetime, time, timedelta
+
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from . import archivo
+from .models import Bitacora, Usuario
+
+TABLA_FTS = 'cuentas_bitacora_fts'
+
+# Deben coincidir con las expresiones de los índices de la migración 0010,
+# si no PostgreSQL no los usa
+_TEXTO_PG = "({tabla}.accion || ' ' || coalesce({tabla}.objeto, ''))"
+_TSVECTOR_PG = "to_tsvector('spanish'::regconfig, " + _TEXTO_PG + ")"
+
+# Con más coincidencias que esto el nombre buscado es demasiado genérico
+MAX_ACTORES = 100
+
+# Coincidencias FTS5 que se resuelven como lista de ids antes de consultar la bitácora
+MAX_IDS_FTS = 2000
+
+_fts_por_base = {}
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def limites_fechas(start=None, end=None):
+    """(desde, hasta) semiabierto para los días [start, end] (fechas ISO; las inválidas quedan en None)"""
+    inicio = parse_date(start) if start else None
+    fin = parse_date(end) if end else None
+    return (
+        inicio_del_dia(inicio) if inicio else None,
+        inicio_del_dia(fin + timedelta(days=1)) if fin else None,
+    )
+
+
+def rango_fechas(start=None, end=None):
+    """Condición sobre timestamp para los días [start, end]"""
+    desde, hasta = limites_fechas(start, end)
+    condicion = Q()
+    if desde:
+        condicion &= Q(timestamp__gte=desde)
+    if hasta:
+        condicion &= Q(timestamp__lt=hasta)
+    return condicion
+
+
+def palabras(texto):
+    return re.findall(r'\w+', texto or '')
+
+
+def escapar_like(texto):
+    """Texto para usar literal dentro de un patrón LIKE/ILIKE (escape por defecto: \\)"""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts_disponible(alias):
+    conexion = connections[alias]
+    clave = (alias, conexion.settings_dict['NAME'])
+    if clave not in _fts_por_base:
+        _fts_por_base[clave] = TABLA_FTS in conexion.introspection.table_names()
+    return _fts_por_base[clave]
+
+
+def condicion_texto(alias, texto):
+    """Condición de búsqueda de `texto` en accion/objeto según el motor de la base"""
+    tokens = palabras(texto)
+    if not tokens:
+        return None
+    vendor = connections[alias].vendor
+    tabla = connections[alias].ops.quote_name(Bitacora._meta.db_table)
+
+    if vendor == 'postgresql':
+        # Palabras (con stemming) por tsvector, fragmentos por trigramas: ambos con índice GIN
+        consulta = ' & '.join(f'{token}:*' for token in tokens)
+        sql = (
+            f"({_TSVECTOR_PG.format(tabla=tabla)} @@ to_tsquery('spanish'::regconfig, %s)"
+            f" OR {_TEXTO_PG.format(tabla=tabla)} ILIKE %s)"
+        )
+        return RawSQL(sql, (consulta, f'%{escapar_like(texto.strip())}%'), output_field=BooleanField())
+
+    if vendor == 'sqlite' and _fts_disponible(alias):
+        consulta = ' '.join('"%s"*' % token for token in tokens)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s LIMIT %s',
+                (consulta, MAX_IDS_FTS + 1),
+            )
+            ids = [fila[0] for fila in cursor.fetchall()]
+        if len(ids) <= MAX_IDS_FTS:
+            # Término poco frecuente: se leen esas filas por id y se ordenan
+            return Q(pk__in=ids)
+        # Término frecuente: SQLite materializa las coincidencias y recorre la bitácora
+        # en orden hasta llenar la página
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', (consulta,),
+        ))
+
+    condicion = Q()
+    for token in tokens:
+        condicion &= Q(accion__icontains=token) | Q(objeto__icontains=token)
+    return condicion
+
+
+def ids_actores(usuarios, nombre):
+    return list(usuarios.filter(nombre__icontains=nombre).values_list('pk', flat=True)[:MAX_ACTORES])
+
+
+def condicion_actores(usuarios, nombre):
+    """
+    Actores cuyo nombre contiene `nombre`. Los ids se buscan antes (pocos usuarios
+    por clínica) para que la bitácora se filtre con un usuario_id = / IN sobre su índice.
+    """
+    ids = ids_actores(usuarios, nombre)
+    if not ids:
+        return None
+    if len(ids) == 1:
+        return Q(usuario_id=ids[0])
+    return Q(usuario_id__in=ids)
+
+
+def filtrar_bitacora(queryset, params, usuarios=None):
+    """
+    Aplica los filtros de `params` (query params del request) a un queryset de Bitacora.
+    `usuarios` es el queryset de Usuario donde se buscan los actores por nombre
+    (normalmente los de la clínica del request).
+    """
+    if usuarios is None:
+        usuarios = Usuario.objects.all()
+
+    queryset = queryset.filter(rango_fechas(params.get('start'), params.get('end')))
+
+    tipo = params.get('tipo')
+    if tipo:
+        queryset = queryset.filter(tipo=tipo.upper())
+
+    objeto = params.get('objeto')
+    if objeto:
+        queryset = queryset.filter(entidad=slugify(objeto))
+
+    usuario = params.get('usuario')
+    if usuario:
+        if usuario.isdigit():
+            queryset = queryset.filter(usuario_id=int(usuario))
+        else:
+            actores = condicion_actores(usuarios, usuario)
+            queryset = queryset.filter(actores) if actores is not None else queryset.none()
+
+    texto = (params.get('q') or '').strip()
+    if texto:
+        condicion = condicion_texto(queryset.db, texto)
+        actores = condicion_actores(usuarios, texto)
+        if condicion is None and actores is None:
+            return queryset.none()
+        if condicion is None or actores is None:
+            queryset = queryset.filter(condicion if actores is None else actores)
+        else:
+            queryset = queryset.filter(condicion | actores)
+
+    return queryset
+
+
+# --- Registros archivados (ver archivo.py) --------------------------------------
+
+def normalizar(texto):
+    """Minúsculas y sin acentos, para comparar texto en memoria como lo hace FTS5"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def alcanza_archivo(params):
+    """True si el rango de fechas pedido llega a meses que ya no están en la base"""
+    desde, hasta = limites_fechas(params.get('start'), params.get('end'))
+    if desde is None and hasta is None:
+        # Sin rango de fechas el listado es el de la base: el archivo se consulta a pedido
+        return False
+    limite = archivo.horizonte()
+    return limite is not None and (desde is None or desde < limite)
+
+
+def filtro_archivados(params, usuarios=None):
+    """
+    Los filtros de filtrar_bitacora como función sobre registros archivados (dicts
+    de archivo.leer). Devuelve (función, desde, hasta).
+    """
+    if usuarios is None:
+        usuarios = Usuario.objects.all()
+    desde, hasta = limites_fechas(params.get('start'), params.get('end'))
+    condiciones = []
+    if desde:
+        condiciones.append(lambda r: r['timestamp'] >= desde)
+    if hasta:
+        condiciones.append(lambda r: r['timestamp'] < hasta)
+
+    tipo = params.get('tipo')
+    if tipo:
+        condiciones.append(lambda r: r['tipo'] == tipo.upper())
+    objeto = params.get('objeto')
+    if objeto:
+        entidad = slugify(objeto)
+        condiciones.append(lambda r: r['entidad'] == entidad)
+
+    def de_actor(nombre):
+        # El actor puede ya no existir: también se compara el nombre guardado al archivar
+        ids = set(ids_actores(usuarios, nombre))
+        buscado = normalizar(nombre)
+        return lambda r: r['usuario_id'] in ids or buscado in normalizar(r['usuario__nombre'])
+
+    usuario = params.get('usuario')
+    if usuario:
+        if usuario.isdigit():
+            condiciones.append(lambda r: r['usuario_id'] == int(usuario))
+        else:
+            condiciones.append(de_actor(usuario))
+
+    texto = (params.get('q') or '').strip()
+    if texto:
+        tokens = [normalizar(t) for t in palabras(texto)]
+        actor = de_actor(texto)
+        condiciones.append(lambda r: actor(r) or (tokens and all(
+            t in normalizar(f"{r['accion']} {r['objeto'] or ''}") for t in tokens
+        )))
+
+    return (lambda r: all(c(r) for c in condiciones)), desde, hasta
+
+
+def buscar_archivados(params, grupo_id, usuarios=None, valores=None, reverso=False, limite=50):
+    """
+    Hasta `limite` registros archivados que cumplen los filtros, como instancias de
+    Bitacora, en el orden de BitacoraPagination (-timestamp, -id) a partir del cursor
+    `valores` (o en el orden inverso si `reverso`).
+    """
+    coincide, desde, hasta = filtro_archivados(params, usuarios)
+    resultado = []
+    for registro in archivo.leer(grupo_id, desde, hasta, descendente=not reverso):
+        if valores is not None:
+            clave = (registro['timestamp'], registro['id'])
+            if (clave <= tuple(valores)) if reverso else (clave >= tuple(valores)):
+                continue
+        if coincide(registro):
+            resultado.append(archivo.como_bitacora(registro))
+            if len(resultado) >= limite:
+                break
+    return resultado
@@ -0,0 +1,348 @@
+"""
+Hashing de contraseñas fuera del hilo del request.
+
+PBKDF2 (o el hasher configurado) es CPU puro: ejecutado en el hilo del worker
+WSGI/ASGI lo bloquea durante todo el hash. Aquí se envía a un pool de procesos
+acotado; si hay demasiados hashes en cola se rechaza el trabajo (HashingSaturado,
+503) en vez de dejar que la latencia crezca sin límite.
+
+Configuración (settings.HASHING_PASSWORDS):
+    MODO            'procesos' (pool) o 'local' (en el hilo actual, sin pool)
+    WORKERS         procesos del pool (None = núcleos disponibles)
+    MAX_PENDIENTES  hashes en vuelo como máximo (None = 4 por worker)
+    ESPERA_MAXIMA   segundos que se espera un hueco antes de rechazar
+    CONTEXTO        método de arranque de los procesos ('spawn', 'forkserver', 'fork')
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher, is_password_usable
+from django.contrib.auth.hashers import make_password as make_password_local
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+def config_hashing():
+    config = {
+        'MODO': 'procesos',
+        'WORKERS': None,
+        'MAX_PENDIENTES': None,
+        'ESPERA_MAXIMA': 5,
+        'CONTEXTO': 'spawn',
+    }
+    config.update(getattr(settings, 'HASHING_PASSWORDS', {}))
+    if not config['WORKERS']:
+        config['WORKERS'] = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    if not config['MAX_PENDIENTES']:
+        config['MAX_PENDIENTES'] = config['WORKERS'] * 4
+    return config
+
+
+class HashingSaturado(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'El servidor está procesando demasiados inicios de sesión. Intenta de nuevo en unos segundos.'
+    default_code = 'hashing_saturado'
+
+
+class MetricasHashing:
+    """Tiempos por hash: espera por un hueco en el pool y duración del hash en sí"""
+
+    VENTANA = 1000  # últimos hashes usados para los percentiles
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self._operaciones = {}
+            self.rechazados = 0
+
+    def registrar(self, operacion, espera, duracion):
+        with self._lock:
+            datos = self._operaciones.setdefault(operacion, {
+                'total': 0, 'segundos': 0.0, 'maximo': 0.0, 'espera': 0.0,
+                'ventana': deque(maxlen=self.VENTANA),
+            })
+            datos['total'] += 1
+            datos['segundos'] += duracion
+            datos['espera'] += espera
+            datos['maximo'] = max(datos['maximo'], duracion)
+            datos['ventana'].append(duracion)
+
+    def registrar_rechazo(self):
+        with self._lock:
+            self.rechazados += 1
+
+    def resumen(self):
+        """Por operación: total, media, p50, p95 y máximo en milisegundos, más la espera media por hueco"""
+        with self._lock:
+            resumen = {'rechazados': self.rechazados}
+            for operacion, datos in self._operaciones.items():
+                ventana = sorted(datos['ventana'])
+                resumen[operacion] = {
+                    'total': datos['total'],
+                    'media_ms': datos['segundos'] / datos['total'] * 1000,
+                    'p50_ms': ventana[len(ventana) // 2] * 1000,
+                    'p95_ms': ventana[min(len(ventana) - 1, int(len(ventana) * 0.95))] * 1000,
+                    'max_ms': datos['maximo'] * 1000,
+                    'espera_media_ms': datos['espera'] / datos['total'] * 1000,
+                }
+            return resumen
+
+
+def _cronometrado(funcion, *args):
+    """Se ejecuta en el worker: devuelve el resultado y lo que tardó el hash"""
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+class PoolHashing:
+    """
+    Pool de procesos con contrapresión para hashear y verificar contraseñas.
+    El hasher se resuelve en el proceso principal (con los settings reales) y al
+    worker solo viaja el objeto hasher con la contraseña y la sal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._huecos = None
+        self._config = None
+        self.metricas = MetricasHashing()
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = config_hashing()
+        return self._config
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                config = self.config
+                self._huecos = threading.BoundedSemaphore(config['MAX_PENDIENTES'])
+                self._executor = ProcessPoolExecutor(
+                    max_workers=config['WORKERS'],
+                    mp_context=get_context(config['CONTEXTO']),
+                )
+            return self._executor, self._huecos
+
+    def cerrar(self):
+        """Apaga el pool; se vuelve a crear con la configuración vigente en el próximo hash"""
+        with self._lock:
+            executor, self._executor, self._config = self._executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reservar(self, huecos):
+        if not huecos.acquire(timeout=self.config['ESPERA_MAXIMA']):
+            self.metricas.registrar_rechazo()
+            raise HashingSaturado()
+
+    def _enviar(self, operacion, funcion, *args):
+        """Envía el trabajo al pool y devuelve el future, con el hueco reservado hasta que termine"""
+        executor, huecos = self._pool()
+        solicitado = time.perf_counter()
+        self._reservar(huecos)
+        espera = time.perf_counter() - solicitado
+        try:
+            futuro = executor.submit(_cronometrado, funcion, *args)
+        except BaseException:
+            huecos.release()
+            raise
+
+        def terminado(f):
+            huecos.release()
+            if not f.cancelled() and f.exception() is None:
+                self.metricas.registrar(operacion, espera, f.result()[1])
+
+        futuro.add_done_callback(terminado)
+        return futuro
+
+    def ejecutar(self, operacion, funcion, *args):
+        if self.config['MODO'] != 'procesos':
+            resultado, duracion = _cronometrado(funcion, *args)
+            self.metricas.registrar(operacion, 0.0, duracion)
+            return resultado
+        for intento in range(2):
+            try:
+                return self._enviar(operacion, funcion, *args).result()[0]
+            except BrokenProcessPool:
+                # Un worker murió (OOM, kill): se rehace el pool y se reintenta una vez
+                logger.warning('Pool de hashing roto (intento %s), se rehace', intento + 1)
+                self.cerrar()
+        # Si el pool no logra arrancar, mejor un login lento que uno fallido
+        logger.error('Pool de hashing no disponible, se hashea en el hilo del request')
+        resultado, duracion = _cronometrado(funcion, *args)
+        self.metricas.registrar(operacion, 0.0, duracion)
+        return resultado
+
+    def ejecutar_varios(self, operacion, funcion, tareas):
+        """Ejecuta funcion(*args) para cada tupla de `tareas` repartidas en el pool; resultados en orden"""
+        if self.config['MODO'] == 'procesos':
+            try:
+                futuros = [self._enviar(operacion, funcion, *args) for args in tareas]
+                return [futuro.result()[0] for futuro in futuros]
+            except BrokenProcessPool:
+                logger.warning('Pool de hashing roto en un trabajo por lotes, se hashea en el hilo actual')
+                self.cerrar()
+        resultados = []
+        for args in tareas:
+            resultado, duracion = _cronometrado(funcion, *args)
+            self.metricas.registrar(operacion, 0.0, duracion)
+            resultados.append(resultado)
+        return resultados
+
+    async def aejecutar(self, operacion, funcion, *args):
+        if self.config['MODO'] != 'procesos':
+            return await asyncio.to_thread(self.ejecutar, operacion, funcion, *args)
+        # Reservar el hueco puede esperar: se hace en un hilo para no bloquear el event loop
+        try:
+            futuro = await asyncio.to_thread(self._enviar, operacion, funcion, *args)
+            resultado, _ = await asyncio.wrap_future(futuro)
+        except BrokenProcessPool:
+            self.cerrar()
+            return await asyncio.to_thread(self.ejecutar, operacion, funcion, *args)
+        return resultado
+
+
+pool_hashing = PoolHashing()
+
+
+@receiver(setting_changed)
+def reiniciar_pool(*, setting, **kwargs):
+    if setting in ('HASHING_PASSWORDS', 'PASSWORD_HASHERS'):
+        pool_hashing.cerrar()
+
+
+def _preparar_hash(password, salt=None, hasher='default'):
+    if password is None:
+        # Contraseña inutilizable: no hay nada que hashear
+        return None
+    hasher = get_hasher(hasher)
+    return hasher, password, salt or hasher.salt()
+
+
+def make_password(password, salt=None, hasher='default'):
+    """Como django.contrib.auth.hashers.make_password, pero el hash corre en el pool"""
+    preparado = _preparar_hash(password, salt, hasher)
+    if preparado is None:
+        return make_password_local(None)
+    hasher, password, salt = preparado
+    return pool_hashing.ejecutar('make_password', hasher.encode, password, salt)
+
+
+async def amake_password(password, salt=None, hasher='default'):
+    preparado = _preparar_hash(password, salt, hasher)
+    if preparado is None:
+        return make_password_local(None)
+    hasher, password, salt = preparado
+    return await pool_hashing.aejecutar('make_password', hasher.encode, password, salt)
+
+
+def _hashear_tramo(hasher, pares):
+    return [hasher.encode(password, salt) for password, salt in pares]
+
+
+def make_passwords(passwords, hasher='default'):
+    """
+    Hashes de muchas contraseñas (None = contraseña inutilizable), en orden. Se
+    reparten en un trabajo por worker del pool: un viaje al proceso por tramo y no
+    por contraseña, y todos los núcleos hasheando a la vez.
+    """
+    hasher = get_hasher(hasher)
+    resultado = [make_password_local(None) if password is None else None for password in passwords]
+    pendientes = [(i, password, hasher.salt()) for i, password in enumerate(passwords) if password is not None]
+    if not pendientes:
+        return resultado
+    config = pool_hashing.config
+    partes = config['WORKERS'] if config['MODO'] == 'procesos' else 1
+    tamano = -(-len(pendientes) // partes)
+    tramos = [pendientes[i:i + tamano] for i in range(0, len(pendientes), tamano)]
+    hashes = pool_hashing.ejecutar_varios(
+        'make_password_lote', _hashear_tramo,
+        [(hasher, [(password, salt) for _, password, salt in tramo]) for tramo in tramos],
+    )
+    for tramo, codificados in zip(tramos, hashes):
+        for (i, _, _), codificado in zip(tramo, codificados):
+            resultado[i] = codificado
+    return resultado
+
+
+def _preparar_verificacion(password, encoded):
+    if password is None or not is_password_usable(encoded):
+        return None
+    try:
+        return identify_hasher(encoded)
+    except ValueError:
+        return None
+
+
+def _debe_actualizarse(hasher, encoded):
+    preferido = get_hasher('default')
+    return hasher.algorithm != preferido.algorithm or preferido.must_update(encoded)
+
+
+def check_password(password, encoded, setter=None):
+    """
+    Como django.contrib.auth.hashers.check_password (incluida la actualización del
+    hash con `setter` si el algoritmo quedó viejo), con la verificación en el pool.
+    """
+    hasher = _preparar_verificacion(password, encoded)
+    if hasher is None:
+        return False
+    es_correcta = pool_hashing.ejecutar('check_password', hasher.verify, password, encoded)
+    if not es_correcta:
+        hasher.harden_runtime(password, encoded)
+    elif setter and _debe_actualizarse(hasher, encoded):
+        setter(password)
+    return es_correcta
+
+
+async def acheck_password(password, encoded, setter=None):
+    hasher = _preparar_verificacion(password, encoded)
+    if hasher is None:
+        return False
+    es_correcta = await pool_hashing.aejecutar('check_password', hasher.verify, password, encoded)
+    if not es_correcta:
+        hasher.harden_runtime(password, encoded)
+    elif setter and _debe_actualizarse(hasher, encoded):
+        await setter(password)
+    return es_correcta
+
+
+def asignar_password(user, raw_password):
+    """Equivalente a user.set_password() con el hash en el pool (no guarda)"""
+    user.password = make_password(raw_password)
+    user._password = raw_password
+
+
+def verificar_password(user, raw_password):
+    """Equivalente a user.check_password(): si el hash quedó viejo lo actualiza y guarda"""
+    def actualizar(raw_password):
+        asignar_password(user, raw_password)
+        user._password = None
+        user.save(update_fields=['password'])
+    return check_password(raw_password, user.password, actualizar)
+
+
+async def averificar_password(user, raw_password):
+    async def actualizar(raw_password):
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=['password'])
+    return await acheck_password(raw_password, user.password, actualizar)
+
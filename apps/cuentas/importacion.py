@@ -0,0 +1,260 @@
+"""
+Importación masiva de usuarios (alta de una clínica con su personal y pacientes).
+
+El archivo (CSV con encabezados o JSON lines, un objeto por línea) se lee fila a
+fila sin cargarlo entero. Las filas se procesan por lotes de TAMANO_LOTE:
+
+    1. validación de cada fila con los validadores de los campos del modelo (sin consultas)
+    2. una sola consulta por lote para ver qué correos ya existen, en Usuario o en User
+    3. hashes de las contraseñas del lote repartidos en el pool (hashing.make_passwords)
+    4. bulk_create de las credenciales (User) y de los perfiles (Usuario), un registro
+       de bitácora por lote y el contador de usuarios del grupo, todo en una transacción
+
+Devuelve un informe con los errores por fila; las filas con error no se crean y
+no impiden crear las demás.
+
+El hash de la contraseña es lo caro (PBKDF2 tarda ~0,5 s por contraseña): para
+altas grandes conviene no mandar contraseñas y pedir `invitar`. Cada usuario queda
+con una contraseña inutilizable y un token de restablecimiento que le llega por
+correo (bandeja de salida, ver correo.py).
+"""
+import csv
+import io
+import json
+import secrets
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .correo import config_correo
+from .hashing import make_passwords
+from .models import CorreoSaliente, Grupo, Rol, Usuario
+from .utils import log_action
+
+TAMANO_LOTE = 500
+MAX_FILAS = 50_000
+CAMPOS = ['nombre', 'correo', 'sexo', 'fecha_nacimiento', 'telefono', 'direccion']
+ROLES_IMPORTABLES = ['paciente', 'medico', 'administrador']
+FORMATOS = ['csv', 'ndjson']
+
+
+FilaValida = namedtuple('FilaValida', ['numero', 'datos', 'rol', 'password', 'extra'])
+
+
+class ArchivoInvalido(Exception):
+    pass
+
+
+class Alta:
+    """
+    Lo que crea cada fila además de su User y su Usuario. La importación de usuarios
+    usa esta clase tal cual; otras altas masivas (p. ej. AltaPacientes) la extienden.
+    """
+    rol = None              # rol de todas las filas; None = columna `rol` (por defecto paciente)
+    descripcion = 'usuarios'
+    entidad = 'Usuario'
+
+    def limpiar(self, fila):
+        """Datos propios de la fila (quedan en FilaValida.extra) y sus errores por campo"""
+        return None, {}
+
+    def descartar(self, lote):
+        """Filas del lote que chocan con lo que ya hay en la base: {número de fila: errores}"""
+        return {}
+
+    def preparar(self, lote):
+        """Se llama antes de abrir la transacción del lote (p. ej. para reservar números)"""
+
+    def crear(self, lote, usuarios):
+        """Dentro de la transacción del lote, con los Usuario ya creados; devuelve lo que se registra en la bitácora"""
+        return usuarios
+
+
+def formato_de(nombre_archivo, formato=None):
+    if formato:
+        if formato not in FORMATOS:
+            raise ArchivoInvalido(f"Formato no soportado. Opciones: {', '.join(FORMATOS)}")
+        return formato
+    return 'ndjson' if nombre_archivo.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def leer_filas(archivo, formato):
+    """(número de fila, dict) por cada fila del archivo, sin leerlo entero"""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        lector = csv.DictReader(texto)
+        if not lector.fieldnames:
+            raise ArchivoInvalido('El archivo CSV está vacío')
+        lector.fieldnames = [nombre.strip().lower() for nombre in lector.fieldnames]
+        for numero, fila in enumerate(lector, start=2):
+            yield numero, fila
+        return
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield numero, fila if isinstance(fila, dict) else None
+
+
+def _limpiar(fila, roles, alta):
+    """Datos del perfil, rol, contraseña y datos propios del alta de una fila, con los errores por campo"""
+    datos, errores = {}, {}
+    for campo in CAMPOS:
+        valor = fila.get(campo)
+        if isinstance(valor, str):
+            valor = valor.strip()
+        campo_modelo = Usuario._meta.get_field(campo)
+        if valor in (None, ''):
+            if not campo_modelo.null:
+                errores[campo] = ['Este campo es requerido.']
+            datos[campo] = None
+            continue
+        try:
+            datos[campo] = campo_modelo.clean(valor, None)
+        except ValidationError as e:
+            errores[campo] = e.messages
+    if datos.get('correo'):
+        datos['correo'] = User.objects.normalize_email(datos['correo'])
+
+    rol = alta.rol or str(fila.get('rol') or 'paciente').strip()
+    if rol not in roles:
+        errores['rol'] = [f"Rol no válido. Opciones: {', '.join(ROLES_IMPORTABLES)}"]
+    password = str(fila['password']) if fila.get('password') not in (None, '') else None
+    extra, errores_extra = alta.limpiar(fila)
+    errores.update(errores_extra)
+    return datos, roles.get(rol), password, extra, errores
+
+
+def _correos_existentes(correos):
+    """Correos del lote que ya tienen perfil o credencial, como username o como email (una consulta)"""
+    perfiles = Usuario.objects.filter(correo__in=correos).order_by().values_list('correo', flat=True)
+    usernames = User.objects.filter(username__in=correos).order_by().values_list('username', flat=True)
+    emails = User.objects.filter(email__in=correos).order_by().values_list('email', flat=True)
+    return set(perfiles.union(usernames, emails))
+
+
+def _mensaje_invitacion(usuario, grupo):
+    return CorreoSaliente(
+        grupo_id=grupo.pk,
+        asunto=f"Tu cuenta en {grupo.nombre}",
+        cuerpo=(
+            f"Hola {usuario.nombre},\n\n"
+            f"{grupo.nombre} te dio de alta en el sistema. Para elegir tu contraseña usa "
+            f"este token de restablecimiento junto con tu correo ({usuario.correo}):\n\n"
+            f"{usuario.token_reset_password}\n\n"
+        ),
+        destinatarios=[usuario.correo],
+        remitente=config_correo()['REMITENTE'],
+    )
+
+
+def _crear_lote(lote, grupo, request, actor, invitar, alta):
+    """Crea los usuarios de un lote de FilaValida (y lo propio del alta); devuelve los Usuario creados"""
+    hashes = make_passwords([fila.password for fila in lote])
+    alta.preparar(lote)
+    with transaction.atomic():
+        credenciales = User.objects.bulk_create([
+            User(username=User.normalize_username(fila.datos['correo']), email=fila.datos['correo'], password=hash_)
+            for fila, hash_ in zip(lote, hashes)
+        ])
+        usuarios = []
+        for fila, credencial in zip(lote, credenciales):
+            token = secrets.token_urlsafe(16) if invitar and fila.password is None else None
+            usuarios.append(Usuario(grupo=grupo, user=credencial, rol=fila.rol, token_reset_password=token, **fila.datos))
+        usuarios = Usuario.objects.bulk_create(usuarios)
+        # bulk_create no pasa por save(): el contador de usuarios activos se mueve a mano
+        Grupo.mover_usuario_activo(grupo.pk, len(usuarios))
+        invitaciones = [_mensaje_invitacion(u, grupo) for u in usuarios if u.token_reset_password]
+        if invitaciones:
+            CorreoSaliente.objects.bulk_create(invitaciones)
+        creados = alta.crear(lote, usuarios)
+        log_action(
+            request=request,
+            accion=f"Creó {len(creados)} {alta.descripcion} por importación",
+            objeto=f"{alta.entidad}: importación de {len(creados)} (id:{creados[0].pk}-{creados[-1].pk})",
+            usuario=actor,
+        )
+    return usuarios
+
+
+def _hasta_error_de_lectura(filas, informe):
+    """Las filas del archivo hasta el primer error de lectura, que queda anotado en el informe"""
+    try:
+        yield from filas
+    except (UnicodeDecodeError, csv.Error) as e:
+        informe['errores'].append({
+            'fila': None, 'correo': None,
+            'errores': {'archivo': [f'No se pudo leer el resto del archivo: {e}']},
+        })
+
+
+def importar_usuarios(filas, grupo, request=None, actor=None, invitar=False, tamano_lote=TAMANO_LOTE, alta=None):
+    """
+    Crea los usuarios de `filas` ((número, dict), ver leer_filas) en `grupo`, con lo
+    que agregue `alta` (ver Alta). Devuelve {'filas', 'creados', 'invitados',
+    'errores': [{'fila', 'correo', 'errores'}]}.
+    """
+    alta = alta or Alta()
+    roles = {r.nombre: r for r in Rol.objects.filter(nombre__in=ROLES_IMPORTABLES)}
+    informe = {'filas': 0, 'creados': 0, 'invitados': 0, 'errores': []}
+    vistos = set()
+
+    def procesar(pendientes):
+        existentes = _correos_existentes([fila.datos['correo'] for fila in pendientes])
+        descartadas = alta.descartar(pendientes)
+        validos = []
+        for fila in pendientes:
+            errores = dict(descartadas.get(fila.numero, {}))
+            if fila.datos['correo'] in existentes:
+                errores['correo'] = ['Ya existe un usuario con este correo.']
+            if errores:
+                informe['errores'].append({'fila': fila.numero, 'correo': fila.datos['correo'], 'errores': errores})
+            else:
+                validos.append(fila)
+        if not validos:
+            return
+        try:
+            creados = _crear_lote(validos, grupo, request, actor, invitar, alta)
+        except IntegrityError:
+            # Otro alta con alguno de estos correos entró entre la verificación y el INSERT
+            informe['errores'].extend(
+                {'fila': fila.numero, 'correo': fila.datos['correo'],
+                 'errores': {'fila': ['Conflicto al guardar el lote; volver a importar esta fila.']}}
+                for fila in validos
+            )
+        else:
+            informe['creados'] += len(creados)
+            informe['invitados'] += sum(1 for u in creados if u.token_reset_password)
+
+    pendientes = []
+    for numero, fila in _hasta_error_de_lectura(filas, informe):
+        if informe['filas'] == MAX_FILAS:
+            informe['errores'].append({
+                'fila': numero, 'correo': None,
+                'errores': {'archivo': [f'El archivo supera las {MAX_FILAS} filas; desde aquí no se procesó.']},
+            })
+            break
+        informe['filas'] += 1
+        if fila is None:
+            informe['errores'].append({'fila': numero, 'correo': None, 'errores': {'fila': ['No es un objeto JSON válido.']}})
+            continue
+        datos, rol, password, extra, errores = _limpiar(fila, roles, alta)
+        if not errores and datos['correo'] in vistos:
+            errores = {'correo': ['Correo repetido en el archivo.']}
+        if errores:
+            informe['errores'].append({'fila': numero, 'correo': datos.get('correo'), 'errores': errores})
+            continue
+        vistos.add(datos['correo'])
+        pendientes.append(FilaValida(numero, datos, rol, password, extra))
+        if len(pendientes) >= tamano_lote:
+            procesar(pendientes)
+            pendientes = []
+    if pendientes:
+        procesar(pendientes)
+    informe['errores'].sort(key=lambda e: (e['fila'] is None, e['fila'] or 0))
+    return informe
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from apps.cuentas.archivo import archivar, directorio
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve los meses de bitácora fuera de la retención a segmentos NDJSON comprimidos '
+        '(BITACORA["DIRECTORIO_ARCHIVO"]) y los borra de la base. Pensado para correr a diario.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retencion', type=int, help='Meses completos que quedan en la base (por defecto, BITACORA["RETENCION_MESES"])')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por DELETE cuando el mes no tiene partición propia')
+        parser.add_argument('--ahora', help='Fecha y hora de referencia (ISO 8601); por defecto, ahora')
+
+    def handle(self, *args, **options):
+        ahora = None
+        if options['ahora']:
+            ahora = parse_datetime(options['ahora'])
+            if ahora is None:
+                raise CommandError('--ahora debe ser una fecha y hora ISO 8601')
+        if options['retencion'] is not None and options['retencion'] < 0:
+            raise CommandError('--retencion no puede ser negativa')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+
+        resultado = archivar(retencion=options['retencion'], ahora=ahora, lote=options['lote'])
+        for mes, archivadas, borradas in resultado:
+            self.stdout.write(f'{mes:%Y-%m}: {archivadas} registros archivados, {borradas} borrados de la base')
+        if not resultado:
+            self.stdout.write('Nada que archivar')
+        else:
+            self.stdout.write(f'Segmentos en {directorio()}')
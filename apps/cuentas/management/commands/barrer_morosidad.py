@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from apps.cuentas.morosidad import barrer_morosidad
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa a VENCIDO los pagos cuyo vencimiento ya pasó y actualiza el estado MOROSO/ACTIVO '
+        'de los grupos. Pensado para correr cada minuto (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Filas por sentencia UPDATE')
+        parser.add_argument('--ahora', help='Fecha y hora de referencia (ISO 8601); por defecto, ahora')
+
+    def handle(self, *args, **options):
+        ahora = None
+        if options['ahora']:
+            ahora = parse_datetime(options['ahora'])
+            if ahora is None:
+                raise CommandError('--ahora debe ser una fecha y hora ISO 8601')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+
+        resultado = barrer_morosidad(ahora=ahora, lote=options['lote'])
+        for paso, datos in resultado.items():
+            self.stdout.write(
+                f"{paso}: {datos['filas']} filas en {datos['sentencias']} sentencias ({datos['ms']:.1f} ms)"
+            )
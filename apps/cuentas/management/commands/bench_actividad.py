@@ -0,0 +1,91 @@
+import time
+from datetime import timedelta
+
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.cuentas import actividad
+from apps.cuentas.auditoria import armar_registro, escritor_bitacora
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles, crear_usuario
+from apps.cuentas.models import ActividadDiaria, Bitacora
+from apps.cuentas.tenant import ANONIMO
+
+TIPOS = ['CREAR', 'ACTUALIZAR', 'ACTUALIZAR', 'ACTUALIZAR', 'ELIMINAR', 'LOGIN', 'PAGO']
+
+
+class Command(BenchmarkCommand):
+    help = 'Gráfico de actividad de 30 días: GROUP BY sobre la bitácora frente al resumen incremental, y costo del resumen al escribir.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='50000,200000,800000', help='Registros de la clínica en cada medición (repartidos en 180 días)')
+        parser.add_argument('--repeticiones', type=int, default=10)
+
+    def percentil_95(self, funcion, repeticiones):
+        muestras = []
+        for _ in range(repeticiones):
+            with cronometro() as t:
+                funcion()
+            muestras.append(t['segundos'])
+        muestras.sort()
+        return muestras[min(len(muestras) - 1, int(len(muestras) * 0.95))]
+
+    def run_benchmark(self, *args, **options):
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Actividad', roles)
+        actores = [
+            crear_usuario(f'actor{i}@clinica-actividad.bench', roles['medico'], grupo)[1]
+            for i in range(25)
+        ]
+        ahora = timezone.now()
+        hasta = timezone.localdate(ahora)
+        desde = hasta - timedelta(days=29)
+
+        def crudo():
+            # Lo que haría el gráfico sin resumen
+            return list(
+                Bitacora.objects.filter(grupo=grupo, timestamp__gte=ahora - timedelta(days=30))
+                .annotate(d=TruncDate('timestamp')).values('d', 'usuario_id', 'tipo')
+                .annotate(n=Count('id')).order_by('d')
+            )
+
+        def resumen():
+            return actividad.acciones_por_dia(ActividadDiaria.objects.filter(grupo=grupo), desde, hasta)
+
+        self.fila(('registros', 10), ('GROUP BY p95', 14), ('resumen p95', 13), ('filas resumen', 14))
+        cargados = 0
+        for total in sorted(int(t) for t in options['tamanos'].split(',')):
+            paso = 180 * 86400 / total
+            for inicio in range(cargados, total, 20_000):
+                Bitacora.objects.bulk_create(
+                    Bitacora(
+                        grupo=grupo, usuario=actores[i % len(actores)], accion=f'Acción {i}',
+                        tipo=TIPOS[i % len(TIPOS)], timestamp=ahora - timedelta(seconds=(total - i) * paso),
+                    )
+                    for i in range(inicio, min(inicio + 20_000, total))
+                )
+            cargados = total
+            # Los registros de bulk_create no pasan por el escritor: se resumen con la reconstrucción
+            actividad.reconstruir(hasta - timedelta(days=180), hasta, dias_por_tramo=30)
+            self.fila(
+                (total, 10),
+                (f'{self.percentil_95(crudo, options["repeticiones"]) * 1000:.1f} ms', 14),
+                (f'{self.percentil_95(resumen, options["repeticiones"]) * 1000:.1f} ms', 13),
+                (ActividadDiaria.objects.filter(grupo=grupo).count(), 14),
+            )
+
+        # Costo de escritura: lotes de 200 registros con y sin el resumen
+        lote = [
+            (armar_registro(ANONIMO, f'Actualizó el paciente P{i}', usuario=actores[i % len(actores)]), time.monotonic())
+            for i in range(200)
+        ]
+        original = actividad.sumar_registros
+        for nombre, sumar in (('sin resumen', lambda registros: None), ('con resumen', original)):
+            actividad.sumar_registros = sumar
+            try:
+                with cronometro() as t:
+                    for _ in range(20):
+                        escritor_bitacora._escribir([(dict(r), e) for r, e in lote])
+            finally:
+                actividad.sumar_registros = original
+            self.stdout.write(f'escritura {nombre}: {t["segundos"] / 20 * 1000:.1f} ms por lote de 200')
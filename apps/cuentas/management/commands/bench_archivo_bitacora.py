@@ -0,0 +1,78 @@
+import tempfile
+from datetime import timedelta
+
+from django.db import reset_queries
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from apps.cuentas import archivo
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles
+from apps.cuentas.filtros import buscar_archivados
+from apps.cuentas.models import Bitacora, Usuario
+from apps.cuentas.pagination import BitacoraPagination
+
+
+class Command(BenchmarkCommand):
+    help = 'Archivo de la bitácora: tiempo de archivar, tamaño de los segmentos y costo de leer un mes archivado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=500_000, help='Registros repartidos en 24 meses')
+        parser.add_argument('--clinicas', type=int, default=20)
+        parser.add_argument('--retencion', type=int, default=12)
+
+    def run_benchmark(self, *args, **options):
+        with tempfile.TemporaryDirectory() as carpeta, override_settings(BITACORA={
+            'MODO': 'sincrono', 'DIRECTORIO_ARCHIVO': carpeta, 'RETENCION_MESES': options['retencion'],
+        }):
+            self.medir(carpeta, **options)
+
+    def medir(self, carpeta, **options):
+        roles = crear_roles()
+        grupos = [crear_clinica(f'Clinica {i}', roles)[0] for i in range(options['clinicas'])]
+        actores = {g.pk: Usuario.objects.get(grupo=g) for g in grupos}
+        ahora = timezone.now()
+        total = options['filas']
+        paso = 24 * 30 * 86400 / total
+        for desde in range(0, total, 20_000):
+            Bitacora.objects.bulk_create(
+                Bitacora(
+                    grupo=grupos[i % len(grupos)], usuario=actores[grupos[i % len(grupos)].pk],
+                    accion=f'Actualizó el paciente Paciente {i} (id:{i})', objeto=f'Paciente: Paciente {i} (id:{i})',
+                    tipo='ACTUALIZAR', entidad='paciente', ip='10.0.0.1',
+                    extra={'campos': ['telefono', 'direccion']},
+                    timestamp=ahora - timedelta(seconds=i * paso),
+                )
+                for i in range(desde, min(desde + 20_000, total))
+            )
+        reset_queries()
+
+        with cronometro() as t:
+            resultado = archivo.archivar(ahora=ahora)
+        archivadas = sum(a for _, a, _ in resultado)
+        quedan = Bitacora.objects.count()
+        tamano = sum(p.stat().st_size for p in archivo.directorio().glob('*.ndjson.gz'))
+        indices = sum(p.stat().st_size for p in archivo.directorio().glob('*.indice.json'))
+        self.stdout.write(
+            f'{archivadas} registros archivados en {len(resultado)} meses, {t["segundos"]:.1f} s '
+            f'({archivadas / t["segundos"]:.0f} registros/s); quedan {quedan} en la base'
+        )
+        self.stdout.write(
+            f'segmentos: {tamano / 1e6:.1f} MB ({tamano / max(archivadas, 1):.0f} bytes/registro), '
+            f'índices: {indices / 1e3:.1f} KB'
+        )
+
+        # Primera página de una clínica en un mes archivado frente al mismo mes aún en la base
+        grupo = grupos[0]
+        mes = resultado[len(resultado) // 2][0]
+        params = {'start': f'{mes:%Y-%m-%d}', 'end': f'{mes + timedelta(days=27):%Y-%m-%d}'}
+        tamano_pagina = BitacoraPagination.page_size
+        muestras = []
+        for _ in range(20):
+            with cronometro() as t:
+                filas = buscar_archivados(params, grupo.pk, limite=tamano_pagina + 1)
+            muestras.append(t['segundos'])
+        muestras.sort()
+        self.stdout.write(
+            f'página de un mes archivado ({len(filas)} filas): p50 {muestras[10] * 1000:.1f} ms, '
+            f'p95 {muestras[18] * 1000:.1f} ms'
+        )
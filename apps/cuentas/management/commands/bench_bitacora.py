@@ -0,0 +1,53 @@
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from apps.cuentas.auditoria import escritor_bitacora
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Bitacora, Usuario
+from apps.cuentas.tenant import get_tenant
+from apps.cuentas.utils import log_action
+
+
+class Command(BenchmarkCommand):
+    help = 'Costo de log_action en el hilo del request: INSERT síncrono frente a cola con escritura por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--acciones', type=int, default=2000)
+
+    def run_benchmark(self, *args, **options):
+        n = options['acciones']
+        roles = crear_roles()
+        crear_clinica('Clinica Bitacora', roles)
+        usuario = Usuario.objects.get(correo='admin@clinica-bitacora.bench')
+
+        request = RequestFactory().post('/api/doctores/medicos/', REMOTE_ADDR='10.0.0.1')
+        request.user = usuario.user
+        actor = get_tenant(request).usuario
+
+        self.fila(('modo', 22), ('µs/acción', 10), ('SQL en request', 15), ('guardados', 10), ('descartados', 12))
+        escenarios = [
+            ('sincrono', {'MODO': 'sincrono'}),
+            ('buffer', {'MODO': 'buffer', 'TAMANO_LOTE': 200, 'INTERVALO': 0.5, 'MAX_COLA': 10000}),
+            ('buffer, cola de 100', {'MODO': 'buffer', 'TAMANO_LOTE': 200, 'INTERVALO': 0.5, 'MAX_COLA': 100}),
+        ]
+        for nombre, config in escenarios:
+            Bitacora.objects.all().delete()
+            with override_settings(BITACORA=config):
+                escritor_bitacora.reiniciar_metricas()
+                with CaptureQueriesContext(connection) as consultas, cronometro() as tiempo:
+                    for i in range(n):
+                        log_action(request, f'Actualizó el médico {i}', objeto=f'Médico: {i}', usuario=actor)
+                escritor_bitacora.cerrar()
+                metricas = escritor_bitacora.metricas()
+            self.fila(
+                (nombre, 22), (f'{tiempo["segundos"] / n * 1e6:.0f}', 10), (len(consultas), 15),
+                (Bitacora.objects.count(), 10), (metricas['descartados'], 12),
+            )
+            if metricas['lotes'] and config['MODO'] == 'buffer':
+                self.stdout.write(
+                    f'    {metricas["lotes"]} lotes, {metricas["escritura_media_ms"]:.1f} ms por lote, '
+                    f'latencia media hasta quedar guardado {metricas["latencia_media_ms"]:.0f} ms'
+                )
+        sin_grupo = Bitacora.objects.filter(grupo__isnull=True).count()
+        self.stdout.write(f'  registros sin grupo: {sin_grupo}')
@@ -0,0 +1,120 @@
+import random
+from datetime import timedelta
+
+from django.db import reset_queries
+from django.utils import timezone
+
+from apps.cuentas.auditoria import clasificar_accion, entidad_de
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles, crear_usuario
+from apps.cuentas.filtros import filtrar_bitacora
+from apps.cuentas.models import Bitacora, Usuario
+from apps.cuentas.pagination import BitacoraPagination
+
+NOMBRES = ['Juan', 'Ana', 'Pedro', 'Lucía', 'Carlos', 'Sofía', 'Miguel', 'Valeria', 'Jorge', 'Camila']
+APELLIDOS = ['Pérez', 'Gómez', 'Rojas', 'Vargas', 'Flores', 'Mamani', 'Quispe', 'Torrez', 'Suárez', 'Castro']
+PLANTILLAS = [
+    ('Creó el paciente {n} (id:{i})', 'Paciente: {n} (id:{i})'),
+    ('Actualizó el médico {n} (id:{i})', 'Médico: {n} (id:{i})'),
+    ('Eliminó (soft delete) el tratamiento {n} (id:{i})', 'Tratamiento: {n} (id:{i})'),
+    ('Restauró la patología {n} (id:{i})', 'Patología: {n} (id:{i})'),
+    ('Inicio de sesión del usuario {n} (id:{i})', 'Usuario: {n} (id:{i})'),
+]
+
+
+def filtrar_como_antes(queryset, params):
+    """Los filtros que tenía BitacoraListAPIView (texto con icontains, fechas con __date)"""
+    if params.get('start'):
+        queryset = queryset.filter(timestamp__date__gte=params['start'])
+    if params.get('end'):
+        queryset = queryset.filter(timestamp__date__lte=params['end'])
+    if params.get('usuario'):
+        queryset = queryset.filter(usuario__nombre__icontains=params['usuario'])
+    if params.get('q'):
+        queryset = queryset.filter(accion__icontains=params['q'])
+    if params.get('tipo'):
+        queryset = queryset.filter(accion__startswith=params['tipo'])
+    if params.get('objeto'):
+        queryset = queryset.filter(objeto__istartswith=params['objeto'])
+    return queryset
+
+
+class Command(BenchmarkCommand):
+    help = 'p95 de la primera página de la bitácora con filtros mientras el registro crece: filtros anteriores frente a filtros con índice.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='25000,100000,400000', help='Registros totales en cada medición')
+        parser.add_argument('--repeticiones', type=int, default=30)
+        parser.add_argument('--actores', type=int, default=30, help='Usuarios de la clínica medida')
+
+    def run_benchmark(self, *args, **options):
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Bitacora', roles)
+        otro, _ = crear_clinica('Clinica Otra', roles)
+        azar = random.Random(10)
+        actores = [
+            crear_usuario(
+                f'actor{i}@clinica-bitacora.bench', roles['medico'], grupo,
+                nombre=f'{NOMBRES[i % 10]} {APELLIDOS[i // 10 % 10]} {i}',
+            )[1]
+            for i in range(options['actores'])
+        ]
+        raro = actores[-1]
+        usuarios = Usuario.objects.filter(grupo=grupo)
+
+        orden = BitacoraPagination.ordering
+        tamano = BitacoraPagination.page_size
+        desde = timezone.now() - timedelta(days=730)
+        dia = (desde + timedelta(days=365)).date()
+        escenarios = [
+            ('semana', {'start': str(dia), 'end': str(dia + timedelta(days=6))}),
+            ('actor', {'usuario': raro.nombre}),
+            ('texto común', {'q': 'Pérez'}),
+            ('texto raro', {'q': '123457'}),
+            ('tipo', {'tipo': 'Eliminó'}),
+            ('objeto', {'objeto': 'Patología'}),
+        ]
+
+        self.fila(('registros', 10), ('filtro', 12), ('antes p95', 12), ('ahora p95', 12), ('filas', 6))
+        cargados = 0
+        for total in sorted(int(t) for t in options['tamanos'].split(',')):
+            # Los registros se reparten en dos años; el actor raro escribe uno de cada 200
+            lote = []
+            for i in range(cargados, total):
+                plantilla, objeto = PLANTILLAS[i % len(PLANTILLAS)]
+                nombre = f'{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)}'
+                accion = plantilla.format(n=nombre, i=i)
+                objeto = objeto.format(n=nombre, i=i)
+                lote.append(Bitacora(
+                    grupo=grupo if i % 4 else otro,
+                    usuario=raro if i % 200 == 1 else actores[i % (len(actores) - 1)],
+                    accion=accion, objeto=objeto, tipo=clasificar_accion(accion), entidad=entidad_de(objeto),
+                    ip='10.0.0.1', timestamp=desde + timedelta(seconds=i * 63_072_000 // total),
+                ))
+                if len(lote) == 10_000:
+                    Bitacora.objects.bulk_create(lote)
+                    lote = []
+            Bitacora.objects.bulk_create(lote)
+            cargados = total
+            reset_queries()
+
+            base = Bitacora.objects.filter(grupo=grupo)
+            for nombre, params in escenarios:
+                ahora_params = dict(params)
+                if 'tipo' in params:
+                    ahora_params['tipo'] = clasificar_accion(params['tipo'])
+                tiempos = {}
+                for clave, consulta in (
+                    ('antes', filtrar_como_antes(base, params)),
+                    ('ahora', filtrar_bitacora(base, ahora_params, usuarios=usuarios)),
+                ):
+                    muestras = []
+                    for _ in range(options['repeticiones']):
+                        with cronometro() as t:
+                            filas = list(consulta.order_by(*orden)[:tamano + 1])
+                        muestras.append(t['segundos'])
+                    muestras.sort()
+                    tiempos[clave] = muestras[min(len(muestras) - 1, int(len(muestras) * 0.95))] * 1000
+                self.fila(
+                    (total, 10), (nombre, 12), (f'{tiempos["antes"]:.1f} ms', 12),
+                    (f'{tiempos["ahora"]:.1f} ms', 12), (len(filas), 6),
+                )
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Bitacora, Usuario
+from apps.cuentas.pagination import BitacoraPagination
+
+
+class Command(BenchmarkCommand):
+    help = 'Costo de una página de la bitácora según su profundidad: OFFSET frente a cursor (keyset).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=1_000_000, help='Registros de bitácora de la clínica medida')
+        parser.add_argument('--otras', type=int, default=100_000, help='Registros repartidos en otras clínicas')
+        parser.add_argument('--tamano', type=int, default=50, help='Filas por página')
+
+    def run_benchmark(self, *args, **options):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Bitacora', roles)
+        otro, _ = crear_clinica('Clinica Otra', roles)
+        actor = Usuario.objects.get(correo='admin@clinica-bitacora.bench')
+
+        with cronometro() as carga:
+            inicio = timezone.now() - timedelta(days=365)
+            # Las dos clínicas escriben intercaladas en el tiempo, como en producción
+            for clinica, usuario, cantidad, desfase in (
+                (grupo, actor, options['filas'], 0),
+                (otro, None, options['otras'], 7),
+            ):
+                paso = 30 * options['filas'] // max(cantidad, 1)
+                for desde in range(0, cantidad, 20_000):
+                    Bitacora.objects.bulk_create(
+                        Bitacora(
+                            grupo=clinica, usuario=usuario, accion=f'acción {i}', objeto=f'Objeto {i}',
+                            ip='10.0.0.1', timestamp=inicio + timedelta(seconds=i * paso + desfase),
+                        )
+                        for i in range(desde, min(desde + 20_000, cantidad))
+                    )
+        total = options['filas'] + options['otras']
+        reset_queries()
+        filas = Bitacora.objects.filter(grupo=grupo).count()
+        self.stdout.write(f'{filas} registros en la clínica medida ({total} en total), cargados en {carga["segundos"]:.0f} s')
+
+        tamano = options['tamano']
+        base = Bitacora.objects.filter(grupo=grupo).select_related('usuario', 'grupo')
+        orden = BitacoraPagination.ordering
+        paginador = BitacoraPagination()
+        paginador.campos = [(Bitacora._meta.get_field(c.lstrip('-')), c.startswith('-')) for c in orden]
+
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+        self.fila(('página', 10), ('OFFSET', 12), ('cursor', 12), ('API con cursor', 16), ('SQL API', 8))
+        for pagina in sorted({1, 10, 1_000, 5_000, filas // tamano // 2, filas // tamano}):
+            desplazamiento = (pagina - 1) * tamano
+            if desplazamiento >= filas:
+                continue
+
+            with cronometro() as offset:
+                list(base.order_by(*orden)[desplazamiento:desplazamiento + tamano])
+
+            # Cursor que apunta justo antes de esa página (lo que traería el enlace `next`)
+            cursor = None
+            if desplazamiento:
+                anterior = base.order_by(*orden)[desplazamiento - 1]
+                cursor = paginador.valores_de(anterior)
+            with cronometro() as keyset:
+                qs = base if cursor is None else base.filter(paginador.despues_de(cursor))
+                list(qs.order_by(*orden)[:tamano + 1])
+
+            url = '/api/cuentas/bitacora/'
+            params = {'page_size': tamano}
+            if cursor is not None:
+                paginador.base_url = f'http://testserver{url}'
+                params['cursor'] = paginador.encode_cursor(anterior, reverso=False).split('cursor=')[1]
+            with CaptureQueriesContext(connection) as consultas, cronometro() as api:
+                respuesta = cliente.get(url, params)
+            assert respuesta.status_code == 200 and len(respuesta.data['results']) == min(tamano, filas - desplazamiento)
+
+            self.fila(
+                (pagina, 10), (f'{offset["segundos"] * 1000:.1f} ms', 12), (f'{keyset["segundos"] * 1000:.1f} ms', 12),
+                (f'{api["segundos"] * 1000:.1f} ms', 16), (len(consultas), 8),
+            )
+
+        consulta = base.filter(paginador.despues_de(cursor)).order_by(*orden)[:tamano + 1]
+        self.stdout.write('plan de la consulta con cursor:')
+        for linea in consulta.explain().splitlines():
+            self.stdout.write(f'  {linea}')
@@ -0,0 +1,76 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.cuentas.authentication import revocaciones
+from apps.cuentas.benchmark import BenchmarkCommand, crear_clinica, crear_roles, crear_usuario
+from apps.cuentas.models import Bitacora, Pago
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente, PatologiasO
+
+ENDPOINTS = [
+    '/api/cuentas/usuarios/',
+    '/api/cuentas/grupos/',
+    '/api/cuentas/pagos/',
+    '/api/cuentas/bitacora/',
+    '/api/doctores/medicos/',
+    '/api/doctores/bloque-horario/',
+    '/api/diagnosticos/patologias/',
+    '/api/diagnosticos/pacientes/',
+]
+
+
+class Command(BenchmarkCommand):
+    help = 'Cuenta las consultas SQL por endpoint y cuántas se gastan resolviendo el tenant del actor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=5, help='Filas por modelo en cada clínica')
+        parser.add_argument(
+            '--auth', choices=['token', 'firmado'], default='token',
+            help='token: authtoken de DRF; firmado: token de acceso firmado (Bearer)',
+        )
+
+    def run_benchmark(self, *args, **options):
+        filas = options['filas']
+        roles = crear_roles()
+        token = None
+        for n in range(2):
+            grupo, token_clinica = crear_clinica(f'Clinica {n}', roles)
+            token = token or token_clinica
+            for i in range(filas):
+                medico = Medico.objects.create(
+                    grupo=grupo, rol=roles['medico'], nombre=f'medico {i}', correo=f'm{i}@c{n}.bench',
+                    sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'C{n}-{i}',
+                )
+                Bloque_Horario.objects.create(
+                    grupo=grupo, medico=medico, dia_semana='LUNES', hora_inicio='08:00', hora_fin='12:00',
+                )
+                _, usuario = crear_usuario(f'p{i}@c{n}.bench', roles['paciente'], grupo)
+                Paciente.objects.create(usuario=usuario, numero_historia_clinica=f'HC-{n}-{i}')
+                PatologiasO.objects.create(grupo=grupo, nombre=f'patologia {n}-{i}', gravedad='LEVE')
+                Pago.objects.create(grupo=grupo, monto=100)
+                Bitacora.objects.create(grupo=grupo, accion=f'accion {i}')
+
+        cliente = APIClient()
+        if options['auth'] == 'firmado':
+            login = cliente.post(
+                '/api/cuentas/usuarios/login/',
+                {'correo': 'admin@clinica-0.bench', 'password': 'clave-bench-123'},
+                format='json',
+            )
+            cliente.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+            # La lista de revocaciones se sincroniza cada pocos segundos, no por request
+            revocaciones.sincronizar(forzar=True)
+        else:
+            cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.fila(('endpoint', 34), ('consultas', 10), ('tenant', 6))
+        for url in ENDPOINTS:
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = cliente.get(url)
+            assert respuesta.status_code == 200, (url, respuesta.status_code)
+            tenant = sum(
+                1 for q in consultas.captured_queries
+                if 'FROM "cuentas_usuario"' in q['sql']
+                and ('"cuentas_usuario"."correo" =' in q['sql'] or '"cuentas_usuario"."user_id" =' in q['sql'])
+            )
+            self.fila((url, 34), (len(consultas), 10), (tenant, 6))
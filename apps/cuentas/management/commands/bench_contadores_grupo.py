@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles, crear_usuario
+from apps.cuentas.models import Pago
+
+
+class Command(BenchmarkCommand):
+    help = 'Consultas SQL por escritura de Pago y por listado de grupos (super admin) según el número de clínicas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinicas', type=int, default=20)
+        parser.add_argument('--pagos', type=int, default=5, help='Pagos por clínica')
+
+    def run_benchmark(self, *args, **options):
+        roles = crear_roles()
+        crear_usuario('root@bench.bench', roles['superAdmin'])
+        ahora = timezone.now()
+
+        def sentencias(funcion):
+            with CaptureQueriesContext(connection) as consultas:
+                resultado = funcion()
+            return resultado, len([q for q in consultas.captured_queries if q['sql'] not in ('BEGIN', 'COMMIT')])
+
+        pagos, crear = [], []
+        for n in range(options['clinicas']):
+            grupo, _ = crear_clinica(f'Clinica {n}', roles)
+            for i in range(options['pagos']):
+                pago, total = sentencias(lambda: Pago.objects.create(
+                    grupo=grupo, monto=100, fecha_vencimiento=ahora + timedelta(days=i - 1),
+                ))
+                pagos.append(pago)
+                crear.append(total)
+
+        marcar = []
+        for pago in pagos[::2]:
+            pago = Pago.objects.get(pk=pago.pk)
+            marcar.append(sentencias(pago.marcar_como_pagado)[1])
+
+        cliente = APIClient()
+        login = cliente.post(
+            '/api/cuentas/usuarios/login/',
+            {'correo': 'root@bench.bench', 'password': 'clave-bench-123'},
+            format='json',
+        )
+        cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {login.data["access"]}')
+        with CaptureQueriesContext(connection) as consultas, cronometro() as tiempo:
+            respuesta = cliente.get('/api/cuentas/grupos/')
+        assert respuesta.status_code == 200, respuesta.content
+
+        self.fila(('operación (sin BEGIN/COMMIT)', 34), ('consultas', 10))
+        self.fila(('crear pago', 34), (f'{sum(crear) / len(crear):.1f}', 10))
+        self.fila(('marcar pago como pagado', 34), (f'{sum(marcar) / len(marcar):.1f}', 10))
+        self.fila((f'listar {options["clinicas"]} grupos', 34), (len(consultas), 10))
+        self.stdout.write(f'  listado de grupos: {tiempo["segundos"] * 1000:.1f} ms')
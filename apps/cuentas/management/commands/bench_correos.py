@@ -0,0 +1,116 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import send_mail
+from django.test.utils import override_settings
+
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro
+from apps.cuentas.correo import despachar, encolar_correo, encolar_correos
+from apps.cuentas.models import CorreoSaliente
+
+
+class ServidorSMTP(socketserver.ThreadingTCPServer):
+    """SMTP mínimo que acepta todo, con demoras para simular la red y el handshake TLS"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, rtt, handshake):
+        super().__init__(('127.0.0.1', 0), ManejadorSMTP)
+        self.rtt, self.handshake = rtt, handshake
+        self.recibidos = 0
+        self.conexiones = 0
+        self.lock = threading.Lock()
+
+
+class ManejadorSMTP(socketserver.StreamRequestHandler):
+    def responder(self, respuesta):
+        time.sleep(self.server.rtt)
+        self.wfile.write(respuesta + b'\r\n')
+
+    def handle(self):
+        with self.server.lock:
+            self.server.conexiones += 1
+        time.sleep(self.server.handshake)
+        self.wfile.write(b'220 bench ESMTP\r\n')
+        en_datos = False
+        for linea in self.rfile:
+            if en_datos:
+                if linea == b'.\r\n':
+                    en_datos = False
+                    with self.server.lock:
+                        self.server.recibidos += 1
+                    self.responder(b'250 OK')
+                continue
+            comando = linea[:4].upper()
+            if comando == b'DATA':
+                en_datos = True
+                self.responder(b'354 Terminar con .')
+            elif comando == b'QUIT':
+                self.responder(b'221 Chau')
+                return
+            else:
+                self.responder(b'250 OK')
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Correos: send_mail dentro del request frente a la bandeja de salida, y rendimiento del '
+        'despachador con envíos masivos (p. ej. recordatorios de citas) contra un SMTP local con latencia simulada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--correos', type=int, default=300, help='Correos del envío masivo')
+        parser.add_argument('--rtt', type=float, default=20, help='Milisegundos por comando SMTP')
+        parser.add_argument('--handshake', type=float, default=150, help='Milisegundos extra al abrir cada conexión (TCP + TLS)')
+        parser.add_argument('--lotes', default='1,10,100', help='Correos por conexión a comparar')
+
+    def run_benchmark(self, *args, **options):
+        servidor = ServidorSMTP(options['rtt'] / 1000, options['handshake'] / 1000)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        smtp = {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1', 'EMAIL_PORT': servidor.server_address[1],
+            'EMAIL_USE_TLS': False, 'EMAIL_HOST_USER': '', 'EMAIL_HOST_PASSWORD': '',
+        }
+        try:
+            with override_settings(**smtp):
+                self.medir(servidor, **options)
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+
+    def medir(self, servidor, **options):
+        # Lo que espera el request de restablecimiento de contraseña
+        muestras = {'send_mail en el request': [], 'encolar (un INSERT)': []}
+        for i in range(20):
+            with cronometro() as t:
+                send_mail('Token', 'cuerpo', 'noreply@bench', [f'usuario{i}@bench'], fail_silently=False)
+            muestras['send_mail en el request'].append(t['segundos'])
+            with cronometro() as t:
+                encolar_correo('Token', 'cuerpo', [f'usuario{i}@bench'])
+            muestras['encolar (un INSERT)'].append(t['segundos'])
+        CorreoSaliente.objects.all().delete()
+        self.fila(('request', 26), ('p50', 10), ('p95', 10))
+        for nombre, valores in muestras.items():
+            valores.sort()
+            self.fila((nombre, 26), (f'{valores[10] * 1000:.1f} ms', 10), (f'{valores[18] * 1000:.1f} ms', 10))
+
+        self.stdout.write('')
+        total = options['correos']
+        self.fila(('correos por conexión', 22), ('conexiones', 12), ('tiempo', 10), ('correos/s', 10))
+        for lote in (int(l) for l in options['lotes'].split(',')):
+            encolar_correos([
+                CorreoSaliente(asunto='Recordatorio de cita', cuerpo=f'Su cita es mañana ({i})', destinatarios=[f'paciente{i}@bench'])
+                for i in range(total)
+            ])
+            servidor.conexiones = servidor.recibidos = 0
+            with cronometro() as t:
+                while despachar(lote)['enviados']:
+                    pass
+            assert servidor.recibidos == total, servidor.recibidos
+            self.fila(
+                (lote, 22), (servidor.conexiones, 12), (f'{t["segundos"]:.1f} s', 10),
+                (f'{total / t["segundos"]:.0f}', 10),
+            )
+            CorreoSaliente.objects.all().delete()
@@ -0,0 +1,78 @@
+import tracemalloc
+from datetime import timedelta
+
+from django.db import reset_queries
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles, crear_usuario
+from apps.cuentas.models import Bitacora
+from apps.cuentas.serializers import BitacoraSerializer
+
+
+class Command(BenchmarkCommand):
+    help = 'Exportación de la bitácora: lista completa serializada en memoria frente al endpoint en streaming (tiempos inflados por tracemalloc).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='10000,50000,200000', help='Registros de la clínica en cada medición')
+        parser.add_argument('--max-anterior', type=int, default=10_000, help='Tamaño máximo para medir la forma anterior (lenta: dos consultas por fila)')
+
+    def medir(self, funcion):
+        reset_queries()
+        tracemalloc.start()
+        try:
+            with contar_consultas() as consultas, cronometro() as t:
+                tamano = funcion()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return t['segundos'], pico, consultas['total'], tamano
+
+    def run_benchmark(self, *args, **options):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Exportacion', roles)
+        actores = [
+            crear_usuario(f'actor{i}@clinica-exportacion.bench', roles['medico'], grupo)[1]
+            for i in range(20)
+        ]
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        ahora = timezone.now()
+
+        def anterior():
+            # Lo que hacía el listado sin paginar: todo en memoria y el actor por fila
+            datos = BitacoraSerializer(Bitacora.objects.filter(grupo=grupo), many=True).data
+            return len(JSONRenderer().render(datos))
+
+        def streaming(comprimir):
+            def exportar():
+                extra = {'HTTP_ACCEPT_ENCODING': 'gzip'} if comprimir else {}
+                respuesta = cliente.get('/api/cuentas/bitacora/exportar/', {'formato': 'ndjson'}, **extra)
+                return sum(len(bloque) for bloque in respuesta.streaming_content)
+            return exportar
+
+        self.fila(('registros', 10), ('forma', 16), ('tiempo', 10), ('memoria pico', 14), ('consultas', 10), ('bytes', 12))
+        cargados = 0
+        for total in sorted(int(t) for t in options['tamanos'].split(',')):
+            for desde in range(cargados, total, 20_000):
+                Bitacora.objects.bulk_create(
+                    Bitacora(
+                        grupo=grupo, usuario=actores[i % len(actores)],
+                        accion=f'Actualizó el paciente Paciente {i} (id:{i})', objeto=f'Paciente: Paciente {i} (id:{i})',
+                        tipo='ACTUALIZAR', entidad='paciente', ip='10.0.0.1', extra={'campos': ['telefono']},
+                        timestamp=ahora - timedelta(seconds=i),
+                    )
+                    for i in range(desde, min(desde + 20_000, total))
+                )
+            cargados = total
+
+            formas = [('streaming', streaming(False)), ('streaming gzip', streaming(True))]
+            if total <= options['max_anterior']:
+                formas.insert(0, ('lista en memoria', anterior))
+            for nombre, funcion in formas:
+                segundos, pico, consultas, tamano = self.medir(funcion)
+                self.fila(
+                    (total, 10), (nombre, 16), (f'{segundos:.2f} s', 10), (f'{pico / 1e6:.1f} MB', 14),
+                    (consultas, 10), (f'{tamano / 1e6:.1f} MB', 12),
+                )
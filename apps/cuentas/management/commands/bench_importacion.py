@@ -0,0 +1,68 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.hashing import pool_hashing
+
+
+class Command(BenchmarkCommand):
+    help = 'Alta de usuarios: uno por request frente a la importación masiva (con y sin contraseñas), con el hasher real.'
+
+    hasher_rapido = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=10_000, help='Filas de la importación sin contraseñas (con invitación)')
+        parser.add_argument('--con-password', type=int, default=50, help='Filas de la importación con contraseñas')
+        parser.add_argument('--uno-por-uno', type=int, default=20, help='Usuarios creados con POST /usuarios/ para comparar')
+
+    def archivo(self, desde, cantidad, con_password):
+        lineas = ['nombre,correo,sexo,fecha_nacimiento,telefono,rol,password']
+        for i in range(desde, desde + cantidad):
+            password = f'Clave-Segura-{i}' if con_password else ''
+            lineas.append(f'Paciente {i},p{i}@importacion.bench,{"FM"[i % 2]},1990-05-05,7000{i % 10000:04d},paciente,{password}')
+        return SimpleUploadedFile('usuarios.csv', '\n'.join(lineas).encode(), content_type='text/csv')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Importacion', roles)
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        # El pool arranca fuera de las mediciones
+        pool_hashing.ejecutar('make_password', str, 'calentar')
+
+        self.fila(('forma', 30), ('usuarios', 10), ('tiempo', 10), ('usuarios/s', 11), ('consultas', 10), ('10k usuarios', 12))
+
+        def informar(nombre, cantidad, segundos, consultas):
+            self.fila(
+                (nombre, 30), (cantidad, 10), (f'{segundos:.1f} s', 10), (f'{cantidad / segundos:.1f}', 11),
+                (consultas, 10), (f'{10_000 * segundos / cantidad:.0f} s', 12),
+            )
+
+        n = options['uno_por_uno']
+        with contar_consultas() as consultas, cronometro() as t:
+            for i in range(n):
+                respuesta = cliente.post('/api/cuentas/usuarios/', {
+                    'nombre': f'Uno {i}', 'correo': f'uno{i}@importacion.bench', 'password': 'Clave-Segura-123',
+                    'sexo': 'F', 'fecha_nacimiento': '1995-05-05', 'rol': roles['paciente'].id,
+                }, format='json')
+                assert respuesta.status_code == 201, respuesta.content
+        informar('POST /usuarios/ uno por uno', n, t['segundos'], consultas['total'])
+
+        desde = 0
+        for nombre, cantidad, con_password, parametros in (
+            ('importar con contraseñas', options['con_password'], True, ''),
+            ('importar con invitación', options['usuarios'], False, '?invitar=1'),
+        ):
+            archivo = self.archivo(desde, cantidad, con_password)
+            desde += cantidad
+            with contar_consultas() as consultas, cronometro() as t:
+                respuesta = cliente.post(f'/api/cuentas/usuarios/importar/{parametros}', {'archivo': archivo}, format='multipart')
+            informe = respuesta.json()
+            assert informe['creados'] == cantidad, informe['errores'][:5]
+            informar(nombre, cantidad, t['segundos'], consultas['total'])
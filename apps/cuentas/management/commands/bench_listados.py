@@ -0,0 +1,98 @@
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Pago, Usuario
+from apps.cuentas.serializers import PagoSerializer, UsuarioSerializer
+from apps.doctores.models import Especialidad, Medico
+from apps.doctores.serializers import MedicoSerializer
+from apps.historiasDiagnosticos.models import Paciente, PatologiasO, TratamientoMedicacion
+from apps.historiasDiagnosticos.serializers import (
+    PacienteSerializer, PatologiasOSerializer, TratamientoMedicacionSerializer,
+)
+
+# (endpoint, serializer, queryset de la clínica tal como lo armaba la vista sin precarga)
+LISTADOS = [
+    ('/api/doctores/medicos/', MedicoSerializer, lambda g: Medico.objects.filter(grupo=g, estado=True)),
+    ('/api/cuentas/usuarios/', UsuarioSerializer, lambda g: Usuario.objects.filter(grupo=g)),
+    ('/api/diagnosticos/pacientes/', PacienteSerializer, lambda g: Paciente.objects.filter(usuario__grupo=g)),
+    ('/api/diagnosticos/tratamientos/', TratamientoMedicacionSerializer, lambda g: TratamientoMedicacion.objects.filter(grupo=g)),
+    ('/api/diagnosticos/patologias/', PatologiasOSerializer, lambda g: PatologiasO.objects.filter(grupo=g, estado=True)),
+    ('/api/cuentas/pagos/', PagoSerializer, lambda g: Pago.objects.filter(grupo=g)),
+]
+
+
+def poblar(grupo, roles, especialidades, filas, prefijo):
+    """Médicos, pacientes, tratamientos, patologías y pagos de una clínica, `filas` de cada uno"""
+    # Médico hereda de Usuario (herencia multitabla): bulk_create no sirve, van de a uno
+    for i in range(filas):
+        medico = Medico.objects.create(
+            grupo=grupo, rol=roles['medico'], nombre=f'Medico {i}', correo=f'm{i}@{prefijo}.bench',
+            sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'{prefijo}-{i}',
+        )
+        medico.especialidades.set(especialidades[i % 3:i % 3 + 2])
+    patologias = PatologiasO.objects.bulk_create([
+        PatologiasO(grupo=grupo, nombre=f'Patologia {prefijo}-{i}', gravedad='LEVE') for i in range(filas)
+    ])
+    pacientes = Usuario.objects.bulk_create([
+        Usuario(grupo=grupo, rol=roles['paciente'], nombre=f'Paciente {i}', correo=f'p{i}@{prefijo}.bench',
+                sexo='M', fecha_nacimiento='1990-01-01')
+        for i in range(filas)
+    ])
+    pacientes = Paciente.objects.bulk_create([
+        Paciente(usuario=usuario, numero_historia_clinica=f'HC-{prefijo}-{i}') for i, usuario in enumerate(pacientes)
+    ])
+    tratamientos = TratamientoMedicacion.objects.bulk_create([
+        TratamientoMedicacion(grupo=grupo, nombre=f'Tratamiento {prefijo}-{i}', descripcion='bench', duracion_dias=10)
+        for i in range(filas)
+    ])
+    for modelo, objetos in ((Paciente, pacientes), (TratamientoMedicacion, tratamientos)):
+        intermedia = modelo.patologias.through
+        campo = modelo.patologias.field
+        intermedia.objects.bulk_create([
+            intermedia(**{campo.m2m_column_name(): objeto.pk, campo.m2m_reverse_name(): patologias[(i + k) % filas].pk})
+            for i, objeto in enumerate(objetos) for k in range(2)
+        ])
+    # Pago calcula su vencimiento y mueve los contadores del grupo en save()
+    for _ in range(filas):
+        Pago.objects.create(grupo=grupo, monto=100)
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Consultas y tiempo de los listados con N filas: serializando sin precarga (como antes) '
+        'y por la API con las relaciones deducidas del serializer (RelacionesMixin).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, nargs='+', default=[50, 500], help='Filas por listado')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        especialidades = [Especialidad.objects.create(nombre=f'Especialidad {i}') for i in range(5)]
+        self.fila(('endpoint', 34), ('filas', 6), ('antes', 8), ('ms', 8), ('ahora', 8), ('ms', 8))
+        for n, filas in enumerate(options['filas']):
+            grupo, token = crear_clinica(f'Clinica {n}', roles)
+            poblar(grupo, roles, especialidades, filas, prefijo=f'c{n}')
+            cliente = APIClient()
+            cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            for url, serializer_class, queryset in LISTADOS:
+                with contar_consultas() as antes, cronometro() as t_antes:
+                    datos = serializer_class(queryset(grupo), many=True).data
+                # El presupuesto de consultas se verifica en cada listado
+                with override_settings(CONSULTAS={'VERIFICAR': True}):
+                    with contar_consultas() as ahora, cronometro() as t_ahora:
+                        respuesta = cliente.get(url)
+                assert respuesta.status_code == 200, (url, respuesta.status_code)
+                assert len(respuesta.json()) == len(datos), url
+                self.fila(
+                    (url, 34), (len(datos), 6),
+                    (antes['total'], 8), (f'{t_antes["segundos"] * 1000:.0f}', 8),
+                    (ahora['total'], 8), (f'{t_ahora["segundos"] * 1000:.0f}', 8),
+                )
+        self.stdout.write('  "ahora" incluye las consultas de autenticación del request')
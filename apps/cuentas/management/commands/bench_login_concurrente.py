@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, crear_clinica, crear_roles, crear_usuario, percentil
+from apps.cuentas.hashing import pool_hashing
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Pico de inicios de sesión concurrentes: latencia de login y de requests livianos '
+        'que llegan mientras tanto, con el hash en el hilo del request o en el pool de procesos.'
+    )
+
+    hasher_rapido = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Logins simultáneos')
+        parser.add_argument('--logins', type=int, default=48, help='Logins en total por modo')
+        parser.add_argument('--workers', type=int, default=None, help='Procesos del pool (por defecto, núcleos)')
+
+    def run_benchmark(self, *args, **options):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Login', roles)
+        correos = []
+        for i in range(options['hilos']):
+            correo = f'staff{i}@login.bench'
+            crear_usuario(correo, roles['medico'], grupo)
+            correos.append(correo)
+
+        self.fila(('modo', 10), ('logins/s', 10), ('login p50', 11), ('login p95', 11),
+                  ('liviano p50', 12), ('liviano p95', 12), ('errores', 8))
+        for modo in ('local', 'procesos'):
+            config = {'MODO': modo, 'WORKERS': options['workers'], 'MAX_PENDIENTES': 64, 'ESPERA_MAXIMA': 30}
+            with override_settings(HASHING_PASSWORDS=config):
+                pool_hashing.metricas.reiniciar()
+                if modo == 'procesos':
+                    # Arranque de los workers fuera de la medición
+                    pool_hashing.ejecutar('calentamiento', len, 'x')
+                resultado = self.pico(correos, token, options['logins'], options['hilos'])
+                metricas = pool_hashing.metricas.resumen()
+            pool_hashing.cerrar()
+            self.fila(
+                (modo, 10), (f'{resultado["logins_s"]:.2f}', 10),
+                (f'{resultado["login_p50"]:.0f} ms', 11), (f'{resultado["login_p95"]:.0f} ms', 11),
+                (f'{resultado["liviano_p50"]:.1f} ms', 12), (f'{resultado["liviano_p95"]:.1f} ms', 12),
+                (resultado['errores'], 8),
+            )
+            hash_ = metricas.get('check_password')
+            if hash_:
+                self.stdout.write(
+                    f'    check_password: {hash_["total"]} hashes, media {hash_["media_ms"]:.0f} ms, '
+                    f'p95 {hash_["p95_ms"]:.0f} ms, espera media por hueco {hash_["espera_media_ms"]:.1f} ms'
+                )
+
+    def pico(self, correos, token, total, hilos):
+        latencias, livianos, errores = [], [], []
+        terminado = threading.Event()
+
+        def login(i):
+            cliente = APIClient()
+            inicio = time.perf_counter()
+            try:
+                respuesta = cliente.post(
+                    '/api/cuentas/usuarios/login/',
+                    {'correo': correos[i % len(correos)], 'password': 'clave-bench-123'},
+                    format='json',
+                )
+                if respuesta.status_code != 200:
+                    errores.append(respuesta.status_code)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            finally:
+                connections.close_all()
+
+        def liviano():
+            # Request barato de otro usuario de la clínica, repetido durante todo el pico
+            cliente = APIClient()
+            cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            try:
+                while not terminado.is_set():
+                    inicio = time.perf_counter()
+                    cliente.get('/api/cuentas/roles/')
+                    livianos.append((time.perf_counter() - inicio) * 1000)
+                    time.sleep(0.01)
+            finally:
+                connections.close_all()
+
+        sonda = threading.Thread(target=liviano)
+        sonda.start()
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            list(executor.map(login, range(total)))
+        segundos = time.perf_counter() - inicio
+        terminado.set()
+        sonda.join()
+
+        return {
+            'logins_s': total / segundos,
+            'login_p50': percentil(latencias, 0.5),
+            'login_p95': percentil(latencias, 0.95),
+            'liviano_p50': percentil(livianos, 0.5),
+            'liviano_p95': percentil(livianos, 0.95),
+            'errores': len(errores),
+        }
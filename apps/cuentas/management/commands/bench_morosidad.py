@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro
+from apps.cuentas.models import Grupo, Pago
+from apps.cuentas.morosidad import barrer_morosidad
+
+
+class Command(BenchmarkCommand):
+    help = 'Barrido de morosidad por lotes frente a recorrer los pagos vencidos instancia por instancia.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grupos', type=int, default=5000)
+        parser.add_argument('--pagos', type=int, default=3, help='Pagos por grupo')
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def run_benchmark(self, *args, **options):
+        ahora = timezone.now()
+        grupos = Grupo.objects.bulk_create(
+            Grupo(nombre=f'Clinica {n}') for n in range(options['grupos'])
+        )
+        # Un tercio de los grupos con un pago ya vencido
+        Pago.objects.bulk_create(
+            Pago(grupo=grupo, monto=100, fecha_vencimiento=ahora + timedelta(days=i * 30 - (n % 3 == 0) * 45))
+            for n, grupo in enumerate(grupos) for i in range(options['pagos'])
+        )
+        Grupo.recalcular_contadores()
+        vencidos = Pago.objects.filter(estado='PENDIENTE', fecha_vencimiento__lt=ahora).count()
+
+        def reiniciar():
+            Pago.objects.filter(estado='VENCIDO').update(estado='PENDIENTE')
+            Grupo.objects.update(estado='ACTIVO')
+
+        with contar_consultas() as consultas, cronometro() as tiempo:
+            for pago in Pago.objects.filter(estado='PENDIENTE', fecha_vencimiento__lt=ahora).select_related('grupo'):
+                pago.estado = 'VENCIDO'
+                pago.save()
+                pago.grupo.actualizar_estado()
+        por_instancia = (consultas['total'], tiempo['segundos'])
+        reiniciar()
+
+        with contar_consultas() as consultas, cronometro() as tiempo:
+            resultado = barrer_morosidad(ahora=ahora, lote=options['lote'])
+        por_lotes = (consultas['total'], tiempo['segundos'])
+
+        with cronometro() as repetido:
+            barrer_morosidad(ahora=ahora, lote=options['lote'])
+
+        self.stdout.write(
+            f"{options['grupos']} grupos, {vencidos} pagos vencidos, "
+            f"{resultado['grupos_morosos']['filas']} grupos pasan a MOROSO"
+        )
+        self.fila(('estrategia', 26), ('consultas', 10), ('ms', 10))
+        self.fila(('instancia por instancia', 26), (por_instancia[0], 10), (f'{por_instancia[1] * 1000:.0f}', 10))
+        self.fila((f'por lotes de {options["lote"]}', 26), (por_lotes[0], 10), (f'{por_lotes[1] * 1000:.0f}', 10))
+        self.fila(('por lotes, sin cambios', 26), ('', 10), (f'{repetido["segundos"] * 1000:.0f}', 10))
@@ -0,0 +1,90 @@
+import datetime
+
+from django.test.utils import override_settings
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.citas_pagos.serializers import CitaMedicaSerializer
+from apps.cuentas.benchmark import BenchmarkCommand, cronometro, crear_clinica, crear_roles
+from apps.cuentas.consultas import relaciones_de
+from apps.cuentas.models import Usuario
+from apps.cuentas.proyecciones import proyeccion_de
+from apps.cuentas.serializers import UsuarioSerializer
+from apps.doctores.models import Bloque_Horario, Especialidad, Medico
+from apps.doctores.serializers import MedicoSerializer
+from apps.historiasDiagnosticos.models import Paciente, PatologiasO
+from apps.historiasDiagnosticos.serializers import PacienteSerializer, PatologiasOSerializer
+
+from .bench_listados import poblar
+
+LISTADOS = [
+    ('medicos', MedicoSerializer, lambda g: Medico.objects.filter(grupo=g, estado=True)),
+    ('usuarios', UsuarioSerializer, lambda g: Usuario.objects.filter(grupo=g)),
+    ('pacientes', PacienteSerializer, lambda g: Paciente.objects.filter(usuario__grupo=g)),
+    ('patologias', PatologiasOSerializer, lambda g: PatologiasO.objects.filter(grupo=g, estado=True)),
+    ('citas', CitaMedicaSerializer, lambda g: Cita_Medica.objects.filter(grupo=g, estado=True)),
+]
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Filas por segundo de los listados: serializer de DRF (con las relaciones ya precargadas) '
+        'frente a la proyección con values_list y conversión precompilada. Sin HTTP ni autenticación.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=2000, help='Filas por listado')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Se informa la mejor')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        filas, repeticiones = options['filas'], options['repeticiones']
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Proyecciones', roles)
+        especialidades = [Especialidad.objects.create(nombre=f'Especialidad {i}') for i in range(5)]
+        poblar(grupo, roles, especialidades, filas, prefijo='pr')
+        medicos = list(Medico.objects.filter(grupo=grupo)[:20])
+        bloques = Bloque_Horario.objects.bulk_create([
+            Bloque_Horario(grupo=grupo, medico=medico, dia_semana='LUNES', hora_inicio='08:00', hora_fin='18:00')
+            for medico in medicos
+        ])
+        pacientes = list(Paciente.objects.filter(usuario__grupo=grupo))
+        lunes = datetime.date(2026, 1, 5)
+        Cita_Medica.objects.bulk_create([
+            Cita_Medica(
+                grupo=grupo, paciente=pacientes[i % len(pacientes)], bloque_horario=bloques[i % len(bloques)],
+                fecha=lunes + datetime.timedelta(weeks=i // 40),
+                hora_inicio=datetime.time(8 + i % 40 // 4, i % 4 * 15), hora_fin=datetime.time(8 + i % 40 // 4, i % 4 * 15 + 14),
+            )
+            for i in range(filas)
+        ])
+
+        self.fila(('listado', 12), ('filas', 7), ('serializer', 12), ('filas/s', 10),
+                  ('proyección', 12), ('filas/s', 10), ('mejora', 7))
+        for nombre, serializer_class, queryset in LISTADOS:
+            select, prefetch = relaciones_de(serializer_class)
+
+            def serializar():
+                qs = queryset(grupo).select_related(*select).prefetch_related(*prefetch)
+                return serializer_class(qs, many=True).data
+
+            def proyectar():
+                return proyeccion_de(serializer_class).filas(queryset(grupo))
+
+            antes, ahora = self.mejor(serializar, repeticiones), self.mejor(proyectar, repeticiones)
+            n = queryset(grupo).count()
+            self.fila(
+                (nombre, 12), (n, 7), (f'{antes * 1000:.0f} ms', 12), (f'{n / antes:.0f}', 10),
+                (f'{ahora * 1000:.0f} ms', 12), (f'{n / ahora:.0f}', 10), (f'{antes / ahora:.1f}x', 7),
+            )
+
+    def mejor(self, funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            with cronometro() as t:
+                funcion()
+            tiempos.append(t['segundos'])
+        return min(tiempos)
@@ -0,0 +1,42 @@
+import time
+
+from apps.cuentas.benchmark import BenchmarkCommand, crear_clinica, crear_roles
+from apps.cuentas.serializers import GrupoSerializer, UsuarioSerializer
+
+
+class Command(BenchmarkCommand):
+    help = 'Mide registros por segundo (Usuario y alta de clínica) con el hasher de contraseñas real.'
+
+    hasher_rapido = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registros', type=int, default=20)
+
+    def run_benchmark(self, *args, **options):
+        n = options['registros']
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Bench', roles)
+
+        inicio = time.perf_counter()
+        for i in range(n):
+            serializer = UsuarioSerializer(data={
+                'nombre': f'usuario {i}', 'correo': f'u{i}@registro.bench', 'password': 'Clave-Segura-123',
+                'sexo': 'F', 'fecha_nacimiento': '1995-05-05', 'grupo': grupo.id, 'rol': roles['paciente'].id,
+            })
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        usuarios = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for i in range(n):
+            serializer = GrupoSerializer(data={
+                'nombre': f'Clinica {i}', 'admin_nombre': f'admin {i}', 'admin_correo': f'a{i}@registro.bench',
+                'admin_sexo': 'M', 'admin_fecha_nacimiento': '1980-01-01', 'admin_password': 'Clave-Segura-123',
+            })
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        grupos = time.perf_counter() - inicio
+
+        self.fila(('registro', 22), ('registros/s', 12), ('ms/registro', 12))
+        for nombre, segundos in (('usuario', usuarios), ('clinica + admin', grupos)):
+            self.fila((nombre, 22), (f'{n / segundos:.2f}', 12), (f'{segundos / n * 1000:.1f}', 12))
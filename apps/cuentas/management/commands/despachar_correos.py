@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from apps.cuentas.correo import config_correo, despachar, purgar_enviados
+
+# Cada cuánto se borran los correos enviados viejos, en segundos
+CADA_PURGA = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía los correos de la bandeja de salida (CorreoSaliente) por lotes, reutilizando la '
+        'conexión SMTP. Queda corriendo como worker; con --una-vez vacía la cola y termina.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Correos por conexión (por defecto, CORREO["LOTE"])')
+        parser.add_argument('--intervalo', type=float, help='Segundos de espera con la cola vacía (por defecto, CORREO["INTERVALO"])')
+        parser.add_argument('--una-vez', action='store_true', help='Envía lo que esté listo y termina')
+
+    def handle(self, *args, **options):
+        config = config_correo()
+        lote = options['lote'] or config['LOTE']
+        intervalo = options['intervalo'] if options['intervalo'] is not None else config['INTERVALO']
+        if lote < 1:
+            raise CommandError('--lote debe ser mayor que cero')
+
+        ultima_purga = 0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - ultima_purga > CADA_PURGA:
+                    borrados = purgar_enviados()
+                    if borrados:
+                        self.stdout.write(f'{borrados} correos enviados purgados')
+                    ultima_purga = time.monotonic()
+                resultado = despachar(lote)
+                if any(resultado.values()):
+                    self.stdout.write(
+                        f"{resultado['enviados']} enviados, {resultado['reintentos']} para reintentar, "
+                        f"{resultado['fallidos']} fallidos"
+                    )
+                if resultado['enviados'] + resultado['reintentos'] + resultado['fallidos'] < lote:
+                    # Cola vacía (o solo quedan reintentos para más tarde)
+                    if options['una_vez']:
+                        return
+                    time.sleep(intervalo)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.cuentas.particiones import asegurar_particiones, convertir, es_particionada, particiones, revertir
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea las particiones mensuales de la bitácora para el mes actual y los siguientes '
+        '(solo PostgreSQL). Pensado para correr a diario. Con --convertir / --revertir '
+        'pasa la tabla a particionada o de vuelta a común (bloquea la tabla mientras tanto).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=3, help='Meses por delante del actual')
+        accion = parser.add_mutually_exclusive_group()
+        accion.add_argument('--convertir', action='store_true', help='Convierte la bitácora en tabla particionada')
+        accion.add_argument('--revertir', action='store_true', help='Vuelve la bitácora a una tabla sin particiones')
+
+    def handle(self, *args, **options):
+        if options['meses'] < 0:
+            raise CommandError('--meses no puede ser negativo')
+        if (options['convertir'] or options['revertir']) and connection.vendor != 'postgresql':
+            raise CommandError('Las particiones solo existen en PostgreSQL')
+        if options['revertir']:
+            if revertir():
+                self.stdout.write('La bitácora volvió a ser una tabla sin particiones')
+            else:
+                self.stdout.write('La bitácora no estaba particionada; nada que hacer')
+            return
+        if options['convertir'] and convertir(meses=options['meses']):
+            self.stdout.write('Bitácora convertida en tabla particionada por mes')
+        if not es_particionada():
+            self.stdout.write(
+                'La bitácora no está particionada en esta base; --convertir la particiona (solo PostgreSQL)'
+            )
+            return
+        for nombre in asegurar_particiones(meses=options['meses']):
+            self.stdout.write(f'Creada {nombre}')
+        for nombre, desde, hasta in particiones():
+            rango = f"{desde:%Y-%m-%d}" if desde else '-∞'
+            rango += f" → {hasta:%Y-%m-%d}" if hasta else ' → ∞'
+            self.stdout.write(f'  {nombre}: {rango}')
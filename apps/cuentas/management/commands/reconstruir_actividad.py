@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.cuentas.actividad import reconstruir
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula los resúmenes de actividad (ActividadDiaria y ActividadHoraria) de un rango '
+        'de días a partir de la bitácora, por tramos. Los meses ya archivados se conservan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día (YYYY-MM-DD); por defecto, hace 30 días')
+        parser.add_argument('--hasta', help='Último día (YYYY-MM-DD); por defecto, hoy')
+        parser.add_argument('--dias', type=int, default=7, help='Días por tramo (una transacción cada uno)')
+
+    def handle(self, *args, **options):
+        fechas = {}
+        for nombre in ('desde', 'hasta'):
+            if options[nombre]:
+                try:
+                    fechas[nombre] = parse_date(options[nombre])
+                except ValueError:
+                    fechas[nombre] = None
+                if fechas[nombre] is None:
+                    raise CommandError(f'--{nombre} debe ser una fecha YYYY-MM-DD')
+        hasta = fechas.get('hasta') or timezone.localdate()
+        desde = fechas.get('desde') or hasta - timedelta(days=29)
+        if desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor que cero')
+
+        tramos = reconstruir(desde, hasta, dias_por_tramo=options['dias'])
+        for inicio, fin, registros in tramos:
+            self.stdout.write(f'{inicio} a {fin}: {registros} registros resumidos')
+        if not tramos:
+            self.stdout.write('Nada que reconstruir: el rango ya está archivado')
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0003_usuario_token_reset_password'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevocacionToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('SESION', 'Sesión'), ('USUARIO', 'Usuario'), ('GRUPO', 'Grupo')], max_length=10, verbose_name='Tipo de revocación')),
+                ('clave', models.CharField(help_text='Id de sesión, de usuario o de grupo revocado', max_length=64)),
+                ('fecha', models.DateTimeField(auto_now_add=True, help_text='Los tokens emitidos antes de esta fecha quedan invalidados')),
+                ('expira', models.DateTimeField(db_index=True, help_text='A partir de aquí ningún token afectado puede seguir vigente')),
+            ],
+            options={
+                'verbose_name': 'Revocación de token',
+                'verbose_name_plural': 'Revocaciones de tokens',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def username_libre(User, usuario):
+    """El correo como username; si ya está tomado, el correo con el id del perfil"""
+    username = usuario.correo[:150]
+    if not User.objects.filter(username=username).exists():
+        return username
+    sufijo = f'+{usuario.pk}'
+    return usuario.correo[:150 - len(sufijo)] + sufijo
+
+
+def vincular_credenciales(apps, schema_editor):
+    """
+    Enlaza cada Usuario con su User de Django (por correo) y deja al User como
+    única fuente de la contraseña. Si un perfil no tiene User, se crea uno que
+    reutiliza el hash ya guardado en el perfil: no hace falta volver a hashear.
+    También se crea uno propio cuando el User encontrado ya es de otro perfil
+    (correos repetidos): sin él, el perfil perdería su contraseña al borrar la columna.
+    """
+    Usuario = apps.get_model('cuentas', 'Usuario')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    for usuario in Usuario.objects.filter(user__isnull=True).iterator():
+        user = (
+            User.objects.filter(username=usuario.correo).first()
+            or User.objects.filter(email=usuario.correo).order_by('id').first()
+        )
+        if user is None or Usuario.objects.filter(user=user).exists():
+            user = User.objects.create(
+                username=username_libre(User, usuario),
+                email=usuario.correo,
+                password=usuario.password,
+            )
+        usuario.user = user
+        usuario.save(update_fields=['user'])
+
+
+def restaurar_password_en_perfil(apps, schema_editor):
+    Usuario = apps.get_model('cuentas', 'Usuario')
+    for usuario in Usuario.objects.filter(user__isnull=False).select_related('user').iterator():
+        usuario.password = usuario.user.password
+        usuario.save(update_fields=['password'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0004_revocaciontoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='perfil', to=settings.AUTH_USER_MODEL, verbose_name='Credenciales de acceso'),
+        ),
+        migrations.RunPython(vincular_credenciales, restaurar_password_en_perfil),
+        # Con default para que la migración se pueda revertir sobre filas existentes
+        migrations.AlterField(
+            model_name='usuario',
+            name='password',
+            field=models.CharField(default='', max_length=128),
+        ),
+        migrations.RemoveField(
+            model_name='usuario',
+            name='password',
+        ),
+    ]
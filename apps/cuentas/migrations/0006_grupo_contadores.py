@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def calcular_contadores(apps, schema_editor):
+    """Llena los contadores de los grupos existentes a partir de sus pagos y usuarios"""
+    Grupo = apps.get_model('cuentas', 'Grupo')
+    Pago = apps.get_model('cuentas', 'Pago')
+    Usuario = apps.get_model('cuentas', 'Usuario')
+
+    pendientes = Pago.objects.filter(grupo=OuterRef('pk'), estado='PENDIENTE').order_by()
+    activos = Usuario.objects.filter(grupo=OuterRef('pk'), estado=True).order_by()
+    Grupo.objects.update(
+        pagos_pendientes=Coalesce(Subquery(pendientes.values('grupo').annotate(n=Count('pk')).values('n')), 0),
+        proximo_vencimiento=Subquery(pendientes.order_by('fecha_vencimiento').values('fecha_vencimiento')[:1]),
+        total_usuarios=Coalesce(Subquery(activos.values('grupo').annotate(n=Count('pk')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0005_usuario_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grupo',
+            name='pagos_pendientes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Pagos pendientes'),
+        ),
+        migrations.AddField(
+            model_name='grupo',
+            name='proximo_vencimiento',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Vencimiento pendiente más próximo'),
+        ),
+        migrations.AddField(
+            model_name='grupo',
+            name='total_usuarios',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Usuarios activos'),
+        ),
+        migrations.RunPython(calcular_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recalcular_adeudados(apps, schema_editor):
+    """Los contadores de pagos pasan a incluir los VENCIDO (se siguen debiendo)"""
+    Grupo = apps.get_model('cuentas', 'Grupo')
+    Pago = apps.get_model('cuentas', 'Pago')
+
+    adeudados = Pago.objects.filter(grupo=OuterRef('pk'), estado__in=['PENDIENTE', 'VENCIDO']).order_by()
+    Grupo.objects.update(
+        pagos_pendientes=Coalesce(Subquery(adeudados.values('grupo').annotate(n=Count('pk')).values('n')), 0),
+        proximo_vencimiento=Subquery(adeudados.order_by('fecha_vencimiento').values('fecha_vencimiento')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0006_grupo_contadores'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='grupo',
+            index=models.Index(fields=['estado', 'proximo_vencimiento'], name='cuentas_gru_estado_49a6ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='cuentas_pag_estado_173414_idx'),
+        ),
+        migrations.RunPython(recalcular_adeudados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0008_bitacora_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['grupo', '-timestamp', '-id'], name='bitacora_grupo_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+PREFIJOS_TIPO = [
+    ('Creó', 'CREAR'),
+    ('Actualizó', 'ACTUALIZAR'),
+    ('Eliminó', 'ELIMINAR'),
+    ('Restauró', 'RESTAURAR'),
+    ('Marcó como pagado', 'PAGO'),
+    ('Inicio de sesión', 'LOGIN'),
+    ('Cierre de sesión', 'LOGOUT'),
+    ('Se registró', 'REGISTRO'),
+]
+
+ENTIDADES = [
+    ('Médico', 'medico'),
+    ('Paciente', 'paciente'),
+    ('Usuario', 'usuario'),
+    ('Tratamiento', 'tratamiento'),
+    ('Patología', 'patologia'),
+    ('Pago', 'pago'),
+    ('Grupo', 'grupo'),
+]
+
+
+def clasificar_existentes(apps, schema_editor):
+    """Tipo y entidad de los registros ya guardados, con un UPDATE por prefijo"""
+    Bitacora = apps.get_model('cuentas', 'Bitacora')
+    for prefijo, tipo in PREFIJOS_TIPO:
+        Bitacora.objects.filter(accion__startswith=prefijo).update(tipo=tipo)
+    for nombre, entidad in ENTIDADES:
+        Bitacora.objects.filter(objeto__startswith=f'{nombre}:').update(entidad=entidad)
+
+
+# Búsqueda de texto: las expresiones de los índices tienen que ser las mismas que usa filtros.py
+SQL_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS bitacora_texto_tsv_idx ON cuentas_bitacora USING gin "
+    "(to_tsvector('spanish'::regconfig, (cuentas_bitacora.accion || ' ' || coalesce(cuentas_bitacora.objeto, ''))))",
+    "CREATE INDEX IF NOT EXISTS bitacora_texto_trgm_idx ON cuentas_bitacora USING gin "
+    "((cuentas_bitacora.accion || ' ' || coalesce(cuentas_bitacora.objeto, '')) gin_trgm_ops)",
+]
+
+REVERSA_POSTGRES = [
+    "DROP INDEX IF EXISTS bitacora_texto_trgm_idx",
+    "DROP INDEX IF EXISTS bitacora_texto_tsv_idx",
+]
+
+# Tabla FTS5 de contenido externo: guarda solo el índice y se mantiene con triggers.
+# Ojo: si una migración posterior reconstruye cuentas_bitacora en SQLite, hay que volver a crearlos.
+SQL_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cuentas_bitacora_fts USING fts5("
+    "accion, objeto, content='cuentas_bitacora', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS cuentas_bitacora_fts_ai AFTER INSERT ON cuentas_bitacora BEGIN "
+    "INSERT INTO cuentas_bitacora_fts(rowid, accion, objeto) VALUES (new.id, new.accion, new.objeto); END",
+    "CREATE TRIGGER IF NOT EXISTS cuentas_bitacora_fts_ad AFTER DELETE ON cuentas_bitacora BEGIN "
+    "INSERT INTO cuentas_bitacora_fts(cuentas_bitacora_fts, rowid, accion, objeto) "
+    "VALUES ('delete', old.id, old.accion, old.objeto); END",
+    "CREATE TRIGGER IF NOT EXISTS cuentas_bitacora_fts_au AFTER UPDATE OF accion, objeto ON cuentas_bitacora BEGIN "
+    "INSERT INTO cuentas_bitacora_fts(cuentas_bitacora_fts, rowid, accion, objeto) "
+    "VALUES ('delete', old.id, old.accion, old.objeto); "
+    "INSERT INTO cuentas_bitacora_fts(rowid, accion, objeto) VALUES (new.id, new.accion, new.objeto); END",
+    "INSERT INTO cuentas_bitacora_fts(cuentas_bitacora_fts) VALUES ('rebuild')",
+]
+
+REVERSA_SQLITE = [
+    "DROP TRIGGER IF EXISTS cuentas_bitacora_fts_au",
+    "DROP TRIGGER IF EXISTS cuentas_bitacora_fts_ad",
+    "DROP TRIGGER IF EXISTS cuentas_bitacora_fts_ai",
+    "DROP TABLE IF EXISTS cuentas_bitacora_fts",
+]
+
+
+def _ejecutar(schema_editor, por_motor):
+    sentencias = por_motor.get(schema_editor.connection.vendor)
+    if sentencias is None:
+        # Otros motores: la búsqueda usa icontains sin índice
+        return
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.prueba_fts5 USING fts5(x)")
+                cursor.execute("DROP TABLE temp.prueba_fts5")
+            except Exception:
+                # SQLite compilado sin FTS5
+                return
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+def crear_busqueda(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': SQL_POSTGRES, 'sqlite': SQL_SQLITE})
+
+
+def quitar_busqueda(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': REVERSA_POSTGRES, 'sqlite': REVERSA_SQLITE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0009_bitacora_indice_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitacora',
+            name='entidad',
+            field=models.CharField(blank=True, default='', editable=False, help_text="Tipo de objeto afectado, normalizado (ej: 'paciente')", max_length=40),
+        ),
+        migrations.AddField(
+            model_name='bitacora',
+            name='tipo',
+            field=models.CharField(choices=[('CREAR', 'Creación'), ('ACTUALIZAR', 'Actualización'), ('ELIMINAR', 'Eliminación'), ('RESTAURAR', 'Restauración'), ('PAGO', 'Pago'), ('LOGIN', 'Inicio de sesión'), ('LOGOUT', 'Cierre de sesión'), ('REGISTRO', 'Registro de clínica'), ('OTRO', 'Otro')], default='OTRO', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['grupo', 'tipo', '-timestamp', '-id'], name='bitacora_grupo_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['grupo', 'entidad', '-timestamp', '-id'], name='bitacora_grupo_entidad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['usuario', '-timestamp', '-id'], name='bitacora_usuario_ts_id_idx'),
+        ),
+        migrations.RunPython(clasificar_existentes, migrations.RunPython.noop),
+        migrations.RunPython(crear_busqueda, quitar_busqueda),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Vacía a propósito. La conversión de cuentas_bitacora en tabla particionada por
+    mes ya no corre dentro de migrate: se hace (y se revierte) con
+    `manage.py particionar_bitacora --convertir / --revertir` (ver particiones.py).
+    Se conserva el número para que la serie no tenga huecos y para las bases que ya
+    la tienen registrada como aplicada.
+    """
+
+    dependencies = [
+        ('cuentas', '0010_bitacora_filtros'),
+    ]
+
+    operations = []
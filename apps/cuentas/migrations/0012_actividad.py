@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate, TruncHour
+
+
+def resumir_existentes(apps, schema_editor):
+    """Resumen de los registros ya guardados (después lo mantiene el escritor de la bitácora)"""
+    Bitacora = apps.get_model('cuentas', 'Bitacora')
+    ActividadDiaria = apps.get_model('cuentas', 'ActividadDiaria')
+    ActividadHoraria = apps.get_model('cuentas', 'ActividadHoraria')
+    registros = Bitacora.objects.filter(grupo__isnull=False).order_by()
+    diarios = (
+        registros.annotate(d=TruncDate('timestamp'))
+        .values('grupo_id', 'usuario_id', 'd', 'tipo').annotate(n=Count('id'))
+    )
+    ActividadDiaria.objects.bulk_create(
+        (ActividadDiaria(grupo_id=f['grupo_id'], actor=f['usuario_id'] or 0, dia=f['d'], tipo=f['tipo'], cantidad=f['n'])
+         for f in diarios.iterator()),
+        batch_size=1000,
+    )
+    horarios = registros.annotate(h=TruncHour('timestamp')).values('grupo_id', 'h', 'tipo').annotate(n=Count('id'))
+    ActividadHoraria.objects.bulk_create(
+        (ActividadHoraria(grupo_id=f['grupo_id'], hora=f['h'], tipo=f['tipo'], cantidad=f['n'])
+         for f in horarios.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0011_bitacora_particionada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActividadDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.PositiveIntegerField(default=0)),
+                ('dia', models.DateField()),
+                ('tipo', models.CharField(choices=[('CREAR', 'Creación'), ('ACTUALIZAR', 'Actualización'), ('ELIMINAR', 'Eliminación'), ('RESTAURAR', 'Restauración'), ('PAGO', 'Pago'), ('LOGIN', 'Inicio de sesión'), ('LOGOUT', 'Cierre de sesión'), ('REGISTRO', 'Registro de clínica'), ('OTRO', 'Otro')], max_length=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actividad_diaria', to='cuentas.grupo')),
+            ],
+            options={
+                'verbose_name': 'Actividad diaria',
+                'verbose_name_plural': 'Actividad diaria',
+                'indexes': [models.Index(fields=['grupo', 'dia'], name='actividad_diaria_grupo_dia')],
+                'constraints': [models.UniqueConstraint(fields=('grupo', 'actor', 'dia', 'tipo'), name='actividad_diaria_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActividadHoraria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField(help_text='Inicio de la hora')),
+                ('tipo', models.CharField(choices=[('CREAR', 'Creación'), ('ACTUALIZAR', 'Actualización'), ('ELIMINAR', 'Eliminación'), ('RESTAURAR', 'Restauración'), ('PAGO', 'Pago'), ('LOGIN', 'Inicio de sesión'), ('LOGOUT', 'Cierre de sesión'), ('REGISTRO', 'Registro de clínica'), ('OTRO', 'Otro')], max_length=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actividad_horaria', to='cuentas.grupo')),
+            ],
+            options={
+                'verbose_name': 'Actividad por hora',
+                'verbose_name_plural': 'Actividad por hora',
+                'constraints': [models.UniqueConstraint(fields=('grupo', 'tipo', 'hora'), name='actividad_horaria_unica')],
+            },
+        ),
+        migrations.RunPython(resumir_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0013_correo_saliente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='revocaciontoken',
+            name='fecha',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, help_text='Los tokens emitidos antes de esta fecha quedan invalidados'),
+        ),
+    ]
@@ -1,9 +1,21 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import LessThan
 from django.conf import settings
-from django.contrib.auth.hashers import make_password, check_password
 from django.core.validators import MinLengthValidator
 from django.utils import timezone
 from datetime import datetime, timedelta
+from .hashing import asignar_password, verificar_password
+from .tenant import TenantManager
+
+def crear_credencial(correo, raw_password):
+    """Crea el User de Django que guarda la contraseña de un perfil (se hashea una sola vez, en el pool)"""
+    from django.contrib.auth.models import User
+    user = User(username=User.normalize_username(correo), email=User.objects.normalize_email(correo))
+    asignar_password(user, raw_password)
+    user.save()
+    return user
 
 # Modelo de Grupo (Clínica)
 class Grupo(models.Model):
@@ -64,37 +76,200 @@ class Grupo(models.Model):
         verbose_name="Fecha de suspensión"
     )
     
+    # Contadores desnormalizados: los mantienen Pago y Usuario con UPDATE atómicos.
+    # "Pendientes" son los pagos adeudados (PENDIENTE o VENCIDO)
+    pagos_pendientes = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Pagos pendientes"
+    )
+    
+    proximo_vencimiento = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Vencimiento pendiente más próximo"
+    )
+    
+    total_usuarios = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Usuarios activos"
+    )
+    
+    CAMPOS_CONTADORES = ('pagos_pendientes', 'proximo_vencimiento', 'total_usuarios')
+    # Estados que dependen de los pagos; SUSPENDIDO y CANCELADO los decide un super admin
+    ESTADOS_POR_PAGOS = ('ACTIVO', 'MOROSO')
+    
     def __str__(self):
         return f"{self.nombre} ({self.get_estado_display()})"
     
+    def save(self, *args, force_insert=False, force_update=False, using=None, update_fields=None):
+        # Los contadores solo cambian con UPDATE atómicos: un save() con la instancia
+        # cargada hace rato no debe pisarlos con valores viejos. Si la fila no existe,
+        # se guarda completa (INSERT), contadores incluidos
+        if (update_fields is None and not force_insert and not self._state.adding
+                and type(self)._base_manager.using(using).filter(pk=self.pk).exists()):
+            update_fields = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_CONTADORES
+            ]
+        super().save(*args, force_insert=force_insert, force_update=force_update, using=using,
+                     update_fields=update_fields)
+    
     def tiene_pagos_pendientes(self):
         """Verifica si el grupo tiene pagos pendientes"""
-        return self.pagos.filter(estado='PENDIENTE').exists()
+        return self.pagos_pendientes > 0
     
     def esta_moroso(self):
-        """Verifica si el grupo está moroso (pagos vencidos)"""
-        return self.pagos.filter(
-            estado='PENDIENTE',
-            fecha_vencimiento__lt=timezone.now()
-        ).exists()
+        """Verifica si el grupo está moroso (algún pago pendiente ya vencido)"""
+        return self.proximo_vencimiento is not None and self.proximo_vencimiento < timezone.now()
     
     def actualizar_estado(self):
         """Actualiza el estado del grupo según los pagos"""
-        if self.esta_moroso():
-            self.estado = 'MOROSO'
-        elif self.tiene_pagos_pendientes():
-            self.estado = 'ACTIVO'  # Tiene pagos pendientes pero no vencidos
-        else:
-            self.estado = 'ACTIVO'
-        self.save()
+        if self.estado not in self.ESTADOS_POR_PAGOS:
+            return
+        estado = 'MOROSO' if self.esta_moroso() else 'ACTIVO'
+        if estado != self.estado:
+            self.estado = estado
+            self.save(update_fields=['estado'])
+    
+    @classmethod
+    def mover_pago_pendiente(cls, grupo_id, delta=0, agregado=None, quitado=None):
+        """
+        Aplica a los contadores de un grupo la entrada (agregado) o salida (quitado)
+        de un pago pendiente, dado por su fecha de vencimiento. Es un solo UPDATE:
+        el vencimiento más próximo solo se vuelve a buscar si salió justo ese pago.
+        """
+        proximo = F('proximo_vencimiento')
+        if agregado is not None:
+            proximo = Case(
+                When(Q(proximo_vencimiento__isnull=True) | Q(proximo_vencimiento__gt=agregado),
+                     then=Value(agregado)),
+                default=proximo,
+                output_field=models.DateTimeField(),
+            )
+        if quitado is not None:
+            siguiente = Subquery(
+                Pago.objects.filter(grupo=OuterRef('pk'), estado__in=Pago.ESTADOS_ADEUDADOS)
+                .order_by('fecha_vencimiento').values('fecha_vencimiento')[:1]
+            )
+            proximo = Case(
+                When(proximo_vencimiento__lt=quitado, then=proximo),
+                default=siguiente,
+                output_field=models.DateTimeField(),
+            )
+        estado = Case(
+            When(~Q(estado__in=cls.ESTADOS_POR_PAGOS), then=F('estado')),
+            When(LessThan(proximo, Value(timezone.now())), then=Value('MOROSO')),
+            default=Value('ACTIVO'),
+        )
+        cls.objects.filter(pk=grupo_id).update(
+            pagos_pendientes=Greatest(F('pagos_pendientes') + delta, 0),
+            proximo_vencimiento=proximo,
+            estado=estado,
+        )
+    
+    @classmethod
+    def mover_usuario_activo(cls, grupo_id, delta):
+        cls.objects.filter(pk=grupo_id).update(total_usuarios=Greatest(F('total_usuarios') + delta, 0))
+    
+    @classmethod
+    def recalcular_contadores(cls, queryset=None):
+        """
+        Recalcula los contadores desde cero. Hace falta solo tras escrituras que
+        no pasan por save()/delete() (queryset.update, bulk_create, SQL a mano).
+        """
+        pendientes = Pago.objects.filter(grupo=OuterRef('pk'), estado__in=Pago.ESTADOS_ADEUDADOS).order_by()
+        activos = Usuario.objects.filter(grupo=OuterRef('pk'), estado=True).order_by()
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            pagos_pendientes=Coalesce(
+                Subquery(pendientes.values('grupo').annotate(n=Count('pk')).values('n')), 0
+            ),
+            proximo_vencimiento=Subquery(
+                pendientes.order_by('fecha_vencimiento').values('fecha_vencimiento')[:1]
+            ),
+            total_usuarios=Coalesce(
+                Subquery(activos.values('grupo').annotate(n=Count('pk')).values('n')), 0
+            ),
+        )
     
     class Meta:
         verbose_name = "Grupo (Clínica)"
         verbose_name_plural = "Grupos (Clínicas)"
         ordering = ['nombre']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_vencimiento']),
+        ]
+
+class ContadorGrupoMixin:
+    """
+    Mantiene los contadores desnormalizados de Grupo al guardar o borrar la fila.
+    Cada modelo declara los campos de los que depende su aporte (CAMPOS_CONTADOR),
+    cómo se traduce en aporte (aporte_contador) y cómo se aplica el cambio
+    (_actualizar_contadores). Los valores cargados de la base se recuerdan en
+    from_db, así que el cambio se calcula sin releer nada.
+    """
+    CAMPOS_CONTADOR = ()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._valores_contador = instance._leer_valores_contador()
+        return instance
+    
+    def _leer_valores_contador(self):
+        diferidos = self.get_deferred_fields()
+        campos = [self._meta.get_field(nombre).attname for nombre in self.CAMPOS_CONTADOR]
+        if any(campo in diferidos for campo in campos):
+            return None
+        return tuple(getattr(self, campo) for campo in campos)
+    
+    def aporte_contador(self, valores):
+        raise NotImplementedError
+    
+    def _actualizar_contadores(self, anterior, actual):
+        raise NotImplementedError
+    
+    def save(self, *args, **kwargs):
+        nuevo = self._state.adding
+        anteriores = None if nuevo else getattr(self, '_valores_contador', None)
+        actuales = self._leer_valores_contador()
+        update_fields = kwargs.get('update_fields')
+        if anteriores is not None and actuales is not None and update_fields is not None:
+            # Lo que no se guarda queda como estaba en la base
+            guardados = set(update_fields)
+            actuales = tuple(
+                actual if nombre in guardados else anterior
+                for nombre, actual, anterior in zip(self.CAMPOS_CONTADOR, actuales, anteriores)
+            )
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if nuevo or anteriores is not None:
+                self._actualizar_contadores(
+                    self.aporte_contador(anteriores) if anteriores else None,
+                    self.aporte_contador(actuales) if actuales else None,
+                )
+            else:
+                # Sin los valores originales no se sabe qué cambió: se recalcula el grupo
+                Grupo.recalcular_contadores(Grupo.objects.filter(pk=self.grupo_id))
+        self._valores_contador = actuales if actuales is not None else self._leer_valores_contador()
+    
+    def delete(self, *args, **kwargs):
+        anteriores = getattr(self, '_valores_contador', None)
+        grupo_id = self.grupo_id
+        with transaction.atomic(savepoint=False):
+            resultado = super().delete(*args, **kwargs)
+            if anteriores is not None:
+                self._actualizar_contadores(self.aporte_contador(anteriores), None)
+            else:
+                Grupo.recalcular_contadores(Grupo.objects.filter(pk=grupo_id))
+        self._valores_contador = None
+        return resultado
 
 # Modelo de Pago
-class Pago(models.Model):
+class Pago(ContadorGrupoMixin, models.Model):
     tipo_pago_opciones = [
         ('MENSUAL', 'Mensual'),
         ('TRIMESTRAL', 'Trimestral'),
@@ -109,6 +284,9 @@ class Pago(models.Model):
         ('CANCELADO', 'Cancelado'),
     ]
     
+    # Pagos que todavía se deben: los vencidos siguen sin pagarse
+    ESTADOS_ADEUDADOS = ('PENDIENTE', 'VENCIDO')
+    
     grupo = models.ForeignKey(
         Grupo,
         on_delete=models.CASCADE,
@@ -157,6 +335,29 @@ class Pago(models.Model):
         verbose_name="Descripción o notas"
     )
     
+    objects = TenantManager()
+
+    CAMPOS_CONTADOR = ('grupo', 'estado', 'fecha_vencimiento')
+
+    def aporte_contador(self, valores):
+        """(grupo, vencimiento) con que el pago cuenta en su grupo, o None si ya no se debe"""
+        grupo_id, estado, fecha_vencimiento = valores
+        if estado not in self.ESTADOS_ADEUDADOS:
+            return None
+        return grupo_id, fecha_vencimiento
+
+    def _actualizar_contadores(self, anterior, actual):
+        if anterior == actual:
+            return
+        if anterior and actual and anterior[0] == actual[0]:
+            # Mismo grupo, cambió el vencimiento
+            Grupo.mover_pago_pendiente(actual[0], agregado=actual[1], quitado=anterior[1])
+            return
+        if anterior:
+            Grupo.mover_pago_pendiente(anterior[0], delta=-1, quitado=anterior[1])
+        if actual:
+            Grupo.mover_pago_pendiente(actual[0], delta=1, agregado=actual[1])
+
     def save(self, *args, **kwargs):
         # Auto-generar fecha de vencimiento si no se proporciona
         if not self.fecha_vencimiento:
@@ -169,10 +370,8 @@ class Pago(models.Model):
             elif self.tipo_pago == 'ANUAL':
                 self.fecha_vencimiento = timezone.now() + timedelta(days=365)
         
+        # Contadores y estado del grupo en un solo UPDATE, sin releer sus pagos
         super().save(*args, **kwargs)
-        
-        # Actualizar estado del grupo después de guardar el pago
-        self.grupo.actualizar_estado()
     
     def marcar_como_pagado(self):
         """Marca el pago como pagado"""
@@ -187,6 +386,9 @@ class Pago(models.Model):
         verbose_name = "Pago"
         verbose_name_plural = "Pagos"
         ordering = ['-fecha_emision']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_vencimiento']),
+        ]
 
 # Modelo de Rol
 class Rol(models.Model):
@@ -213,7 +415,7 @@ class Rol(models.Model):
         ordering = ['nombre']
 
 # Modelo de Usuario (actualizado con grupo)
-class Usuario(models.Model):  
+class Usuario(ContadorGrupoMixin, models.Model):  
     sexo_opciones = [
         ('M', 'Masculino'),
         ('F', 'Femenino'),
@@ -234,7 +436,15 @@ class Usuario(models.Model):
         verbose_name="Nombre completo"
     )
     
-    password = models.CharField(max_length=128)
+    # Credencial única: la contraseña vive solo en el User de Django
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='perfil',
+        verbose_name="Credenciales de acceso",
+        null=True,
+        blank=True
+    )
     
     correo = models.EmailField(
         unique=True,
@@ -292,24 +502,66 @@ class Usuario(models.Model):
 
     token_reset_password = models.CharField(max_length=64, null=True, blank=True)
 
+    objects = TenantManager()
+
+    CAMPOS_CONTADOR = ('grupo', 'estado')
+
+    def aporte_contador(self, valores):
+        """Grupo en cuyo contador de usuarios activos cuenta este usuario, o None"""
+        grupo_id, estado = valores
+        return grupo_id if estado else None
+
+    def _actualizar_contadores(self, anterior, actual):
+        if anterior == actual:
+            return
+        if anterior:
+            Grupo.mover_usuario_activo(anterior, -1)
+        if actual:
+            Grupo.mover_usuario_activo(actual, 1)
+
     def set_password(self, raw_password):
-        self.password = make_password(raw_password)
-        self.save()
+        """Cambia la contraseña en la credencial única: un hash y un UPDATE"""
+        if self.user_id is None:
+            self.user = crear_credencial(self.correo, raw_password)
+            self.save(update_fields=['user'])
+            return
+        asignar_password(self.user, raw_password)
+        self.user.save(update_fields=['password'])
     
     def check_password(self, raw_password):
-        return check_password(raw_password, self.password)
-    
-    def puede_acceder_sistema(self):
-        """Verifica si el usuario puede acceder al sistema"""
+        return self.user_id is not None and verificar_password(self.user, raw_password)
+    
+    def sincronizar_credencial(self, raw_password=None):
+        """Mantiene la credencial al día con el perfil: correo como username y, si se da, la nueva contraseña"""
+        if self.user_id is None:
+            if raw_password:
+                self.set_password(raw_password)
+            return
+        campos = []
+        if self.user.email != self.correo:
+            self.user.username = self.user.email = self.correo
+            campos += ['username', 'email']
+        if raw_password:
+            asignar_password(self.user, raw_password)
+            campos.append('password')
+        if campos:
+            self.user.save(update_fields=campos)
+    
+    @staticmethod
+    def acceso_permitido(rol_nombre, estado_grupo):
+        """Regla de acceso a partir del nombre del rol y del estado del grupo (None si no tiene)"""
         # Super admin siempre puede acceder
-        if self.rol and self.rol.nombre == 'superAdmin':
+        if rol_nombre == 'superAdmin':
             return True
-        
         # Usuarios normales solo si su grupo está activo
-        if self.grupo:
-            return self.grupo.estado in ['ACTIVO']
-        
-        return False
+        return estado_grupo in ['ACTIVO']
+
+    def puede_acceder_sistema(self):
+        """Verifica si el usuario puede acceder al sistema"""
+        return Usuario.acceso_permitido(
+            self.rol.nombre if self.rol else None,
+            self.grupo.estado if self.grupo else None,
+        )
     
     def __str__(self):
         grupo_info = f" - {self.grupo.nombre}" if self.grupo else ""
@@ -327,6 +579,18 @@ class Usuario(models.Model):
 
 # Modelo de Bitácora (actualizado con grupo)
 class Bitacora(models.Model):
+    TIPOS = [
+        ('CREAR', 'Creación'),
+        ('ACTUALIZAR', 'Actualización'),
+        ('ELIMINAR', 'Eliminación'),
+        ('RESTAURAR', 'Restauración'),
+        ('PAGO', 'Pago'),
+        ('LOGIN', 'Inicio de sesión'),
+        ('LOGOUT', 'Cierre de sesión'),
+        ('REGISTRO', 'Registro de clínica'),
+        ('OTRO', 'Otro'),
+    ]
+
     grupo = models.ForeignKey(
         Grupo,
         on_delete=models.CASCADE,
@@ -363,14 +627,161 @@ class Bitacora(models.Model):
         help_text="Información adicional en JSON (opcional)"
     )
     
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Hora en que ocurrió la acción (no la del INSERT: la bitácora se guarda por lotes)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+
+    # Clasificación para filtrar por columna en vez de por texto (ver auditoria.clasificar_accion)
+    tipo = models.CharField(max_length=20, choices=TIPOS, default='OTRO', editable=False)
+    entidad = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Tipo de objeto afectado, normalizado (ej: 'paciente')"
+    )
+
+    objects = TenantManager()
 
     class Meta:
         ordering = ['-timestamp']
         verbose_name = 'Registro de bitácora'
+        indexes = [
+            # Listado paginado por cursor de la bitácora de cada clínica
+            models.Index(fields=['grupo', '-timestamp', '-id'], name='bitacora_grupo_ts_id_idx'),
+            # Mismo orden con los filtros por tipo de acción, objeto y actor
+            models.Index(fields=['grupo', 'tipo', '-timestamp', '-id'], name='bitacora_grupo_tipo_idx'),
+            models.Index(fields=['grupo', 'entidad', '-timestamp', '-id'], name='bitacora_grupo_entidad_idx'),
+            models.Index(fields=['usuario', '-timestamp', '-id'], name='bitacora_usuario_ts_id_idx'),
+        ]
         verbose_name_plural = 'Bitácoras'
 
     def __str__(self):
         user = self.usuario.nombre if self.usuario else "Anónimo"
         grupo_info = f" ({self.grupo.nombre})" if self.grupo else ""
         return f"{self.timestamp.isoformat()} — {user}{grupo_info} — {self.accion[:80]}"
+
+
+# Resúmenes de actividad de la bitácora (ver actividad.py): se actualizan al guardar
+# cada lote de registros y sobreviven al archivo de los meses viejos
+class ActividadDiaria(models.Model):
+    grupo = models.ForeignKey(Grupo, on_delete=models.CASCADE, related_name='actividad_diaria')
+    # Id del Usuario que actuó (0 = sin actor). Sin FK: el resumen no se pierde si se borra el usuario
+    actor = models.PositiveIntegerField(default=0)
+    dia = models.DateField()
+    tipo = models.CharField(max_length=20, choices=Bitacora.TIPOS)
+    cantidad = models.PositiveIntegerField(default=0)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = 'Actividad diaria'
+        verbose_name_plural = 'Actividad diaria'
+        constraints = [
+            models.UniqueConstraint(fields=['grupo', 'actor', 'dia', 'tipo'], name='actividad_diaria_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['grupo', 'dia'], name='actividad_diaria_grupo_dia'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.tipo} actor {self.actor}: {self.cantidad}"
+
+
+class ActividadHoraria(models.Model):
+    grupo = models.ForeignKey(Grupo, on_delete=models.CASCADE, related_name='actividad_horaria')
+    hora = models.DateTimeField(help_text="Inicio de la hora")
+    tipo = models.CharField(max_length=20, choices=Bitacora.TIPOS)
+    cantidad = models.PositiveIntegerField(default=0)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = 'Actividad por hora'
+        verbose_name_plural = 'Actividad por hora'
+        constraints = [
+            # También sirve de índice para (grupo, tipo, rango de horas)
+            models.UniqueConstraint(fields=['grupo', 'tipo', 'hora'], name='actividad_horaria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.hora:%Y-%m-%d %H}h {self.tipo}: {self.cantidad}"
+
+
+# Revocaciones de tokens firmados (logout, suspensión de grupo, etc.)
+class RevocacionToken(models.Model):
+    tipo_opciones = [
+        ('SESION', 'Sesión'),
+        ('USUARIO', 'Usuario'),
+        ('GRUPO', 'Grupo'),
+    ]
+
+    tipo = models.CharField(
+        max_length=10,
+        choices=tipo_opciones,
+        verbose_name="Tipo de revocación"
+    )
+
+    clave = models.CharField(
+        max_length=64,
+        help_text="Id de sesión, de usuario o de grupo revocado"
+    )
+
+    fecha = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        help_text="Los tokens emitidos antes de esta fecha quedan invalidados"
+    )
+
+    expira = models.DateTimeField(
+        db_index=True,
+        help_text="A partir de aquí ningún token afectado puede seguir vigente"
+    )
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.clave} ({self.fecha.isoformat()})"
+
+    class Meta:
+        verbose_name = "Revocación de token"
+        verbose_name_plural = "Revocaciones de tokens"
+        ordering = ['id']
+
+
+# Bandeja de salida de correos (ver correo.py): el request solo inserta la fila y
+# `despachar_correos` la envía por lotes reutilizando la conexión SMTP
+class CorreoSaliente(models.Model):
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+
+    grupo = models.ForeignKey(
+        Grupo, on_delete=models.CASCADE, null=True, blank=True, related_name='correos'
+    )
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=255)
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(
+        default=timezone.now,
+        help_text="No se envía antes de esta fecha (reintentos y reservas de un despachador)"
+    )
+    ultimo_error = models.TextField(blank=True, default='')
+    creado = models.DateTimeField(auto_now_add=True)
+    enviado = models.DateTimeField(null=True, blank=True)
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = 'Correo saliente'
+        verbose_name_plural = 'Correos salientes'
+        indexes = [
+            # Lo que el despachador toma en cada vuelta
+            models.Index(fields=['estado', 'proximo_intento'], name='correo_pendiente_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} → {', '.join(self.destinatarios)} ({self.estado})"
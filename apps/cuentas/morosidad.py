@@ -0,0 +1,66 @@
+"""
+Barrido de morosidad: pasa a VENCIDO los pagos cuyo vencimiento ya pasó y a
+MOROSO (o de vuelta a ACTIVO) los grupos según su vencimiento más próximo.
+
+Todo son UPDATE ... WHERE sobre lotes acotados, cada uno en su propia
+transacción corta: no se cargan instancias y ningún lote retiene bloqueos más
+que lo que tarda en actualizar sus filas. Las filas que otra transacción tiene
+bloqueadas se saltan (SKIP LOCKED donde la base lo soporta) y quedan para el
+siguiente barrido, así que se puede correr cada minuto.
+"""
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Grupo, Pago
+
+
+def _actualizar_por_lotes(queryset, lote, **valores):
+    """
+    Actualiza las filas del queryset de a `lote` por sentencia hasta agotarlas.
+    Devuelve (filas actualizadas, sentencias ejecutadas).
+    """
+    modelo = queryset.model
+    if connection.features.has_select_for_update_skip_locked:
+        queryset = queryset.select_for_update(skip_locked=True)
+    total = sentencias = 0
+    while True:
+        with transaction.atomic():
+            ids = queryset.order_by('pk').values('pk')[:lote]
+            actualizadas = modelo.objects.filter(pk__in=ids).update(**valores)
+        total += actualizadas
+        sentencias += 1
+        if actualizadas < lote:
+            return total, sentencias
+
+
+def barrer_morosidad(ahora=None, lote=1000):
+    """
+    Aplica los vencimientos hasta `ahora` (por defecto, el momento actual) y
+    devuelve cuántas filas cambió cada paso, con su tiempo en milisegundos.
+    Los contadores del grupo no cambian: un pago VENCIDO se sigue debiendo.
+    """
+    ahora = ahora or timezone.now()
+    resultado = {}
+
+    pasos = [
+        ('pagos_vencidos', Pago.objects.filter(
+            estado='PENDIENTE', fecha_vencimiento__lt=ahora,
+        ), {'estado': 'VENCIDO'}),
+        ('grupos_morosos', Grupo.objects.filter(
+            estado='ACTIVO', proximo_vencimiento__lt=ahora,
+        ), {'estado': 'MOROSO'}),
+        ('grupos_al_dia', Grupo.objects.filter(estado='MOROSO').exclude(
+            proximo_vencimiento__lt=ahora,
+        ), {'estado': 'ACTIVO'}),
+    ]
+    for nombre, queryset, valores in pasos:
+        inicio = time.perf_counter()
+        filas, sentencias = _actualizar_por_lotes(queryset, lote, **valores)
+        resultado[nombre] = {
+            'filas': filas,
+            'sentencias': sentencias,
+            'ms': (time.perf_counter() - inicio) * 1000,
+        }
+    return resultado
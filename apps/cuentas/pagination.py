@@ -0,0 +1,161 @@
+"""
+Paginación por cursor (keyset).
+
+A diferencia de la paginación por número de página, no usa OFFSET: el cursor
+guarda los valores de orden de la última fila entregada y la página siguiente
+empieza con un WHERE sobre esos valores. Con un índice que siga el mismo orden,
+la página N cuesta lo mismo que la primera.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor sobre una tupla de campos de orden, p. ej. ('-timestamp', '-id').
+    El último campo debe ser único (normalmente el id) y ninguno puede ser nulo.
+    La vista puede declarar `keyset_ordering` para cambiar el orden, y definir
+    `filas_externas(valores, reverso, limite)` para sumar filas que no salen del
+    queryset (p. ej. la bitácora archivada): devuelve hasta `limite` objetos que van
+    después del cursor `valores` (None en la primera página) y se mezclan por orden.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(tamano, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.tamano = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        opts = queryset.model._meta
+        self.campos = [
+            (opts.get_field(campo.lstrip('-')), campo.startswith('-'))
+            for campo in ordering
+        ]
+
+        cursor = self.decode_cursor(request)
+        reverso = bool(cursor and cursor['reverso'])
+        if cursor:
+            queryset = queryset.filter(self.despues_de(cursor['valores'], reverso))
+        if reverso:
+            ordering = tuple(c[1:] if c.startswith('-') else f'-{c}' for c in ordering)
+
+        filas = list(queryset.order_by(*ordering)[:self.tamano + 1])
+        externas = getattr(view, 'filas_externas', None)
+        if externas is not None:
+            extra = externas(cursor['valores'] if cursor else None, reverso, self.tamano + 1)
+            if extra:
+                filas = self.ordenar(filas + list(extra), reverso)[:self.tamano + 1]
+        hay_mas = len(filas) > self.tamano
+        filas = filas[:self.tamano]
+        if reverso:
+            filas.reverse()
+            self.hay_siguiente, self.hay_anterior = True, hay_mas
+        else:
+            self.hay_siguiente, self.hay_anterior = hay_mas, cursor is not None
+        self.filas = filas
+        return filas
+
+    def despues_de(self, valores, reverso=False):
+        """
+        Filas que van después de `valores` en el orden de la paginación (antes, si es reverso).
+        (a, b) < (x, y) se escribe como a <= x AND (a < x OR (a = x AND b < y)): la
+        primera condición es un rango sobre la primera columna del índice.
+        """
+        iguales = {}
+        alternativas = Q()
+        for (campo, descendente), valor in zip(self.campos, valores):
+            operador = 'lt' if descendente != reverso else 'gt'
+            alternativas |= Q(**iguales, **{f'{campo.attname}__{operador}': valor})
+            iguales[campo.attname] = valor
+        primero, descendente = self.campos[0]
+        rango = 'lte' if descendente != reverso else 'gte'
+        return Q(**{f'{primero.attname}__{rango}': valores[0]}) & alternativas
+
+    def ordenar(self, filas, reverso=False):
+        """Ordena objetos en memoria como lo haría order_by con el orden de la paginación"""
+        for campo, descendente in reversed(self.campos):
+            filas.sort(key=lambda fila: getattr(fila, campo.attname), reverse=descendente != reverso)
+        return filas
+
+    def valores_de(self, fila):
+        return [getattr(fila, campo.attname) for campo, _ in self.campos]
+
+    def encode_cursor(self, fila, reverso):
+        valores = [v.isoformat() if hasattr(v, 'isoformat') else v for v in self.valores_de(fila)]
+        datos = json.dumps({'v': valores, 'r': int(reverso)}, default=str, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            valores = datos['v']
+            if len(valores) != len(self.campos):
+                raise ValueError
+            return {
+                'valores': [campo.to_python(v) for (campo, _), v in zip(self.campos, valores)],
+                'reverso': bool(datos.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.hay_siguiente or not self.filas:
+            return None
+        return self.encode_cursor(self.filas[-1], reverso=False)
+
+    def get_previous_link(self):
+        if not self.hay_anterior:
+            return None
+        if not self.filas:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.filas[0], reverso=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class BitacoraPagination(KeysetPagination):
+    """Bitácora de la más reciente a la más antigua; índice (grupo, -timestamp, -id)"""
+    ordering = ('-timestamp', '-id')
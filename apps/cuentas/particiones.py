@@ -0,0 +1,279 @@
+"""
+Particiones mensuales de la bitácora (solo PostgreSQL).
+
+`particionar_bitacora --convertir` convierte cuentas_bitacora en una tabla
+particionada por rango de timestamp; `--revertir` la vuelve a una tabla común.
+No es una migración: la conversión toma la tabla en exclusiva y reconstruye la
+clave primaria, así que se corre a mano en una ventana de mantenimiento.
+
+Lo que ya existía queda como una sola partición (cuentas_bitacora_historico,
+desde MINVALUE hasta el mes siguiente a la conversión); desde ahí hay una
+partición por mes (cuentas_bitacora_p2026_11) y una por defecto para lo que
+llegue sin partición creada. `particionar_bitacora` crea las de los meses
+próximos y conviene correrlo a diario.
+
+Archivar un mes que tiene partición propia es DETACH + DROP: no hay DELETE
+fila a fila ni vacuum posterior. En SQLite (y en una base sin convertir) la
+bitácora es una sola tabla y el archivo borra por rango (ver archivo.py).
+"""
+import re
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+TABLA = 'cuentas_bitacora'
+HISTORICO = 'cuentas_bitacora_historico'
+PARTICION_DEFECTO = 'cuentas_bitacora_defecto'
+SECUENCIA = 'cuentas_bitacora_id_seq'
+
+_LIMITES = re.compile(r"FROM \((?:'(?P<desde>[^']+)'|MINVALUE)\) TO \((?:'(?P<hasta>[^']+)'|MAXVALUE)\)")
+
+
+def inicio_de_mes(momento):
+    """Primer instante del mes de `momento` (en la zona horaria vigente)"""
+    momento = timezone.localtime(momento)
+    return timezone.make_aware(datetime(momento.year, momento.month, 1))
+
+
+def sumar_meses(inicio, meses):
+    indice = inicio.year * 12 + inicio.month - 1 + meses
+    return timezone.make_aware(datetime(indice // 12, indice % 12 + 1, 1))
+
+
+def nombre_particion(inicio):
+    return f'{TABLA}_p{inicio.year:04d}_{inicio.month:02d}'
+
+
+def es_particionada():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLA])
+        fila = cursor.fetchone()
+    return bool(fila) and fila[0] == 'p'
+
+
+def particiones():
+    """Particiones de la bitácora como (nombre, desde, hasta); None en un límite abierto o en la por defecto"""
+    if not es_particionada():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [TABLA])
+        filas = cursor.fetchall()
+    resultado = []
+    for nombre, limites in filas:
+        m = _LIMITES.search(limites)
+        desde = parse_datetime(m['desde']) if m and m['desde'] else None
+        hasta = parse_datetime(m['hasta']) if m and m['hasta'] else None
+        resultado.append((nombre, desde, hasta))
+    # Primero las de límite inferior abierto (histórico, por defecto), después por mes
+    return sorted(resultado, key=lambda p: (p[1] is not None, p[1].timestamp() if p[1] else 0))
+
+
+def crear_particion(inicio):
+    """
+    Crea la partición del mes que empieza en `inicio` si no existe.
+    Si la partición por defecto ya recibió filas de ese mes, se mueven a la nueva.
+    Devuelve True si la creó.
+    """
+    nombre = nombre_particion(inicio)
+    fin = sumar_meses(inicio, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [nombre])
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {PARTICION_DEFECTO} WHERE "timestamp" >= %s AND "timestamp" < %s)',
+            [inicio, fin],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE {nombre} PARTITION OF {TABLA} FOR VALUES FROM (%s) TO (%s)',
+                [inicio, fin],
+            )
+            return True
+        cursor.execute(f'CREATE TABLE {nombre} (LIKE {TABLA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH movidas AS (DELETE FROM {PARTICION_DEFECTO} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO {nombre} SELECT * FROM movidas',
+            [inicio, fin],
+        )
+        cursor.execute(f'ALTER TABLE {TABLA} ATTACH PARTITION {nombre} FOR VALUES FROM (%s) TO (%s)', [inicio, fin])
+    return True
+
+
+def asegurar_particiones(meses=3, ahora=None):
+    """Crea las particiones del mes actual y de los `meses` siguientes; devuelve los nombres creados"""
+    if not es_particionada():
+        return []
+    inicio = inicio_de_mes(ahora or timezone.now())
+    creadas = []
+    for i in range(meses + 1):
+        mes = sumar_meses(inicio, i)
+        cubierto = any(
+            nombre != PARTICION_DEFECTO and (desde is None or desde <= mes) and hasta is not None and mes < hasta
+            for nombre, desde, hasta in particiones()
+        )
+        if not cubierto and crear_particion(mes):
+            creadas.append(nombre_particion(mes))
+    return creadas
+
+
+def particion_del_mes(inicio):
+    """Nombre de la partición que contiene exactamente ese mes, o None"""
+    fin = sumar_meses(inicio, 1)
+    for nombre, desde, hasta in particiones():
+        if desde == inicio and hasta == fin:
+            return nombre
+    return None
+
+
+def eliminar_particion(nombre):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLA} DETACH PARTITION {nombre}')
+        cursor.execute(f'DROP TABLE {nombre}')
+
+
+def _indices(cursor, tabla):
+    """(nombre, definición, es la clave primaria) de los índices de `tabla`"""
+    cursor.execute("""
+        SELECT i.relname, pg_get_indexdef(i.oid), x.indisprimary
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(%s)
+    """, [tabla])
+    return cursor.fetchall()
+
+
+def _foraneas(cursor, tabla):
+    """(nombre, definición) de las claves foráneas de `tabla`"""
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype = 'f'
+    """, [tabla])
+    return cursor.fetchall()
+
+
+def _clave_primaria(cursor, tabla):
+    cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'", [tabla])
+    fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def convertir(meses=3, ahora=None):
+    """
+    Convierte la bitácora en una tabla particionada por mes. Devuelve False si
+    ya lo estaba (o la base no es PostgreSQL).
+
+    Lo existente no se copia: la tabla pasa a ser la partición HISTORICO y sus
+    índices se adjuntan a los de la tabla nueva sin reconstruirlos. Solo la
+    clave primaria se reconstruye, como (id, timestamp): PostgreSQL exige que
+    incluya la columna de partición. Para Django el pk sigue siendo id.
+    """
+    if connection.vendor != 'postgresql' or es_particionada():
+        return False
+    ahora = ahora or timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE')
+        # Las foráneas de Django son diferidas: verificarlas ya, o no se puede alterar la tabla
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'SELECT coalesce(max(id), 0), max("timestamp") FROM {TABLA}')
+        ultimo_id, ultimo = cursor.fetchone()
+        # El histórico llega hasta el mes siguiente (o el de su registro más adelantado)
+        corte = sumar_meses(inicio_de_mes(max(ahora, ultimo or ahora)), 1)
+        indices = _indices(cursor, TABLA)
+        foraneas = _foraneas(cursor, TABLA)
+
+        cursor.execute(f'ALTER TABLE {TABLA} RENAME TO {HISTORICO}')
+        cursor.execute(f'ALTER TABLE {HISTORICO} ALTER COLUMN id DROP IDENTITY IF EXISTS')
+        cursor.execute(f'ALTER TABLE {HISTORICO} ALTER COLUMN id DROP DEFAULT')
+        for nombre, _, primaria in indices:
+            if primaria:
+                cursor.execute(f'ALTER TABLE {HISTORICO} DROP CONSTRAINT {nombre}')
+            else:
+                cursor.execute(f'ALTER INDEX {nombre} RENAME TO {nombre[:50]}_hist')
+        cursor.execute(f'ALTER TABLE {HISTORICO} ADD CONSTRAINT {HISTORICO}_pkey PRIMARY KEY (id, "timestamp")')
+
+        cursor.execute(f'CREATE TABLE {TABLA} (LIKE {HISTORICO}) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'ALTER TABLE {TABLA} ADD CONSTRAINT {TABLA}_pkey PRIMARY KEY (id, "timestamp")')
+        # Secuencia propia: las columnas identity en tablas particionadas recién existen en PostgreSQL 17
+        cursor.execute(f'CREATE SEQUENCE {SECUENCIA} OWNED BY {TABLA}.id')
+        cursor.execute(f"ALTER TABLE {TABLA} ALTER COLUMN id SET DEFAULT nextval('{SECUENCIA}')")
+        cursor.execute('SELECT setval(%s, %s, %s)', [SECUENCIA, max(ultimo_id, 1), bool(ultimo_id)])
+        for nombre, definicion in foraneas:
+            cursor.execute(f'ALTER TABLE {TABLA} ADD CONSTRAINT {nombre} {definicion}')
+        # Las definiciones apuntan a TABLA, que ahora es la tabla particionada
+        for _, definicion, primaria in indices:
+            if not primaria:
+                cursor.execute(definicion)
+        cursor.execute(
+            f'ALTER TABLE {TABLA} ATTACH PARTITION {HISTORICO} FOR VALUES FROM (MINVALUE) TO (%s)', [corte],
+        )
+        cursor.execute(f'CREATE TABLE {PARTICION_DEFECTO} PARTITION OF {TABLA} DEFAULT')
+        asegurar_particiones(meses, ahora=ahora)
+    return True
+
+
+def revertir():
+    """
+    Vuelve la bitácora a una tabla común. Devuelve False si no estaba particionada.
+
+    La partición HISTORICO vuelve a ser la tabla (sus índices recuperan los
+    nombres de la tabla particionada); las filas del resto de las particiones
+    se copian en ella. La clave primaria vuelve a ser id, con identity.
+    """
+    if not es_particionada():
+        return False
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE')
+        # Las foráneas de Django son diferidas: verificarlas ya, o no se puede alterar la tabla
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        indices = [(nombre, definicion) for nombre, definicion, primaria in _indices(cursor, TABLA) if not primaria]
+        foraneas = _foraneas(cursor, TABLA)
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [HISTORICO])
+        if cursor.fetchone()[0]:
+            # Índice del histórico -> índice de la tabla particionada al que está adjunto
+            cursor.execute("""
+                SELECT hijo.relname, padre.relname
+                FROM pg_index x
+                JOIN pg_class hijo ON hijo.oid = x.indexrelid
+                JOIN pg_inherits h ON h.inhrelid = x.indexrelid
+                JOIN pg_class padre ON padre.oid = h.inhparent
+                WHERE x.indrelid = to_regclass(%s) AND NOT x.indisprimary
+            """, [HISTORICO])
+            adjuntos = cursor.fetchall()
+            cursor.execute(f'ALTER TABLE {TABLA} DETACH PARTITION {HISTORICO}')
+        else:
+            adjuntos = []
+            cursor.execute(f'CREATE TABLE {HISTORICO} (LIKE {TABLA})')
+        cursor.execute(f'INSERT INTO {HISTORICO} SELECT * FROM {TABLA}')
+        # Se lleva las demás particiones, sus índices y la secuencia
+        cursor.execute(f'DROP TABLE {TABLA}')
+        cursor.execute(f'ALTER TABLE {HISTORICO} RENAME TO {TABLA}')
+
+        primaria = _clave_primaria(cursor, TABLA)
+        if primaria:
+            cursor.execute(f'ALTER TABLE {TABLA} DROP CONSTRAINT {primaria}')
+        cursor.execute(f'ALTER TABLE {TABLA} ADD CONSTRAINT {TABLA}_pkey PRIMARY KEY (id)')
+        renombrados = set()
+        for hijo, padre in adjuntos:
+            cursor.execute(f'ALTER INDEX {hijo} RENAME TO {padre}')
+            renombrados.add(padre)
+        for nombre, definicion in indices:
+            if nombre not in renombrados:
+                cursor.execute(definicion.replace(' ON ONLY ', ' ON ', 1))
+        existentes = {nombre for nombre, _ in _foraneas(cursor, TABLA)}
+        for nombre, definicion in foraneas:
+            if nombre not in existentes:
+                cursor.execute(f'ALTER TABLE {TABLA} ADD CONSTRAINT {nombre} {definicion}')
+        cursor.execute(f'ALTER TABLE {TABLA} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) FROM {TABLA}",
+            [TABLA],
+        )
+    return True
@@ -0,0 +1,200 @@
+"""
+Listados de solo lectura armados con values_list en vez de instancias del modelo.
+
+Con páginas grandes, crear una instancia por fila (en Medico, dos modelos por la
+herencia multitabla) y pasar cada campo por el to_representation del serializer
+se lleva casi todo el tiempo del request, aunque las consultas ya estén resueltas.
+La proyección sale del mismo serializer, así que el JSON es el mismo:
+
+    - cada campo legible es una columna de values_list ('grupo.nombre' -> 'grupo__nombre');
+      si la ruta pasa por una relación que admite nulos y no hay objeto, la clave se
+      omite, como hace DRF
+    - fechas, horas y decimales pasan por el to_representation del campo del serializer;
+      textos, enteros y pks se copian tal cual
+    - las relaciones many=True y los SerializerMethodField marcados con
+      @proyectar_lista salen de una consulta más por relación, agrupada por fila
+    - los SerializerMethodField marcados con @proyectar(funcion, 'ruta', ...) se
+      calculan con `funcion` sobre esas columnas
+
+Por cada serializer se genera (una vez) una función fila -> dict con exec, sin
+bucles ni búsquedas por campo al convertir cada fila.
+"""
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import ForeignObjectRel
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Campos cuyo valor de la base ya es el del JSON
+_SIN_CONVERSION = (
+    serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+_PROYECCIONES = {}
+
+
+def proyectar(funcion, *rutas):
+    """Para un get_<campo>: el valor es funcion(*columnas), con rutas de values_list ('rol__nombre')"""
+    def decorar(metodo):
+        metodo.proyeccion = ('columnas', rutas, funcion)
+        return metodo
+    return decorar
+
+
+def proyectar_lista(relacion, campo):
+    """Para un get_<campo> que devuelve [objeto.<campo> for objeto in obj.<relacion>.all()]"""
+    def decorar(metodo):
+        metodo.proyeccion = ('lista', relacion, campo)
+        return metodo
+    return decorar
+
+
+def _campo_modelo(modelo, atributo):
+    try:
+        return modelo._meta.get_field(atributo)
+    except FieldDoesNotExist:
+        raise ImproperlyConfigured(f'{modelo.__name__} no tiene el campo {atributo!r}')
+
+
+class Proyeccion:
+    """Conversión de filas de values_list al JSON de un serializer (ver proyeccion_de)"""
+
+    def __init__(self, serializer_class):
+        self.modelo = serializer_class.Meta.model
+        self.columnas = ['pk']   # rutas de values_list; la pk primero, para agrupar las listas
+        self.listas = []         # (relación many, campo del objeto relacionado o 'pk')
+        self.nombres = {}        # nombres de las variables del código generado
+        lineas = []
+        serializer = serializer_class()
+        for clave, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            if isinstance(campo, serializers.SerializerMethodField):
+                lineas += self._metodo(clave, getattr(serializer, campo.method_name), serializer_class)
+            elif isinstance(campo, serializers.ManyRelatedField) and isinstance(campo.child_relation, serializers.PrimaryKeyRelatedField):
+                lineas.append(f'd[{clave!r}] = {self._lista(campo.source, "pk")}.get(fila[0], [])')
+            elif isinstance(campo, serializers.PrimaryKeyRelatedField):
+                lineas += self._columna(clave, campo)
+            elif isinstance(campo, (serializers.Serializer, serializers.RelatedField, serializers.ManyRelatedField)):
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{clave}: campo sin proyección')
+            else:
+                lineas += self._columna(clave, campo)
+        codigo = 'def convertir(fila, listas):\n    d = {}\n' + ''.join(f'    {l}\n' for l in lineas) + '    return d\n'
+        espacio = dict(self.nombres)
+        exec(compile(codigo, f'<proyeccion {serializer_class.__name__}>', 'exec'), espacio)
+        self.convertir = espacio['convertir']
+
+    def _indice(self, ruta):
+        if ruta not in self.columnas:
+            self.columnas.append(ruta)
+        return self.columnas.index(ruta)
+
+    def _nombre(self, valor):
+        nombre = f'_v{len(self.nombres)}'
+        self.nombres[nombre] = valor
+        return nombre
+
+    def _lista(self, relacion, campo):
+        if (relacion, campo) not in self.listas:
+            self.listas.append((relacion, campo))
+        return f'listas[{self.listas.index((relacion, campo))}]'
+
+    def _columna(self, clave, campo):
+        atributos = campo.source.split('.')
+        modelo, guardas = self.modelo, []
+        for i, atributo in enumerate(atributos[:-1], start=1):
+            relacion = _campo_modelo(modelo, atributo)
+            if relacion.null:
+                guardas.append(self._indice('__'.join(atributos[:i])))
+            modelo = relacion.related_model
+        final = _campo_modelo(modelo, atributos[-1])
+        if final.many_to_one or final.one_to_one:
+            # Por la columna (usuario_id): con el nombre de la relación como alias, un
+            # ORDER BY por esa relación ordenaría por la columna y no por el orden del modelo relacionado
+            atributos = atributos[:-1] + [final.attname]
+        valor = f'fila[{self._indice("__".join(atributos))}]'
+        if not isinstance(campo, _SIN_CONVERSION):
+            convertir = self._nombre(campo.to_representation)
+            valor = f'None if {valor} is None else {convertir}({valor})'
+        linea = f'd[{clave!r}] = {valor}'
+        if guardas:
+            # Sin el objeto intermedio DRF omite la clave (SkipField)
+            condicion = ' and '.join(f'fila[{i}] is not None' for i in guardas)
+            return [f'if {condicion}:', f'    {linea}']
+        return [linea]
+
+    def _metodo(self, clave, metodo, serializer_class):
+        proyeccion = getattr(metodo, 'proyeccion', None)
+        if proyeccion is None:
+            raise ImproperlyConfigured(
+                f'{serializer_class.__name__}.{metodo.__name__}: falta @proyectar o @proyectar_lista'
+            )
+        if proyeccion[0] == 'lista':
+            _, relacion, campo = proyeccion
+            return [f'd[{clave!r}] = {self._lista(relacion, campo)}.get(fila[0], [])']
+        _, rutas, funcion = proyeccion
+        argumentos = ', '.join(f'fila[{self._indice(ruta)}]' for ruta in rutas)
+        return [f'd[{clave!r}] = {self._nombre(funcion)}({argumentos})']
+
+    def _valores_listas(self, pks):
+        """
+        Por cada lista, {pk de la fila: [valores]} en el orden por defecto del modelo
+        relacionado. Una consulta por relación, aunque se lean varios campos de ella.
+        """
+        por_relacion = {}
+        for relacion, campo in self.listas:
+            por_relacion.setdefault(relacion, []).append(campo)
+        valores = {}
+        for relacion, campos in por_relacion.items():
+            descriptor = _campo_modelo(self.modelo, relacion)
+            if isinstance(descriptor, ForeignObjectRel):
+                consulta = descriptor.field.name
+            else:
+                consulta = descriptor.related_query_name()
+            listas = [{} for _ in campos]
+            filas = descriptor.related_model._default_manager.filter(**{f'{consulta}__in': pks}).values_list(consulta, *campos)
+            for pk, *columnas in filas:
+                for por_fila, valor in zip(listas, columnas):
+                    por_fila.setdefault(pk, []).append(valor)
+            valores.update(((relacion, campo), lista) for campo, lista in zip(campos, listas))
+        return [valores[lista] for lista in self.listas]
+
+    def filas(self, queryset):
+        return self._convertir(list(queryset.prefetch_related(None).values_list(*self.columnas)))
+
+    def filas_de(self, queryset, pks):
+        """Filas de los objetos `pks` de queryset, en el orden de `pks` (una página ya elegida)"""
+        if not pks:
+            return []
+        por_pk = {fila[0]: fila for fila in queryset.prefetch_related(None).filter(pk__in=pks).values_list(*self.columnas)}
+        return self._convertir([por_pk[pk] for pk in pks if pk in por_pk])
+
+    def _convertir(self, filas):
+        listas = self._valores_listas([fila[0] for fila in filas]) if self.listas and filas else [{}] * len(self.listas)
+        convertir = self.convertir
+        return [convertir(fila, listas) for fila in filas]
+
+
+def proyeccion_de(serializer_class):
+    """Proyección de `serializer_class`, armada una vez por clase"""
+    if serializer_class not in _PROYECCIONES:
+        _PROYECCIONES[serializer_class] = Proyeccion(serializer_class)
+    return _PROYECCIONES[serializer_class]
+
+
+class ProyeccionMixin:
+    """
+    Para ModelViewSet: el listado sale de proyeccion_de(serializer) en vez de instanciar
+    el serializer por fila. Con paginación, la página se elige con el paginador y sus
+    filas se proyectan con una consulta más por pk. Las demás acciones no cambian.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        proyeccion = proyeccion_de(self.get_serializer_class())
+        if self.paginator is None:
+            return Response(proyeccion.filas(queryset))
+        pagina = self.paginate_queryset(queryset)
+        if pagina is None:
+            return Response(proyeccion.filas(queryset))
+        return self.get_paginated_response(proyeccion.filas_de(queryset, [objeto.pk for objeto in pagina]))
@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.db import transaction
 from .models import *
+from .consultas import relaciones
+from .proyecciones import proyectar
+from .hashing import HashingSaturado
+from .tenant import get_tenant
 
 class GrupoSerializer(serializers.ModelSerializer):
     admin_nombre = serializers.CharField(write_only=True, required=True)
@@ -13,8 +16,7 @@ class GrupoSerializer(serializers.ModelSerializer):
     admin_direccion = serializers.CharField(write_only=True, required=False, allow_blank=True)
     admin_password = serializers.CharField(write_only=True, required=True)
     
-    pagos_pendientes = serializers.SerializerMethodField()
-    total_usuarios = serializers.SerializerMethodField()
+    # pagos_pendientes y total_usuarios son contadores del propio Grupo (solo lectura)
     esta_moroso = serializers.SerializerMethodField()
     
     class Meta:
@@ -29,12 +31,6 @@ class GrupoSerializer(serializers.ModelSerializer):
             'admin_direccion': {'write_only': True},
         }
     
-    def get_pagos_pendientes(self, obj):
-        return obj.pagos.filter(estado='PENDIENTE').count()
-    
-    def get_total_usuarios(self, obj):
-        return obj.usuarios.filter(estado=True).count()
-    
     def get_esta_moroso(self, obj):
         return obj.esta_moroso()
 
@@ -57,15 +53,11 @@ class GrupoSerializer(serializers.ModelSerializer):
         grupo = Grupo.objects.create(**validated_data)
         try:
             rol_admin = Rol.objects.get(nombre='administrador')
-            django_user = User.objects.create_user(
-                username=admin_data['correo'],
-                email=admin_data['correo'],
-                password=admin_data['password']
-            )
+            django_user = crear_credencial(admin_data['correo'], admin_data['password'])
             admin_usuario = Usuario.objects.create(
                 grupo=grupo,
+                user=django_user,
                 nombre=admin_data['nombre'],
-                password=make_password(admin_data['password']),
                 correo=admin_data['correo'],
                 sexo=admin_data['sexo'],
                 fecha_nacimiento=admin_data['fecha_nacimiento'],
@@ -78,6 +70,9 @@ class GrupoSerializer(serializers.ModelSerializer):
         except Rol.DoesNotExist:
             grupo.delete()
             raise serializers.ValidationError({'non_field_errors': 'No se encontró el rol de Administrador'})
+        except HashingSaturado:
+            # Se propaga como 503 para que el cliente reintente; la transacción deshace el grupo
+            raise
         except Exception as e:
             grupo.delete()
             raise serializers.ValidationError({'non_field_errors': f'Error al crear el administrador: {str(e)}'})
@@ -91,14 +86,9 @@ class PagoSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         # Auto-asignar grupo del usuario actual si no se especifica
-        request = self.context.get('request')
-        if request and request.user:
-            try:
-                usuario_perfil = Usuario.objects.get(correo=request.user.email)
-                if usuario_perfil.grupo and 'grupo' not in validated_data:
-                    validated_data['grupo'] = usuario_perfil.grupo
-            except Usuario.DoesNotExist:
-                pass
+        tenant = get_tenant(self.context.get('request'))
+        if tenant.grupo_id and 'grupo' not in validated_data:
+            validated_data['grupo'] = tenant.grupo
         
         return super().create(validated_data)
 
@@ -112,70 +102,58 @@ class UsuarioSerializer(serializers.ModelSerializer):
     rol_nombre = serializers.CharField(source='rol.nombre', read_only=True)
     grupo_nombre = serializers.CharField(source='grupo.nombre', read_only=True)
     puede_acceder = serializers.SerializerMethodField()
+    # La contraseña no se guarda en Usuario: va a su credencial (User de Django)
+    password = serializers.CharField(write_only=True)
     
     class Meta:
         model = Usuario
         fields = '__all__'
-        extra_kwargs = {'password': {'write_only': True}}
+        extra_kwargs = {'user': {'read_only': True}}
     
+    @relaciones('rol', 'grupo')
+    @proyectar(Usuario.acceso_permitido, 'rol__nombre', 'grupo__estado')
     def get_puede_acceder(self, obj):
         return obj.puede_acceder_sistema()
     
     def validate(self, data):
-        request = self.context.get('request')
         # Solo valida grupo si hay usuario autenticado
-        if request and hasattr(request.user, 'email') and request.user.is_authenticated:
-            try:
-                usuario_creador = Usuario.objects.get(correo=request.user.email)
-                # Si no es super admin, debe usar su mismo grupo
-                if usuario_creador.rol.nombre != 'superAdmin':
-                    if 'grupo' in data and data['grupo'] != usuario_creador.grupo:
-                        raise serializers.ValidationError({
-                            'grupo': 'No puedes registrar usuarios en otros grupos'
-                        })
-                    # Forzar el grupo del creador
-                    data['grupo'] = usuario_creador.grupo
-            except Usuario.DoesNotExist:
-                pass
+        creador = get_tenant(self.context.get('request'))
+        if creador.usuario is not None:
+            # Si no es super admin, debe usar su mismo grupo
+            if not creador.is_super_admin:
+                if 'grupo' in data and data['grupo'] != creador.grupo:
+                    raise serializers.ValidationError({
+                        'grupo': 'No puedes registrar usuarios en otros grupos'
+                    })
+                # Forzar el grupo del creador
+                data['grupo'] = creador.grupo
         # Si no hay usuario autenticado, no valida grupo
         return data
     
+    @transaction.atomic
     def create(self, validated_data):
-        request = self.context.get('request')
         # Solo asigna grupo si hay usuario autenticado
-        if request and hasattr(request.user, 'email') and request.user.is_authenticated:
-            try:
-                usuario_creador = Usuario.objects.get(correo=request.user.email)
-                if (usuario_creador.rol.nombre != 'superAdmin' and 
-                    usuario_creador.grupo and 
-                    'grupo' not in validated_data):
-                    validated_data['grupo'] = usuario_creador.grupo
-            except Usuario.DoesNotExist:
-                pass
+        creador = get_tenant(self.context.get('request'))
+        if (creador.usuario is not None and
+            not creador.is_super_admin and
+            creador.grupo_id and
+            'grupo' not in validated_data):
+            validated_data['grupo'] = creador.grupo
         
         password = validated_data.pop('password', None)
-        if password:
-            validated_data['password'] = make_password(password)
         
-        # Crear el User de Django también
-        if 'correo' in validated_data:
-            User.objects.create_user(
-                username=validated_data['correo'],
-                email=validated_data['correo'],
-                password=password or '123'
-            )
+        # La credencial (User de Django) es la única que guarda el hash
+        validated_data['user'] = crear_credencial(validated_data['correo'], password or '123')
         
         usuario = Usuario.objects.create(**validated_data)
         return usuario
     
     def update(self, instance, validated_data):
         password = validated_data.pop('password', None)
-        # Hashear la contraseña si se proporciona
-        if password:
-            validated_data['password'] = make_password(password)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+        instance.sincronizar_credencial(password)
         return instance
 
 class BitacoraSerializer(serializers.ModelSerializer):
@@ -184,7 +162,8 @@ class BitacoraSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Bitacora
-        fields = ['id', 'usuario', 'grupo_nombre', 'accion', 'ip', 'objeto', 'extra', 'timestamp']
+        fields = ['id', 'usuario', 'grupo_nombre', 'tipo', 'accion', 'ip', 'objeto', 'entidad', 'extra', 'timestamp']
 
+    @relaciones('usuario')
     def get_usuario(self, obj):
         return obj.usuario.nombre if obj.usuario else None
\ No newline at end of file
@@ -0,0 +1,172 @@
+from collections import namedtuple
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.utils.functional import LazyObject, empty
+
+
+class TenantContext(namedtuple('TenantContext', ['user_id', 'usuario_id', 'grupo_id', 'rol', 'usuario'])):
+    """
+    Contexto inmutable del actor de un request: su perfil Usuario, su grupo y su rol.
+    Se resuelve una sola vez por request (ver get_tenant) y todas las vistas,
+    mixins y serializers lo leen en lugar de volver a consultar Usuario.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def desde_usuario(cls, user_id, usuario):
+        if usuario is None:
+            return cls(user_id, None, None, None, None)
+        rol = usuario.rol.nombre if usuario.rol_id else None
+        return cls(user_id, usuario.pk, usuario.grupo_id, rol, usuario)
+
+    @property
+    def perfil(self):
+        """
+        El perfil Usuario, o None. Con tokens firmados `usuario` es un objeto perezoso
+        que nunca es None, aunque el perfil se haya borrado: aquí se evalúa.
+        """
+        usuario = self.usuario
+        if isinstance(usuario, LazyObject):
+            if usuario._wrapped is empty:
+                usuario._setup()
+            return usuario._wrapped
+        return usuario
+
+    @property
+    def grupo(self):
+        perfil = self.perfil
+        return perfil.grupo if perfil is not None else None
+
+    @property
+    def is_super_admin(self):
+        return self.rol == 'superAdmin'
+
+
+ANONIMO = TenantContext(None, None, None, None, None)
+
+
+def resolver_tenant(user):
+    """Busca el perfil del usuario autenticado con su rol y grupo en una sola consulta"""
+    if user is None or not user.is_authenticated:
+        return ANONIMO
+    from .models import Usuario
+    usuario = (
+        Usuario.objects
+        .select_related('rol', 'grupo')
+        .filter(user_id=user.pk)
+        .first()
+    )
+    return TenantContext.desde_usuario(user.pk, usuario)
+
+
+def get_tenant(request):
+    """
+    Devuelve el TenantContext del request, resolviéndolo solo la primera vez.
+    Acepta tanto el Request de DRF como el HttpRequest de Django: el contexto se
+    guarda en el HttpRequest subyacente y se invalida si cambia el usuario autenticado.
+    """
+    if request is None:
+        return ANONIMO
+    http_request = getattr(request, '_request', request)
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+
+    contexto = getattr(http_request, '_tenant', None)
+    if contexto is None or contexto.user_id != user_id:
+        contexto = resolver_tenant(user)
+        http_request._tenant = contexto
+    return contexto
+
+
+# --- Managers con alcance por tenant -------------------------------------------
+
+# Ruta de lookup hasta Grupo de cada modelo tenant, calculada una vez en ready()
+_RUTAS_TENANT = {}
+
+
+class TenantQuerySet(models.QuerySet):
+    """QuerySet que sabe filtrarse por grupo usando la ruta precalculada de su modelo"""
+
+    def for_grupo(self, grupo):
+        """Filtra por grupo (instancia o id) con un único WHERE sobre la ruta del modelo"""
+        return self.filter(**{_RUTAS_TENANT[self.model]: grupo})
+
+    def for_tenant(self, tenant):
+        """
+        Aplica el alcance del actor: el super admin ve todo, el resto solo su grupo.
+        Sin grupo (anónimo o usuario suelto) no ve nada.
+        """
+        if tenant.is_super_admin:
+            return self
+        if not tenant.grupo_id:
+            return self.none()
+        return self.for_grupo(tenant.grupo_id)
+
+
+class TenantManager(models.Manager.from_queryset(TenantQuerySet)):
+    """
+    Manager de los modelos que pertenecen a un grupo (clínica).
+    La ruta hasta Grupo se deduce del modelo al arrancar la app; para casos
+    ambiguos se puede declarar explícitamente, p. ej. TenantManager(ruta='usuario__grupo').
+    """
+
+    def __init__(self, ruta=None):
+        super().__init__()
+        self.ruta = ruta
+
+
+def calcular_ruta_tenant(model):
+    """Devuelve el lookup de model hasta Grupo: FK directa o un salto por FK/OneToOne"""
+    from .models import Grupo
+
+    def fk_a_grupo(modelo):
+        for field in modelo._meta.get_fields():
+            if field.many_to_one and field.related_model is Grupo:
+                return field.name
+        return None
+
+    directa = fk_a_grupo(model)
+    if directa:
+        return directa
+    for field in model._meta.get_fields():
+        if (field.many_to_one or field.one_to_one) and field.concrete and field.related_model:
+            intermedia = fk_a_grupo(field.related_model)
+            if intermedia:
+                return f'{field.name}__{intermedia}'
+    raise ImproperlyConfigured(f'{model.__name__} usa TenantManager pero no tiene una ruta hasta Grupo')
+
+
+def registrar_rutas_tenant():
+    """Precalcula la ruta a Grupo de cada modelo con TenantManager (se llama en ready())"""
+    _RUTAS_TENANT.clear()
+    for model in apps.get_models():
+        manager = model._default_manager
+        if isinstance(manager, TenantManager):
+            _RUTAS_TENANT[model] = manager.ruta or calcular_ruta_tenant(model)
+
+
+def ruta_tenant(model):
+    return _RUTAS_TENANT.get(model)
+
+
+class MultiTenantMixin:
+    """Mixin para filtrar datos por grupo del usuario actual"""
+
+    def get_tenant(self):
+        return get_tenant(self.request)
+
+    def get_user_grupo(self):
+        """Obtiene el grupo del usuario actual"""
+        return self.get_tenant().grupo
+
+    def is_super_admin(self):
+        """Verifica si el usuario actual es super admin"""
+        return self.get_tenant().is_super_admin
+
+    def filter_by_grupo(self, queryset):
+        """Filtra el queryset por el grupo del usuario actual"""
+        if isinstance(queryset, TenantQuerySet):
+            return queryset.for_tenant(self.get_tenant())
+        return queryset
@@ -1,3 +1,819 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import smtplib
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import check_password as check_password_django, is_password_usable
+from django.contrib.auth.models import User
+from django.core import mail, signing
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.citas_pagos.serializers import CitaMedicaSerializer
+from apps.doctores.models import Bloque_Horario, Especialidad, Medico
+from apps.doctores.serializers import MedicoSerializer
+from apps.historiasDiagnosticos.models import Paciente, PatologiasO
+from apps.historiasDiagnosticos.serializers import PacienteSerializer, PatologiasOSerializer
+
+from .auditoria import EscritorBitacora, config_bitacora, entidad_de
+from .consultas import config_consultas, relaciones_de
+from .correo import despachar, encolar_correo
+from .hashing import check_password, make_passwords, pool_hashing, verificar_password
+from .authentication import SALT_ACCESS, ListaRevocacion, emitir_tokens, revocaciones, tenant_desde_claims
+from .benchmark import crear_clinica, crear_roles, crear_usuario
+from . import filtros, particiones
+from .actividad import reconstruir, sumar_registros
+from .exportacion import COLUMNAS
+from .filtros import condicion_texto, filtrar_bitacora, inicio_del_dia
+from .importacion import importar_usuarios
+from .morosidad import barrer_morosidad
+from .management.commands.bench_listados import poblar
+from .proyecciones import proyeccion_de
+from .serializers import UsuarioSerializer
+from .utils import alog_action, log_action
+from .models import ActividadDiaria, ActividadHoraria, Bitacora, CorreoSaliente, Grupo, Pago, RevocacionToken, Usuario
+
+# Hasher barato, hashing en el proceso y bitácora sin hilo de fondo
+PRUEBAS = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    HASHING_PASSWORDS={'MODO': 'local'},
+    BITACORA={'MODO': 'sincrono'},
+)
+
+
+def cliente(token=None, bearer=None):
+    c = APIClient()
+    if token:
+        c.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    if bearer:
+        c.credentials(HTTP_AUTHORIZATION=f'Bearer {bearer}')
+    return c
+
+
+@PRUEBAS
+class ListaRevocacionTests(TestCase):
+
+    def revocacion(self, pk, sid, hace=0):
+        RevocacionToken.objects.create(id=pk, tipo='SESION', clave=sid, expira=timezone.now() + timedelta(days=1))
+        if hace:
+            # Creada antes pero confirmada después: su fecha queda detrás de la última leída
+            RevocacionToken.objects.filter(pk=pk).update(fecha=timezone.now() - timedelta(seconds=hace))
+
+    def test_incorpora_revocaciones_confirmadas_fuera_de_orden(self):
+        lista = ListaRevocacion()
+        self.revocacion(100, 'nueva')
+        lista.sincronizar(forzar=True)
+        self.revocacion(50, 'tardia', hace=10)
+        lista.sincronizar(forzar=True)
+        self.assertTrue(lista.esta_revocado({'sid': 'nueva', 'iat': time.time()}))
+        self.assertTrue(lista.esta_revocado({'sid': 'tardia', 'iat': time.time()}))
+
+    def test_ignora_revocaciones_vencidas_al_arrancar(self):
+        RevocacionToken.objects.create(tipo='SESION', clave='vieja', expira=timezone.now() - timedelta(seconds=1))
+        lista = ListaRevocacion()
+        lista.sincronizar(forzar=True)
+        self.assertFalse(lista.esta_revocado({'sid': 'vieja', 'iat': time.time()}))
+
+    def test_usuario_revocado_invalida_solo_tokens_anteriores(self):
+        lista = ListaRevocacion()
+        anterior = {'sid': 'a', 'pid': 7, 'iat': time.time() - 1}
+        lista.revocar_usuario(7)
+        posterior = {'sid': 'b', 'pid': 7, 'iat': time.time() + 1}
+        self.assertTrue(lista.esta_revocado(anterior))
+        self.assertFalse(lista.esta_revocado(posterior))
+
+
+@PRUEBAS
+class DesactivarUsuarioTests(TestCase):
+
+    def setUp(self):
+        revocaciones._reiniciar()
+        self.roles = crear_roles()
+        self.grupo, token = crear_clinica('Clinica Uno', self.roles)
+        self.admin = cliente(token)
+        self.user, self.usuario = crear_usuario('medico@uno.test', self.roles['administrador'], self.grupo)
+        self.acceso = emitir_tokens(self.user, self.usuario)['access']
+        Token.objects.create(user=self.user)
+
+    def assert_sin_acceso(self):
+        self.assertEqual(cliente(bearer=self.acceso).get('/api/cuentas/usuarios/').status_code, 401)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_token_firmado_valido_mientras_esta_activo(self):
+        self.assertEqual(cliente(bearer=self.acceso).get('/api/cuentas/usuarios/').status_code, 200)
+
+    def test_desactivar_revoca_sus_tokens(self):
+        respuesta = self.admin.patch(f'/api/cuentas/usuarios/{self.usuario.pk}/', {'estado': False}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assert_sin_acceso()
+
+    def test_borrar_revoca_sus_tokens(self):
+        self.assertEqual(self.admin.delete(f'/api/cuentas/usuarios/{self.usuario.pk}/').status_code, 204)
+        self.assertEqual(cliente(bearer=self.acceso).get('/api/cuentas/usuarios/').status_code, 401)
+
+    def test_editar_otro_campo_no_revoca(self):
+        self.admin.patch(f'/api/cuentas/usuarios/{self.usuario.pk}/', {'telefono': '555'}, format='json')
+        self.assertEqual(cliente(bearer=self.acceso).get('/api/cuentas/usuarios/').status_code, 200)
+
+    def test_perfil_borrado_sin_revocar(self):
+        # Borrado por fuera de la API: el token sigue vigente, pero ya no hay perfil ni grupo
+        Usuario.objects.filter(pk=self.usuario.pk).delete()
+        tenant = tenant_desde_claims(signing.loads(self.acceso, salt=SALT_ACCESS))
+        self.assertEqual((tenant.perfil, tenant.grupo), (None, None))
+        respuesta = cliente(bearer=self.acceso).post('/api/cuentas/usuarios/importar/', {}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('grupo', respuesta.data)
+
+
+@PRUEBAS
+class LoginTests(TestCase):
+    url = '/api/cuentas/usuarios/login/'
+
+    def setUp(self):
+        self.roles = crear_roles()
+        self.grupo, _ = crear_clinica('Clinica Uno', self.roles)
+        self.user, self.usuario = crear_usuario('ana@uno.test', self.roles['medico'], self.grupo, password='clave-ana')
+
+    def login(self, correo, password):
+        return cliente().post(self.url, {'correo': correo, 'password': password}, format='json')
+
+    def test_login(self):
+        respuesta = self.login('ana@uno.test', 'clave-ana')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['usuario_id'], self.usuario.pk)
+        self.assertEqual(self.login('ana@uno.test', 'otra').status_code, 400)
+        self.assertEqual(self.login('nadie@uno.test', 'clave-ana').status_code, 404)
+
+    def test_correo_repetido_en_otro_user(self):
+        # Como los que crea la migración 0005 cuando dos perfiles compartían correo
+        User.objects.create_user(username='ana+2', email='ana@uno.test', password='clave-otro')
+        respuesta = self.login('ana@uno.test', 'clave-ana')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Token.objects.get(key=respuesta.data['token']).user, self.user)
+        # La contraseña del otro User no abre el perfil
+        self.assertEqual(self.login('ana@uno.test', 'clave-otro').status_code, 400)
+
+    def test_perfil_sin_credencial(self):
+        Usuario.objects.filter(pk=self.usuario.pk).update(user=None)
+        self.assertEqual(self.login('ana@uno.test', 'clave-ana').status_code, 400)
+
+
+# Pool real de un proceso: más lento que el resto, pero es el camino de producción
+EN_POOL = override_settings(
+    HASHING_PASSWORDS={'MODO': 'procesos', 'WORKERS': 1, 'MAX_PENDIENTES': 1, 'ESPERA_MAXIMA': 0.05},
+)
+
+
+@PRUEBAS
+class PoolHashingTests(TestCase):
+
+    @EN_POOL
+    def test_hash_del_pool_verifica(self):
+        self.addCleanup(pool_hashing.cerrar)
+        pool_hashing.metricas.reiniciar()
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Uno', roles)
+        user, _ = crear_usuario('ana@uno.test', roles['medico'], grupo, password='clave-ana')
+        self.assertTrue(check_password_django('clave-ana', user.password))
+        self.assertTrue(verificar_password(user, 'clave-ana'))
+        self.assertFalse(verificar_password(user, 'otra'))
+        hashes = make_passwords(['uno', None, 'dos'])
+        self.assertEqual([check_password('uno', hashes[0]), check_password('dos', hashes[2])], [True, True])
+        self.assertFalse(is_password_usable(hashes[1]))
+        resumen = pool_hashing.metricas.resumen()
+        self.assertEqual(resumen['check_password']['total'], 4)
+
+    @EN_POOL
+    def test_pool_saturado_responde_503(self):
+        self.addCleanup(pool_hashing.cerrar)
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Uno', roles)
+        with override_settings(HASHING_PASSWORDS={'MODO': 'local'}):
+            crear_usuario('ana@uno.test', roles['medico'], grupo, password='clave-ana')
+        # El único hueco está ocupado: el login no espera más que ESPERA_MAXIMA
+        _, huecos = pool_hashing._pool()
+        huecos.acquire()
+        self.addCleanup(huecos.release)
+        rechazados = pool_hashing.metricas.rechazados
+        respuesta = cliente().post('/api/cuentas/usuarios/login/',
+                                   {'correo': 'ana@uno.test', 'password': 'clave-ana'}, format='json')
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta.data['detail'].code, 'hashing_saturado')
+        self.assertEqual(pool_hashing.metricas.rechazados, rechazados + 1)
+
+
+@PRUEBAS
+class ContadoresGrupoTests(TestCase):
+
+    def setUp(self):
+        self.roles = crear_roles()
+        self.grupo = Grupo.objects.create(nombre='Clinica Uno')
+
+    def contadores(self):
+        return Grupo.objects.values_list('pagos_pendientes', 'total_usuarios').get(pk=self.grupo.pk)
+
+    def pago(self, dias, **extra):
+        return Pago.objects.create(
+            grupo=self.grupo, monto=100, fecha_vencimiento=timezone.now() + timedelta(days=dias), **extra,
+        )
+
+    def test_usuarios_activos(self):
+        _, usuario = crear_usuario('uno@uno.test', self.roles['paciente'], self.grupo)
+        crear_usuario('dos@uno.test', self.roles['paciente'], self.grupo)
+        self.assertEqual(self.contadores(), (0, 2))
+        usuario.estado = False
+        usuario.save()
+        self.assertEqual(self.contadores(), (0, 1))
+        usuario.delete()
+        self.assertEqual(self.contadores(), (0, 1))
+
+    def test_pagos_pendientes_y_morosidad(self):
+        pago = self.pago(-1)
+        self.pago(30, estado='PAGADO')
+        self.grupo.refresh_from_db()
+        self.assertEqual(self.grupo.pagos_pendientes, 1)
+        self.assertEqual(self.grupo.estado, 'MOROSO')
+        pago.estado = 'PAGADO'
+        pago.save()
+        self.grupo.refresh_from_db()
+        self.assertEqual((self.grupo.pagos_pendientes, self.grupo.proximo_vencimiento), (0, None))
+        self.assertEqual(self.grupo.estado, 'ACTIVO')
+
+    def test_save_de_instancia_vieja_no_pisa_contadores(self):
+        viejo = Grupo.objects.get(pk=self.grupo.pk)
+        self.pago(10)
+        viejo.nombre = 'Clinica Renombrada'
+        viejo.save()
+        self.assertEqual(self.contadores(), (1, 0))
+        self.assertEqual(Grupo.objects.get(pk=self.grupo.pk).nombre, 'Clinica Renombrada')
+
+    def test_save_sin_fila_inserta(self):
+        grupo = Grupo(pk=self.grupo.pk + 100, nombre='Clinica Dos')
+        grupo._state.adding = False
+        grupo.save()
+        self.assertTrue(Grupo.objects.filter(pk=grupo.pk, nombre='Clinica Dos').exists())
+
+    def test_decremento_no_baja_de_cero(self):
+        Grupo.mover_usuario_activo(self.grupo.pk, -1)
+        Grupo.mover_pago_pendiente(self.grupo.pk, -1)
+        self.assertEqual(self.contadores(), (0, 0))
+
+    def test_recalcular_contadores(self):
+        crear_usuario('uno@uno.test', self.roles['paciente'], self.grupo)
+        self.pago(10)
+        Grupo.objects.filter(pk=self.grupo.pk).update(pagos_pendientes=7, total_usuarios=7)
+        Grupo.recalcular_contadores()
+        self.assertEqual(self.contadores(), (1, 1))
+
+
+@PRUEBAS
+class BarridoMorosidadTests(TestCase):
+
+    def setUp(self):
+        self.ahora = timezone.now()
+        self.uno = Grupo.objects.create(nombre='Clinica Uno')
+        self.dos = Grupo.objects.create(nombre='Clinica Dos')
+
+    def pago(self, grupo, dias, **extra):
+        return Pago.objects.create(grupo=grupo, monto=100, fecha_vencimiento=self.ahora + timedelta(days=dias), **extra)
+
+    def estados(self, modelo):
+        return dict(modelo.objects.values_list('pk', 'estado'))
+
+    def test_vencimientos_por_lotes(self):
+        vencen = [self.pago(self.uno, dias) for dias in (1, 2, 3, 4, 5)]
+        pagado = self.pago(self.uno, 1, estado='PAGADO')
+        mas_tarde = self.pago(self.dos, 30)
+        contadores = list(Grupo.objects.order_by('pk').values_list('pagos_pendientes', 'proximo_vencimiento'))
+
+        resultado = barrer_morosidad(ahora=self.ahora + timedelta(days=10), lote=2)
+        self.assertEqual((resultado['pagos_vencidos']['filas'], resultado['pagos_vencidos']['sentencias']), (5, 3))
+        estados = self.estados(Pago)
+        self.assertEqual({estados[p.pk] for p in vencen}, {'VENCIDO'})
+        self.assertEqual((estados[pagado.pk], estados[mas_tarde.pk]), ('PAGADO', 'PENDIENTE'))
+        self.assertEqual(self.estados(Grupo), {self.uno.pk: 'MOROSO', self.dos.pk: 'ACTIVO'})
+        # Un pago VENCIDO se sigue debiendo: los contadores no cambian
+        self.assertEqual(list(Grupo.objects.order_by('pk').values_list('pagos_pendientes', 'proximo_vencimiento')),
+                         contadores)
+
+        # Un segundo barrido no encuentra nada que cambiar
+        resultado = barrer_morosidad(ahora=self.ahora + timedelta(days=10), lote=2)
+        self.assertEqual({paso: datos['filas'] for paso, datos in resultado.items()},
+                         {'pagos_vencidos': 0, 'grupos_morosos': 0, 'grupos_al_dia': 0})
+
+    def test_grupos_vuelven_al_dia(self):
+        self.pago(self.uno, 5)
+        self.pago(self.dos, 20)
+        # Los dos marcados morosos: el uno sigue vencido y el dos vuelve al día
+        Grupo.objects.update(estado='MOROSO')
+        resultado = barrer_morosidad(ahora=self.ahora + timedelta(days=10), lote=1)
+        self.assertEqual(self.estados(Grupo), {self.uno.pk: 'MOROSO', self.dos.pk: 'ACTIVO'})
+        self.assertEqual(resultado['grupos_al_dia']['filas'], 1)
+
+        Pago.objects.filter(grupo=self.uno).update(estado='PAGADO')
+        Grupo.objects.filter(pk=self.uno.pk).update(proximo_vencimiento=None)
+        barrer_morosidad(ahora=self.ahora + timedelta(days=10))
+        self.assertEqual(set(self.estados(Grupo).values()), {'ACTIVO'})
+
+
+@PRUEBAS
+class EscritorBitacoraTests(TestCase):
+
+    def escritor(self, **config):
+        escritor = EscritorBitacora()
+        escritor._config = dict(config_bitacora(), MODO='buffer', **config)
+        self.addCleanup(escritor.cerrar)
+        return escritor
+
+    def registros(self, escritor, cantidad):
+        for i in range(cantidad):
+            escritor.registrar({'accion': f'accion {i}', 'tipo': 'OTRO'})
+
+    def test_desborde_escrito_no_cuenta_como_encolado(self):
+        escritor = self.escritor(MAX_COLA=0, DESBORDE='escribir')
+        self.registros(escritor, 3)
+        metricas = escritor.metricas()
+        self.assertEqual((metricas['encolados'], metricas['desbordados'], metricas['escritos']), (0, 3, 3))
+        self.assertEqual(Bitacora.objects.count(), 3)
+
+    def test_desborde_descartado(self):
+        escritor = self.escritor(MAX_COLA=0, DESBORDE='descartar')
+        self.registros(escritor, 2)
+        metricas = escritor.metricas()
+        self.assertEqual((metricas['encolados'], metricas['descartados'], metricas['escritos']), (0, 2, 0))
+        self.assertFalse(Bitacora.objects.exists())
+
+    def test_aregistrar_encola_sin_escribir(self):
+        escritor = self.escritor(INTERVALO=60, TAMANO_LOTE=10)
+        async_to_sync(escritor.aregistrar)({'accion': 'async', 'tipo': 'OTRO'})
+        self.assertEqual((escritor.metricas()['encolados'], escritor.metricas()['en_cola']), (1, 1))
+        self.assertFalse(Bitacora.objects.exists())
+        escritor.vaciar()
+        self.assertEqual(Bitacora.objects.get().accion, 'async')
+
+    def test_alog_action(self):
+        _, usuario = crear_usuario('ana@uno.test', crear_roles()['medico'], Grupo.objects.create(nombre='Uno'))
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        async_to_sync(alog_action)(request, 'Creó paciente', objeto='Paciente: Ana (id:1)', usuario=usuario)
+        registro = Bitacora.objects.get()
+        self.assertEqual((registro.tipo, registro.usuario_id, registro.grupo_id, registro.ip),
+                         ('CREAR', usuario.pk, usuario.grupo_id, '10.0.0.1'))
+
+    def test_error_al_registrar_va_al_log(self):
+        with self.assertLogs('apps.cuentas.utils', 'ERROR'):
+            log_action(object(), 'Creó algo')
+
+
+@PRUEBAS
+class BitacoraViewSetTests(TestCase):
+
+    def test_listado_paginado(self):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Uno', roles)
+        Bitacora.objects.bulk_create([Bitacora(grupo=grupo, accion=f'accion {i}') for i in range(5)])
+        respuesta = cliente(token).get('/api/cuentas/bitacoras/', {'page_size': 2})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([r['accion'] for r in respuesta.data['results']], ['accion 4', 'accion 3'])
+        siguiente = cliente(token).get(respuesta.data['next'])
+        self.assertEqual([r['accion'] for r in siguiente.data['results']], ['accion 2', 'accion 1'])
+
+
+@PRUEBAS
+class ExportacionBitacoraTests(TestCase):
+    url = '/api/cuentas/bitacora/exportar/'
+
+    def setUp(self):
+        roles = crear_roles()
+        self.grupo, self.token = crear_clinica('Clinica Uno', roles)
+        otro, _ = crear_clinica('Clinica Dos', roles)
+        _, self.ana = crear_usuario('ana@uno.test', roles['medico'], self.grupo, nombre='Ana Ñandú')
+        inicio = timezone.now() - timedelta(hours=1)
+        Bitacora.objects.bulk_create([
+            Bitacora(grupo=self.grupo, usuario=self.ana, accion='Creó paciente', tipo='CREAR',
+                     objeto='Paciente: Juan, "el de siempre" (id:4)', entidad='paciente',
+                     extra={'campos': ['nombre'], 'total': 1}, timestamp=inicio + timedelta(minutes=2)),
+            Bitacora(grupo=self.grupo, accion='Inicio de sesión', tipo='LOGIN', ip='10.0.0.1',
+                     timestamp=inicio + timedelta(minutes=1)),
+            Bitacora(grupo=otro, accion='De otra clínica', timestamp=inicio),
+        ])
+
+    def exportar(self, **params):
+        respuesta = cliente(self.token).get(self.url, params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, b''.join(respuesta.streaming_content)
+
+    def test_csv(self):
+        respuesta, cuerpo = self.exportar()
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(cuerpo.startswith('\ufeff'.encode()))
+        filas = list(csv.DictReader(io.StringIO(cuerpo.decode('utf-8-sig'))))
+        self.assertEqual([f['accion'] for f in filas], ['Inicio de sesión', 'Creó paciente'])
+        self.assertEqual((filas[0]['ip'], filas[0]['usuario_id'], filas[0]['extra']), ('10.0.0.1', '', ''))
+        self.assertEqual((filas[1]['usuario'], filas[1]['grupo'], filas[1]['objeto']),
+                         ('Ana Ñandú', 'Clinica Uno', 'Paciente: Juan, "el de siempre" (id:4)'))
+        self.assertEqual(json.loads(filas[1]['extra']), {'campos': ['nombre'], 'total': 1})
+
+    def test_csv_sin_registros_lleva_encabezado(self):
+        _, cuerpo = self.exportar(tipo='ELIMINAR')
+        self.assertEqual(cuerpo.decode('utf-8-sig').splitlines(), [','.join(nombre for nombre, _ in COLUMNAS)])
+
+    def test_ndjson(self):
+        respuesta, cuerpo = self.exportar(formato='ndjson')
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+        filas = [json.loads(linea) for linea in cuerpo.decode().splitlines()]
+        self.assertEqual([list(f) for f in filas], [[nombre for nombre, _ in COLUMNAS]] * 2)
+        self.assertEqual((filas[1]['usuario_id'], filas[1]['tipo'], filas[1]['extra']),
+                         (self.ana.pk, 'CREAR', {'campos': ['nombre'], 'total': 1}))
+        self.assertEqual(filas[0]['grupo_id'], self.grupo.pk)
+
+    def test_gzip(self):
+        _, plano = self.exportar(formato='ndjson')
+        respuesta = cliente(self.token).get(self.url, {'formato': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', respuesta['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(respuesta.streaming_content)), plano)
+
+    def test_formato_no_soportado(self):
+        self.assertEqual(cliente(self.token).get(self.url, {'formato': 'xml'}).status_code, 400)
+
+
+@PRUEBAS
+class FiltrosBitacoraTests(TestCase):
+
+    def setUp(self):
+        self.grupo = Grupo.objects.create(nombre='Uno')
+        _, self.juana = crear_usuario('juana@uno.test', crear_roles()['medico'], self.grupo, nombre='Juana Pérez')
+        registros = [
+            ('Creó paciente', 'Paciente: Juanito (id:4)', 'CREAR', None),
+            ('Editó paciente', 'Paciente: Pedro (id:5)', 'EDITAR', None),
+            ('Creó cita médica', 'Cita: 2031-03-03 (id:7)', 'CREAR', self.juana.pk),
+            ('Aplicó descuento', 'Pago: ab%cd (id:8)', 'OTRO', None),
+            ('Aplicó descuento', 'Pago: ab_cd (id:9)', 'OTRO', None),
+            ('Aplicó descuento', 'Pago: abxcd (id:10)', 'OTRO', None),
+        ]
+        Bitacora.objects.bulk_create([
+            Bitacora(grupo=self.grupo, accion=accion, objeto=objeto, tipo=tipo,
+                     entidad=entidad_de(objeto), usuario_id=usuario_id)
+            for accion, objeto, tipo, usuario_id in registros
+        ])
+
+    def objetos(self, **params):
+        queryset = filtrar_bitacora(Bitacora.objects.all(), params, Usuario.objects.filter(grupo=self.grupo))
+        return sorted(queryset.values_list('objeto', flat=True))
+
+    def test_tipo_y_entidad(self):
+        self.assertEqual(self.objetos(tipo='crear', objeto='Paciente'), ['Paciente: Juanito (id:4)'])
+        self.assertEqual(self.objetos(objeto='cita'), ['Cita: 2031-03-03 (id:7)'])
+        self.assertEqual(self.objetos(tipo='eliminar'), [])
+
+    def test_texto_y_actor(self):
+        # 'juan' es comienzo de palabra en un objeto y parte del nombre de un actor
+        self.assertEqual(self.objetos(q='juan'), ['Cita: 2031-03-03 (id:7)', 'Paciente: Juanito (id:4)'])
+        self.assertEqual(self.objetos(q='paciente pedro'), ['Paciente: Pedro (id:5)'])
+        self.assertEqual(self.objetos(q='%'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 solo existe en SQLite')
+    def test_fts_resuelve_ids(self):
+        condicion = condicion_texto('default', 'paciente')
+        self.assertEqual(condicion.children[0][0], 'pk__in')
+        self.assertIsInstance(condicion.children[0][1], list)
+        self.assertEqual(len(self.objetos(q='paciente')), 2)
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 solo existe en SQLite')
+    def test_fts_frecuente_usa_subconsulta(self):
+        with mock.patch.object(filtros, 'MAX_IDS_FTS', 1):
+            condicion = condicion_texto('default', 'paciente')
+            self.assertIsInstance(condicion.children[0][1], RawSQL)
+            self.assertEqual(len(self.objetos(q='paciente')), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'El ILIKE por trigramas es de PostgreSQL')
+    def test_comodines_del_texto_son_literales(self):
+        self.assertEqual(self.objetos(q='b%c'), ['Pago: ab%cd (id:8)'])
+        self.assertEqual(self.objetos(q='b_c'), ['Pago: ab_cd (id:9)'])
+
+
+@PRUEBAS
+class ActividadTests(TestCase):
+
+    def setUp(self):
+        self.uno = Grupo.objects.create(nombre='Uno')
+        self.dos = Grupo.objects.create(nombre='Dos')
+        self.dia = timezone.localdate() - timedelta(days=10)
+
+    def registros(self, grupo, dia, tipos, usuario_id=None):
+        inicio = inicio_del_dia(dia)
+        return Bitacora.objects.bulk_create([
+            Bitacora(grupo=grupo, usuario_id=usuario_id, accion=tipo, tipo=tipo,
+                     timestamp=inicio + timedelta(hours=2 * i, minutes=5))
+            for i, tipo in enumerate(tipos)
+        ])
+
+    def resumen(self):
+        diario = sorted(ActividadDiaria.objects.values_list('grupo_id', 'actor', 'dia', 'tipo', 'cantidad'))
+        horario = sorted(ActividadHoraria.objects.values_list('grupo_id', 'hora', 'tipo', 'cantidad'))
+        return diario, horario
+
+    def sumar(self, registros):
+        sumar_registros([
+            {'grupo_id': r.grupo_id, 'usuario_id': r.usuario_id, 'tipo': r.tipo, 'timestamp': r.timestamp}
+            for r in registros
+        ])
+
+    def test_incremental_igual_a_reconstruir(self):
+        _, usuario = crear_usuario('ana@uno.test', crear_roles()['medico'], self.uno)
+        lotes = [
+            self.registros(self.uno, self.dia, ['LOGIN', 'CREAR', 'LOGIN'], usuario.pk),
+            self.registros(self.uno, self.dia, ['LOGIN', 'EDITAR']),
+            self.registros(self.dos, self.dia + timedelta(days=1), ['LOGIN', 'LOGIN']),
+            self.registros(self.uno, self.dia + timedelta(days=1), ['ELIMINAR'], usuario.pk),
+        ]
+        # Lotes que comparten (grupo, actor, día, tipo) suman sobre la misma fila
+        for lote in lotes:
+            self.sumar(lote)
+        incremental = self.resumen()
+        self.assertIn((self.uno.pk, usuario.pk, self.dia, 'LOGIN', 2), incremental[0])
+        self.assertIn((self.uno.pk, 0, self.dia, 'LOGIN', 1), incremental[0])
+
+        ActividadDiaria.objects.all().delete()
+        ActividadHoraria.objects.all().delete()
+        reconstruir(self.dia, self.dia + timedelta(days=1), dias_por_tramo=1)
+        self.assertEqual(self.resumen(), incremental)
+
+    def test_reconstruir_solo_toca_el_rango(self):
+        antes, despues = self.dia - timedelta(days=1), self.dia + timedelta(days=1)
+        for dia in (antes, self.dia, despues):
+            self.sumar(self.registros(self.uno, dia, ['LOGIN']))
+            self.sumar(self.registros(self.dos, dia, ['CREAR']))
+        # Sin pasar por el resumen: solo reconstruir los recupera
+        for dia in (antes, self.dia, despues):
+            self.registros(self.uno, dia, ['LOGIN'])
+
+        reconstruir(self.dia, self.dia)
+        diario, horario = self.resumen()
+        login_uno = {dia: n for g, _, dia, tipo, n in diario if g == self.uno.pk and tipo == 'LOGIN'}
+        self.assertEqual(login_uno, {antes: 1, self.dia: 2, despues: 1})
+        crear_dos = {dia: n for g, _, dia, tipo, n in diario if g == self.dos.pk}
+        self.assertEqual(crear_dos, {antes: 1, self.dia: 1, despues: 1})
+        horas_fuera = [n for g, hora, _, n in horario if timezone.localdate(hora) != self.dia]
+        self.assertEqual(horas_fuera, [1] * 4)
+
+
+@PRUEBAS
+@skipUnless(connection.vendor == 'postgresql', 'Las particiones solo existen en PostgreSQL')
+class ParticionesBitacoraTests(TestCase):
+
+    def test_convertir_y_revertir(self):
+        grupo = Grupo.objects.create(nombre='Clinica Uno')
+        ahora = timezone.now()
+        Bitacora.objects.bulk_create([
+            Bitacora(grupo=grupo, accion=f'vieja {i}', timestamp=ahora - timedelta(days=40 * i)) for i in range(3)
+        ])
+        Bitacora.objects.create(grupo=grupo, accion='adelantada', timestamp=ahora + timedelta(days=45))
+
+        self.assertTrue(particiones.convertir(meses=2))
+        self.assertTrue(particiones.es_particionada())
+        nombres = [nombre for nombre, _, _ in particiones.particiones()]
+        self.assertIn(particiones.HISTORICO, nombres)
+        self.assertIn(particiones.PARTICION_DEFECTO, nombres)
+        nueva = Bitacora.objects.create(grupo=grupo, accion='nueva')
+        self.assertEqual(Bitacora.objects.count(), 5)
+        self.assertFalse(particiones.convertir())
+
+        self.assertTrue(particiones.revertir())
+        self.assertFalse(particiones.es_particionada())
+        otra = Bitacora.objects.create(grupo=grupo, accion='otra')
+        self.assertGreater(otra.pk, nueva.pk)
+        self.assertEqual(Bitacora.objects.count(), 6)
+        with connection.cursor() as cursor:
+            indices = {nombre for nombre, _, _ in particiones._indices(cursor, particiones.TABLA)}
+        self.assertIn('bitacora_grupo_ts_id_idx', indices)
+        self.assertIn(f'{particiones.TABLA}_pkey', indices)
+
+
+@PRUEBAS
+class ImportacionUsuariosTests(TestCase):
+
+    def setUp(self):
+        self.roles = crear_roles()
+        self.grupo, token = crear_clinica('Clinica Uno', self.roles)
+        self.admin = cliente(token)
+
+    def importar(self, contenido, nombre='usuarios.csv', cliente_=None, **params):
+        archivo = SimpleUploadedFile(nombre, contenido.encode())
+        url = '/api/cuentas/usuarios/importar/'
+        if params:
+            url += '?' + '&'.join(f'{k}={v}' for k, v in params.items())
+        return (cliente_ or self.admin).post(url, {'archivo': archivo}, format='multipart')
+
+    def test_csv_crea_validas_e_informa_errores(self):
+        crear_usuario('repetido@uno.test', self.roles['paciente'], self.grupo)
+        respuesta = self.importar(
+            'nombre,correo,sexo,fecha_nacimiento,rol,password\n'
+            'Ana,ana@uno.test,F,1990-01-01,medico,clave-123\n'
+            'Beto,beto@uno.test,M,1985-05-05,,\n'
+            'Sin Fecha,sinfecha@uno.test,M,,paciente,\n'
+            'Otra Ana,ana@uno.test,F,1990-01-01,paciente,\n'
+            'Repetido,repetido@uno.test,M,1990-01-01,paciente,\n'
+            'Rol,rol@uno.test,M,1990-01-01,superAdmin,\n'
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual((respuesta.data['filas'], respuesta.data['creados']), (6, 2))
+        self.assertEqual(
+            {(e['fila'], tuple(e['errores'])) for e in respuesta.data['errores']},
+            {(4, ('fecha_nacimiento',)), (5, ('correo',)), (6, ('correo',)), (7, ('rol',))},
+        )
+        ana = Usuario.objects.select_related('rol', 'user').get(correo='ana@uno.test')
+        self.assertEqual((ana.rol.nombre, ana.grupo_id), ('medico', self.grupo.pk))
+        self.assertTrue(ana.user.check_password('clave-123'))
+        self.assertEqual(Usuario.objects.get(correo='beto@uno.test').rol.nombre, 'paciente')
+        # Administrador, repetido y los dos importados
+        self.assertEqual(Grupo.objects.get(pk=self.grupo.pk).total_usuarios, 4)
+
+    def test_correo_de_otra_credencial(self):
+        # Un User sin perfil cuyo email coincide (el username es otro)
+        User.objects.create_user(username='ana+7', email='ana@uno.test')
+        respuesta = self.importar('nombre,correo,sexo,fecha_nacimiento\nAna,ana@uno.test,F,1990-01-01\n')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['creados'], 0)
+        self.assertEqual([tuple(e['errores']) for e in respuesta.data['errores']], [('correo',)])
+        self.assertEqual(User.objects.filter(email='ana@uno.test').count(), 1)
+
+    def test_ndjson_con_invitacion(self):
+        filas = [
+            {'nombre': 'Ana', 'correo': 'ana@uno.test', 'sexo': 'F', 'fecha_nacimiento': '1990-01-01'},
+            {'nombre': 'Beto', 'correo': 'beto@uno.test', 'sexo': 'M', 'fecha_nacimiento': '1985-05-05',
+             'password': 'clave-123'},
+        ]
+        contenido = '\n'.join(json.dumps(f) for f in filas) + '\nno es json\n'
+        respuesta = self.importar(contenido, nombre='usuarios.ndjson', invitar=1)
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual((respuesta.data['creados'], respuesta.data['invitados']), (2, 1))
+        self.assertEqual([e['fila'] for e in respuesta.data['errores']], [3])
+        ana = Usuario.objects.select_related('user').get(correo='ana@uno.test')
+        self.assertFalse(ana.user.has_usable_password())
+        correo = CorreoSaliente.objects.get(destinatarios=['ana@uno.test'])
+        self.assertIn(ana.token_reset_password, correo.cuerpo)
+
+    def test_por_lotes(self):
+        filas = [
+            (i + 2, {'nombre': f'U{i}', 'correo': f'u{i}@uno.test', 'sexo': 'M', 'fecha_nacimiento': '1990-01-01'})
+            for i in range(5)
+        ]
+        filas.append((7, dict(filas[0][1])))
+        with self.captureOnCommitCallbacks(execute=True):
+            informe = importar_usuarios(iter(filas), self.grupo, tamano_lote=2)
+        self.assertEqual((informe['creados'], [e['fila'] for e in informe['errores']]), (5, [7]))
+        self.assertEqual(Usuario.objects.filter(correo__startswith='u').count(), 5)
+        # Un registro de bitácora por lote, también fuera de un request
+        self.assertEqual(Bitacora.objects.filter(accion__contains='por importación').count(), 3)
+
+    def test_solo_administradores(self):
+        user, _ = crear_usuario('paciente@uno.test', self.roles['paciente'], self.grupo)
+        paciente = cliente(Token.objects.create(user=user).key)
+        respuesta = self.importar('nombre,correo\n', cliente_=paciente)
+        self.assertEqual(respuesta.status_code, 403)
+
+    def test_sin_archivo(self):
+        respuesta = self.admin.post('/api/cuentas/usuarios/importar/', {}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+@PRUEBAS
+class ProyeccionesTests(TestCase):
+
+    def test_mismo_json_que_el_serializer(self):
+        roles = crear_roles()
+        grupo, _ = crear_clinica('Clinica Uno', roles)
+        especialidades = [Especialidad.objects.create(nombre=f'Especialidad {i}') for i in range(4)]
+        poblar(grupo, roles, especialidades, 3, prefijo='pr')
+        # Sin rol (relación nula: la clave se omite) y sin patologías (lista vacía)
+        sin_rol = Usuario.objects.create(grupo=grupo, nombre='Sin rol', correo='sinrol@pr.test',
+                                         sexo='F', fecha_nacimiento='1991-02-03')
+        Paciente.objects.create(usuario=sin_rol, numero_historia_clinica='HC-sin-rol')
+        Medico.objects.filter(grupo=grupo).first().especialidades.clear()
+        bloque = Bloque_Horario.objects.create(grupo=grupo, medico=Medico.objects.filter(grupo=grupo).first(),
+                                               dia_semana='LUNES', hora_inicio='08:00', hora_fin='12:00')
+        pacientes = list(Paciente.objects.filter(usuario__grupo=grupo))
+        for i, paciente in enumerate(pacientes):
+            Cita_Medica.objects.create(
+                grupo=grupo, paciente=paciente, bloque_horario=bloque, fecha='2031-03-03',
+                hora_inicio=f'{8 + i:02d}:00', hora_fin=f'{8 + i:02d}:30',
+                recordatorio_24h=timezone.now() if i % 2 else None,
+            )
+
+        listados = [
+            (UsuarioSerializer, Usuario.objects.filter(grupo=grupo)),
+            (MedicoSerializer, Medico.objects.filter(grupo=grupo)),
+            (PacienteSerializer, Paciente.objects.filter(usuario__grupo=grupo)),
+            (PatologiasOSerializer, PatologiasO.objects.filter(grupo=grupo)),
+            (CitaMedicaSerializer, Cita_Medica.objects.filter(grupo=grupo)),
+        ]
+        for serializer_class, queryset in listados:
+            with self.subTest(serializer_class.__name__):
+                select, prefetch = relaciones_de(serializer_class)
+                queryset = queryset.order_by('pk')
+                esperado = serializer_class(queryset.select_related(*select).prefetch_related(*prefetch), many=True).data
+                self.assertEqual(proyeccion_de(serializer_class).filas(queryset), [dict(fila) for fila in esperado])
+                pks = list(queryset.values_list('pk', flat=True))[::-1]
+                self.assertEqual(proyeccion_de(serializer_class).filas_de(queryset, pks),
+                                 [dict(fila) for fila in reversed(esperado)])
+
+
+@PRUEBAS
+class PresupuestoConsultasTests(TestCase):
+
+    def setUp(self):
+        self.roles = crear_roles()
+        self.grupo, token = crear_clinica('Clinica Uno', self.roles)
+        self.admin = cliente(token)
+        for i in range(15):
+            crear_usuario(f'u{i}@uno.test', self.roles['paciente'], self.grupo)
+            Pago.objects.create(grupo=self.grupo, monto=10, fecha_vencimiento=timezone.now() + timedelta(days=i))
+
+    def test_no_se_verifica_por_defecto(self):
+        self.assertFalse(config_consultas()['VERIFICAR'])
+
+    @override_settings(CONSULTAS={'VERIFICAR': True})
+    def test_listados_dentro_del_presupuesto(self):
+        for url in ('/api/cuentas/usuarios/', '/api/cuentas/grupos/', '/api/cuentas/pagos/', '/api/cuentas/roles/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.admin.get(url).status_code, 200)
+
+
+class BackendContado(locmem.EmailBackend):
+    """locmem que cuenta las conexiones abiertas"""
+    conexiones = 0
+
+    def open(self):
+        BackendContado.conexiones += 1
+        return super().open()
+
+
+class BackendQueFalla(BaseEmailBackend):
+    """Rechaza todos los envíos con `error`"""
+    error = smtplib.SMTPException('Servicio no disponible')
+
+    def send_messages(self, mensajes):
+        raise BackendQueFalla.error
+
+
+@PRUEBAS
+@override_settings(CORREO={'ESPERA_BASE': 60, 'MAX_INTENTOS': 2})
+class DespacharCorreosTests(TestCase):
+
+    def setUp(self):
+        for i in range(3):
+            encolar_correo(f'Asunto {i}', 'Cuerpo', [f'u{i}@uno.test'])
+
+    def estados(self):
+        return list(CorreoSaliente.objects.order_by('pk').values_list('estado', 'intentos'))
+
+    def vencer_esperas(self):
+        CorreoSaliente.objects.update(proximo_intento=timezone.now())
+
+    @override_settings(EMAIL_BACKEND='apps.cuentas.tests.BackendContado')
+    def test_un_lote_por_una_conexion(self):
+        BackendContado.conexiones = 0
+        self.assertEqual(despachar(), {'enviados': 3, 'reintentos': 0, 'fallidos': 0})
+        self.assertEqual(BackendContado.conexiones, 1)
+        self.assertEqual([m.to for m in mail.outbox], [['u0@uno.test'], ['u1@uno.test'], ['u2@uno.test']])
+        self.assertEqual(self.estados(), [('ENVIADO', 0)] * 3)
+        self.assertEqual(despachar(), {'enviados': 0, 'reintentos': 0, 'fallidos': 0})
+
+    @override_settings(EMAIL_BACKEND='apps.cuentas.tests.BackendQueFalla')
+    def test_reintento_con_espera_y_limite(self):
+        antes = timezone.now()
+        self.assertEqual(despachar(), {'enviados': 0, 'reintentos': 3, 'fallidos': 0})
+        correo = CorreoSaliente.objects.first()
+        self.assertEqual((correo.estado, correo.intentos), ('PENDIENTE', 1))
+        self.assertIn('Servicio no disponible', correo.ultimo_error)
+        # ESPERA_BASE con ±20 % de jitter
+        self.assertGreaterEqual(correo.proximo_intento, antes + timedelta(seconds=48))
+        self.assertLessEqual(correo.proximo_intento, timezone.now() + timedelta(seconds=72))
+        # Antes de que venza la espera no se reintenta
+        self.assertEqual(despachar(), {'enviados': 0, 'reintentos': 0, 'fallidos': 0})
+        self.vencer_esperas()
+        with self.assertLogs('apps.cuentas.correo', 'WARNING'):
+            self.assertEqual(despachar(), {'enviados': 0, 'reintentos': 0, 'fallidos': 3})
+        self.assertEqual(self.estados(), [('FALLIDO', 2)] * 3)
+
+    @override_settings(EMAIL_BACKEND='apps.cuentas.tests.BackendQueFalla')
+    def test_error_permanente_no_se_reintenta(self):
+        BackendQueFalla.error = smtplib.SMTPResponseException(550, b'Buzon inexistente')
+        self.addCleanup(setattr, BackendQueFalla, 'error', smtplib.SMTPException('Servicio no disponible'))
+        with self.assertLogs('apps.cuentas.correo', 'WARNING'):
+            self.assertEqual(despachar(), {'enviados': 0, 'reintentos': 0, 'fallidos': 3})
+        self.assertEqual(self.estados(), [('FALLIDO', 1)] * 3)
@@ -11,5 +11,8 @@ router.register(r'pagos', views.PagoViewSet, basename='pago')
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('bitacora/', views.BitacoraListAPIView.as_view(), name='bitacora-list')
+    path('bitacora/', views.BitacoraListAPIView.as_view(), name='bitacora-list'),
+    path('bitacora/exportar/', views.BitacoraExportAPIView.as_view(), name='bitacora-exportar'),
+    path('bitacora/actividad/', views.BitacoraActividadAPIView.as_view(), name='bitacora-actividad'),
+    path('bitacora/actividad/horas/', views.BitacoraActividadHorariaAPIView.as_view(), name='bitacora-actividad-horas'),
 ]
\ No newline at end of file
@@ -1,43 +1,66 @@
+import logging
+
+from asgiref.sync import sync_to_async
+
+from .tenant import get_tenant
+
+logger = logging.getLogger(__name__)
+
+
 def get_actor_usuario_from_request(request):
     """
     Intenta obtener el usuario actor desde el request.
     Retorna None si no se puede obtener.
     """
     try:
-        # Si tienes autenticación por token
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            # Buscar el Usuario correspondiente por email
-            from .models import Usuario
-            return Usuario.objects.filter(correo=request.user.email).first()
-        return None
+        # El perfil ya viene resuelto (con rol y grupo) en el contexto del request
+        return get_tenant(request).usuario
     except:
         return None
 
-def log_action(request, accion, objeto=None, usuario=None):
+def log_action(request, accion, objeto=None, usuario=None, grupo=None, tipo=None):
     """
     Registra una acción en la bitácora.
+    El registro se encola y lo guarda por lotes un hilo de fondo (ver auditoria.py);
+    el grupo sale del actor o, si no hay actor, del contexto del request.
+    `tipo` (ver Bitacora.TIPOS) se deduce del texto de la acción si no se indica.
     """
     try:
-        from .models import Bitacora
-        
-        # Obtener IP del request
-        ip = get_client_ip(request)
+        from .auditoria import armar_registro, encolar_al_confirmar
         
-        # Crear registro de bitácora
-        Bitacora.objects.create(
-            usuario=usuario,
-            accion=accion,
-            ip=ip,
-            objeto=objeto
+        registro = armar_registro(
+            get_tenant(request), accion, objeto=objeto, usuario=usuario,
+            ip=get_client_ip(request), grupo=grupo, tipo=tipo,
         )
-    except Exception as e:
+        encolar_al_confirmar(registro)
+    except Exception:
         # En caso de error, no fallar la operación principal
-        print(f"Error al registrar en bitácora: {e}")
+        logger.exception('Error al registrar en bitácora: %s', accion)
+
+async def alog_action(request, accion, objeto=None, usuario=None, grupo=None, tipo=None):
+    """
+    Variante de log_action para vistas async (ASGI): no bloquea el event loop.
+    Se encola enseguida: fuera de una transacción no hay commit que esperar.
+    """
+    try:
+        from .auditoria import armar_registro, escritor_bitacora
+        
+        # El contexto solo consulta la base si nadie lo resolvió antes en este request
+        tenant = await sync_to_async(get_tenant)(request)
+        registro = armar_registro(
+            tenant, accion, objeto=objeto, usuario=usuario,
+            ip=get_client_ip(request), grupo=grupo, tipo=tipo,
+        )
+        await escritor_bitacora.aregistrar(registro)
+    except Exception:
+        logger.exception('Error al registrar en bitácora: %s', accion)
 
 def get_client_ip(request):
     """
-    Obtiene la IP del cliente desde el request.
+    Obtiene la IP del cliente desde el request (None fuera de un request, p. ej. en comandos).
     """
+    if request is None:
+        return None
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
         ip = x_forwarded_for.split(',')[0]
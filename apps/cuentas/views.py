@@ -1,9 +1,22 @@
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework import permissions
+from . import importacion
+from .actividad import acciones_por_dia, acciones_por_hora, rango_dias
+from .consultas import RelacionesMixin
+from .proyecciones import ProyeccionMixin
+from .correo import encolar_correo
+from .authentication import cerrar_sesiones, emitir_tokens, leer_refresh, revocaciones
+from .exportacion import FORMATOS, contenido, registros
+from .filtros import alcanza_archivo, buscar_archivados, filtrar_bitacora
+from .hashing import verificar_password
+from .pagination import BitacoraPagination
+from .tenant import MultiTenantMixin
 from .utils import get_actor_usuario_from_request, log_action
 from .models import *
 from .serializers import *
@@ -11,46 +24,11 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import permission_classes
-from django.utils.dateparse import parse_date
 import secrets
-from django.core.mail import send_mail
+from django.core import signing
 from django.utils import timezone
 
-class MultiTenantMixin:
-    """Mixin para filtrar datos por grupo del usuario actual"""
-    
-    def get_user_grupo(self):
-        """Obtiene el grupo del usuario actual"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
-    
-    def is_super_admin(self):
-        """Verifica si el usuario actual es super admin"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.rol and usuario.rol.nombre == 'superAdmin'  # Cambiar aquí también
-            except Usuario.DoesNotExist:
-                pass
-        return False
-    
-    def filter_by_grupo(self, queryset):
-        """Filtra el queryset por el grupo del usuario actual"""
-        if self.is_super_admin():
-            return queryset  # Super admin ve todo
-        
-        grupo = self.get_user_grupo()
-        if grupo and hasattr(queryset.model, 'grupo'):
-            return queryset.filter(grupo=grupo)
-        
-        return queryset
-
-class GrupoViewSet(viewsets.ModelViewSet):
+class GrupoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     serializer_class = GrupoSerializer
 
     def get_permissions(self):
@@ -70,29 +48,11 @@ class GrupoViewSet(viewsets.ModelViewSet):
             return Grupo.objects.all()
         else:
             # Usuarios normales solo ven su propio grupo
-            grupo = self.get_user_grupo()
-            if grupo:
-                return Grupo.objects.filter(id=grupo.id)
+            grupo_id = self.get_tenant().grupo_id
+            if grupo_id:
+                return Grupo.objects.filter(id=grupo_id)
             return Grupo.objects.none()
     
-    def is_super_admin(self):
-        if not self.request.user.is_authenticated:
-            return False
-        try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
-            return usuario.rol and usuario.rol.nombre == 'superAdmin'
-        except Usuario.DoesNotExist:
-            return False
-    
-    def get_user_grupo(self):
-        if not self.request.user.is_authenticated:
-            return None
-        try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
-            return usuario.grupo
-        except Usuario.DoesNotExist:
-            return None
-    
     def perform_create(self, serializer):
         """Crear grupo y administrador automáticamente"""
         grupo = serializer.save()
@@ -102,7 +62,8 @@ class GrupoViewSet(viewsets.ModelViewSet):
             request=self.request,
             accion=f"Se registró la nueva clínica {grupo.nombre}",
             objeto=f"Grupo: {grupo.nombre} (id:{grupo.id})",
-            usuario=None  # Registro público, sin usuario
+            usuario=None,  # Registro público, sin usuario
+            grupo=grupo
         )
     
     @action(detail=True, methods=['post'])
@@ -119,6 +80,10 @@ class GrupoViewSet(viewsets.ModelViewSet):
         grupo.fecha_suspension = timezone.now()
         grupo.save()
         
+        # Invalidar las sesiones abiertas de la clínica
+        revocaciones.revocar_grupo(grupo.id)
+        Token.objects.filter(user__email__in=grupo.usuarios.values('correo')).delete()
+        
         return Response({'message': 'Grupo suspendido correctamente'})
     
     @action(detail=True, methods=['post'])
@@ -137,7 +102,7 @@ class GrupoViewSet(viewsets.ModelViewSet):
         
         return Response({'message': 'Grupo activado correctamente'})
 
-class PagoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
+class PagoViewSet(RelacionesMixin, MultiTenantMixin, viewsets.ModelViewSet):
     serializer_class = PagoSerializer
     permission_classes = [IsAuthenticated]
     
@@ -171,14 +136,14 @@ class RolViewSet(viewsets.ModelViewSet):
     serializer_class = RolSerializer
     permission_classes = [IsAuthenticated]
 
-class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
+class UsuarioViewSet(RelacionesMixin, ProyeccionMixin, MultiTenantMixin, viewsets.ModelViewSet):
     serializer_class = UsuarioSerializer
     def get_permissions(self):
         """
         Permite crear usuarios y login sin autenticación
         Requiere autenticación para otras operaciones
         """
-        if self.action in ['create', 'login','solicitar_reset_token', 'nueva_password']:
+        if self.action in ['create', 'login', 'refresh', 'solicitar_reset_token', 'nueva_password']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAuthenticated]
@@ -205,7 +170,6 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             )
 
         usuario.set_password(nuevo_password)
-        usuario.save()
         return Response({'message': 'Contraseña actualizada correctamente'}, status=status.HTTP_200_OK)
 
     def perform_create(self, serializer):
@@ -218,10 +182,53 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             usuario=actor
         )
 
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """
+        Alta masiva desde un archivo CSV o JSON lines (campo `archivo`): nombre, correo,
+        sexo, fecha_nacimiento, telefono, direccion, rol y password (opcional). Con
+        ?invitar=1 los que no traen contraseña reciben un correo para elegirla.
+        El super admin indica la clínica con ?grupo=<id>.
+        """
+        tenant = self.get_tenant()
+        if tenant.rol not in ('administrador', 'superAdmin'):
+            return Response(
+                {'error': 'No tienes permisos para esta acción'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if tenant.is_super_admin:
+            grupo = Grupo.objects.filter(pk=request.query_params.get('grupo') or None).first()
+        else:
+            grupo = tenant.grupo
+        if grupo is None:
+            return Response({'grupo': 'Indica la clínica con ?grupo=<id>'}, status=status.HTTP_400_BAD_REQUEST)
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'archivo': 'El archivo es requerido'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            formato = importacion.formato_de(archivo.name, request.query_params.get('formato'))
+            informe = importacion.importar_usuarios(
+                importacion.leer_filas(archivo.file, formato), grupo,
+                request=request, actor=get_actor_usuario_from_request(request),
+                invitar=request.query_params.get('invitar') in ('1', 'true'),
+            )
+        except importacion.ArchivoInvalido as e:
+            return Response({'archivo': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(informe, status=status.HTTP_201_CREATED if informe['creados'] else status.HTTP_400_BAD_REQUEST)
+
+    def perform_update(self, serializer):
+        activo = serializer.instance.estado
+        usuario = serializer.save()
+        if activo and not usuario.estado:
+            # Desactivado: sus tokens dejan de valer ya, no cuando expiren
+            cerrar_sesiones(usuario)
+
     def perform_destroy(self, instance):
         nombre = instance.nombre
         pk = instance.pk
         actor = get_actor_usuario_from_request(self.request)
+        cerrar_sesiones(instance)
         instance.delete()
         log_action(
             request=self.request,
@@ -242,26 +249,25 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # El perfil manda: su User es la única credencial (puede haber varios User con el mismo email)
         try:
-            user = User.objects.get(email=correo)
-        except User.DoesNotExist:
+            usuario_perfil = Usuario.objects.select_related('rol', 'grupo', 'user').get(correo=correo)
+        except Usuario.DoesNotExist:
             return Response(
                 {"error": "Usuario no encontrado"},
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        if not user.check_password(password):
+        except Usuario.MultipleObjectsReturned:
             return Response(
-                {"error": "Contraseña incorrecta"},
-                status=status.HTTP_400_BAD_REQUEST
+                {"error": "Hay más de una cuenta con ese correo. Contacta al administrador."},
+                status=status.HTTP_409_CONFLICT
             )
         
-        try:
-            usuario_perfil = Usuario.objects.get(correo=correo)
-        except Usuario.DoesNotExist:
+        user = usuario_perfil.user
+        if user is None or not verificar_password(user, password):
             return Response(
-                {"error": "Perfil de usuario no encontrado"},
-                status=status.HTTP_404_NOT_FOUND
+                {"error": "Contraseña incorrecta"},
+                status=status.HTTP_400_BAD_REQUEST
             )
         
         if usuario_perfil.rol and usuario_perfil.rol.nombre == 'superAdmin':
@@ -273,13 +279,14 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             )
         
         token, created = Token.objects.get_or_create(user=user)
+        tokens_firmados = emitir_tokens(user, usuario_perfil)
         
-        actor = get_actor_usuario_from_request(request)
+        # El request del login es anónimo: el actor es quien inicia sesión
         log_action(
             request=request,
             accion=f"Inicio de sesión del usuario {usuario_perfil.nombre} (id:{usuario_perfil.id})",
             objeto=f"Usuario: {usuario_perfil.nombre} (id:{usuario_perfil.id})",
-            usuario=actor
+            usuario=usuario_perfil
         )
         
         return Response(
@@ -287,6 +294,9 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
                 "message": "Login exitoso",
                 "usuario_id": usuario_perfil.id,
                 "token": token.key,
+                "access": tokens_firmados['access'],
+                "refresh": tokens_firmados['refresh'],
+                "expira_en": tokens_firmados['expira_en'],
                 "rol": usuario_perfil.rol.nombre,  # Envía el valor interno, no el display
                 "grupo_id": usuario_perfil.grupo.id if usuario_perfil.grupo else None,
                 "grupo_nombre": usuario_perfil.grupo.nombre if usuario_perfil.grupo else None,
@@ -300,6 +310,9 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     def logout(self, request):
         try:
             Token.objects.filter(user=request.user).delete()
+            # Si la sesión usa token firmado, se revoca junto con su refresh
+            if isinstance(request.auth, dict) and 'sid' in request.auth:
+                revocaciones.revocar_sesion(request.auth['sid'])
 
             actor = get_actor_usuario_from_request(request)
             log_action(
@@ -318,6 +331,46 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             )
 
 
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        """Emite un nuevo token de acceso a partir de un refresh token vigente"""
+        refresh = request.data.get('refresh')
+        if not refresh:
+            return Response(
+                {"error": "El refresh token es requerido"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            claims = leer_refresh(refresh)
+        except signing.BadSignature:
+            return Response(
+                {"error": "Refresh token inválido, expirado o revocado"},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        # Se revalida contra la base: el usuario debe seguir activo y con acceso
+        usuario_perfil = (
+            Usuario.objects.select_related('rol', 'grupo')
+            .filter(pk=claims['pid'], estado=True)
+            .first()
+        )
+        user = User.objects.filter(pk=claims['uid'], is_active=True).first()
+        if user is None or usuario_perfil is None or not usuario_perfil.puede_acceder_sistema():
+            return Response(
+                {"error": "Tu grupo no tiene acceso al sistema. Contacta al administrador."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        tokens_firmados = emitir_tokens(user, usuario_perfil, sid=claims['sid'])
+        return Response(
+            {
+                "access": tokens_firmados['access'],
+                "expira_en": tokens_firmados['expira_en'],
+            },
+            status=status.HTTP_200_OK
+        )
+
     @action(detail=False, methods=['post'])
     @permission_classes([AllowAny])
     def solicitar_reset_token(self, request):
@@ -332,19 +385,20 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             usuario = Usuario.objects.get(correo=correo)
             token_recuperacion = secrets.token_urlsafe(16)
             usuario.token_reset_password = token_recuperacion
-            usuario.save()
-
-            send_mail(
-                subject="Solicitud de restablecimiento de contraseña",
-                message=(
-                    f"Hola {usuario.nombre},\n\n"
-                    f"Usa este token para restablecer tu contraseña:\n\n"
-                    f"{token_recuperacion}\n\n"
-                ),
-                from_email="noreply@clinicavisionx.com",
-                recipient_list=[usuario.correo],
-                fail_silently=False,
-            )
+
+            # El correo queda en la bandeja de salida; lo envía `despachar_correos`
+            with transaction.atomic():
+                usuario.save(update_fields=['token_reset_password'])
+                encolar_correo(
+                    asunto="Solicitud de restablecimiento de contraseña",
+                    cuerpo=(
+                        f"Hola {usuario.nombre},\n\n"
+                        f"Usa este token para restablecer tu contraseña:\n\n"
+                        f"{token_recuperacion}\n\n"
+                    ),
+                    destinatarios=[usuario.correo],
+                    grupo_id=usuario.grupo_id,
+                )
 
             return Response(
                 {"message": "Token enviado al correo correctamente"},
@@ -375,7 +429,7 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             )
             usuario.set_password(nueva_password)
             usuario.token_reset_password = ""
-            usuario.save()
+            usuario.save(update_fields=['token_reset_password'])
 
             return Response(
                 {"message": "Contraseña actualizada correctamente"},
@@ -392,36 +446,102 @@ class UsuarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
 class BitacoraListAPIView(MultiTenantMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BitacoraSerializer
-    pagination_class = None
+    # Cursor sobre (timestamp, id): la página N cuesta lo mismo que la primera
+    pagination_class = BitacoraPagination
 
     def get_queryset(self):
-        qs = Bitacora.objects.all()
+        qs = Bitacora.objects.select_related('usuario', 'grupo')
         qs = self.filter_by_grupo(qs)
-        
-        # Filtros adicionales
-        start = self.request.query_params.get('start')
-        end = self.request.query_params.get('end')
-        usuario = self.request.query_params.get('usuario')
-        
-        if start:
-            sd = parse_date(start)
-            if sd:
-                qs = qs.filter(timestamp__date__gte=sd)
-        if end:
-            ed = parse_date(end)
-            if ed:
-                qs = qs.filter(timestamp__date__lte=ed)
-        if usuario:
-            if usuario.isdigit():
-                qs = qs.filter(usuario__id=int(usuario))
-            else:
-                qs = qs.filter(usuario__nombre__icontains=usuario)
-        return qs
+        # Filtros por rango de timestamp, tipo, objeto, actor y texto (ver filtros.py)
+        return filtrar_bitacora(qs, self.request.query_params, usuarios=self.get_usuarios())
+
+    def get_usuarios(self):
+        """Usuarios entre los que se buscan los actores por nombre"""
+        return self.filter_by_grupo(Usuario.objects.all())
+
+    def filas_externas(self, valores, reverso, limite):
+        """Registros archivados, cuando el rango de fechas pedido llega hasta el archivo"""
+        params = self.request.query_params
+        if not alcanza_archivo(params):
+            return []
+        tenant = self.get_tenant()
+        if not tenant.is_super_admin and not tenant.grupo_id:
+            return []
+        grupo_id = None if tenant.is_super_admin else tenant.grupo_id
+        return buscar_archivados(params, grupo_id, self.get_usuarios(), valores, reverso, limite)
+
+class BitacoraExportAPIView(MultiTenantMixin, generics.GenericAPIView):
+    """
+    Exportación completa de la bitácora del grupo en streaming.
+    ?formato=csv (por defecto) o ndjson; acepta los filtros del listado (start, end,
+    usuario, tipo, objeto, q) y, si start/end llegan a meses archivados, los incluye.
+    Con Accept-Encoding: gzip la respuesta se comprime al vuelo.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return Response(
+                {'formato': f"Formato no soportado. Opciones: {', '.join(FORMATOS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        tenant = self.get_tenant()
+        grupo_id = None if tenant.is_super_admin else tenant.grupo_id
+        filas = registros(
+            self.filter_by_grupo(Bitacora.objects.all()), request.query_params,
+            grupo_id=grupo_id, usuarios=self.filter_by_grupo(Usuario.objects.all()),
+            archivados=tenant.is_super_admin or bool(grupo_id),
+        )
+        comprimir = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = StreamingHttpResponse(contenido(filas, formato, comprimir), content_type=FORMATOS[formato])
+        response['Content-Disposition'] = (
+            f'attachment; filename="bitacora-{grupo_id or "todas"}-{timezone.now():%Y%m%d}.{formato}"'
+        )
+        response['Vary'] = 'Accept-Encoding'
+        if comprimir:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+class BitacoraActividadAPIView(MultiTenantMixin, generics.GenericAPIView):
+    """
+    Acciones por día y por usuario, con el desglose por tipo, leídas del resumen
+    ActividadDiaria (no recorre la bitácora). ?start=&end= (YYYY-MM-DD, por defecto
+    los últimos 30 días) y ?tipo= opcional.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            desde, hasta = rango_dias(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        tipo = request.query_params.get('tipo')
+        dias = acciones_por_dia(self.filter_by_grupo(ActividadDiaria.objects.all()), desde, hasta, tipo)
+        return Response({'desde': desde, 'hasta': hasta, 'tipo': tipo, 'dias': dias})
+
+class BitacoraActividadHorariaAPIView(MultiTenantMixin, generics.GenericAPIView):
+    """
+    Acciones de un tipo por hora (?tipo=, por defecto LOGIN) en los días
+    ?start=&end=, leídas del resumen ActividadHoraria.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            desde, hasta = rango_dias(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        tipo = request.query_params.get('tipo', 'LOGIN')
+        horas = acciones_por_hora(self.filter_by_grupo(ActividadHoraria.objects.all()), desde, hasta, tipo)
+        return Response({'desde': desde, 'hasta': hasta, 'tipo': tipo, 'horas': horas})
 
 class BitacoraViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     serializer_class = BitacoraSerializer
     permission_classes = [IsAuthenticated]
+    # Misma paginación por cursor que /bitacora/: el listado nunca trae la tabla entera
+    pagination_class = BitacoraPagination
     
     def get_queryset(self):
-        qs = Bitacora.objects.all()
+        qs = Bitacora.objects.select_related('usuario', 'grupo')
         return self.filter_by_grupo(qs)
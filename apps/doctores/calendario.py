@@ -0,0 +1,132 @@
+"""
+Calendario de los médicos: los bloques de cada día de una semana o un mes con las
+citas activas que caen en cada uno.
+
+El frontend armaba el calendario bajando completos /api/doctores/bloque-horario/ y
+/api/citas/citas-medicas/ y cruzándolos. Acá son dos consultas acotadas al rango
+(citas con su paciente por select_related, y bloques) y el cruce en memoria.
+
+La respuesta lleva un ETag fuerte calculado antes de leer las filas, con dos
+agregados: el máximo fecha_modificacion y la cantidad de bloques y de citas (de
+cualquier estado) del rango. Editar, cancelar, crear o borrar una cita o un bloque
+cambia alguno de los dos; con If-None-Match igual la vista responde 304 sin leer
+el calendario. Los médicos y pacientes que se muestran entran por su ultimo_login
+(Usuario no tiene fecha_modificacion, pero ese campo es auto_now: cambia con cada
+save, p. ej. al renombrarlos) y, los médicos, por cuántos están activos.
+"""
+import calendar
+import datetime
+import hashlib
+from collections import defaultdict
+
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.citas_pagos.models import Cita_Medica
+
+from .disponibilidad import DIAS_SEMANA, fechas, formato_hora, minutos, rango_fechas
+
+VISTAS = ('semana', 'mes')
+
+
+def rango_calendario(params):
+    """
+    [desde, hasta] de ?vista=semana|mes (por defecto semana) que contiene ?fecha=
+    (por defecto hoy), o ?start=&end= explícitos. ValueError si no son válidos.
+    """
+    if params.get('start') or params.get('end'):
+        return rango_fechas(params)
+    vista = params.get('vista', 'semana')
+    if vista not in VISTAS:
+        raise ValueError(f"vista debe ser {' o '.join(VISTAS)}")
+    try:
+        fecha = parse_date(params['fecha']) if params.get('fecha') else timezone.localdate()
+    except ValueError:
+        fecha = None
+    if fecha is None:
+        raise ValueError('fecha debe ser YYYY-MM-DD')
+    if vista == 'semana':
+        desde = fecha - datetime.timedelta(days=fecha.weekday())
+        return desde, desde + datetime.timedelta(days=6)
+    return fecha.replace(day=1), fecha.replace(day=calendar.monthrange(fecha.year, fecha.month)[1])
+
+
+def citas_del_rango(bloques, desde, hasta):
+    return Cita_Medica.objects.filter(bloque_horario__in=bloques.values('pk'), fecha__range=(desde, hasta))
+
+
+def etag(grupo_id, bloques, desde, hasta):
+    """
+    ETag del calendario: grupo, rango y máximo fecha_modificacion y cantidad de
+    bloques y citas, más la última modificación de sus médicos y pacientes
+    """
+    partes = [grupo_id, desde, hasta]
+    resumenes = (
+        bloques.order_by().aggregate(
+            ultima=Max('fecha_modificacion'), filas=Count('pk'),
+            persona=Max('medico__ultimo_login'), activos=Count('pk', filter=Q(medico__estado=True)),
+        ),
+        citas_del_rango(bloques, desde, hasta).order_by().aggregate(
+            ultima=Max('fecha_modificacion'), filas=Count('pk'), persona=Max('paciente__usuario__ultimo_login'),
+        ),
+    )
+    for resumen in resumenes:
+        partes += [
+            valor.isoformat() if isinstance(valor, datetime.datetime) else valor
+            for _, valor in sorted(resumen.items())
+        ]
+    return '"%s"' % hashlib.sha1(repr(partes).encode()).hexdigest()
+
+
+def calendario(bloques, desde, hasta):
+    """
+    [{'medico', 'medico_nombre', 'dias': [{'fecha', 'bloques': [{'bloque_horario',
+    'hora_inicio', 'hora_fin', 'tipo_atencion', 'max_citas_por_bloque', 'citas': [...]}]}]}]
+    con los bloques de `bloques` (ya filtrados por clínica y médico) que rigen cada día
+    del rango: los activos, y los inactivos que todavía tienen citas ese día.
+    """
+    citas = (
+        citas_del_rango(bloques, desde, hasta).filter(estado=True)
+        .select_related('paciente__usuario')
+        .only('fecha', 'hora_inicio', 'hora_fin', 'notas', 'bloque_horario_id', 'paciente__usuario__nombre')
+        .order_by('fecha', 'hora_inicio')
+    )
+    por_bloque = defaultdict(list)   # (bloque, fecha) -> citas
+    for cita in citas:
+        por_bloque[(cita.bloque_horario_id, cita.fecha)].append({
+            'id': cita.pk,
+            'hora_inicio': formato_hora(minutos(cita.hora_inicio)),
+            'hora_fin': formato_hora(minutos(cita.hora_fin)),
+            'paciente': cita.paciente_id,
+            'paciente_nombre': cita.paciente.usuario.nombre,
+            'notas': cita.notas,
+        })
+    con_citas = {bloque_id for bloque_id, _ in por_bloque}
+    filas = (
+        bloques.filter(Q(estado=True, medico__estado=True) | Q(pk__in=con_citas))
+        .order_by('medico__nombre', 'medico_id', 'hora_inicio')
+        .values_list('id', 'medico_id', 'medico__nombre', 'dia_semana', 'hora_inicio', 'hora_fin',
+                     'tipo_atencion_id', 'max_citas_por_bloque', 'estado')
+    )
+    medicos, por_dia = {}, defaultdict(list)   # día de la semana -> bloques
+    for fila in filas:
+        medicos.setdefault(fila[1], {'medico': fila[1], 'medico_nombre': fila[2], 'dias': []})
+        por_dia[fila[3]].append(fila)
+    for fecha in fechas(desde, hasta):
+        del_dia = defaultdict(list)
+        for bloque_id, medico_id, _, _, inicio, fin, tipo, maximo, activo in por_dia[DIAS_SEMANA[fecha.weekday()]]:
+            citas_bloque = por_bloque.get((bloque_id, fecha), [])
+            if not activo and not citas_bloque:
+                continue
+            del_dia[medico_id].append({
+                'bloque_horario': bloque_id,
+                'hora_inicio': formato_hora(minutos(inicio)),
+                'hora_fin': formato_hora(minutos(fin)),
+                'tipo_atencion': tipo,
+                'max_citas_por_bloque': maximo,
+                'citas': citas_bloque,
+            })
+        for medico_id, bloques_dia in del_dia.items():
+            medicos[medico_id]['dias'].append({'fecha': fecha, 'bloques': bloques_dia})
+    return list(medicos.values())
@@ -0,0 +1,165 @@
+"""
+Horarios libres de los médicos a partir de sus bloques semanales y de las citas.
+
+Cada Bloque_Horario activo se repite todas las semanas en su día: en cada fecha
+del rango se parte en turnos de `duracion_cita_minutos` (los que caben enteros
+antes de hora_fin). Un turno está libre si:
+
+    - el bloque no llegó a `max_citas_por_bloque` citas activas ese día, y
+    - no se superpone con ninguna cita activa del médico ese día (de cualquier
+      bloque: el médico no puede atender dos citas a la vez), y
+    - no empezó todavía (para hoy)
+
+Son dos consultas acotadas al rango (bloques y citas) y un barrido por médico y
+día: las citas se ordenan y se funden en intervalos ocupados disjuntos, y los
+turnos, también ordenados, avanzan sobre ellos con un solo puntero. El costo es
+O(bloques + citas + turnos), sin consultas por turno.
+
+Las horas se manejan como minutos desde la medianoche.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.citas_pagos.models import Cita_Medica
+
+DIAS_SEMANA = ['LUNES', 'MARTES', 'MIERCOLES', 'JUEVES', 'VIERNES', 'SABADO', 'DOMINGO']
+DIAS_POR_DEFECTO = 7
+MAX_DIAS = 62
+
+
+def rango_fechas(params):
+    """
+    Días [desde, hasta] pedidos con ?start=&end= (YYYY-MM-DD); por defecto la semana
+    que empieza hoy. ValueError si las fechas no son válidas o el rango es muy largo.
+    """
+    hoy = timezone.localdate()
+    try:
+        desde = parse_date(params['start']) if params.get('start') else hoy
+        hasta = parse_date(params['end']) if params.get('end') else desde + timedelta(days=DIAS_POR_DEFECTO - 1)
+    except (TypeError, ValueError):
+        desde = hasta = None
+    if desde is None or hasta is None:
+        raise ValueError('start y end deben ser fechas YYYY-MM-DD')
+    if desde > hasta:
+        raise ValueError('start no puede ser posterior a end')
+    if (hasta - desde).days >= MAX_DIAS:
+        raise ValueError(f'El rango no puede superar {MAX_DIAS} días')
+    return desde, hasta
+
+
+def minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def formato_hora(minuto):
+    return f'{minuto // 60:02d}:{minuto % 60:02d}'
+
+
+def fechas(desde, hasta):
+    return [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+
+
+def bloques_activos(bloques):
+    """Bloques activos de médicos activos: (id, medico_id, nombre, día, inicio, fin, duración, máximo)"""
+    return list(
+        bloques.filter(estado=True, medico__estado=True)
+        .order_by()
+        .values_list(
+            'id', 'medico_id', 'medico__nombre', 'dia_semana', 'hora_inicio', 'hora_fin',
+            'duracion_cita_minutos', 'max_citas_por_bloque',
+        )
+    )
+
+
+def citas_activas(medicos, desde, hasta):
+    """Citas activas de los médicos en el rango: (medico_id, bloque_id, fecha, inicio, fin)"""
+    return (
+        Cita_Medica.objects
+        .filter(bloque_horario__medico_id__in=medicos, fecha__range=(desde, hasta), estado=True)
+        .order_by()
+        .values_list('bloque_horario__medico_id', 'bloque_horario_id', 'fecha', 'hora_inicio', 'hora_fin')
+    )
+
+
+def fundir(intervalos):
+    """Intervalos (inicio, fin) ordenados y fundidos en intervalos disjuntos"""
+    fundidos = []
+    for inicio, fin in sorted(intervalos):
+        if fundidos and inicio < fundidos[-1][1]:
+            if fin > fundidos[-1][1]:
+                fundidos[-1][1] = fin
+        else:
+            fundidos.append([inicio, fin])
+    return fundidos
+
+
+def sin_superponer(turnos, ocupados):
+    """Turnos (inicio, fin, dato) ordenados por inicio que no se superponen con ningún intervalo de `ocupados` (fundidos)"""
+    libres, i = [], 0
+    for inicio, fin, bloque in turnos:
+        while i < len(ocupados) and ocupados[i][1] <= inicio:
+            i += 1
+        if i == len(ocupados) or ocupados[i][0] >= fin:
+            libres.append((inicio, fin, bloque))
+    return libres
+
+
+def turnos_libres(bloques, citas, desde, hasta, ahora=None):
+    """
+    {medico_id: {'nombre', 'turnos': [(fecha, inicio, fin, bloque_id)]}} con los turnos
+    libres entre `desde` y `hasta` (minutos desde la medianoche), a partir de las filas
+    de bloques_activos y citas_activas. `ahora` descarta los turnos ya empezados.
+    """
+    por_dia = defaultdict(list)       # día de la semana -> bloques
+    for bloque in bloques:
+        por_dia[bloque[3]].append(bloque)
+    ocupadas = defaultdict(list)      # (médico, fecha) -> intervalos de sus citas
+    por_bloque = defaultdict(int)     # (bloque, fecha) -> citas activas
+    for medico_id, bloque_id, fecha, inicio, fin in citas:
+        ocupadas[(medico_id, fecha)].append((minutos(inicio), minutos(fin)))
+        por_bloque[(bloque_id, fecha)] += 1
+
+    # Todos los médicos con bloques aparecen, aunque no les quede ningún turno
+    medicos = {bloque[1]: {'nombre': bloque[2], 'turnos': []} for bloque in bloques}
+    hoy, minuto_actual = (ahora.date(), minutos(ahora)) if ahora else (None, None)
+    for fecha in fechas(desde, hasta):
+        if hoy and fecha < hoy:
+            continue
+        candidatos = defaultdict(list)  # médico -> turnos del día
+        for bloque_id, medico_id, _, _, inicio, fin, duracion, maximo in por_dia[DIAS_SEMANA[fecha.weekday()]]:
+            if por_bloque[(bloque_id, fecha)] >= maximo or not duracion:
+                continue
+            inicio, fin = minutos(inicio), minutos(fin)
+            if fecha == hoy:
+                # El primer turno que todavía no empezó
+                inicio += max(0, -(-(minuto_actual - inicio) // duracion)) * duracion
+            candidatos[medico_id].extend((t, t + duracion, bloque_id) for t in range(inicio, fin - duracion + 1, duracion))
+        for medico_id, turnos in candidatos.items():
+            turnos.sort()
+            libres = sin_superponer(turnos, fundir(ocupadas.get((medico_id, fecha), ())))
+            medicos[medico_id]['turnos'].extend((fecha, inicio, fin, bloque) for inicio, fin, bloque in libres)
+    return medicos
+
+
+def disponibilidad(bloques, desde, hasta, ahora=None):
+    """
+    Turnos libres de los bloques de `bloques` (queryset ya filtrado por clínica, médico,
+    especialidad o tipo de atención) entre las fechas `desde` y `hasta`, para la API.
+    """
+    filas = bloques_activos(bloques)
+    citas = citas_activas({fila[1] for fila in filas}, desde, hasta) if filas else []
+    medicos = turnos_libres(filas, citas, desde, hasta, ahora=ahora)
+    return [
+        {
+            'medico': medico_id,
+            'medico_nombre': datos['nombre'],
+            'turnos': [
+                {'fecha': fecha, 'hora_inicio': formato_hora(inicio), 'hora_fin': formato_hora(fin), 'bloque_horario': bloque}
+                for fecha, inicio, fin, bloque in datos['turnos']
+            ],
+        }
+        for medico_id, datos in sorted(medicos.items(), key=lambda item: (item[1]['nombre'], item[0]))
+    ]
@@ -0,0 +1,163 @@
+"""
+Alta de horarios semanales completos: una plantilla de bloques para uno o muchos médicos.
+
+Antes cada Bloque_Horario era un POST y lo único que se controlaba era el
+unique_together exacto (médico, día, inicio, fin): 08:00-12:00 y 11:00-13:00 del
+mismo médico entraban los dos. Acá, por médico y día:
+
+    - los bloques activos que ya tiene se funden en intervalos ocupados
+    - los de la plantilla, ordenados por inicio, se barren contra esos intervalos
+      (un puntero) y contra el último aceptado de la misma plantilla
+    - los que se superponen quedan en el informe con su error y no se crean
+
+Todo con una consulta por tabla (médicos, tipos de atención, bloques existentes),
+y los bloques válidos se crean con un bulk_create, todo en una sola transacción. Un
+bloque idéntico a uno inactivo del médico se reactiva en lugar de crearse (el
+unique_together no permitiría otro). Con `reemplazar`, los bloques activos de los
+médicos de la plantilla se desactivan antes (las citas que tengan siguen en pie).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from apps.citas_pagos.turnos import generar_turnos
+
+from .disponibilidad import DIAS_SEMANA, fundir, minutos, sin_superponer
+from .models import Bloque_Horario, Medico, Tipo_Atencion
+
+MAX_BLOQUES = 10000
+
+
+class PlantillaBloqueSerializer(serializers.Serializer):
+    dia_semana = serializers.ChoiceField(choices=DIAS_SEMANA)
+    hora_inicio = serializers.TimeField()
+    hora_fin = serializers.TimeField()
+    duracion_cita_minutos = serializers.IntegerField(min_value=1, default=30)
+    max_citas_por_bloque = serializers.IntegerField(min_value=1, default=10)
+    tipo_atencion = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, datos):
+        if datos['hora_inicio'] >= datos['hora_fin']:
+            raise serializers.ValidationError({'hora_fin': ['Debe ser posterior a hora_inicio.']})
+        return datos
+
+
+class PlantillaSerializer(serializers.Serializer):
+    medicos = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    bloques = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+
+def _leer_bloques(plantillas):
+    """(médico, fila del bloque en la plantilla, datos validados) y los errores por fila"""
+    pedidos, errores = [], []
+    for p, plantilla in enumerate(plantillas):
+        filas = []
+        for b, bloque in enumerate(plantilla['bloques']):
+            serializer = PlantillaBloqueSerializer(data=bloque)
+            if serializer.is_valid():
+                filas.append((b, serializer.validated_data))
+            else:
+                errores.append({'plantilla': p, 'bloque': b, 'medico': None, 'errores': serializer.errors})
+        pedidos += [(medico_id, (p, b), datos) for medico_id in plantilla['medicos'] for b, datos in filas]
+    return pedidos, errores
+
+
+@transaction.atomic
+def programar(grupo, plantillas, reemplazar=False, generar=True):
+    """
+    Crea los bloques de `plantillas` ([{'medicos': [ids], 'bloques': [{...}]}]) en la
+    clínica `grupo`. Devuelve el informe {'bloques', 'creados', 'reactivados',
+    'desactivados', 'errores': [{'plantilla', 'bloque', 'medico', 'errores'}]}.
+    Las filas de los médicos quedan bloqueadas hasta el final: dos plantillas para
+    el mismo médico no se barren a la vez contra el mismo estado.
+    """
+    pedidos, errores = _leer_bloques(plantillas)
+    informe = {'bloques': len(pedidos) + len(errores), 'creados': 0, 'reactivados': 0, 'desactivados': 0, 'errores': errores}
+
+    def rechazar(medico_id, posicion, campo, mensaje):
+        errores.append({'plantilla': posicion[0], 'bloque': posicion[1], 'medico': medico_id, 'errores': {campo: [mensaje]}})
+
+    if len(pedidos) > MAX_BLOQUES:
+        raise serializers.ValidationError({'bloques': [f'La plantilla supera los {MAX_BLOQUES} bloques.']})
+    medicos = set(
+        Medico.objects.select_for_update().filter(grupo=grupo, pk__in={m for m, _, _ in pedidos})
+        .values_list('pk', flat=True)
+    )
+    tipos = {datos['tipo_atencion'] for _, _, datos in pedidos if datos.get('tipo_atencion')}
+    tipos = set(Tipo_Atencion.objects.filter(grupo=grupo, pk__in=tipos).values_list('pk', flat=True)) if tipos else set()
+
+    # Bloques que ya tienen los médicos: los activos ocupan su horario, los inactivos se pueden reactivar
+    ocupados, inactivos, a_desactivar = defaultdict(list), {}, []
+    existentes = Bloque_Horario.objects.filter(medico_id__in=medicos).order_by().values_list(
+        'pk', 'medico_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'estado',
+    )
+    for pk, medico_id, dia, inicio, fin, estado in existentes:
+        if estado and reemplazar:
+            a_desactivar.append(pk)
+            estado = False
+        if estado:
+            ocupados[(medico_id, dia)].append((minutos(inicio), minutos(fin)))
+        else:
+            inactivos[(medico_id, dia, inicio, fin)] = pk
+
+    por_dia = defaultdict(list)
+    for medico_id, posicion, datos in pedidos:
+        if medico_id not in medicos:
+            rechazar(medico_id, posicion, 'medico', 'El médico no existe en esta clínica.')
+        elif datos.get('tipo_atencion') and datos['tipo_atencion'] not in tipos:
+            rechazar(medico_id, posicion, 'tipo_atencion', 'El tipo de atención no existe en esta clínica.')
+        else:
+            por_dia[(medico_id, datos['dia_semana'])].append(
+                (minutos(datos['hora_inicio']), minutos(datos['hora_fin']), (posicion, datos))
+            )
+
+    nuevos, reactivados = [], []
+    ahora = timezone.now()
+    for (medico_id, dia), candidatos in por_dia.items():
+        candidatos.sort(key=lambda c: (c[0], c[1]))
+        sin_choque = {
+            k for _, _, k in sin_superponer(
+                [(inicio, fin, k) for k, (inicio, fin, _) in enumerate(candidatos)],
+                fundir(ocupados[(medico_id, dia)]),
+            )
+        }
+        ultimo_fin = None
+        for k, (inicio, fin, (posicion, datos)) in enumerate(candidatos):
+            if k not in sin_choque:
+                rechazar(medico_id, posicion, 'hora_inicio', 'Se superpone con un bloque que el médico ya tiene ese día.')
+                continue
+            if ultimo_fin is not None and inicio < ultimo_fin:
+                rechazar(medico_id, posicion, 'hora_inicio', 'Se superpone con otro bloque de la plantilla para ese día.')
+                continue
+            ultimo_fin = fin
+            campos = {
+                'duracion_cita_minutos': datos['duracion_cita_minutos'],
+                'max_citas_por_bloque': datos['max_citas_por_bloque'],
+                'tipo_atencion_id': datos.get('tipo_atencion'),
+            }
+            pk = inactivos.get((medico_id, dia, datos['hora_inicio'], datos['hora_fin']))
+            if pk is not None:
+                reactivados.append(Bloque_Horario(pk=pk, estado=True, fecha_modificacion=ahora, **campos))
+            else:
+                nuevos.append(Bloque_Horario(
+                    grupo=grupo, medico_id=medico_id, dia_semana=dia, hora_inicio=datos['hora_inicio'],
+                    hora_fin=datos['hora_fin'], **campos,
+                ))
+
+    reactivar = {b.pk for b in reactivados}
+    informe['desactivados'] = Bloque_Horario.objects.filter(
+        pk__in=[pk for pk in a_desactivar if pk not in reactivar]
+    ).update(estado=False, fecha_modificacion=ahora)
+    # bulk_update no pasa por auto_now: fecha_modificacion va explícita
+    Bloque_Horario.objects.bulk_update(
+        reactivados, ['estado', 'duracion_cita_minutos', 'max_citas_por_bloque', 'tipo_atencion', 'fecha_modificacion'],
+        batch_size=500,
+    )
+    Bloque_Horario.objects.bulk_create(nuevos, batch_size=500)
+    if generar and (nuevos or reactivados or informe['desactivados']):
+        generar_turnos(Bloque_Horario.objects.filter(medico_id__in=medicos))
+    informe['creados'], informe['reactivados'] = len(nuevos), len(reactivados)
+    errores.sort(key=lambda e: (e['plantilla'], e['bloque'], e['medico'] or 0))
+    return informe
@@ -0,0 +1,110 @@
+import datetime
+from collections import defaultdict
+
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Usuario
+from apps.doctores.disponibilidad import DIAS_SEMANA, fechas
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+INICIO = datetime.date(2031, 3, 3)  # lunes
+
+
+def armar_en_cliente(cliente, desde, hasta):
+    """
+    Como armaba el frontend la semana: todos los bloques y todas las citas activas de la
+    clínica, cruzados por bloque y fecha. Devuelve (bytes recibidos, citas en el rango).
+    """
+    bloques = cliente.get('/api/doctores/bloque-horario/')
+    recibidos = len(bloques.content)
+    por_bloque = defaultdict(list)
+    # El listado de citas está paginado: se siguen los enlaces `next` hasta el final
+    siguiente = '/api/citas/citas-medicas/?page_size=500'
+    while siguiente:
+        pagina = cliente.get(siguiente)
+        recibidos += len(pagina.content)
+        for cita in pagina.json()['results']:
+            if desde.isoformat() <= cita['fecha'] <= hasta.isoformat():
+                por_bloque[(cita['bloque_horario'], cita['fecha'])].append(cita)
+        siguiente = pagina.json()['next']
+    total = 0
+    for fecha in fechas(desde, hasta):
+        for bloque in bloques.json():
+            if bloque['estado'] and bloque['dia_semana'] == DIAS_SEMANA[fecha.weekday()]:
+                total += len(por_bloque[(bloque['id'], fecha.isoformat())])
+    return recibidos, total
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Semana de calendario de una clínica con meses de citas guardadas: bloques y citas '
+        'completos cruzados en el cliente frente a /api/doctores/calendario/, y la revalidación con ETag (304).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=40)
+        parser.add_argument('--semanas', type=int, default=12, help='Semanas con citas guardadas')
+        parser.add_argument('--citas-por-dia', type=int, default=6, help='Citas por médico y día hábil')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Calendario', roles)
+        medicos = [
+            Medico.objects.create(
+                grupo=grupo, rol=roles['medico'], nombre=f'Medico {i:04d}', correo=f'm{i}@cal.bench',
+                sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'cal-{i}',
+            )
+            for i in range(options['medicos'])
+        ]
+        bloques = Bloque_Horario.objects.bulk_create([
+            Bloque_Horario(grupo=grupo, medico=medico, dia_semana=dia, hora_inicio=datetime.time(8),
+                           hora_fin=datetime.time(12), duracion_cita_minutos=30, max_citas_por_bloque=8)
+            for medico in medicos for dia in DIAS_SEMANA[:5]
+        ])
+        usuario = Usuario.objects.create(grupo=grupo, rol=roles['paciente'], nombre='Paciente', correo='p@cal.bench',
+                                         sexo='M', fecha_nacimiento='1990-01-01')
+        paciente = Paciente.objects.create(usuario=usuario, numero_historia_clinica='HC-cal-1')
+        por_medico_dia = {(b.medico_id, b.dia_semana): b for b in bloques}
+        citas = [
+            Cita_Medica(grupo=grupo, paciente=paciente, bloque_horario=bloque, fecha=fecha,
+                        hora_inicio=datetime.time(8 + k // 2, k % 2 * 30), hora_fin=datetime.time(8 + k // 2, k % 2 * 30 + 29))
+            for medico in medicos
+            for fecha in fechas(INICIO, INICIO + datetime.timedelta(weeks=options['semanas']) - datetime.timedelta(days=1))
+            for bloque in [por_medico_dia.get((medico.pk, DIAS_SEMANA[fecha.weekday()]))] if bloque
+            for k in range(options['citas_por_dia'])
+        ]
+        Cita_Medica.objects.bulk_create(citas, batch_size=1000)
+
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        desde, hasta = INICIO, INICIO + datetime.timedelta(days=6)
+        with contar_consultas() as c_antes, cronometro() as t_antes:
+            bytes_antes, esperadas = armar_en_cliente(cliente, desde, hasta)
+        with contar_consultas() as c_ahora, cronometro() as t_ahora:
+            respuesta = cliente.get('/api/doctores/calendario/', {'fecha': desde})
+        assert respuesta.status_code == 200, respuesta.content
+        obtenidas = sum(len(b['citas']) for m in respuesta.json()['medicos'] for d in m['dias'] for b in d['bloques'])
+        assert obtenidas == esperadas, (obtenidas, esperadas)
+        with contar_consultas() as c_304, cronometro() as t_304:
+            revalidada = cliente.get('/api/doctores/calendario/', {'fecha': desde}, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        assert revalidada.status_code == 304, revalidada.status_code
+
+        self.stdout.write(f'{len(medicos)} médicos, {len(bloques)} bloques, {len(citas)} citas guardadas; '
+                          f'una semana con {obtenidas} citas')
+        self.fila(('', 30), ('consultas', 10), ('ms', 8), ('bytes', 10))
+        self.fila(('bloques + citas completos', 30), (c_antes['total'], 10),
+                  (f'{t_antes["segundos"] * 1000:.0f}', 8), (bytes_antes, 10))
+        self.fila(('calendario', 30), (c_ahora['total'], 10),
+                  (f'{t_ahora["segundos"] * 1000:.0f}', 8), (len(respuesta.content), 10))
+        self.fila(('calendario con If-None-Match', 30), (c_304['total'], 10),
+                  (f'{t_304["segundos"] * 1000:.0f}', 8), (len(revalidada.content), 10))
+        self.stdout.write('  incluye las consultas de autenticación; "bloques + citas" incluye el cruce en el cliente')
@@ -0,0 +1,105 @@
+import datetime
+
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.cuentas.models import Usuario
+from apps.doctores.disponibilidad import DIAS_SEMANA, fechas, minutos
+from apps.doctores.models import Bloque_Horario, Medico
+from apps.historiasDiagnosticos.models import Paciente
+
+INICIO = datetime.date(2031, 3, 3)  # lunes, lejos de "hoy" para que no se descarten turnos
+
+
+def libres_por_dia(medicos, desde, hasta):
+    """
+    Como se armaba el calendario antes: por médico y día, sus bloques y sus citas, y
+    cada turno comparado contra todas las citas del día.
+    """
+    total = 0
+    for medico in medicos:
+        for fecha in fechas(desde, hasta):
+            bloques = Bloque_Horario.objects.filter(medico=medico, dia_semana=DIAS_SEMANA[fecha.weekday()], estado=True)
+            citas = list(Cita_Medica.objects.filter(bloque_horario__medico=medico, fecha=fecha, estado=True))
+            for bloque in bloques:
+                if sum(1 for cita in citas if cita.bloque_horario_id == bloque.pk) >= bloque.max_citas_por_bloque:
+                    continue
+                inicio, fin = minutos(bloque.hora_inicio), minutos(bloque.hora_fin)
+                for t in range(inicio, fin - bloque.duracion_cita_minutos + 1, bloque.duracion_cita_minutos):
+                    if not any(minutos(c.hora_inicio) < t + bloque.duracion_cita_minutos and t < minutos(c.hora_fin) for c in citas):
+                        total += 1
+    return total
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Turnos libres de N médicos en un rango de días: por médico y día (como se armaba '
+        'el calendario) frente a /api/doctores/disponibilidad/ (dos consultas y un barrido).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=120)
+        parser.add_argument('--dias', type=int, default=31)
+        parser.add_argument('--citas-por-dia', type=int, default=8, help='Citas por médico y día hábil')
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Disponibilidad', roles)
+        desde = INICIO
+        hasta = desde + datetime.timedelta(days=options['dias'] - 1)
+        medicos = [
+            Medico.objects.create(
+                grupo=grupo, rol=roles['medico'], nombre=f'Medico {i:04d}', correo=f'm{i}@disp.bench',
+                sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'disp-{i}',
+            )
+            for i in range(options['medicos'])
+        ]
+        # Mañana y tarde de lunes a viernes, turnos de 20 minutos
+        bloques = Bloque_Horario.objects.bulk_create([
+            Bloque_Horario(grupo=grupo, medico=medico, dia_semana=dia, hora_inicio=inicio, hora_fin=fin,
+                           duracion_cita_minutos=20, max_citas_por_bloque=12)
+            for medico in medicos for dia in DIAS_SEMANA[:5]
+            for inicio, fin in (('08:00', '12:00'), ('14:00', '18:00'))
+        ])
+        usuario = Usuario.objects.create(grupo=grupo, rol=roles['paciente'], nombre='Paciente', correo='p@disp.bench',
+                                         sexo='M', fecha_nacimiento='1990-01-01')
+        paciente = Paciente.objects.create(usuario=usuario, numero_historia_clinica='HC-disp-1')
+        por_medico_dia = {(b.medico_id, b.dia_semana): b for b in bloques if b.hora_inicio == '08:00'}
+        citas = []
+        for medico in medicos:
+            for fecha in fechas(desde, hasta):
+                bloque = por_medico_dia.get((medico.pk, DIAS_SEMANA[fecha.weekday()]))
+                if bloque is None:
+                    continue
+                for k in range(options['citas_por_dia']):
+                    inicio = 8 * 60 + (k * 37 + medico.pk * 11) % 220
+                    citas.append(Cita_Medica(
+                        grupo=grupo, paciente=paciente, bloque_horario=bloque, fecha=fecha,
+                        hora_inicio=datetime.time(inicio // 60, inicio % 60),
+                        hora_fin=datetime.time((inicio + 20) // 60, (inicio + 20) % 60),
+                    ))
+        Cita_Medica.objects.bulk_create(citas, batch_size=1000)
+
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        with contar_consultas() as c_antes, cronometro() as t_antes:
+            esperados = libres_por_dia(medicos, desde, hasta)
+        with contar_consultas() as c_ahora, cronometro() as t_ahora:
+            respuesta = cliente.get('/api/doctores/disponibilidad/', {'start': desde, 'end': hasta})
+        assert respuesta.status_code == 200, respuesta.content
+        obtenidos = sum(len(m['turnos']) for m in respuesta.json()['medicos'])
+        assert obtenidos == esperados, (obtenidos, esperados)
+
+        self.stdout.write(f'{len(medicos)} médicos, {len(bloques)} bloques, {len(citas)} citas, '
+                          f'{options["dias"]} días: {obtenidos} turnos libres')
+        self.fila(('', 22), ('consultas', 10), ('ms', 8))
+        self.fila(('por médico y día', 22), (c_antes['total'], 10), (f'{t_antes["segundos"] * 1000:.0f}', 8))
+        self.fila(('disponibilidad', 22), (c_ahora['total'], 10), (f'{t_ahora["segundos"] * 1000:.0f}', 8))
+        self.stdout.write('  "disponibilidad" incluye las consultas de autenticación y la serialización JSON')
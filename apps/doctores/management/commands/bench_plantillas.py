@@ -0,0 +1,73 @@
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, contar_consultas, cronometro, crear_clinica, crear_roles
+from apps.doctores.disponibilidad import DIAS_SEMANA
+from apps.doctores.horarios import programar
+from apps.doctores.models import Bloque_Horario, Medico
+
+# Semana tipo: mañana y tarde de lunes a viernes
+SEMANA = [
+    {'dia_semana': dia, 'hora_inicio': inicio, 'hora_fin': fin, 'duracion_cita_minutos': 20}
+    for dia in DIAS_SEMANA[:5] for inicio, fin in (('08:00', '12:00'), ('14:00', '18:00'))
+]
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Horario semanal de todos los médicos de una clínica: un POST por bloque a '
+        '/api/doctores/bloque-horario/ (como antes) frente a una sola plantilla.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicos', type=int, default=200)
+
+    def run_benchmark(self, *args, **options):
+        # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+        with override_settings(BITACORA={'MODO': 'sincrono'}):
+            self.medir(**options)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        self.fila(('forma', 22), ('requests', 9), ('bloques', 8), ('consultas', 10), ('segundos', 9), ('rechazados', 10))
+        for n, (nombre, cargar) in enumerate((
+            ('un POST por bloque', self.uno_por_uno),
+            ('plantilla', self.plantilla),
+            ('plantilla sin turnos', self.sin_turnos),
+        )):
+            grupo, token = crear_clinica(f'Clinica Plantillas {n}', roles)
+            medicos = [
+                Medico.objects.create(
+                    grupo=grupo, rol=roles['medico'], nombre=f'Medico {i}', correo=f'm{i}@plantillas{n}.bench',
+                    sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'plantillas-{n}-{i}',
+                ).pk
+                for i in range(options['medicos'])
+            ]
+            cliente = APIClient()
+            cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            # Un bloque que se superpone por médico: antes entraba, ahora se rechaza
+            carga = SEMANA + [{'dia_semana': 'LUNES', 'hora_inicio': '11:00', 'hora_fin': '13:00'}]
+            with contar_consultas() as consultas, cronometro() as t:
+                requests, rechazados = cargar(cliente, grupo, medicos, carga)
+            creados = Bloque_Horario.objects.filter(grupo=grupo).count()
+            self.fila((nombre, 22), (requests, 9), (creados, 8), (consultas['total'], 10),
+                      (f'{t["segundos"]:.1f}', 9), (rechazados, 10))
+        self.stdout.write('  las dos primeras incluyen la generación de turnos (90 días); la última llama a programar() sin HTTP ni turnos')
+
+    def uno_por_uno(self, cliente, grupo, medicos, carga):
+        requests = rechazados = 0
+        for medico in medicos:
+            for bloque in carga:
+                respuesta = cliente.post('/api/doctores/bloque-horario/', {**bloque, 'medico': medico, 'grupo': grupo.pk}, format='json')
+                requests += 1
+                rechazados += respuesta.status_code != 201
+        return requests, rechazados
+
+    def plantilla(self, cliente, grupo, medicos, carga):
+        respuesta = cliente.post('/api/doctores/bloque-horario/plantilla/', {'medicos': medicos, 'bloques': carga}, format='json')
+        assert respuesta.status_code == 201, respuesta.content
+        return 1, len(respuesta.json()['errores'])
+
+    def sin_turnos(self, cliente, grupo, medicos, carga):
+        informe = programar(grupo, [{'medicos': medicos, 'bloques': carga}], generar=False)
+        return 0, len(informe['errores'])
@@ -1,6 +1,7 @@
 #pendiente
 from django.db import models
 from apps.cuentas.models import Usuario, Grupo
+from apps.cuentas.tenant import TenantManager
 
 # Modelo Especialidad
 class Especialidad(models.Model):
@@ -72,6 +73,8 @@ class Bloque_Horario(models.Model):
         related_name='bloques_horarios',
         verbose_name="Grupo al que pertenece",
     )
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Bloque Horario"
         verbose_name_plural = "Bloques Horarios"
@@ -91,6 +94,8 @@ class Tipo_Atencion(models.Model):
         related_name='tipos_atencion',
         verbose_name="Grupo al que pertenece",
     )
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Tipo de Atención"
         verbose_name_plural = "Tipos de Atención"
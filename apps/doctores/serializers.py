@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from django.contrib.auth.hashers import make_password
 from django.db import transaction
 from .models import *
-from apps.cuentas.models import Usuario, Rol
+from apps.cuentas.consultas import relaciones
+from apps.cuentas.proyecciones import proyectar, proyectar_lista
+from apps.cuentas.models import Usuario, Rol, crear_credencial
 
 class EspecialidadSerializer(serializers.ModelSerializer):
     class Meta:
@@ -20,36 +21,45 @@ class MedicoSerializer(serializers.ModelSerializer):
         queryset=Especialidad.objects.all(),
         required=False
     )
+    # La contraseña va a la credencial del médico (User de Django), no al perfil
+    password = serializers.CharField(write_only=True)
     
     class Meta:
         model = Medico
         fields = '__all__'
         extra_kwargs = {
-            'password': {'write_only': True},
+            'user': {'read_only': True},
             # REMUEVE 'grupo': {'required': True} - Ahora se asigna automáticamente
         }
     
+    @relaciones('rol', 'grupo')
+    @proyectar(Usuario.acceso_permitido, 'rol__nombre', 'grupo__estado')
     def get_puede_acceder(self, obj):
         return obj.puede_acceder_sistema()
     
+    @relaciones('especialidades')
+    @proyectar_lista('especialidades', 'nombre')
     def get_especialidades_nombres(self, obj):
         return [esp.nombre for esp in obj.especialidades.all()]
     
+    @transaction.atomic
+    def create(self, validated_data):
+        # Un solo hash: la credencial se crea con la contraseña en claro
+        password = validated_data.pop('password')
+        validated_data['user'] = crear_credencial(validated_data['correo'], password)
+        return super().create(validated_data)
+    
     def update(self, instance, validated_data):
         # Extraer especialidades antes de actualizar
         especialidades_data = validated_data.pop('especialidades', None)
-        
-        # Hashear la contraseña si se proporciona
         password = validated_data.pop('password', None)
-        if password:
-            from django.contrib.auth.hashers import make_password
-            validated_data['password'] = make_password(password)
         
         # Actualizar campos normales
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
         instance.save()
+        instance.sincronizar_credencial(password)
         
         # Actualizar especialidades si se proporcionaron
         if especialidades_data is not None:
@@ -1,3 +1,230 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.citas_pagos.models import Cita_Medica
+from apps.cuentas.benchmark import crear_clinica, crear_roles
+from apps.cuentas.models import Usuario
+from apps.historiasDiagnosticos.models import Paciente
+
+from .disponibilidad import formato_hora, fundir, sin_superponer, turnos_libres
+from .horarios import programar
+from .models import Bloque_Horario, Medico, Tipo_Atencion
+
+PRUEBAS = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    HASHING_PASSWORDS={'MODO': 'local'},
+    BITACORA={'MODO': 'sincrono'},
+)
+
+LUNES = datetime.date(2031, 3, 3)
+
+
+def bloque(pk, inicio, fin, duracion=30, maximo=10, medico=1):
+    """Fila de bloques_activos: un bloque de los lunes"""
+    return (pk, medico, 'Medico', 'LUNES', datetime.time.fromisoformat(inicio),
+            datetime.time.fromisoformat(fin), duracion, maximo)
+
+
+def cita(bloque_id, inicio, fin, medico=1, fecha=LUNES):
+    """Fila de citas_activas"""
+    return (medico, bloque_id, fecha, datetime.time.fromisoformat(inicio), datetime.time.fromisoformat(fin))
+
+
+class TurnosLibresTests(SimpleTestCase):
+
+    def libres(self, bloques, citas=(), desde=LUNES, hasta=LUNES, ahora=None):
+        medicos = turnos_libres(bloques, citas, desde, hasta, ahora=ahora)
+        return [
+            (formato_hora(inicio), bloque_id)
+            for _, inicio, _, bloque_id in medicos[1]['turnos']
+        ]
+
+    def test_bloque_lleno(self):
+        bloques = [bloque(1, '08:00', '10:00', maximo=2)]
+        self.assertEqual(len(self.libres(bloques, [cita(1, '08:00', '08:30')])), 3)
+        self.assertEqual(self.libres(bloques, [cita(1, '08:00', '08:30'), cita(1, '09:00', '09:30')]), [])
+
+    def test_cita_de_otro_bloque_del_medico(self):
+        bloques = [bloque(1, '08:00', '10:00'), bloque(2, '09:00', '10:00', duracion=60)]
+        libres = self.libres(bloques, [cita(2, '09:00', '09:30')])
+        self.assertEqual(libres, [('08:00', 1), ('08:30', 1), ('09:30', 1)])
+        # La cita de otro médico no le quita turnos
+        self.assertEqual(len(self.libres(bloques, [cita(3, '09:00', '09:30', medico=2)])), 5)
+
+    def test_citas_seguidas(self):
+        self.assertEqual(fundir([(510, 540), (480, 510), (490, 500)]), [[480, 510], [510, 540]])
+        libres = self.libres([bloque(1, '08:00', '10:00')], [cita(1, '08:00', '08:30'), cita(1, '08:30', '09:00')])
+        self.assertEqual(libres, [('09:00', 1), ('09:30', 1)])
+        # Un turno que empieza justo cuando termina la cita está libre
+        self.assertEqual(sin_superponer([(510, 540, 1)], [[480, 510]]), [(510, 540, 1)])
+
+    def test_hoy_sin_turnos_empezados(self):
+        bloques = [bloque(1, '08:00', '10:00')]
+        ahora = datetime.datetime.combine(LUNES, datetime.time(8, 40))
+        libres = self.libres(bloques, desde=LUNES - datetime.timedelta(days=7), hasta=LUNES, ahora=ahora)
+        self.assertEqual(libres, [('09:00', 1), ('09:30', 1)])
+        ahora = datetime.datetime.combine(LUNES, datetime.time(9))
+        self.assertEqual(self.libres(bloques, ahora=ahora), [('09:00', 1), ('09:30', 1)])
+
+    def test_duracion_que_no_divide_el_bloque(self):
+        bloques = [bloque(1, '08:00', '09:45', duracion=40)]
+        self.assertEqual(self.libres(bloques), [('08:00', 1), ('08:40', 1)])
+        ahora = datetime.datetime.combine(LUNES, datetime.time(8, 10))
+        self.assertEqual(self.libres(bloques, ahora=ahora), [('08:40', 1)])
+
+
+@PRUEBAS
+class CalendarioETagTests(TestCase):
+    url = '/api/doctores/calendario/'
+
+    def setUp(self):
+        roles = crear_roles()
+        grupo, token = crear_clinica('Clinica Uno', roles)
+        self.admin = APIClient()
+        self.admin.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.medico = Medico.objects.create(
+            grupo=grupo, rol=roles['medico'], nombre='Medico', correo='medico@uno.test',
+            sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado='uno-1',
+        )
+        bloque = Bloque_Horario.objects.create(
+            grupo=grupo, medico=self.medico, dia_semana='LUNES',
+            hora_inicio=datetime.time(8), hora_fin=datetime.time(10),
+        )
+        self.usuario = Usuario.objects.create(
+            grupo=grupo, rol=roles['paciente'], nombre='Paciente', correo='paciente@uno.test',
+            sexo='M', fecha_nacimiento='1990-01-01',
+        )
+        paciente = Paciente.objects.create(usuario=self.usuario, numero_historia_clinica='HC-1')
+        hoy = timezone.localdate()
+        self.lunes = hoy - datetime.timedelta(days=hoy.weekday())
+        Cita_Medica.objects.create(
+            grupo=grupo, paciente=paciente, bloque_horario=bloque, fecha=self.lunes,
+            hora_inicio=datetime.time(8), hora_fin=datetime.time(8, 30),
+        )
+
+    def get(self, etiqueta=None):
+        extra = {'HTTP_IF_NONE_MATCH': etiqueta} if etiqueta else {}
+        return self.admin.get(self.url, {'fecha': self.lunes.isoformat()}, **extra)
+
+    def test_sin_cambios_responde_304(self):
+        respuesta = self.get()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.data['medicos']), 1)
+        self.assertEqual(self.get(respuesta['ETag']).status_code, 304)
+
+    def test_desactivar_medico_cambia_el_etag(self):
+        etiqueta = self.get()['ETag']
+        # Sin pasar por save(): el ETag igual cuenta los médicos activos
+        Medico.objects.filter(pk=self.medico.pk).update(estado=False)
+        self.assertEqual(self.get(etiqueta).status_code, 200)
+
+    def test_renombrar_medico_o_paciente_cambia_el_etag(self):
+        etiqueta = self.get()['ETag']
+        self.medico.nombre = 'Medica Renombrada'
+        self.medico.save()
+        respuesta = self.get(etiqueta)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['medicos'][0]['medico_nombre'], 'Medica Renombrada')
+
+        self.usuario.nombre = 'Paciente Renombrado'
+        self.usuario.save()
+        self.assertEqual(self.get(respuesta['ETag']).status_code, 200)
+
+
+def horario(dia, inicio, fin, **extra):
+    return dict(dia_semana=dia, hora_inicio=inicio, hora_fin=fin, **extra)
+
+
+@PRUEBAS
+class ProgramarTests(TestCase):
+
+    def setUp(self):
+        self.roles = crear_roles()
+        self.grupo, token = crear_clinica('Clinica Uno', self.roles)
+        self.admin = APIClient()
+        self.admin.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.medico = self.crear_medico(self.grupo, 'uno')
+        otro_grupo, _ = crear_clinica('Clinica Dos', self.roles)
+        self.ajeno = self.crear_medico(otro_grupo, 'dos')
+        self.tipo_ajeno = Tipo_Atencion.objects.create(nombre='Consulta Dos', grupo=otro_grupo)
+
+    def crear_medico(self, grupo, sufijo):
+        return Medico.objects.create(
+            grupo=grupo, rol=self.roles['medico'], nombre=f'Medico {sufijo}', correo=f'medico@{sufijo}.test',
+            sexo='F', fecha_nacimiento='1980-01-01', numero_colegiado=f'col-{sufijo}',
+        )
+
+    def existente(self, inicio, fin, estado=True):
+        return Bloque_Horario.objects.create(
+            grupo=self.grupo, medico=self.medico, dia_semana='LUNES', estado=estado,
+            hora_inicio=datetime.time.fromisoformat(inicio), hora_fin=datetime.time.fromisoformat(fin),
+        )
+
+    def programar(self, *bloques, medicos=None, reemplazar=False):
+        plantillas = [{'medicos': medicos or [self.medico.pk], 'bloques': list(bloques)}]
+        return programar(self.grupo, plantillas, reemplazar=reemplazar, generar=False)
+
+    def errores(self, informe):
+        return [(e['bloque'], e['medico'], list(e['errores'])) for e in informe['errores']]
+
+    def activos(self):
+        return list(
+            Bloque_Horario.objects.filter(medico=self.medico, estado=True)
+            .order_by('dia_semana', 'hora_inicio').values_list('dia_semana', 'hora_inicio')
+        )
+
+    def test_choque_con_bloque_existente(self):
+        self.existente('08:00', '12:00')
+        informe = self.programar(horario('LUNES', '11:00', '13:00'), horario('MARTES', '08:00', '12:00'))
+        self.assertEqual((informe['creados'], self.errores(informe)), (1, [(0, self.medico.pk, ['hora_inicio'])]))
+        self.assertIn('ya tiene', informe['errores'][0]['errores']['hora_inicio'][0])
+
+    def test_choque_dentro_de_la_plantilla(self):
+        informe = self.programar(
+            horario('LUNES', '09:00', '11:00'), horario('LUNES', '08:00', '10:00'), horario('LUNES', '10:00', '12:00'),
+        )
+        self.assertEqual((informe['creados'], self.errores(informe)), (2, [(0, self.medico.pk, ['hora_inicio'])]))
+        self.assertIn('plantilla', informe['errores'][0]['errores']['hora_inicio'][0])
+        self.assertEqual(self.activos(), [('LUNES', datetime.time(8)), ('LUNES', datetime.time(10))])
+
+    def test_reactiva_bloque_identico_inactivo(self):
+        viejo = self.existente('08:00', '12:00', estado=False)
+        informe = self.programar(horario('LUNES', '08:00', '12:00', duracion_cita_minutos=20))
+        self.assertEqual((informe['creados'], informe['reactivados']), (0, 1))
+        viejo.refresh_from_db()
+        self.assertEqual((viejo.estado, viejo.duracion_cita_minutos), (True, 20))
+
+    def test_reemplazar(self):
+        igual = self.existente('08:00', '10:00')
+        self.existente('14:00', '18:00')
+        informe = self.programar(horario('LUNES', '08:00', '10:00'), horario('LUNES', '12:00', '16:00'), reemplazar=True)
+        self.assertEqual((informe['creados'], informe['reactivados'], informe['desactivados']), (1, 1, 1))
+        self.assertEqual(informe['errores'], [])
+        self.assertEqual(self.activos(), [('LUNES', datetime.time(8)), ('LUNES', datetime.time(12))])
+        self.assertTrue(Bloque_Horario.objects.get(pk=igual.pk).estado)
+
+    def test_medico_o_tipo_de_otra_clinica(self):
+        informe = self.programar(
+            horario('LUNES', '08:00', '10:00'), horario('MARTES', '08:00', '10:00', tipo_atencion=self.tipo_ajeno.pk),
+            medicos=[self.medico.pk, self.ajeno.pk],
+        )
+        self.assertEqual(informe['creados'], 1)
+        self.assertEqual(self.errores(informe), [
+            (0, self.ajeno.pk, ['medico']), (1, self.medico.pk, ['tipo_atencion']), (1, self.ajeno.pk, ['medico']),
+        ])
+        self.assertFalse(Bloque_Horario.objects.filter(medico=self.ajeno).exists())
+
+    def test_plantilla_sin_bloques_validos(self):
+        self.existente('08:00', '12:00')
+        respuesta = self.admin.post('/api/doctores/bloque-horario/plantilla/', {
+            'medicos': [self.medico.pk, self.ajeno.pk],
+            'bloques': [horario('LUNES', '09:00', '10:00'), horario('MARTES', '10:00', '09:00')],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['creados'], 0)
+        # La fila inválida una vez; la del lunes, por cada médico
+        self.assertEqual([(e['bloque'], e['medico']) for e in respuesta.data['errores']],
+                         [(0, self.medico.pk), (0, self.ajeno.pk), (1, None)])
@@ -10,5 +10,7 @@ router.register(r'tipo-atencion', views.TipoAtencionViewSet)
 router.register(r'bloque-horario', views.BloqueHorarioViewSet)
 
 urlpatterns = [
+    path('disponibilidad/', views.DisponibilidadAPIView.as_view(), name='disponibilidad'),
+    path('calendario/', views.CalendarioAPIView.as_view(), name='calendario'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
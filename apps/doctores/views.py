@@ -1,65 +1,36 @@
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework import permissions
+from apps.citas_pagos.turnos import generar_turnos
+from apps.cuentas.consultas import RelacionesMixin
+from apps.cuentas.proyecciones import ProyeccionMixin
+from apps.cuentas.tenant import MultiTenantMixin as TenantMixinBase, get_tenant
+from apps.cuentas.authentication import cerrar_sesiones
 from apps.cuentas.utils import get_actor_usuario_from_request, log_action
+from apps.cuentas.models import Grupo
+from .calendario import calendario, etag, rango_calendario
+from .disponibilidad import disponibilidad, rango_fechas
+from .horarios import PlantillaSerializer, programar
 from .models import *
 from .serializers import *
 from django.contrib.auth.models import User
 
-class MultiTenantMixin:
+class MultiTenantMixin(TenantMixinBase):
     """Mixin para filtrar datos por grupo del usuario actual"""
     
     permission_classes = [permissions.IsAuthenticated]  # Requiere autenticación
-    
-    def get_user_grupo(self):
-        """Obtiene el grupo del usuario actual"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
-    
-    def is_super_admin(self):
-        """Verifica si el usuario actual es super admin"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.rol and usuario.rol.nombre == 'superAdmin'
-            except Usuario.DoesNotExist:
-                pass
-        return False
-    
-    def filter_by_grupo(self, queryset):
-        """Filtra el queryset por el grupo del usuario actual"""
-        if self.is_super_admin():
-            return queryset  # Super admin ve todo
-        
-        grupo = self.get_user_grupo()
-        if grupo:
-            # Verifica si el modelo tiene campo grupo (incluyendo herencia)
-            model = queryset.model
-            has_grupo_field = any(
-                hasattr(field, 'name') and field.name == 'grupo' 
-                for field in model._meta.get_fields()
-            )
-            
-            if has_grupo_field:
-                print(f"🔍 Filtering {model.__name__} by grupo: {grupo}")
-                return queryset.filter(grupo=grupo)
-        
-        print(f"🔍 No filtering applied for {queryset.model.__name__}")
-        return queryset
 
 class EspecialidadViewSet(viewsets.ModelViewSet):
     queryset = Especialidad.objects.all()
     serializer_class = EspecialidadSerializer
 
-class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):  
+class MedicoViewSet(RelacionesMixin, ProyeccionMixin, MultiTenantMixin, viewsets.ModelViewSet):  
     queryset = Medico.objects.all()
     serializer_class = MedicoSerializer
     
@@ -94,7 +65,9 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     def perform_create(self, serializer):
         # Asignar automáticamente el grupo del usuario que crea
         try:
-            usuario = Usuario.objects.get(correo=self.request.user.email)
+            usuario = get_tenant(self.request).perfil
+            if usuario is None:
+                raise Usuario.DoesNotExist
             print(f"🔍 Usuario creador: {usuario}, Grupo: {usuario.grupo}")
             
             # ASIGNAR ROL MÉDICO AUTOMÁTICAMENTE
@@ -113,29 +86,7 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             
             print(f"🔍 Rol asignado: {rol_medico.nombre} (ID: {rol_medico.id})")
             
-            # OBTENER Y HASHEAR LA CONTRASEÑA
-            validated_data = serializer.validated_data
-            password = validated_data.get('password')
-            
-            if password:
-                from django.contrib.auth.hashers import make_password
-                validated_data['password'] = make_password(password)
-                print("🔍 Contraseña hasheada")
-            
-            # Crear también el User de Django
-            correo = validated_data.get('correo')
-            if correo and password:
-                try:
-                    User.objects.create_user(
-                        username=correo,
-                        email=correo,
-                        password=password  # Django ya la hashea automáticamente
-                    )
-                    print("🔍 User de Django creado")
-                except Exception as e:
-                    print(f"⚠️ Error creando User Django: {e}")
-            
-            # Guardar con grupo Y rol
+            # Guardar con grupo Y rol (el serializer crea la credencial con un solo hash)
             medico = serializer.save(grupo=usuario.grupo, rol=rol_medico)
             
             # Log de la acción
@@ -157,18 +108,14 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             except Rol.DoesNotExist:
                 rol_medico = Rol.objects.get(id=4)
             
-            # Hashear contraseña en fallback también
-            validated_data = serializer.validated_data
-            password = validated_data.get('password')
-            if password:
-                from django.contrib.auth.hashers import make_password
-                validated_data['password'] = make_password(password)
-                
             medico = serializer.save(grupo=grupo, rol=rol_medico)
             print(f"✅ Médico creado con grupo fallback y rol médico")
 
     def perform_update(self, serializer):
+        activo = serializer.instance.estado
         medico = serializer.save()
+        if activo and not medico.estado:
+            cerrar_sesiones(medico)
         
         # Log de la acción
         actor = get_actor_usuario_from_request(self.request)
@@ -185,6 +132,9 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
         pk = instance.pk
         instance.estado = False
         instance.save()
+        cerrar_sesiones(instance)
+        # Sus turnos libres dejan de ofrecerse
+        generar_turnos(instance.bloques_horarios.all())
         
         # Log de la acción
         actor = get_actor_usuario_from_request(self.request)
@@ -199,7 +149,7 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     def eliminados(self, request):
         queryset = Medico.objects.all()
         queryset = self.filter_by_grupo(queryset)  # Filtrar por grupo
-        eliminados = queryset.filter(estado=False)
+        eliminados = self.optimizar(queryset.filter(estado=False))
         serializer = self.get_serializer(eliminados, many=True)
         return Response(serializer.data)    
     
@@ -208,6 +158,7 @@ class MedicoViewSet(MultiTenantMixin, viewsets.ModelViewSet):
         medico = self.get_object()
         medico.estado = True
         medico.save()
+        generar_turnos(medico.bloques_horarios.all())
         
         # Log de la acción
         actor = get_actor_usuario_from_request(self.request)
@@ -235,4 +186,112 @@ class BloqueHorarioViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     
     def get_queryset(self):
         queryset = Bloque_Horario.objects.all()
-        return self.filter_by_grupo(queryset)
\ No newline at end of file
+        return self.filter_by_grupo(queryset)
+
+    # Los turnos del bloque se regeneran al crearlo o editarlo; al borrarlo se borran con él
+    def perform_create(self, serializer):
+        bloque = serializer.save()
+        generar_turnos(Bloque_Horario.objects.filter(pk=bloque.pk))
+
+    def perform_update(self, serializer):
+        bloque = serializer.save()
+        generar_turnos(Bloque_Horario.objects.filter(pk=bloque.pk))
+
+    @action(detail=False, methods=['post'])
+    def plantilla(self, request):
+        """
+        Horario semanal de uno o muchos médicos en un solo request:
+        {"plantillas": [{"medicos": [ids], "bloques": [{dia_semana, hora_inicio, hora_fin,
+        duracion_cita_minutos, max_citas_por_bloque, tipo_atencion}]}], "reemplazar": false}
+        (o "medicos" y "bloques" directamente para una sola plantilla). Los bloques que se
+        superponen con otros del médico no se crean y vuelven en "errores". Con
+        "reemplazar" los bloques actuales de esos médicos se desactivan. El super admin
+        indica la clínica con ?grupo=<id>.
+        """
+        tenant = self.get_tenant()
+        if tenant.rol not in ('administrador', 'superAdmin'):
+            return Response(
+                {'error': 'No tienes permisos para esta acción'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if tenant.is_super_admin:
+            grupo = Grupo.objects.filter(pk=request.query_params.get('grupo') or None).first()
+        else:
+            grupo = tenant.grupo
+        if grupo is None:
+            return Response({'grupo': 'Indica la clínica con ?grupo=<id>'}, status=status.HTTP_400_BAD_REQUEST)
+
+        plantillas = request.data.get('plantillas')
+        if plantillas is None:
+            plantillas = [{'medicos': request.data.get('medicos'), 'bloques': request.data.get('bloques')}]
+        serializer = PlantillaSerializer(data=plantillas, many=True)
+        serializer.is_valid(raise_exception=True)
+        reemplazar = str(request.data.get('reemplazar', '')).lower() in ('1', 'true')
+        informe = programar(grupo, serializer.validated_data, reemplazar=reemplazar)
+
+        log_action(
+            request=request,
+            accion=f"Cargó una plantilla de horarios: {informe['creados']} bloques creados, "
+                   f"{informe['reactivados']} reactivados, {informe['desactivados']} desactivados",
+            objeto=f"Grupo: {grupo.nombre} (id:{grupo.id})",
+            usuario=get_actor_usuario_from_request(request),
+        )
+        creados = informe['creados'] + informe['reactivados']
+        return Response(informe, status=status.HTTP_201_CREATED if creados else status.HTTP_400_BAD_REQUEST)
+
+class BloquesFiltradosMixin(MultiTenantMixin):
+    """Bloques horarios de la clínica filtrados por ?medico= (ids separados por coma), ?especialidad= y ?tipo_atencion="""
+
+    def get_bloques(self):
+        params = self.request.query_params
+        bloques = self.filter_by_grupo(Bloque_Horario.objects.all())
+        if params.get('medico'):
+            ids = [int(i) for i in params['medico'].split(',') if i.strip()]
+            bloques = bloques.filter(medico_id__in=ids)
+        if params.get('especialidad'):
+            bloques = bloques.filter(medico__especialidades=int(params['especialidad']))
+        if params.get('tipo_atencion'):
+            bloques = bloques.filter(tipo_atencion_id=int(params['tipo_atencion']))
+        return bloques
+
+
+class DisponibilidadAPIView(BloquesFiltradosMixin, generics.GenericAPIView):
+    """
+    Turnos libres por médico entre ?start= y ?end= (YYYY-MM-DD, por defecto los
+    próximos 7 días), calculados con los bloques horarios y las citas activas.
+    Filtros opcionales: ?medico= (uno o varios ids separados por coma),
+    ?especialidad= y ?tipo_atencion=.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            desde, hasta = rango_fechas(request.query_params)
+            bloques = self.get_bloques()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        medicos = disponibilidad(bloques, desde, hasta, ahora=timezone.localtime())
+        return Response({'desde': desde, 'hasta': hasta, 'medicos': medicos})
+
+
+class CalendarioAPIView(BloquesFiltradosMixin, generics.GenericAPIView):
+    """
+    Bloques y citas por día de ?vista=semana|mes alrededor de ?fecha= (por defecto
+    la semana actual), o entre ?start= y ?end=, para un médico (?medico=) o toda la
+    clínica. Con If-None-Match igual al ETag responde 304 sin leer el calendario.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            desde, hasta = rango_calendario(request.query_params)
+            bloques = self.get_bloques()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        etiqueta = etag(self.get_tenant().grupo_id, bloques, desde, hasta)
+        if etiqueta in parse_etags(request.headers.get('If-None-Match', '')):
+            respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            respuesta = Response({'desde': desde, 'hasta': hasta, 'medicos': calendario(bloques, desde, hasta)})
+        respuesta['ETag'] = etiqueta
+        # El navegador guarda la respuesta pero la revalida siempre con el ETag
+        patch_cache_control(respuesta, private=True, no_cache=True)
+        return respuesta
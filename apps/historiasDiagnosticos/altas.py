@@ -0,0 +1,114 @@
+"""
+Alta masiva de pacientes: cada fila crea su Usuario (rol paciente), su Paciente
+con número de historia clínica asignado por el servidor (ver numeracion.py) y sus
+patologías iniciales. Se apoya en la importación de usuarios de cuentas
+(apps/cuentas/importacion.py): mismo formato de archivo, mismos lotes, y las tres
+tablas (Usuario, Paciente y la intermedia de patologías) con bulk_create dentro
+de la transacción de cada lote.
+
+Columnas propias además de las del usuario: numero_historia_clinica (opcional;
+si falta, lo asigna el servidor), agudeza_visual_derecho/izquierdo,
+presion_ocular_derecho/izquierdo y patologias (ids o nombres de patologías de la
+clínica; lista en JSON, separados por ';' en CSV).
+"""
+from django.core.exceptions import ValidationError
+
+from apps.cuentas.importacion import Alta
+
+from .models import Paciente, PatologiasO
+from .numeracion import asignador_historias
+
+CAMPOS = [
+    'numero_historia_clinica',
+    'agudeza_visual_derecho',
+    'agudeza_visual_izquierdo',
+    'presion_ocular_derecho',
+    'presion_ocular_izquierdo',
+]
+
+
+class AltaPacientes(Alta):
+    rol = 'paciente'
+    descripcion = 'pacientes'
+    entidad = 'Paciente'
+
+    def __init__(self, grupo):
+        self.grupo = grupo
+        patologias = PatologiasO.objects.filter(grupo=grupo, estado=True).values_list('pk', 'nombre')
+        self.patologias = {}
+        for pk, nombre in patologias:
+            self.patologias[str(pk)] = self.patologias[nombre.strip().lower()] = pk
+        self.numeros_vistos = set()
+
+    def _patologias(self, valor):
+        if valor in (None, ''):
+            return [], None
+        if isinstance(valor, str):
+            valor = valor.split(';')
+        elif not isinstance(valor, list):
+            valor = [valor]
+        ids, desconocidas = [], []
+        for patologia in valor:
+            clave = str(patologia).strip().lower()
+            if not clave:
+                continue
+            if clave in self.patologias:
+                ids.append(self.patologias[clave])
+            else:
+                desconocidas.append(str(patologia).strip())
+        if desconocidas:
+            return ids, [f"Patologías inexistentes en la clínica: {', '.join(desconocidas)}"]
+        return list(dict.fromkeys(ids)), None
+
+    def limpiar(self, fila):
+        datos, errores = {}, {}
+        for campo in CAMPOS:
+            valor = fila.get(campo)
+            if isinstance(valor, str):
+                valor = valor.strip()
+            if valor in (None, ''):
+                continue
+            try:
+                datos[campo] = Paciente._meta.get_field(campo).clean(valor, None)
+            except ValidationError as e:
+                errores[campo] = e.messages
+        numero = datos.get('numero_historia_clinica')
+        if numero:
+            if numero in self.numeros_vistos:
+                errores['numero_historia_clinica'] = ['Número de historia clínica repetido en el archivo.']
+            self.numeros_vistos.add(numero)
+        patologias, error = self._patologias(fila.get('patologias'))
+        if error:
+            errores['patologias'] = error
+        return {'paciente': datos, 'patologias': patologias}, errores
+
+    def descartar(self, lote):
+        """Números de historia clínica traídos en el archivo que ya existen (una consulta por lote)"""
+        numeros = {f.extra['paciente']['numero_historia_clinica']: f.numero
+                   for f in lote if f.extra['paciente'].get('numero_historia_clinica')}
+        if not numeros:
+            return {}
+        existentes = Paciente.objects.filter(numero_historia_clinica__in=numeros).values_list('numero_historia_clinica', flat=True)
+        return {
+            numeros[numero]: {'numero_historia_clinica': ['Ya existe un paciente con este número de historia clínica.']}
+            for numero in existentes
+        }
+
+    def preparar(self, lote):
+        # Los números se reservan antes de la transacción del lote: el contador no queda bloqueado mientras dura
+        sin_numero = [f for f in lote if not f.extra['paciente'].get('numero_historia_clinica')]
+        for fila, numero in zip(sin_numero, asignador_historias.numeros(self.grupo.pk, len(sin_numero))):
+            fila.extra['paciente']['numero_historia_clinica'] = numero
+
+    def crear(self, lote, usuarios):
+        pacientes = Paciente.objects.bulk_create([
+            Paciente(usuario=usuario, **fila.extra['paciente']) for fila, usuario in zip(lote, usuarios)
+        ])
+        campo = Paciente.patologias.field
+        intermedia = campo.remote_field.through
+        intermedia.objects.bulk_create([
+            intermedia(**{campo.m2m_column_name(): paciente.pk, campo.m2m_reverse_name(): patologia})
+            for paciente, fila in zip(pacientes, lote)
+            for patologia in fila.extra['patologias']
+        ])
+        return pacientes
@@ -0,0 +1,169 @@
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.db.models import Max
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from apps.cuentas.benchmark import BenchmarkCommand, crear_clinica, crear_roles, percentil
+from apps.cuentas.models import Usuario
+from apps.historiasDiagnosticos.models import Paciente, PatologiasO
+from apps.historiasDiagnosticos.numeracion import asignador_historias
+
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Altas de pacientes concurrentes en una clínica: número de historia clínica elegido por el '
+        'cliente (máximo + 1, reintentando si choca) frente al asignado por el servidor, uno por uno '
+        'y con el alta masiva.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Clientes simultáneos')
+        parser.add_argument('--pacientes', type=int, default=100, help='Pacientes por forma de alta')
+        parser.add_argument('--lote', type=int, default=25, help='Pacientes por request en el alta masiva')
+
+    def run_benchmark(self, *args, **options):
+        # Los choques y bloqueos son parte de la medición: no se registran como errores
+        registro = logging.getLogger('django.request')
+        nivel = registro.level
+        registro.setLevel(logging.CRITICAL)
+        try:
+            # Bitácora sincrónica: el hilo de fondo compite por la base SQLite de prueba
+            with override_settings(BITACORA={'MODO': 'sincrono'}):
+                self.medir(**options)
+        finally:
+            registro.setLevel(nivel)
+
+    def medir(self, **options):
+        roles = crear_roles()
+        self.grupo, self.token = crear_clinica('Clinica Pacientes', roles)
+        self.patologia = PatologiasO.objects.create(grupo=self.grupo, nombre='Glaucoma', descripcion='bench')
+        self.rol_paciente = roles['paciente']
+        self.siguiente_usuario = 0
+        n, hilos = options['pacientes'], options['hilos']
+
+        self.fila(('forma', 26), ('pacientes', 10), ('pacientes/s', 12), ('p50', 10), ('p95', 10),
+                  ('choques', 8), ('bloqueos', 9), ('requests', 9))
+        for nombre, medir in (
+            ('cliente: máximo + 1', lambda: self.uno_por_uno(self.usuarios(n), hilos, numero_cliente=True)),
+            ('servidor: uno por uno', lambda: self.uno_por_uno(self.usuarios(n), hilos, numero_cliente=False)),
+            ('servidor: alta masiva', lambda: self.masiva(n, hilos, options['lote'])),
+        ):
+            antes = Paciente.objects.count()
+            resultado = medir()
+            creados = Paciente.objects.count() - antes
+            self.fila(
+                (nombre, 26), (creados, 10), (f'{creados / resultado["segundos"]:.1f}', 12),
+                (f'{resultado["p50"]:.0f} ms', 10), (f'{resultado["p95"]:.0f} ms', 10),
+                (resultado['choques'], 8), (resultado['bloqueos'], 9), (resultado['requests'], 9),
+            )
+        numeros = list(Paciente.objects.values_list('numero_historia_clinica', flat=True))
+        assert len(numeros) == len(set(numeros))
+        self.stdout.write(
+            '  choques: el número elegido ya estaba tomado y el cliente reintentó; bloqueos: SQLite '
+            'rechazó la escritura concurrente ("table is locked") y se reintentó el request'
+        )
+
+    def usuarios(self, cantidad):
+        """Usuarios con rol paciente todavía sin ficha, para el alta uno por uno"""
+        desde = self.siguiente_usuario
+        self.siguiente_usuario += cantidad
+        return list(Usuario.objects.bulk_create([
+            Usuario(grupo=self.grupo, rol=self.rol_paciente, nombre=f'Paciente {i}', correo=f'p{i}@pacientes.bench',
+                    sexo='F', fecha_nacimiento='1990-01-01')
+            for i in range(desde, desde + cantidad)
+        ]))
+
+    def cliente(self):
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return cliente
+
+    def reintentar(self, funcion, contadores):
+        """
+        Ejecuta `funcion` en una transacción, reintentando mientras SQLite rechace el acceso
+        concurrente ("table is locked"); en PostgreSQL no hay bloqueos de tabla que reintentar.
+        Devuelve None si la escritura chocó con una restricción única.
+        """
+        while True:
+            try:
+                with transaction.atomic():
+                    return funcion()
+            except OperationalError:
+                contadores['bloqueos'] += 1
+                # Espera al azar: dos transacciones que se bloquean no reintentan a la vez
+                time.sleep(random.uniform(0.001, 0.05))
+            except IntegrityError:
+                return None
+
+    def enviar(self, cliente, url, datos, contadores):
+        def post():
+            contadores['requests'] += 1
+            return cliente.post(url, datos, format='json')
+        return self.reintentar(post, contadores)
+
+    def concurrente(self, tareas, hilos, tarea):
+        contadores = {'choques': 0, 'bloqueos': 0, 'requests': 0}
+        latencias = []
+
+        def ejecutar(argumento):
+            inicio = time.perf_counter()
+            try:
+                tarea(argumento, contadores)
+            finally:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                connections.close_all()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            list(executor.map(ejecutar, tareas))
+        contadores.update(
+            segundos=time.perf_counter() - inicio, p50=percentil(latencias, 0.5), p95=percentil(latencias, 0.95),
+        )
+        return contadores
+
+    def uno_por_uno(self, usuarios, hilos, numero_cliente):
+        anio = time.localtime().tm_year
+
+        def alta(usuario, contadores):
+            cliente = self.cliente()
+            while True:
+                datos = {'usuario': usuario.pk, 'patologias': [self.patologia.pk]}
+                if numero_cliente:
+                    # Como lo hacía el frontend: el último número de la clínica más uno
+                    ultimo = self.reintentar(lambda: Paciente.objects.filter(
+                        numero_historia_clinica__startswith=f'HC-{anio}-'
+                    ).aggregate(ultimo=Max('numero_historia_clinica'))['ultimo'], contadores)
+                    siguiente = int(ultimo.rsplit('-', 1)[1]) + 1 if ultimo else 1
+                    datos['numero_historia_clinica'] = f'HC-{anio}-{siguiente:05d}'
+                respuesta = self.enviar(cliente, '/api/diagnosticos/pacientes/', datos, contadores)
+                if respuesta is not None and respuesta.status_code == 201:
+                    return
+                # El número ya estaba tomado: lo rechaza la validación o, si otro cliente ganó
+                # entre la validación y el INSERT, la restricción única
+                assert respuesta is None or 'numero_historia_clinica' in respuesta.json(), respuesta.content
+                contadores['choques'] += 1
+
+        return self.concurrente(usuarios, hilos, alta)
+
+    def masiva(self, cantidad, hilos, tamano_lote):
+        desde = self.siguiente_usuario
+        self.siguiente_usuario += cantidad
+        lotes = [range(i, min(i + tamano_lote, desde + cantidad)) for i in range(desde, desde + cantidad, tamano_lote)]
+        asignador_historias.olvidar()
+
+        def alta(lote, contadores):
+            pacientes = [
+                {'nombre': f'Paciente {i}', 'correo': f'p{i}@pacientes.bench', 'sexo': 'M',
+                 'fecha_nacimiento': '1990-01-01', 'patologias': [self.patologia.pk]}
+                for i in lote
+            ]
+            respuesta = self.enviar(self.cliente(), '/api/diagnosticos/pacientes/alta_masiva/', {'pacientes': pacientes}, contadores)
+            assert respuesta.json()['creados'] == len(lote), respuesta.content
+
+        return self.concurrente(lotes, hilos, alta)
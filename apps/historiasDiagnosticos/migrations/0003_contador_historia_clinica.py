@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuentas', '0013_correo_saliente'),
+        ('historiasDiagnosticos', '0002_tratamientomedicacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorHistoriaClinica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveSmallIntegerField()),
+                ('siguiente', models.PositiveIntegerField(default=1, help_text='Primer número todavía no reservado por ningún proceso')),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores_historia', to='cuentas.grupo')),
+            ],
+            options={
+                'verbose_name': 'Contador de historias clínicas',
+                'verbose_name_plural': 'Contadores de historias clínicas',
+                'constraints': [models.UniqueConstraint(fields=('grupo', 'anio'), name='contador_historia_unico')],
+            },
+        ),
+    ]
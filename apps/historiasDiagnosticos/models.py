@@ -1,5 +1,6 @@
 from django.db import models
 from apps.cuentas.models import Usuario, Grupo  # Importar Grupo
+from apps.cuentas.tenant import TenantManager
 
 class PatologiasO(models.Model):
     
@@ -44,6 +45,8 @@ class PatologiasO(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Patologia"
         verbose_name_plural = "Patologias"
@@ -89,6 +92,8 @@ class TratamientoMedicacion(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Tratamiento"
         verbose_name_plural = "Tratamientos"
@@ -114,8 +119,33 @@ class Paciente(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
 
+    objects = TenantManager()
+
     class Meta:
         ordering = ['usuario']
 
     def __str__(self):
         return f" {self.usuario.nombre} - {self.numero_historia_clinica}"
+
+
+# Numeración de historias clínicas por clínica y año (ver numeracion.py). Cada
+# proceso reserva bloques de números con un UPDATE de esta fila y los reparte en memoria
+class ContadorHistoriaClinica(models.Model):
+    grupo = models.ForeignKey(Grupo, on_delete=models.CASCADE, related_name='contadores_historia')
+    anio = models.PositiveSmallIntegerField()
+    siguiente = models.PositiveIntegerField(
+        default=1,
+        help_text="Primer número todavía no reservado por ningún proceso"
+    )
+
+    objects = TenantManager()
+
+    class Meta:
+        verbose_name = "Contador de historias clínicas"
+        verbose_name_plural = "Contadores de historias clínicas"
+        constraints = [
+            models.UniqueConstraint(fields=['grupo', 'anio'], name='contador_historia_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.grupo_id}/{self.anio}: {self.siguiente}"
@@ -0,0 +1,91 @@
+"""
+Números de historia clínica asignados por el servidor: HC-<grupo>-<año>-<número>.
+
+El número es correlativo por clínica y por año. En vez de bloquear el contador
+en cada alta, cada proceso reserva un bloque de TAMANO_BLOQUE números con un
+UPDATE ... SET siguiente = siguiente + n (la fila queda bloqueada solo durante
+esa transacción corta) y los reparte desde memoria. Las altas concurrentes de una
+misma clínica no compiten por ninguna fila salvo una vez por bloque.
+
+Como con las secuencias de PostgreSQL con CACHE, los números de un bloque que no
+llegan a usarse (reinicio del proceso) quedan como huecos: la numeración es única
+y creciente por proceso, pero no necesariamente contigua.
+
+La reserva abre su propia transacción: conviene pedir los números antes de la
+transacción del alta, para que el bloqueo del contador no dure lo que dura el alta.
+Si se piden dentro de una transacción ya abierta, la reserva se revierte con ella;
+por eso ahí no se guarda bloque en memoria y se reserva solo lo pedido.
+"""
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContadorHistoriaClinica
+
+TAMANO_BLOQUE = 20
+
+
+def formatear(grupo_id, anio, numero):
+    return f'HC-{grupo_id}-{anio}-{numero:04d}'
+
+
+def reservar_bloque(grupo_id, anio, cantidad):
+    """Reserva `cantidad` números en la base y devuelve el primero"""
+    contador = ContadorHistoriaClinica.objects.filter(grupo_id=grupo_id, anio=anio)
+    with transaction.atomic():
+        if not contador.update(siguiente=F('siguiente') + cantidad):
+            try:
+                with transaction.atomic():
+                    ContadorHistoriaClinica.objects.create(grupo_id=grupo_id, anio=anio, siguiente=1 + cantidad)
+                return 1
+            except IntegrityError:
+                # Otro proceso creó el contador a la vez
+                contador.update(siguiente=F('siguiente') + cantidad)
+        return contador.values_list('siguiente', flat=True).get() - cantidad
+
+
+class AsignadorHistorias:
+    """Bloques reservados por este proceso: (grupo_id, año) -> [siguiente, límite)"""
+
+    def __init__(self, tamano_bloque=TAMANO_BLOQUE):
+        self.tamano_bloque = tamano_bloque
+        self._lock = threading.Lock()
+        self._bloques = {}
+
+    def numeros(self, grupo_id, cantidad=1, anio=None):
+        """`cantidad` números de historia clínica nuevos para la clínica, en orden"""
+        anio = anio or timezone.localdate().year
+        clave = (grupo_id, anio)
+        with self._lock:
+            siguiente, limite = self._bloques.get(clave, (0, 0))
+            tomados = list(range(siguiente, min(limite, siguiente + cantidad)))
+            faltan = cantidad - len(tomados)
+            if not faltan:
+                siguiente += cantidad
+            elif connection.in_atomic_block:
+                # Un bloque guardado en memoria sobreviviría a un rollback de la reserva
+                inicio = reservar_bloque(grupo_id, anio, faltan)
+                tomados += range(inicio, inicio + faltan)
+                siguiente = limite
+            else:
+                # Lo que falta más un bloque entero para las próximas altas
+                reservados = faltan + self.tamano_bloque
+                inicio = reservar_bloque(grupo_id, anio, reservados)
+                tomados += range(inicio, inicio + faltan)
+                siguiente, limite = inicio + faltan, inicio + reservados
+            self._bloques[clave] = (siguiente, limite)
+        return [formatear(grupo_id, anio, numero) for numero in tomados]
+
+    def olvidar(self):
+        """Descarta los bloques en memoria (los números que quedaban se pierden)"""
+        with self._lock:
+            self._bloques.clear()
+
+
+asignador_historias = AsignadorHistorias()
+
+
+def numero_historia(grupo_id):
+    return asignador_historias.numeros(grupo_id)[0]
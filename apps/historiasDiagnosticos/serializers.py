@@ -1,5 +1,8 @@
 from rest_framework import serializers
+from apps.cuentas.consultas import relaciones
+from apps.cuentas.proyecciones import proyectar_lista
 from .models import *
+from .numeracion import numero_historia
 
 class PatologiasOSerializer(serializers.ModelSerializer):
     grupo_nombre = serializers.CharField(source='grupo.nombre', read_only=True)
@@ -23,6 +26,8 @@ class TratamientoMedicacionSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['grupo']  # El grupo se asigna automáticamente
 
+    @relaciones('patologias')
+    @proyectar_lista('patologias', 'nombre')
     def get_patologias_nombres(self, obj):
         return [p.nombre for p in obj.patologias.all()]
 
@@ -56,4 +61,16 @@ class PacienteSerializer(serializers.ModelSerializer):
             'fecha_creacion',
             'fecha_modificacion',
         ]
+        # Si no se indica, lo asigna el servidor (ver numeracion.py)
+        extra_kwargs = {'numero_historia_clinica': {'required': False}}
 
+    def validate_usuario(self, usuario):
+        # La historia clínica se numera por clínica: un usuario sin grupo no tiene contador
+        if usuario.grupo_id is None:
+            raise serializers.ValidationError('El usuario no pertenece a ninguna clínica.')
+        return usuario
+
+    def create(self, validated_data):
+        if not validated_data.get('numero_historia_clinica'):
+            validated_data['numero_historia_clinica'] = numero_historia(validated_data['usuario'].grupo_id)
+        return super().create(validated_data)
@@ -1,3 +1,61 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.cuentas.benchmark import crear_clinica, crear_roles, crear_usuario
+
+from .models import ContadorHistoriaClinica, Paciente, PatologiasO
+from .numeracion import asignador_historias
+
+PRUEBAS = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    HASHING_PASSWORDS={'MODO': 'local'},
+    BITACORA={'MODO': 'sincrono'},
+)
+
+
+@PRUEBAS
+class AltaPacienteTests(TestCase):
+
+    def setUp(self):
+        # Los bloques en memoria sobrevivirían al rollback de cada test
+        asignador_historias.olvidar()
+        self.roles = crear_roles()
+        self.grupo, token = crear_clinica('Clinica Uno', self.roles)
+        self.admin = APIClient()
+        self.admin.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.anio = timezone.localdate().year
+
+    def alta(self, usuario):
+        return self.admin.post('/api/diagnosticos/pacientes/', {'usuario': usuario.pk}, format='json')
+
+    def test_numera_por_clinica(self):
+        _, uno = crear_usuario('uno@uno.test', self.roles['paciente'], self.grupo)
+        _, dos = crear_usuario('dos@uno.test', self.roles['paciente'], self.grupo)
+        self.assertEqual(self.alta(uno).data['numero_historia_clinica'], f'HC-{self.grupo.pk}-{self.anio}-0001')
+        self.assertEqual(self.alta(dos).data['numero_historia_clinica'], f'HC-{self.grupo.pk}-{self.anio}-0002')
+
+    def test_usuario_sin_clinica(self):
+        _, usuario = crear_usuario('suelto@uno.test', self.roles['paciente'])
+        respuesta = self.alta(usuario)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('usuario', respuesta.data)
+        self.assertFalse(ContadorHistoriaClinica.objects.exists())
+
+    def test_alta_masiva(self):
+        PatologiasO.objects.create(nombre='Glaucoma', grupo=self.grupo)
+        respuesta = self.admin.post('/api/diagnosticos/pacientes/alta_masiva/', {'pacientes': [
+            {'nombre': 'Ana', 'correo': 'ana@uno.test', 'sexo': 'F', 'fecha_nacimiento': '1990-01-01',
+             'patologias': ['glaucoma']},
+            {'nombre': 'Beto', 'correo': 'beto@uno.test', 'sexo': 'M', 'fecha_nacimiento': '1985-05-05',
+             'numero_historia_clinica': 'HC-PROPIO-1'},
+            {'nombre': 'Caro', 'correo': 'caro@uno.test', 'sexo': 'F', 'fecha_nacimiento': '1980-01-01',
+             'patologias': ['inexistente']},
+        ]}, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.data['creados'], 2)
+        self.assertEqual([e['fila'] for e in respuesta.data['errores']], [3])
+        ana = Paciente.objects.get(usuario__correo='ana@uno.test')
+        self.assertEqual(ana.numero_historia_clinica, f'HC-{self.grupo.pk}-{self.anio}-0001')
+        self.assertEqual([p.nombre for p in ana.patologias.all()], ['Glaucoma'])
+        self.assertTrue(Paciente.objects.filter(numero_historia_clinica='HC-PROPIO-1').exists())
@@ -4,47 +4,21 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import *
 from .serializers import *
-from apps.cuentas.models import Usuario
+from apps.cuentas import importacion
+from apps.cuentas.consultas import RelacionesMixin
+from apps.cuentas.proyecciones import ProyeccionMixin
+from apps.cuentas.models import Grupo, Usuario
+from apps.cuentas.tenant import MultiTenantMixin as TenantMixinBase, get_tenant
+from apps.cuentas.authentication import cerrar_sesiones
 from apps.cuentas.utils import get_actor_usuario_from_request, log_action
+from .altas import AltaPacientes
 
-class MultiTenantMixin:
+class MultiTenantMixin(TenantMixinBase):
     """Mixin para filtrar datos por grupo del usuario actual"""
     
     permission_classes = [permissions.IsAuthenticated]  # Requiere autenticación
-    
-    def get_user_grupo(self):
-        """Obtiene el grupo del usuario actual"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.grupo
-            except Usuario.DoesNotExist:
-                pass
-        return None
-    
-    def is_super_admin(self):
-        """Verifica si el usuario actual es super admin"""
-        if hasattr(self.request, 'user') and self.request.user.is_authenticated:
-            try:
-                usuario = Usuario.objects.get(correo=self.request.user.email)
-                return usuario.rol and usuario.rol.nombre == 'superAdmin'
-            except Usuario.DoesNotExist:
-                pass
-        return False
-    
-    def filter_by_grupo(self, queryset):
-        """Filtra el queryset por el grupo del usuario actual"""
-        if self.is_super_admin():
-            return queryset  # Super admin ve todo
-        
-        grupo = self.get_user_grupo()
-        if grupo and hasattr(queryset.model, 'grupo'):
-            return queryset.filter(grupo=grupo)
-        
-        return queryset
-
 
-class PatologiasOViewSet(MultiTenantMixin, viewsets.ModelViewSet):
+class PatologiasOViewSet(RelacionesMixin, ProyeccionMixin, MultiTenantMixin, viewsets.ModelViewSet):
     queryset = PatologiasO.objects.all() 
     serializer_class = PatologiasOSerializer
 
@@ -60,8 +34,7 @@ class PatologiasOViewSet(MultiTenantMixin, viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Asignar automáticamente el grupo del usuario que crea
-        usuario = Usuario.objects.get(correo=self.request.user.email)
-        patologia = serializer.save(grupo=usuario.grupo)
+        patologia = serializer.save(grupo=get_tenant(self.request).grupo)
         
         # Log de la acción
         actor = get_actor_usuario_from_request(self.request)
@@ -104,7 +77,7 @@ class PatologiasOViewSet(MultiTenantMixin, viewsets.ModelViewSet):
     def eliminadas(self, request):
         queryset = PatologiasO.objects.all()
         queryset = self.filter_by_grupo(queryset)  # Filtrar por grupo
-        eliminadas = queryset.filter(estado=False)
+        eliminadas = self.optimizar(queryset.filter(estado=False))
         serializer = self.get_serializer(eliminadas, many=True)
         return Response(serializer.data)    
     
@@ -126,7 +99,7 @@ class PatologiasOViewSet(MultiTenantMixin, viewsets.ModelViewSet):
         serializer = self.get_serializer(patologia)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-class TratamientoMedicacionViewSet(MultiTenantMixin, viewsets.ModelViewSet):
+class TratamientoMedicacionViewSet(RelacionesMixin, MultiTenantMixin, viewsets.ModelViewSet):
     queryset = TratamientoMedicacion.objects.all() 
     serializer_class = TratamientoMedicacionSerializer
 
@@ -138,8 +111,7 @@ class TratamientoMedicacionViewSet(MultiTenantMixin, viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Asignar automáticamente el grupo del usuario que crea
-        usuario = Usuario.objects.get(correo=self.request.user.email)
-        tratamiento = serializer.save(grupo=usuario.grupo)
+        tratamiento = serializer.save(grupo=get_tenant(self.request).grupo)
         
         # Log de la acción
         actor = get_actor_usuario_from_request(self.request)
@@ -178,17 +150,14 @@ class TratamientoMedicacionViewSet(MultiTenantMixin, viewsets.ModelViewSet):
         )
 
 
-class PacienteViewSet(MultiTenantMixin, viewsets.ModelViewSet):
+class PacienteViewSet(RelacionesMixin, ProyeccionMixin, MultiTenantMixin, viewsets.ModelViewSet):
     queryset = Paciente.objects.all() 
     serializer_class = PacienteSerializer
 
     def get_queryset(self):
         queryset = Paciente.objects.all()
-        # Filtrar por grupo a través del usuario
-        if not self.is_super_admin():
-            grupo = self.get_user_grupo()
-            if grupo:
-                queryset = queryset.filter(usuario__grupo=grupo)
+        # Filtrar por grupo (a través del usuario)
+        queryset = self.filter_by_grupo(queryset)
         return queryset
 
     def perform_destroy(self, instance):
@@ -197,6 +166,7 @@ class PacienteViewSet(MultiTenantMixin, viewsets.ModelViewSet):
         pk = instance.pk
         instance.usuario.estado = False
         instance.usuario.save()
+        cerrar_sesiones(instance.usuario)
         
         # Log de la acción
         actor = get_actor_usuario_from_request(self.request)
@@ -207,16 +177,54 @@ class PacienteViewSet(MultiTenantMixin, viewsets.ModelViewSet):
             usuario=actor
         )
     
+    @action(detail=False, methods=['post'])
+    def alta_masiva(self, request):
+        """
+        Alta de muchos pacientes a la vez (usuario, paciente y patologías iniciales).
+        Recibe un archivo CSV o JSON lines en `archivo`, o JSON {"pacientes": [...]}.
+        El número de historia clínica lo asigna el servidor si no viene. Con
+        ?invitar=1 los que no traen contraseña reciben un correo para elegirla.
+        El super admin indica la clínica con ?grupo=<id>.
+        """
+        tenant = self.get_tenant()
+        if tenant.rol not in ('administrador', 'medico', 'superAdmin'):
+            return Response(
+                {'error': 'No tienes permisos para esta acción'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if tenant.is_super_admin:
+            grupo = Grupo.objects.filter(pk=request.query_params.get('grupo') or None).first()
+        else:
+            grupo = tenant.grupo
+        if grupo is None:
+            return Response({'grupo': 'Indica la clínica con ?grupo=<id>'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            archivo = request.FILES.get('archivo')
+            if archivo is not None:
+                formato = importacion.formato_de(archivo.name, request.query_params.get('formato'))
+                filas = importacion.leer_filas(archivo.file, formato)
+            else:
+                pacientes = request.data.get('pacientes')
+                if not isinstance(pacientes, list):
+                    raise importacion.ArchivoInvalido('Envía un archivo o una lista "pacientes"')
+                filas = ((i, fila if isinstance(fila, dict) else None) for i, fila in enumerate(pacientes, start=1))
+            invitar = str(request.query_params.get('invitar', request.data.get('invitar', ''))).lower() in ('1', 'true')
+            informe = importacion.importar_usuarios(
+                filas, grupo, request=request, actor=get_actor_usuario_from_request(request),
+                invitar=invitar, alta=AltaPacientes(grupo),
+            )
+        except importacion.ArchivoInvalido as e:
+            return Response({'archivo': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(informe, status=status.HTTP_201_CREATED if informe['creados'] else status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'])
     def eliminadas(self, request):
         queryset = Paciente.objects.all()
-        # Filtrar por grupo a través del usuario
-        if not self.is_super_admin():
-            grupo = self.get_user_grupo()
-            if grupo:
-                queryset = queryset.filter(usuario__grupo=grupo)
+        # Filtrar por grupo (a través del usuario)
+        queryset = self.filter_by_grupo(queryset)
         
-        eliminadas = queryset.filter(usuario__estado=False)
+        eliminadas = self.optimizar(queryset.filter(usuario__estado=False))
         serializer = self.get_serializer(eliminadas, many=True)
         return Response(serializer.data)
     
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Las vistas async deben usar amake_password / acheck_password / averificar_password
+de apps.cuentas.hashing: el hash corre en el pool de procesos sin bloquear el event loop.
+Para la bitácora, alog_action de apps.cuentas.utils en lugar de log_action.
 """
 
 import os
@@ -155,6 +155,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'apps.cuentas.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -163,6 +164,56 @@ REST_FRAMEWORK = {
     
 }
 
+# Tokens de acceso firmados (Authorization: Bearer <access>), en segundos
+TOKENS_FIRMADOS = {
+    'ACCESS_TTL': 15 * 60,
+    'REFRESH_TTL': 7 * 24 * 3600,
+    'SYNC_REVOCACIONES': 5,
+    'VENTANA_REVOCACIONES': 60,   # solapamiento al releer revocaciones (transacciones que confirman tarde)
+}
+
+# Hashing de contraseñas en un pool de procesos acotado (ver apps/cuentas/hashing.py)
+HASHING_PASSWORDS = {
+    'MODO': 'procesos',
+    'WORKERS': None,          # None = núcleos disponibles
+    'MAX_PENDIENTES': None,   # None = 4 por worker; más allá se responde 503
+    'ESPERA_MAXIMA': 5,
+}
+
+# Bitácora: registros en cola y guardados por lotes en segundo plano (ver apps/cuentas/auditoria.py)
+BITACORA = {
+    'MODO': 'buffer',
+    'TAMANO_LOTE': 200,
+    'INTERVALO': 1.0,
+    'MAX_COLA': 10000,
+    'DESBORDE': 'descartar',   # o 'escribir': con la cola llena, el request guarda su propio registro
+    # Meses completos que quedan en la base; lo anterior lo mueve `archivar_bitacora` a archivos NDJSON comprimidos
+    'RETENCION_MESES': 12,
+    'DIRECTORIO_ARCHIVO': BASE_DIR / 'archivo_bitacora',
+}
+
+# Bandeja de salida de correos: los requests encolan y `despachar_correos` envía (ver apps/cuentas/correo.py)
+CORREO = {
+    'LOTE': 100,              # correos por conexión SMTP
+    'INTERVALO': 2.0,
+    'MAX_INTENTOS': 6,
+    'ESPERA_BASE': 30,        # segundos; se duplica en cada reintento hasta ESPERA_MAXIMA
+    'ESPERA_MAXIMA': 3600,
+    'REMITENTE': 'noreply@clinicavisionx.com',
+}
+
+# Recordatorios de citas 24 h y 2 h antes: `enviar_recordatorios` los encola (ver apps/citas_pagos/recordatorios.py)
+RECORDATORIOS = {
+    'LOTE': 500,              # citas por transacción
+    'INTERVALO': 60.0,        # segundos entre vueltas sin citas pendientes
+    'ZONA_HORARIA': None,     # zona de la clínica (p. ej. 'America/La_Paz'); None usa TIME_ZONE
+}
+
+# Listados con relaciones precargadas según el serializer (ver apps/cuentas/consultas.py)
+CONSULTAS = {
+    'PRESUPUESTO': 10,        # consultas por listado, contando la autenticación
+    'VERIFICAR': False,       # True solo en tests o desarrollo: al pasarse, AssertionError con las consultas
+}
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"